@@ -8,8 +8,16 @@ from tortoise.exceptions import DoesNotExist
 from app.models.project import Project
 from datetime import datetime, date
 from typing import List
-from app.core.llm_cache_utils import generate_cache_hash_key, get_cached_result, save_to_cache
+from app.core.llm_cache_utils import (
+    generate_cache_hash_key,
+    get_cached_result,
+    save_to_cache,
+    run_single_flight,
+    clear_cache_for_resource,
+    get_cache_stats,
+)
 from app.core.task_manager import task_manager
+from app.core.llm_concurrency import run_in_llm_executor
 try:
     from app.ingestion.aws.llm_s3_integration import run_llm_analysis_s3
     from app.ingestion.aws.llm_ec2_integration import run_llm_analysis as run_llm_analysis_ec2
@@ -141,61 +149,70 @@ async def llm_aws(
         print(f"🔄 Cache miss - calling LLM for AWS {payload.resource_type} (task: {task_id})")
 
         try:
-            # Route based on resource type
-            resource_type_lower = payload.resource_type.lower().strip()
-
-            if resource_type_lower == 's3':
-                result = run_llm_analysis_s3(
-                    schema_name=schema,
-                    start_date=payload.start_date,
-                    end_date=payload.end_date,
-                    bucket_name=payload.resource_id,
-                    task_id=task_id
-                )
-            elif resource_type_lower == 'ec2':
-                result = run_llm_analysis_ec2(
-                    resource_type=payload.resource_type,
-                    schema_name=schema,
-                    start_date=payload.start_date,
-                    end_date=payload.end_date,
-                    resource_id=payload.resource_id,
-                    task_id=task_id
-                )
-            else:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Unsupported AWS resource type: {payload.resource_type}. Supported types: s3, ec2"
-                )
-
-            # Convert single dict result to list for consistent frontend handling
-            if result is not None:
-                result_list = [result] if isinstance(result, dict) else result
-                print(f'Final response_list: {len(result_list)} resources processed')
-            else:
-                result_list = []
-
-            # Validate JSON serialization
-            try:
-                test_json = json.dumps(result_list)
-                print(f'✅ JSON validation passed, serialized {len(test_json)} characters')
-            except (TypeError, ValueError) as e:
-                print(f'❌ JSON serialization failed: {e}')
-                result_list = []
-
-            # Save to cache (async) - but only if task was NOT cancelled
-            if result_list and not task_manager.is_cancelled(task_id):
-                await save_to_cache(
-                    hash_key=hash_key,
-                    cloud_platform="aws",
-                    schema_name=schema,
-                    resource_type=payload.resource_type,
-                    start_date=start_dt,
-                    end_date=end_dt,
-                    resource_id=payload.resource_id,
-                    output_json=result_list
-                )
-            elif task_manager.is_cancelled(task_id):
-                print(f"🚫 NOT saving to cache - task {task_id[:8]}... was cancelled")
+            async def _analyze_and_cache():
+                # Route based on resource type
+                resource_type_lower = payload.resource_type.lower().strip()
+
+                # Analysis is blocking (psycopg2, pandas, LLM calls) - run it off the event loop
+                if resource_type_lower == 's3':
+                    result = await run_in_llm_executor(
+                        run_llm_analysis_s3,
+                        schema_name=schema,
+                        start_date=payload.start_date,
+                        end_date=payload.end_date,
+                        bucket_name=payload.resource_id,
+                        task_id=task_id
+                    )
+                elif resource_type_lower == 'ec2':
+                    result = await run_in_llm_executor(
+                        run_llm_analysis_ec2,
+                        resource_type=payload.resource_type,
+                        schema_name=schema,
+                        start_date=payload.start_date,
+                        end_date=payload.end_date,
+                        resource_id=payload.resource_id,
+                        task_id=task_id
+                    )
+                else:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Unsupported AWS resource type: {payload.resource_type}. Supported types: s3, ec2"
+                    )
+
+                # Convert single dict result to list for consistent frontend handling
+                if result is not None:
+                    result_list = [result] if isinstance(result, dict) else result
+                    print(f'Final response_list: {len(result_list)} resources processed')
+                else:
+                    result_list = []
+
+                # Validate JSON serialization
+                try:
+                    test_json = json.dumps(result_list)
+                    print(f'✅ JSON validation passed, serialized {len(test_json)} characters')
+                except (TypeError, ValueError) as e:
+                    print(f'❌ JSON serialization failed: {e}')
+                    result_list = []
+
+                # Save to cache (async) - but only if task was NOT cancelled
+                if result_list and not task_manager.is_cancelled(task_id):
+                    await save_to_cache(
+                        hash_key=hash_key,
+                        cloud_platform="aws",
+                        schema_name=schema,
+                        resource_type=payload.resource_type,
+                        start_date=start_dt,
+                        end_date=end_dt,
+                        resource_id=payload.resource_id,
+                        output_json=result_list
+                    )
+                elif task_manager.is_cancelled(task_id):
+                    print(f"🚫 NOT saving to cache - task {task_id[:8]}... was cancelled")
+
+                return result_list
+
+            # Single-flight: concurrent misses on the same key wait for one run
+            result_list = await run_single_flight(hash_key, task_id, _analyze_and_cache)
 
             # Mark task as complete
             task_manager.complete_task(task_id)
@@ -275,44 +292,52 @@ async def llm_azure(
         print(f"🔄 Cache miss - calling LLM for Azure {payload.resource_type} (task: {task_id})")
 
         try:
-            result = run_llm_analysis(
-                payload.resource_type,
-                schema,
-                payload.start_date,
-                payload.end_date,
-                payload.resource_id,
-                task_id=task_id
-            )
-
-            # Convert single dict result to list for consistent frontend handling
-            if result is not None:
-                result_list = [result] if isinstance(result, dict) else result
-                print(f'Final response__list: {len(result_list)} resources processed')
-            else:
-                result_list = []
-
-            # Validate JSON serialization
-            try:
-                test_json = json.dumps(result_list)
-                print(f'✅ JSON validation passed, serialized {len(test_json)} characters')
-            except (TypeError, ValueError) as e:
-                print(f'❌ JSON serialization failed: {e}')
-                result_list = []
-
-            # Save to cache (async) - but only if task was NOT cancelled
-            if result_list and not task_manager.is_cancelled(task_id):
-                await save_to_cache(
-                    hash_key=hash_key,
-                    cloud_platform="azure",
-                    schema_name=schema,
-                    resource_type=payload.resource_type,
-                    start_date=start_dt,
-                    end_date=end_dt,
-                    resource_id=payload.resource_id,
-                    output_json=result_list
+            async def _analyze_and_cache():
+                # Analysis is blocking (psycopg2, pandas, LLM calls) - run it off the event loop
+                result = await run_in_llm_executor(
+                    run_llm_analysis,
+                    payload.resource_type,
+                    schema,
+                    payload.start_date,
+                    payload.end_date,
+                    payload.resource_id,
+                    task_id=task_id
                 )
-            elif task_manager.is_cancelled(task_id):
-                print(f"🚫 NOT saving to cache - task {task_id[:8]}... was cancelled")
+
+                # Convert single dict result to list for consistent frontend handling
+                if result is not None:
+                    result_list = [result] if isinstance(result, dict) else result
+                    print(f'Final response__list: {len(result_list)} resources processed')
+                else:
+                    result_list = []
+
+                # Validate JSON serialization
+                try:
+                    test_json = json.dumps(result_list)
+                    print(f'✅ JSON validation passed, serialized {len(test_json)} characters')
+                except (TypeError, ValueError) as e:
+                    print(f'❌ JSON serialization failed: {e}')
+                    result_list = []
+
+                # Save to cache (async) - but only if task was NOT cancelled
+                if result_list and not task_manager.is_cancelled(task_id):
+                    await save_to_cache(
+                        hash_key=hash_key,
+                        cloud_platform="azure",
+                        schema_name=schema,
+                        resource_type=payload.resource_type,
+                        start_date=start_dt,
+                        end_date=end_dt,
+                        resource_id=payload.resource_id,
+                        output_json=result_list
+                    )
+                elif task_manager.is_cancelled(task_id):
+                    print(f"🚫 NOT saving to cache - task {task_id[:8]}... was cancelled")
+
+                return result_list
+
+            # Single-flight: concurrent misses on the same key wait for one run
+            result_list = await run_single_flight(hash_key, task_id, _analyze_and_cache)
 
             # Mark task as complete
             task_manager.complete_task(task_id)
@@ -468,8 +493,8 @@ async def get_resource_ids(
             print(f"Error fetching resource IDs: {e}")
             return []
 
-    # Fetch the resource IDs
-    resource_ids = fetch_resource_ids(schema, resource_type, cloud_platform)
+    # Fetch the resource IDs (pd.read_sql_query is blocking - run it off the event loop)
+    resource_ids = await run_in_llm_executor(fetch_resource_ids, schema, resource_type, cloud_platform)
 
     return {
         "status": "success",
@@ -481,6 +506,48 @@ async def get_resource_ids(
     }
 
 
+# ---------------------------------------------------------
+# CACHE MANAGEMENT ENDPOINTS
+# ---------------------------------------------------------
+@router.delete("/{cloud_platform}/{project_id}/cache")
+async def clear_cache(
+    cloud_platform: str,
+    project_id: str,
+    resource_type: Optional[str] = None,
+    resource_id: Optional[str] = None,
+):
+    """
+    Clear cached recommendations (and the LLM answers behind them) of a project,
+    optionally narrowed to a resource type or a single resource of that type.
+    """
+    schema = await _resolve_schema_name(project_id, None)
+
+    try:
+        deleted = await clear_cache_for_resource(cloud_platform, schema, resource_type, resource_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "status": "success",
+        "cloud_platform": cloud_platform.lower(),
+        "schema_name": schema,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "deleted_count": deleted
+    }
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """
+    Redis cache statistics: live keys and memory per namespace, cumulative writes, L1 usage.
+    """
+    stats = await get_cache_stats()
+    if "error" in stats:
+        raise HTTPException(status_code=503, detail=f"Cache statistics unavailable: {stats['error']}")
+    return {"status": "success", **stats}
+
+
 # ---------------------------------------------------------
 # TASK MANAGEMENT ENDPOINTS
 # ---------------------------------------------------------
@@ -2,9 +2,29 @@ import os
 import json
 import re
 import time
+import asyncio
 import logging
-from openai import AzureOpenAI, RateLimitError
+import threading
+import weakref
+import httpx
+from typing import Optional, Tuple
+from openai import (
+    AzureOpenAI,
+    AsyncAzureOpenAI,
+    DefaultHttpxClient,
+    DefaultAsyncHttpxClient,
+    RateLimitError,
+)
 from dotenv import load_dotenv
+from app.core.llm_concurrency import rate_limiter
+from app.core.llm_cache_utils import (
+    generate_prompt_fingerprint,
+    get_fingerprint_result,
+    save_fingerprint_result,
+    fingerprint_index_keys,
+    get_fingerprint_result_async,
+    save_fingerprint_result_async,
+)
 
 # Set up basic logging configuration
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,62 +38,177 @@ AZURE_OPENAI_VERSION = os.getenv("AZURE_OPENAI_VERSION")
 # --- Configuration for Resilience ---
 MAX_RETRIES = 5
 INITIAL_BACKOFF = 2  # Starting wait time in seconds
-REQUEST_DELAY = 3  # Delay in seconds between successful LLM calls to avoid rate limits (set to 0 to disable)
+MAX_BACKOFF = 60  # Upper bound for a single wait, including server-provided Retry-After
+MAX_TOKENS = 800  # Response token limit per call
 
-def llm_call(prompt: str) -> str:
+# --- Configuration for the shared HTTP connection pool ---
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))  # Read timeout per request
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "10"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+SYSTEM_PROMPT = "You are a helpful FinOps and cloud optimization assistant. Your response must be in the specified JSON format only."
+
+# Process-wide clients (one sync client, one async client per event loop)
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+_client_lock = threading.Lock()
+
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def get_llm_client() -> AzureOpenAI:
     """
-    Calls the Azure OpenAI service, sets the response token limit, and 
-    implements exponential backoff to handle RateLimitError (HTTP 429).
-    Returns the extracted JSON string or an empty string on failure.
+    Get the process-wide AzureOpenAI client.
+    Created on first call and reused thereafter so TLS connections stay alive
+    across requests and threads (httpx clients are thread-safe).
     """
-    
-    try:
-        client = AzureOpenAI(
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AzureOpenAI(
+                    azure_endpoint=AZURE_OPENAI_ENDPOINT,
+                    api_key=AZURE_OPENAI_KEY,
+                    api_version=AZURE_OPENAI_VERSION,
+                    max_retries=0,  # Retries are handled below (honouring Retry-After)
+                    http_client=DefaultHttpxClient(limits=_http_limits(), timeout=_http_timeout()),
+                )
+    return _client
+
+
+def get_async_llm_client() -> AsyncAzureOpenAI:
+    """
+    Get the pooled AsyncAzureOpenAI client of the running event loop.
+    httpx async pools are bound to the loop that created them, so Celery tasks that
+    call asyncio.run() repeatedly get a fresh client per loop while uvicorn reuses one.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+
+    if client is None:
+        client = AsyncAzureOpenAI(
             azure_endpoint=AZURE_OPENAI_ENDPOINT,
             api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_VERSION
+            api_version=AZURE_OPENAI_VERSION,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=_http_limits(), timeout=_http_timeout()),
         )
+        _async_clients[loop] = client
+    return client
+
+
+def _build_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _extract_json_text(output_text: str) -> str:
+    """Clean output_text to extract only the JSON."""
+    # This regex captures the outermost JSON object starting with { and ending with }
+    match = re.search(r"(\{.*\})", output_text or "", re.DOTALL)
+    if match:
+        return match.group(0)
+    # Fallback to the whole output text if the pattern is not found
+    return output_text or ""
+
+
+def _is_recommendation(json_str: str) -> bool:
+    """True if the extracted reply parses into a JSON object, as the analysis callers require."""
+    try:
+        return isinstance(json.loads(json_str), dict)
+    except ValueError:
+        return False
+
+
+def _cache_index_keys(cache_scope: Optional[Tuple[str, str, str, Optional[str]]]) -> list:
+    """Fingerprint index sets of a (cloud_platform, schema_name, resource_type, resource_id) scope."""
+    if not cache_scope or not all(cache_scope[:3]):
+        return []
+    return fingerprint_index_keys(*cache_scope)
+
+
+def _retry_after_seconds(error: RateLimitError, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a 429.
+    Uses the service's Retry-After / retry-after-ms header when present,
+    otherwise falls back to exponential backoff (2^attempt * INITIAL_BACKOFF).
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+
+    try:
+        if headers.get("retry-after-ms"):
+            return min(float(headers["retry-after-ms"]) / 1000.0, MAX_BACKOFF)
+        if headers.get("retry-after"):
+            return min(float(headers["retry-after"]), MAX_BACKOFF)
+    except (TypeError, ValueError):
+        pass
+
+    return min(INITIAL_BACKOFF * (2 ** attempt), MAX_BACKOFF)
+
+
+def llm_call(prompt: str, cache_scope: Optional[Tuple[str, str, str, Optional[str]]] = None) -> str:
+    """
+    Calls the Azure OpenAI service, sets the response token limit, and
+    retries RateLimitError (HTTP 429) after the server's Retry-After interval.
+    Returns the extracted JSON string or an empty string on failure.
+
+    Replies that parse into a JSON object are cached under the prompt's
+    fingerprint; cache_scope (cloud_platform, schema_name, resource_type,
+    resource_id) indexes that entry so clear_cache_for_resource drops it.
+    """
+
+    # Identical input (metrics, cost, pricing) was already answered - reuse it
+    fingerprint = generate_prompt_fingerprint(prompt)
+    cached = get_fingerprint_result(fingerprint)
+    if cached:
+        logging.info(f"LLM fingerprint cache hit ({fingerprint[:20]}...)")
+        return cached
+
+    try:
+        client = get_llm_client()
     except Exception as e:
         logging.error(f"Error initializing AzureOpenAI client: {e}")
         return ""
 
     for attempt in range(MAX_RETRIES):
+        # Wait for RPM/TPM budget (shared by all threads) instead of a fixed delay
+        rate_limiter.acquire(prompt, MAX_TOKENS)
         try:
             # 1. Set Token Limit: max_tokens is crucial for cost and speed.
             response = client.chat.completions.create(
                 model=AZURE_DEPLOYMENT_NAME,
-                messages=[
-                    {"role": "system", "content": "You are a helpful FinOps and cloud optimization assistant. Your response must be in the specified JSON format only."},
-                    {"role": "user", "content": prompt},
-                ],
+                messages=_build_messages(prompt),
                 temperature=0.3,
-                max_tokens=800,  # ✅ Token Limit Set (Adjust as needed)
+                max_tokens=MAX_TOKENS,  # ✅ Token Limit Set (Adjust as needed)
             )
 
             # --- Success handling ---
-            output_text = response.choices[0].message.content
-            
-            # Clean output_text to extract only the JSON
-            # This regex captures the outermost JSON object starting with { and ending with }
-            match = re.search(r"(\{.*\})", output_text, re.DOTALL)
-            if match:
-                json_str = match.group(0)
-            else:
-                # Fallback to the whole output text if the pattern is not found
-                json_str = output_text
-
-            # Add delay after successful request to prevent rate limit exhaustion
-            if REQUEST_DELAY > 0:
-                time.sleep(REQUEST_DELAY)
-
             # Return the raw JSON string for the caller (llm_analysis.py) to process
+            json_str = _extract_json_text(response.choices[0].message.content)
+            # An unparseable reply is returned for the caller to log, but not replayed from the cache
+            if _is_recommendation(json_str):
+                save_fingerprint_result(fingerprint, json_str, _cache_index_keys(cache_scope))
             return json_str
-            
+
         except RateLimitError as e:
-            # 2. Rate Limit Handling (Exponential Backoff)
+            # 2. Rate Limit Handling (Retry-After, falling back to exponential backoff)
+            rate_limiter.throttle()
             if attempt < MAX_RETRIES - 1:
-                # Calculate backoff time: 2^attempt * INITIAL_BACKOFF
-                backoff_time = INITIAL_BACKOFF * (2 ** attempt)
+                backoff_time = _retry_after_seconds(e, attempt)
                 logging.warning(f"Rate limit hit (429). Retrying in {backoff_time:.2f} seconds (Attempt {attempt + 1}/{MAX_RETRIES}).")
                 time.sleep(backoff_time)
             else:
@@ -86,7 +221,73 @@ def llm_call(prompt: str) -> str:
             logging.error(f"Unforeseen Error during LLM processing (Attempt {attempt + 1}): {e}")
             # For non-recoverable errors, stop and return empty string
             return ""
-            
+
     # Should only be reached if the loop finished due to returning on success
     # or if all retries failed and the exception was logged/handled inside the loop.
-    return ""
\ No newline at end of file
+    return ""
+
+
+async def llm_call_async(prompt: str, cache_scope: Optional[Tuple[str, str, str, Optional[str]]] = None) -> str:
+    """
+    Async variant of llm_call for use from the event loop (FastAPI endpoints,
+    async pre-warming). Same retry and rate-limit semantics; never blocks the loop.
+    """
+    fingerprint = generate_prompt_fingerprint(prompt)
+    cached = await get_fingerprint_result_async(fingerprint)
+    if cached:
+        logging.info(f"LLM fingerprint cache hit ({fingerprint[:20]}...)")
+        return cached
+
+    try:
+        client = get_async_llm_client()
+    except Exception as e:
+        logging.error(f"Error initializing AsyncAzureOpenAI client: {e}")
+        return ""
+
+    for attempt in range(MAX_RETRIES):
+        # The limiter is thread-based, so wait for budget off the event loop
+        await asyncio.to_thread(rate_limiter.acquire, prompt, MAX_TOKENS)
+        try:
+            response = await client.chat.completions.create(
+                model=AZURE_DEPLOYMENT_NAME,
+                messages=_build_messages(prompt),
+                temperature=0.3,
+                max_tokens=MAX_TOKENS,
+            )
+            json_str = _extract_json_text(response.choices[0].message.content)
+            if _is_recommendation(json_str):
+                await save_fingerprint_result_async(fingerprint, json_str, _cache_index_keys(cache_scope))
+            return json_str
+
+        except RateLimitError as e:
+            rate_limiter.throttle()
+            if attempt < MAX_RETRIES - 1:
+                backoff_time = _retry_after_seconds(e, attempt)
+                logging.warning(f"Rate limit hit (429). Retrying in {backoff_time:.2f} seconds (Attempt {attempt + 1}/{MAX_RETRIES}).")
+                await asyncio.sleep(backoff_time)
+            else:
+                logging.error(f"Rate limit hit, max retries reached after {MAX_RETRIES} attempts. Error: {e}")
+                return ""
+
+        except Exception as e:
+            logging.error(f"Unforeseen Error during LLM processing (Attempt {attempt + 1}): {e}")
+            return ""
+
+    return ""
+
+
+def close_llm_clients() -> None:
+    """Close the pooled sync LLM client (called on application shutdown)."""
+    global _client
+
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def close_async_llm_clients() -> None:
+    """Close the pooled async LLM client of the running event loop, if any."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
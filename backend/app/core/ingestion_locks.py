@@ -0,0 +1,158 @@
+# app/core/ingestion_locks.py
+
+"""
+Redis coordination for the fanned-out daily ingestion.
+
+- Per-project locks: a project is never ingested by two tasks at once.
+- Per-cloud slots: at most INGESTION_CONCURRENCY_<CLOUD> ingestion tasks of one
+  cloud run at the same time across all Celery workers, however many workers
+  pick up tasks from the queue.
+
+- Pricing locks: one refresh of the shared pricing catalog per provider at a
+  time (beat task or an ingestion bootstrapping an empty catalog); an
+  ingestion that finds no catalog waits for the holder instead of going on.
+
+All are leases with a TTL, so a worker that dies mid-ingestion cannot block a
+project or a slot for longer than INGESTION_LOCK_TTL_SECONDS (pricing locks:
+PRICING_LOCK_TTL_SECONDS).
+"""
+
+import os
+import time
+import redis
+
+# Upper bound on a single connection's ingestion; leases expire after this
+INGESTION_LOCK_TTL_SECONDS = int(os.getenv("INGESTION_LOCK_TTL_SECONDS", str(3 * 60 * 60)))
+
+# Concurrent ingestion tasks per cloud (provider API quotas, DB load)
+INGESTION_CONCURRENCY = {
+    "aws": int(os.getenv("INGESTION_CONCURRENCY_AWS", "4")),
+    "azure": int(os.getenv("INGESTION_CONCURRENCY_AZURE", "4")),
+    "gcp": int(os.getenv("INGESTION_CONCURRENCY_GCP", "2")),
+}
+DEFAULT_INGESTION_CONCURRENCY = 2
+
+# Upper bound on one pricing catalog refresh
+PRICING_LOCK_TTL_SECONDS = int(os.getenv("PRICING_LOCK_TTL_SECONDS", str(60 * 60)))
+# How often a worker waiting on another worker's pricing refresh checks the lock
+PRICING_LOCK_POLL_SECONDS = float(os.getenv("PRICING_LOCK_POLL_SECONDS", "5"))
+
+# Take a slot if fewer than ARGV[1] unexpired holders exist
+_ACQUIRE_SLOT_SCRIPT = """
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[3])
+if redis.call('zcard', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('zadd', KEYS[1], ARGV[4], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Release only if we still own the lock (value == owner)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_redis_client = None
+
+
+def get_redis_client() -> redis.Redis:
+    """Get the (lazily created) Redis client used for ingestion coordination."""
+    global _redis_client
+
+    if _redis_client is None:
+        redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+        _redis_client = redis.from_url(redis_url, decode_responses=True)
+    return _redis_client
+
+
+def _project_lock_key(project_id) -> str:
+    return f"ingestion_lock:project:{project_id}"
+
+
+def _cloud_slots_key(cloud_platform: str) -> str:
+    return f"ingestion_slots:{cloud_platform}"
+
+
+def _pricing_lock_key(provider: str) -> str:
+    return f"pricing_lock:{provider}"
+
+
+def acquire_project_lock(project_id, owner: str) -> bool:
+    """
+    Try to take the ingestion lock for a project.
+
+    Returns:
+        True if acquired, False if the project is already being ingested
+    """
+    return bool(get_redis_client().set(
+        _project_lock_key(project_id), owner, nx=True, ex=INGESTION_LOCK_TTL_SECONDS
+    ))
+
+
+def release_project_lock(project_id, owner: str) -> None:
+    """Release a project lock if `owner` still holds it."""
+    try:
+        get_redis_client().eval(_RELEASE_LOCK_SCRIPT, 1, _project_lock_key(project_id), owner)
+    except Exception as e:
+        print(f"⚠️ Error releasing ingestion lock for project {project_id}: {e}")
+
+
+def acquire_cloud_slot(cloud_platform: str, owner: str) -> bool:
+    """
+    Try to take one of the concurrent ingestion slots of a cloud.
+
+    Returns:
+        True if a slot was taken, False if the cloud is at its concurrency limit
+    """
+    limit = INGESTION_CONCURRENCY.get(cloud_platform, DEFAULT_INGESTION_CONCURRENCY)
+    now = time.time()
+    return bool(get_redis_client().eval(
+        _ACQUIRE_SLOT_SCRIPT, 1, _cloud_slots_key(cloud_platform),
+        limit, owner, now, now + INGESTION_LOCK_TTL_SECONDS
+    ))
+
+
+def release_cloud_slot(cloud_platform: str, owner: str) -> None:
+    """Give a cloud ingestion slot back."""
+    try:
+        get_redis_client().zrem(_cloud_slots_key(cloud_platform), owner)
+    except Exception as e:
+        print(f"⚠️ Error releasing {cloud_platform} ingestion slot: {e}")
+
+
+def acquire_pricing_lock(provider: str, owner: str) -> bool:
+    """
+    Try to take the pricing catalog refresh lock of a provider.
+
+    Returns:
+        True if acquired, False if another worker is refreshing its prices
+    """
+    return bool(get_redis_client().set(
+        _pricing_lock_key(provider), owner, nx=True, ex=PRICING_LOCK_TTL_SECONDS
+    ))
+
+
+def wait_for_pricing_lock(provider: str, timeout: float = PRICING_LOCK_TTL_SECONDS) -> bool:
+    """
+    Block until the pricing lock of a provider is released (or its lease expires).
+
+    Returns:
+        True if the lock was released, False if `timeout` seconds passed first
+    """
+    deadline = time.time() + timeout
+    while get_redis_client().exists(_pricing_lock_key(provider)):
+        if time.time() >= deadline:
+            return False
+        time.sleep(PRICING_LOCK_POLL_SECONDS)
+    return True
+
+
+def release_pricing_lock(provider: str, owner: str) -> None:
+    """Release a pricing lock if `owner` still holds it."""
+    try:
+        get_redis_client().eval(_RELEASE_LOCK_SCRIPT, 1, _pricing_lock_key(provider), owner)
+    except Exception as e:
+        print(f"⚠️ Error releasing {provider} pricing lock: {e}")
@@ -1,18 +1,122 @@
 # app/core/llm_cache_utils.py
 
+import asyncio
 import hashlib
 import json
 import os
+import re
+import threading
+import time
+import uuid
+import zlib
+import orjson
+import redis as redis_sync
 import redis.asyncio as redis
+from cachetools import TTLCache
 from datetime import date
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Awaitable
 
-# Redis connection pool (initialized once)
+try:
+    import zstandard
+except ImportError:  # Optional - falls back to zlib
+    zstandard = None
+
+# Redis connection pools (initialized once)
 _redis_pool = None
+_sync_redis_pool = None
 
 # Cache TTL: 24 hours in seconds
 CACHE_TTL_SECONDS = 24 * 60 * 60  # 86400 seconds
 
+# Bulk ("all resources") entries hold a manifest of per-resource keys instead of
+# the full result, so bulk and single-resource lookups share the same entries
+MANIFEST_FIELD = "_manifest"
+
+# Value encoding: b"LC1" + codec byte + payload. Values without the header are
+# legacy plain-JSON entries and are still read as such.
+VALUE_HEADER = b"LC1"
+CODEC_RAW = b"r"
+CODEC_ZLIB = b"z"
+CODEC_ZSTD = b"s"
+COMPRESSION_THRESHOLD_BYTES = int(os.getenv("LLM_CACHE_COMPRESSION_THRESHOLD", "2048"))
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Per-namespace cumulative write counters (hash fields "<namespace>:<counter>")
+STATS_KEY = "llm_cache_stats"
+# Live keys per namespace whose MEMORY USAGE is sampled for the current-usage stats
+STATS_SAMPLE_SIZE = int(os.getenv("LLM_CACHE_STATS_SAMPLE_SIZE", "200"))
+
+# Secondary indexes maintained at write time (sorted sets of cache keys scored by
+# their expiry time), so invalidation touches only the affected keys
+INDEX_ALL_KEY = "llm_idx:all"
+FINGERPRINT_INDEX_KEY = "llm_idx:fingerprints"
+# Index holding every live key of a namespace (used for the usage stats)
+NAMESPACE_INDEXES = {"llm_cache": INDEX_ALL_KEY, "llm_fp": FINGERPRINT_INDEX_KEY}
+INVALIDATION_BATCH_SIZE = 500
+
+# In-process L1 cache in front of Redis (per uvicorn worker). Only used while the
+# worker is subscribed to the invalidation channel, so it never serves stale data
+# for longer than it takes a pub/sub message to arrive.
+L1_CACHE_MAXSIZE = int(os.getenv("LLM_L1_CACHE_MAXSIZE", "256"))
+L1_CACHE_TTL_SECONDS = int(os.getenv("LLM_L1_CACHE_TTL_SECONDS", "300"))
+L1_INVALIDATION_CHANNEL = "llm_cache_invalidate"
+L1_FLUSH_ALL = "*"
+
+_l1_cache = TTLCache(maxsize=L1_CACHE_MAXSIZE, ttl=L1_CACHE_TTL_SECONDS)
+_l1_dependents: Dict[str, set] = {}  # per-resource key -> bulk keys assembled from it
+_l1_lock = threading.Lock()
+_l1_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_l1_listener_task: Optional[asyncio.Task] = None
+_l1_active = False
+
+# Content-addressed layer: LLM responses keyed on a fingerprint of the prompt input
+# (metric aggregates, billed cost, pricing context). Survives rolling date presets.
+FINGERPRINT_CACHE_ENABLED = os.getenv("LLM_FINGERPRINT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+FINGERPRINT_TTL_SECONDS = int(os.getenv("LLM_FINGERPRINT_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+
+# Timestamps (e.g. *_MaxDate) move with the window even when the values do not
+_TIMESTAMP_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?")
+
+# Canonical resource type names, so aliases share cache entries
+_RESOURCE_TYPE_ALIASES = {
+    "virtualmachine": "vm",
+    "virtual_machine": "vm",
+    "storageaccount": "storage",
+    "storage_account": "storage",
+    "public_ip": "publicip",
+    "pip": "publicip",
+    "instance": "ec2",
+    "bucket": "s3",
+}
+
+# Single-flight lock: short TTL kept alive by a heartbeat, so locks held by a
+# crashed worker expire on their own within SINGLEFLIGHT_LOCK_TTL_SECONDS
+SINGLEFLIGHT_LOCK_TTL_SECONDS = 60
+SINGLEFLIGHT_HEARTBEAT_SECONDS = 20
+# Longest a waiter follows another caller's run before giving up
+SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS = 30 * 60
+# Waiters poll the cache and lock keys (no connection held in between), backing
+# off from SINGLEFLIGHT_POLL_SECONDS to SINGLEFLIGHT_MAX_POLL_SECONDS
+SINGLEFLIGHT_POLL_SECONDS = 1.0
+SINGLEFLIGHT_MAX_POLL_SECONDS = 5.0
+# Consecutive Redis errors (retried with backoff) before Redis is treated as
+# unreachable and the caller computes without the lock
+SINGLEFLIGHT_MAX_REDIS_ERRORS = 3
+
+# Release/extend only if we still own the lock (value == owner)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
 
 async def get_redis_client() -> redis.Redis:
     """
@@ -32,6 +136,156 @@ async def get_redis_client() -> redis.Redis:
     return redis.Redis(connection_pool=_redis_pool)
 
 
+def get_sync_redis_client() -> redis_sync.Redis:
+    """
+    Get synchronous Redis client with connection pooling.
+    Used from the (threaded) bulk analysis code, which has no event loop.
+    """
+    global _sync_redis_pool
+
+    if _sync_redis_pool is None:
+        redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+        _sync_redis_pool = redis_sync.ConnectionPool.from_url(
+            redis_url,
+            decode_responses=False,
+            max_connections=10
+        )
+
+    return redis_sync.Redis(connection_pool=_sync_redis_pool)
+
+
+def _date_str(value) -> str:
+    """Normalize a date / datetime / 'YYYY-MM-DD' string for cache keys."""
+    if not value:
+        return ""
+    if hasattr(value, "date") and callable(value.date):
+        value = value.date()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)[:10]
+
+
+def _encode_bytes(payload: bytes) -> bytes:
+    """Add the versioned header, compressing payloads above the threshold."""
+    if len(payload) < COMPRESSION_THRESHOLD_BYTES:
+        return VALUE_HEADER + CODEC_RAW + payload
+    if zstandard is not None:
+        return VALUE_HEADER + CODEC_ZSTD + zstandard.ZstdCompressor(level=3).compress(payload)
+    return VALUE_HEADER + CODEC_ZLIB + zlib.compress(payload, 6)
+
+
+def _decode_bytes(raw: bytes) -> bytes:
+    """Strip the header and decompress; legacy values are returned unchanged."""
+    if not raw.startswith(VALUE_HEADER):
+        return raw
+    codec = raw[len(VALUE_HEADER):len(VALUE_HEADER) + 1]
+    payload = raw[len(VALUE_HEADER) + 1:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd-compressed cache entry but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return payload
+
+
+def encode_cache_value(value: Any) -> bytes:
+    """Serialize a cache value with orjson (compressed above the threshold)."""
+    return _encode_bytes(orjson.dumps(value, option=_ORJSON_OPTIONS))
+
+
+def decode_cache_value(raw: bytes) -> Any:
+    """Inverse of encode_cache_value; also reads legacy json.dumps entries."""
+    if not raw.startswith(VALUE_HEADER):
+        # Legacy entries may contain NaN, which orjson rejects
+        return json.loads(raw.decode('utf-8'))
+    return orjson.loads(_decode_bytes(raw))
+
+
+def _namespace(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+def _count_bytes(pipe, key: str, raw_size: int, stored_size: int) -> None:
+    """Queue per-namespace cumulative write counters on a (sync or async) pipeline."""
+    namespace = _namespace(key)
+    pipe.hincrby(STATS_KEY, f"{namespace}:writes", 1)
+    pipe.hincrby(STATS_KEY, f"{namespace}:raw_bytes", raw_size)
+    pipe.hincrby(STATS_KEY, f"{namespace}:stored_bytes", stored_size)
+
+
+def _normalize_scope(cloud_platform: str, schema_name: str, resource_type: str):
+    """Canonical (cloud, schema, resource_type) used in cache and index keys."""
+    rtype = (resource_type or "").lower().strip()
+    return (
+        cloud_platform.lower().strip(),
+        schema_name.lower().strip(),
+        _RESOURCE_TYPE_ALIASES.get(rtype, rtype),
+    )
+
+
+def _index_key(
+    cloud_platform: str,
+    schema_name: str,
+    resource_type: Optional[str] = None,
+    resource_id: Optional[str] = None
+) -> str:
+    """Most specific index set for a schema, a resource type or a single resource."""
+    cloud, schema, rtype = _normalize_scope(cloud_platform, schema_name, resource_type)
+    if not rtype:
+        return f"llm_idx:schema:{cloud}:{schema}"
+    if not resource_id:
+        return f"llm_idx:type:{cloud}:{schema}:{rtype}"
+    return f"llm_idx:rid:{cloud}:{schema}:{rtype}:{resource_id.lower().strip()}"
+
+
+def _index_keys(cloud_platform: str, schema_name: str, resource_type: str, resource_id: Optional[str] = None) -> List[str]:
+    """Every index set a cache entry belongs to."""
+    keys = [
+        INDEX_ALL_KEY,
+        _index_key(cloud_platform, schema_name),
+        _index_key(cloud_platform, schema_name, resource_type),
+    ]
+    if resource_id:
+        keys.append(_index_key(cloud_platform, schema_name, resource_type, resource_id))
+    return keys
+
+
+def _fingerprint_index_key(index_key: str) -> str:
+    """Fingerprint counterpart of a schema / type / resource index set."""
+    return index_key.replace("llm_idx:", "llm_idx:fp:", 1)
+
+
+def fingerprint_index_keys(
+    cloud_platform: str,
+    schema_name: str,
+    resource_type: str,
+    resource_id: Optional[str] = None
+) -> List[str]:
+    """
+    Index sets a fingerprint entry of this resource belongs to, so
+    clear_cache_for_resource also drops the raw LLM answers behind it.
+    Kept apart from the llm_cache indexes, whose TTL is shorter.
+    """
+    return [
+        _fingerprint_index_key(index_key)
+        for index_key in _index_keys(cloud_platform, schema_name, resource_type, resource_id)[1:]
+    ]
+
+
+def _queue_setex(pipe, key: str, ttl: int, value: Any, index_keys: Optional[List[str]] = None) -> None:
+    """Queue SETEX of an encoded value plus its byte counters and index entries."""
+    payload = orjson.dumps(value, option=_ORJSON_OPTIONS)
+    encoded = _encode_bytes(payload)
+    pipe.setex(key, ttl, encoded)
+    _count_bytes(pipe, key, len(payload), len(encoded))
+
+    expires_at = time.time() + ttl
+    for index_key in index_keys or []:
+        pipe.zadd(index_key, {key: expires_at})
+        pipe.expire(index_key, ttl)
+
+
 def generate_cache_hash_key(
     cloud_platform: str,
     schema_name: str,
@@ -55,14 +309,12 @@ def generate_cache_hash_key(
         MD5 hash string (32 characters)
     """
     # Normalize inputs
-    cloud = cloud_platform.lower().strip()
-    schema = schema_name.lower().strip()
-    rtype = resource_type.lower().strip()
+    cloud, schema, rtype = _normalize_scope(cloud_platform, schema_name, resource_type)
     rid = resource_id.lower().strip() if resource_id else ""
 
     # Convert dates to string format
-    start_str = start_date.isoformat() if start_date else ""
-    end_str = end_date.isoformat() if end_date else ""
+    start_str = _date_str(start_date)
+    end_str = _date_str(end_date)
 
     # Concatenate all parameters in a consistent order
     cache_string = f"{cloud}|{schema}|{rtype}|{start_str}|{end_str}|{rid}"
@@ -75,9 +327,155 @@ def generate_cache_hash_key(
     return f"llm_cache:{hash_key}"
 
 
+def _is_manifest(value: Any) -> bool:
+    return isinstance(value, dict) and MANIFEST_FIELD in value
+
+
+def _assemble_manifest(member_values: List[Optional[bytes]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Build a bulk result from MGET-ed per-resource entries.
+    Returns None if any member has expired or been invalidated.
+    """
+    output_json = []
+    for raw in member_values:
+        if raw is None:
+            return None
+        output_json.extend(decode_cache_value(raw))
+    return output_json
+
+
+async def _read_cached(client: redis.Redis, hash_key: str) -> Optional[List[Dict[str, Any]]]:
+    """Read a cache entry, resolving bulk manifests into their per-resource entries."""
+    cached_data = await client.get(hash_key)
+    if not cached_data:
+        return None
+
+    output_json = decode_cache_value(cached_data)
+    if not _is_manifest(output_json):
+        _l1_put(hash_key, output_json)
+        return output_json
+
+    member_keys = output_json[MANIFEST_FIELD]
+    if not member_keys:
+        return []
+    member_values = await client.mget(member_keys)
+    output_json = _assemble_manifest(member_values)
+    if output_json is not None:
+        _l1_put(hash_key, output_json, member_keys)
+    return output_json
+
+
+def _l1_get(hash_key: str) -> Optional[List[Dict[str, Any]]]:
+    if not _l1_active:
+        return None
+    with _l1_lock:
+        value = _l1_cache.get(hash_key)
+        _l1_stats["hits" if value is not None else "misses"] += 1
+        return value
+
+
+def _l1_put(hash_key: str, output_json: List[Dict[str, Any]], member_keys: Optional[List[str]] = None) -> None:
+    if not _l1_active:
+        return
+    with _l1_lock:
+        _l1_cache[hash_key] = output_json
+        for member_key in member_keys or []:
+            _l1_dependents.setdefault(member_key, set()).add(hash_key)
+
+
+def _l1_invalidate(keys: List[str]) -> None:
+    """Drop keys (and bulk entries assembled from them) from this worker's L1."""
+    with _l1_lock:
+        _l1_stats["invalidations"] += 1
+        if L1_FLUSH_ALL in keys:
+            _l1_cache.clear()
+            _l1_dependents.clear()
+            return
+        for key in keys:
+            _l1_cache.pop(key, None)
+            for parent in _l1_dependents.pop(key, ()):
+                _l1_cache.pop(parent, None)
+
+
+async def _publish_invalidation(client: redis.Redis, keys: List[str]) -> None:
+    """Invalidate keys locally and in every other worker's L1."""
+    _l1_invalidate(keys)
+    try:
+        await client.publish(L1_INVALIDATION_CHANNEL, orjson.dumps(keys))
+    except Exception as e:
+        print(f"⚠️ Error publishing L1 cache invalidation: {e}")
+
+
+async def _l1_invalidation_listener() -> None:
+    """Apply invalidation messages from other workers; reconnects on failure."""
+    global _l1_active
+
+    while True:
+        pubsub = None
+        try:
+            client = await get_redis_client()
+            pubsub = client.pubsub()
+            await pubsub.subscribe(L1_INVALIDATION_CHANNEL)
+            # Messages may have been missed while disconnected - start empty
+            _l1_invalidate([L1_FLUSH_ALL])
+            _l1_active = True
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _l1_invalidate(orjson.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ L1 cache invalidation listener error, retrying: {e}")
+        finally:
+            _l1_active = False
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+        await asyncio.sleep(SINGLEFLIGHT_POLL_SECONDS)
+
+
+async def start_l1_cache() -> None:
+    """Enable the in-process L1 cache for this worker (call on app startup)."""
+    global _l1_listener_task
+
+    if _l1_listener_task is None or _l1_listener_task.done():
+        _l1_listener_task = asyncio.create_task(_l1_invalidation_listener())
+
+
+async def stop_l1_cache() -> None:
+    """Stop the invalidation listener and drop the L1 cache (call on shutdown)."""
+    global _l1_listener_task
+
+    if _l1_listener_task is not None:
+        _l1_listener_task.cancel()
+        try:
+            await _l1_listener_task
+        except asyncio.CancelledError:
+            pass
+        _l1_listener_task = None
+    _l1_invalidate([L1_FLUSH_ALL])
+
+
+def get_l1_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of this worker's L1 cache."""
+    with _l1_lock:
+        lookups = _l1_stats["hits"] + _l1_stats["misses"]
+        return {
+            "enabled": _l1_active,
+            "entries": len(_l1_cache),
+            "maxsize": L1_CACHE_MAXSIZE,
+            "ttl_seconds": L1_CACHE_TTL_SECONDS,
+            **_l1_stats,
+            "hit_rate": round(_l1_stats["hits"] / lookups, 3) if lookups else None,
+        }
+
+
 async def get_cached_result(hash_key: str) -> Optional[List[Dict[str, Any]]]:
     """
-    Retrieve cached LLM result from Redis by hash key.
+    Retrieve cached LLM result by hash key, from the in-process L1 cache or Redis.
+    Bulk entries are assembled from their per-resource entries with a single MGET.
 
     Args:
         hash_key: The MD5 hash key (with namespace prefix)
@@ -85,13 +483,16 @@ async def get_cached_result(hash_key: str) -> Optional[List[Dict[str, Any]]]:
     Returns:
         Cached output as a list of dictionaries, or None if not found
     """
+    output_json = _l1_get(hash_key)
+    if output_json is not None:
+        print(f"⚡ L1 Cache HIT for hash_key: {hash_key[:20]}...")
+        return output_json
+
     try:
         client = await get_redis_client()
-        cached_data = await client.get(hash_key)
+        output_json = await _read_cached(client, hash_key)
 
-        if cached_data:
-            # Decode and parse JSON
-            output_json = json.loads(cached_data.decode('utf-8'))
+        if output_json is not None:
             print(f"✅ Redis Cache HIT for hash_key: {hash_key[:20]}...")
             return output_json
         else:
@@ -102,6 +503,74 @@ async def get_cached_result(hash_key: str) -> Optional[List[Dict[str, Any]]]:
         return None
 
 
+def get_cached_resources(
+    cloud_platform: str,
+    schema_name: str,
+    resource_type: str,
+    start_date,
+    end_date,
+    resource_ids: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Look up per-resource recommendations for many resources with one MGET.
+    Synchronous, for use inside bulk analysis runs.
+
+    Returns:
+        Mapping of resource_id -> cached recommendation (hits only)
+    """
+    if not resource_ids:
+        return {}
+
+    keys = [
+        generate_cache_hash_key(cloud_platform, schema_name, resource_type, start_date, end_date, rid)
+        for rid in resource_ids
+    ]
+    try:
+        values = get_sync_redis_client().mget(keys)
+    except Exception as e:
+        print(f"⚠️ Error retrieving per-resource cache entries: {e}")
+        return {}
+
+    hits = {}
+    for rid, raw in zip(resource_ids, values):
+        if raw is None:
+            continue
+        entry = decode_cache_value(raw)
+        if isinstance(entry, list) and entry:
+            hits[rid] = entry[0]
+    print(f"📦 Per-resource cache: {len(hits)}/{len(resource_ids)} hits for {cloud_platform}/{resource_type}")
+    return hits
+
+
+def save_resource_to_cache(
+    cloud_platform: str,
+    schema_name: str,
+    resource_type: str,
+    start_date,
+    end_date,
+    resource_id: str,
+    recommendation: Dict[str, Any]
+) -> bool:
+    """
+    Save one resource's recommendation (synchronous, for bulk analysis threads).
+    Stored in the same shape and under the same key as a single-resource request.
+    """
+    try:
+        hash_key = generate_cache_hash_key(cloud_platform, schema_name, resource_type, start_date, end_date, resource_id)
+        with get_sync_redis_client().pipeline(transaction=False) as pipe:
+            _queue_setex(
+                pipe, hash_key, CACHE_TTL_SECONDS, [recommendation],
+                _index_keys(cloud_platform, schema_name, resource_type, resource_id)
+            )
+            # Bulk entries assembled from this resource are now stale in every L1
+            pipe.publish(L1_INVALIDATION_CHANNEL, orjson.dumps([hash_key]))
+            pipe.execute()
+        return True
+    except Exception as e:
+        print(f"⚠️ Error saving per-resource cache entry: {e}")
+        return False
+
+
 async def save_to_cache(
     hash_key: str,
     cloud_platform: str,
@@ -114,6 +583,8 @@ async def save_to_cache(
 ) -> bool:
     """
     Save LLM result to Redis cache with 24-hour TTL.
+    Bulk results (resource_id=None) are split into per-resource entries plus a
+    manifest under `hash_key`, written in one pipeline.
 
     Args:
         hash_key: The MD5 hash key (with namespace prefix)
@@ -131,11 +602,38 @@ async def save_to_cache(
     try:
         client = await get_redis_client()
 
-        # Serialize to JSON
-        json_data = json.dumps(output_json).encode('utf-8')
+        if resource_id is None and all(isinstance(r, dict) and r.get('resource_id') for r in output_json):
+            # Bulk result: store one entry per resource plus a manifest of their keys
+            member_keys = []
+            async with client.pipeline(transaction=False) as pipe:
+                for recommendation in output_json:
+                    member_key = generate_cache_hash_key(
+                        cloud_platform, schema_name, resource_type,
+                        start_date, end_date, str(recommendation['resource_id'])
+                    )
+                    member_keys.append(member_key)
+                    _queue_setex(
+                        pipe, member_key, CACHE_TTL_SECONDS, [recommendation],
+                        _index_keys(cloud_platform, schema_name, resource_type, str(recommendation['resource_id']))
+                    )
+                _queue_setex(
+                    pipe, hash_key, CACHE_TTL_SECONDS, {MANIFEST_FIELD: member_keys},
+                    _index_keys(cloud_platform, schema_name, resource_type)
+                )
+                await pipe.execute()
+            await _publish_invalidation(client, member_keys + [hash_key])
+
+            print(f"💾 Redis Cache SAVED {len(member_keys)} resources for hash_key: {hash_key[:20]}... (TTL: 24h)")
+            return True
 
-        # Save to Redis with TTL (EX = expire in seconds)
-        await client.setex(hash_key, CACHE_TTL_SECONDS, json_data)
+        # Serialize (orjson, compressed above threshold) and save with TTL
+        async with client.pipeline(transaction=False) as pipe:
+            _queue_setex(
+                pipe, hash_key, CACHE_TTL_SECONDS, output_json,
+                _index_keys(cloud_platform, schema_name, resource_type, resource_id)
+            )
+            await pipe.execute()
+        await _publish_invalidation(client, [hash_key])
 
         print(f"💾 Redis Cache SAVED for hash_key: {hash_key[:20]}... (TTL: 24h)")
         return True
@@ -147,69 +645,420 @@ async def save_to_cache(
 async def clear_cache_for_resource(
     cloud_platform: str,
     schema_name: str,
-    resource_type: str,
+    resource_type: Optional[str] = None,
     resource_id: Optional[str] = None
 ) -> int:
     """
     Clear cache entries matching the given criteria.
-    Uses Redis SCAN to find matching keys without blocking.
+    Keys are looked up in the secondary index written by save_to_cache, so only
+    entries of this schema (and resource type / resource, when given) are deleted,
+    together with the fingerprint entries (raw LLM answers) indexed for them.
+    Bulk entries that include a cleared resource become misses on their own,
+    because their manifest can no longer be fully assembled.
 
     Args:
         cloud_platform: Cloud platform
         schema_name: Schema/project name
-        resource_type: Resource type
-        resource_id: Specific resource ID (optional)
+        resource_type: Resource type (optional, clears the whole schema when omitted)
+        resource_id: Specific resource ID (optional, requires resource_type)
 
     Returns:
         Number of keys deleted
+
+    Raises:
+        ValueError: resource_id given without resource_type (resource indexes are per type)
     """
+    if resource_id and not resource_type:
+        raise ValueError("resource_type is required to clear the cache of a single resource")
+
     try:
         client = await get_redis_client()
+        index_key = _index_key(cloud_platform, schema_name, resource_type, resource_id)
+
+        fingerprint_index_key = _fingerprint_index_key(index_key)
 
-        # Build pattern for scanning
-        # Since our hash includes dates, we need to scan all llm_cache keys
-        # and check if they match our criteria by regenerating potential keys
-        pattern = "llm_cache:*"
+        # Drop index members whose entries already expired
+        now = time.time()
+        await client.zremrangebyscore(index_key, "-inf", now)
+        await client.zremrangebyscore(fingerprint_index_key, "-inf", now)
+        keys = [member.decode('utf-8') for member in await client.zrange(index_key, 0, -1)]
+        fingerprints = [member.decode('utf-8') for member in await client.zrange(fingerprint_index_key, 0, -1)]
 
         deleted_count = 0
-        async for key in client.scan_iter(match=pattern, count=100):
-            # For simplicity, delete all matching the base pattern
-            # In production, you might want more granular control
-            await client.delete(key)
-            deleted_count += 1
+        for members, namespace_index in ((keys, INDEX_ALL_KEY), (fingerprints, FINGERPRINT_INDEX_KEY)):
+            for start in range(0, len(members), INVALIDATION_BATCH_SIZE):
+                batch = members[start:start + INVALIDATION_BATCH_SIZE]
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.delete(*batch)
+                    pipe.zrem(namespace_index, *batch)
+                    results = await pipe.execute()
+                deleted_count += results[0]
+        await client.delete(index_key, fingerprint_index_key)
+
+        if keys:
+            await _publish_invalidation(client, keys)
 
-        print(f"🗑️ Cleared {deleted_count} Redis cache entries matching pattern: {pattern}")
+        print(f"🗑️ Cleared {deleted_count} Redis cache entries for index: {index_key}")
         return deleted_count
     except Exception as e:
         print(f"⚠️ Error clearing Redis cache: {e}")
         return 0
 
 
+async def _current_usage(client: redis.Redis, index_key: str) -> Dict[str, Any]:
+    """
+    Live keys of a namespace and the memory they hold now, estimated from
+    MEMORY USAGE of up to STATS_SAMPLE_SIZE random keys of its index.
+    """
+    # Drop index members whose entries already expired
+    await client.zremrangebyscore(index_key, "-inf", time.time())
+    indexed = await client.zcard(index_key)
+    sample = await client.zrandmember(index_key, STATS_SAMPLE_SIZE) if indexed else []
+
+    sizes = []
+    if sample:
+        async with client.pipeline(transaction=False) as pipe:
+            for key in sample:
+                pipe.memory_usage(key)
+            sizes = await pipe.execute()
+    # Members whose entry is already gone (deleted, not yet pruned) report None
+    present = [size for size in sizes if size]
+    live_ratio = len(present) / len(sample) if sample else 0
+    average = sum(present) / len(present) if present else 0
+
+    return {
+        "keys": indexed,
+        "bytes": round(indexed * live_ratio * average),
+        "sampled_keys": len(sample),
+    }
+
+
 async def get_cache_stats() -> Dict[str, Any]:
     """
     Get Redis cache statistics.
 
+    Per namespace, `current` is what the live entries hold now (keys and bytes,
+    estimated from a sample) and `cumulative_writes` counts every write since
+    the counters were created, including entries that have since expired or
+    been invalidated.
+
     Returns:
         Dictionary with cache stats (keys count, memory usage, etc.)
     """
     try:
         client = await get_redis_client()
 
-        # Count llm_cache keys
-        keys_count = 0
-        async for _ in client.scan_iter(match="llm_cache:*", count=100):
-            keys_count += 1
-
         # Get Redis info
         info = await client.info('memory')
 
+        namespaces: Dict[str, Dict[str, Any]] = {}
+        for namespace, index_key in NAMESPACE_INDEXES.items():
+            namespaces[namespace] = {"current": await _current_usage(client, index_key)}
+
+        # Cumulative write counters: {"llm_cache": {"writes": .., "raw_bytes": .., "stored_bytes": ..}}
+        cumulative: Dict[str, Dict[str, Any]] = {}
+        for field, value in (await client.hgetall(STATS_KEY)).items():
+            namespace, _, counter = field.decode('utf-8').rpartition(':')
+            cumulative.setdefault(namespace, {})[counter] = int(value)
+        for namespace, counters in cumulative.items():
+            raw_bytes = counters.get("raw_bytes", 0)
+            counters["compression_ratio"] = round(counters.get("stored_bytes", 0) / raw_bytes, 3) if raw_bytes else None
+            namespaces.setdefault(namespace, {})["cumulative_writes"] = counters
+
         return {
-            "cache_keys_count": keys_count,
+            "cache_keys_count": namespaces["llm_cache"]["current"]["keys"],
             "memory_used_bytes": info.get('used_memory', 0),
             "memory_used_human": info.get('used_memory_human', 'N/A'),
             "ttl_seconds": CACHE_TTL_SECONDS,
-            "ttl_hours": CACHE_TTL_SECONDS / 3600
+            "ttl_hours": CACHE_TTL_SECONDS / 3600,
+            "namespaces": namespaces,
+            "l1": get_l1_cache_stats()
         }
     except Exception as e:
         print(f"⚠️ Error getting Redis cache stats: {e}")
         return {"error": str(e)}
+
+
+# ============================================================
+# SINGLE-FLIGHT DE-DUPLICATION OF CACHE MISSES
+# ============================================================
+
+def _singleflight_lock_key(hash_key: str) -> str:
+    """Redis key of the single-flight lock for a cache hash key."""
+    return f"llm_lock:{hash_key.split(':', 1)[-1]}"
+
+
+def _singleflight_backoff(attempt: int) -> float:
+    """Seconds to sleep before the next poll / retry (exponential, capped)."""
+    return min(SINGLEFLIGHT_POLL_SECONDS * (2 ** attempt), SINGLEFLIGHT_MAX_POLL_SECONDS)
+
+
+async def acquire_singleflight_lock(hash_key: str, owner: str) -> Optional[bool]:
+    """
+    Try to become the single caller computing `hash_key`.
+
+    Args:
+        hash_key: The cache hash key (with namespace prefix)
+        owner: Lock owner, normally the task_id of the caller
+
+    Returns:
+        True if the lock was acquired, False if another caller holds it,
+        None if Redis could not be asked (the caller retries with backoff)
+    """
+    try:
+        client = await get_redis_client()
+        acquired = await client.set(
+            _singleflight_lock_key(hash_key), owner,
+            nx=True, ex=SINGLEFLIGHT_LOCK_TTL_SECONDS
+        )
+        return bool(acquired)
+    except Exception as e:
+        print(f"⚠️ Error acquiring single-flight lock: {e}")
+        return None
+
+
+async def release_singleflight_lock(hash_key: str, owner: str) -> None:
+    """Release the lock if still owned; waiters notice on their next poll."""
+    try:
+        client = await get_redis_client()
+        await client.eval(_RELEASE_LOCK_SCRIPT, 1, _singleflight_lock_key(hash_key), owner)
+    except Exception as e:
+        print(f"⚠️ Error releasing single-flight lock: {e}")
+
+
+async def _keep_singleflight_lock_alive(hash_key: str, owner: str) -> None:
+    """Heartbeat that extends the lock TTL while the owner is still computing."""
+    client = await get_redis_client()
+    lock_key = _singleflight_lock_key(hash_key)
+    while True:
+        await asyncio.sleep(SINGLEFLIGHT_HEARTBEAT_SECONDS)
+        try:
+            extended = await client.eval(_EXTEND_LOCK_SCRIPT, 1, lock_key, owner, SINGLEFLIGHT_LOCK_TTL_SECONDS)
+            if not extended:
+                print(f"⚠️ Lost single-flight lock for {hash_key[:20]}...")
+                return
+        except Exception as e:
+            print(f"⚠️ Error extending single-flight lock: {e}")
+
+
+async def wait_for_singleflight_result(
+    hash_key: str,
+    waiter_task_id: Optional[str] = None,
+    timeout: float = SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Wait for the current lock holder to publish its result into the cache.
+
+    Polls the cache and lock keys with backoff; pooled connections are only
+    borrowed for each poll, so any number of waiters share the Redis pool.
+
+    Returns:
+        The cached result as soon as it is there. None when the holder finished
+        without caching a result (error, cancellation), its lock expired, the
+        holder's or the waiter's task was cancelled, or the timeout elapsed.
+
+    Raises:
+        The last Redis error after SINGLEFLIGHT_MAX_REDIS_ERRORS consecutive failures
+    """
+    from app.core.task_manager import task_manager
+
+    lock_key = _singleflight_lock_key(hash_key)
+    deadline = time.monotonic() + timeout
+    polls = 0
+    errors = 0
+
+    while time.monotonic() < deadline:
+        try:
+            client = await get_redis_client()
+            output_json = await _read_cached(client, hash_key)
+            if output_json is not None:
+                print(f"✅ Single-flight result ready for hash_key: {hash_key[:20]}...")
+                return output_json
+
+            holder = await client.get(lock_key)
+            if holder is None:
+                # Holder finished (or crashed and the lock expired) without caching
+                return None
+            holder = holder.decode('utf-8')
+            if task_manager.is_cancelled(holder):
+                # A cancelled holder never caches its result - free the lock for a waiter
+                print(f"🛑 Single-flight holder for {hash_key[:20]}... was cancelled")
+                await client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, holder)
+                return None
+            errors = 0
+        except Exception as e:
+            errors += 1
+            print(f"⚠️ Error polling single-flight result ({errors}/{SINGLEFLIGHT_MAX_REDIS_ERRORS}): {e}")
+            if errors >= SINGLEFLIGHT_MAX_REDIS_ERRORS:
+                raise
+
+        if waiter_task_id and task_manager.is_cancelled(waiter_task_id):
+            print(f"🛑 Task {waiter_task_id[:8]}... cancelled while waiting on single-flight")
+            return None
+
+        await asyncio.sleep(min(_singleflight_backoff(polls), max(deadline - time.monotonic(), 0)))
+        polls += 1
+
+    print(f"⏱️ Timed out waiting on single-flight for hash_key: {hash_key[:20]}...")
+    return None
+
+
+async def run_single_flight(
+    hash_key: str,
+    owner: Optional[str],
+    compute: Callable[[], Awaitable[List[Dict[str, Any]]]]
+) -> List[Dict[str, Any]]:
+    """
+    Compute a cache miss at most once across all workers.
+
+    The first caller takes the Redis lock and runs `compute` (which is expected
+    to save its result with save_to_cache). Later callers wait for that result
+    instead of starting their own run. If the holder finishes without a result,
+    a waiter takes over the lock and computes it.
+
+    Redis errors are retried with backoff; only after
+    SINGLEFLIGHT_MAX_REDIS_ERRORS consecutive failures is Redis treated as
+    unreachable and `compute` run without the lock.
+
+    Args:
+        hash_key: The cache hash key (with namespace prefix)
+        owner: task_id of the caller (used for cancellation checks)
+        compute: Coroutine function producing (and caching) the result
+
+    Returns:
+        The computed or shared result list ([] if the caller was cancelled)
+    """
+    from app.core.task_manager import task_manager
+
+    owner = owner or str(uuid.uuid4())
+    deadline = time.monotonic() + SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS
+    errors = 0
+
+    while True:
+        acquired = await acquire_singleflight_lock(hash_key, owner)
+        if acquired:
+            heartbeat = asyncio.create_task(_keep_singleflight_lock_alive(hash_key, owner))
+            try:
+                return await compute()
+            finally:
+                heartbeat.cancel()
+                await release_singleflight_lock(hash_key, owner)
+
+        result = None
+        if acquired is None:
+            errors += 1
+        else:
+            errors = 0
+            print(f"⏳ Another worker is computing hash_key: {hash_key[:20]}... - waiting for its result")
+            try:
+                result = await wait_for_singleflight_result(
+                    hash_key, waiter_task_id=owner, timeout=max(deadline - time.monotonic(), 0)
+                )
+            except Exception:
+                errors += 1
+
+        if result is not None:
+            return result
+        if task_manager.is_cancelled(owner):
+            return []
+        if errors >= SINGLEFLIGHT_MAX_REDIS_ERRORS:
+            # Nothing to coordinate on - compute without the lock
+            print(f"⚠️ Redis unreachable, computing hash_key: {hash_key[:20]}... without single-flight")
+            return await compute()
+        if time.monotonic() >= deadline:
+            # Holder is still alive but far too slow - compute without the lock
+            return await compute()
+        if errors:
+            await asyncio.sleep(_singleflight_backoff(errors))
+
+
+# ============================================================
+# INPUT-FINGERPRINT (CONTENT-ADDRESSED) CACHE
+# ============================================================
+
+def generate_prompt_fingerprint(prompt: str) -> str:
+    """
+    Fingerprint the normalized LLM input.
+    The prompt already contains exactly the inputs that drive the answer (metric
+    aggregates, billed cost, pricing context, period length); timestamps are
+    masked and whitespace collapsed so a rolling window over unchanged data
+    produces the same key.
+    """
+    normalized = _TIMESTAMP_PATTERN.sub("<ts>", prompt or "")
+    normalized = " ".join(normalized.split())
+    return f"llm_fp:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+
+def get_fingerprint_result(fingerprint: str) -> Optional[str]:
+    """Return the cached raw LLM response for a fingerprint (synchronous)."""
+    if not FINGERPRINT_CACHE_ENABLED:
+        return None
+    try:
+        cached = get_sync_redis_client().get(fingerprint)
+        return _decode_bytes(cached).decode('utf-8') if cached else None
+    except Exception as e:
+        print(f"⚠️ Error reading fingerprint cache: {e}")
+        return None
+
+
+def save_fingerprint_result(fingerprint: str, response_text: str, index_keys: Optional[List[str]] = None) -> None:
+    """
+    Store a raw LLM response under its input fingerprint (synchronous).
+
+    Args:
+        index_keys: fingerprint_index_keys() of the analysed resource, if known
+    """
+    if not FINGERPRINT_CACHE_ENABLED or not response_text:
+        return
+    try:
+        payload = response_text.encode('utf-8')
+        encoded = _encode_bytes(payload)
+        with get_sync_redis_client().pipeline(transaction=False) as pipe:
+            pipe.setex(fingerprint, FINGERPRINT_TTL_SECONDS, encoded)
+            _count_bytes(pipe, fingerprint, len(payload), len(encoded))
+            now = time.time()
+            pipe.zremrangebyscore(FINGERPRINT_INDEX_KEY, "-inf", now)
+            pipe.zadd(FINGERPRINT_INDEX_KEY, {fingerprint: now + FINGERPRINT_TTL_SECONDS})
+            pipe.expire(FINGERPRINT_INDEX_KEY, FINGERPRINT_TTL_SECONDS)
+            for index_key in index_keys or []:
+                pipe.zadd(index_key, {fingerprint: now + FINGERPRINT_TTL_SECONDS})
+                pipe.expire(index_key, FINGERPRINT_TTL_SECONDS)
+            pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Error saving fingerprint cache: {e}")
+
+
+async def get_fingerprint_result_async(fingerprint: str) -> Optional[str]:
+    """Async variant of get_fingerprint_result."""
+    if not FINGERPRINT_CACHE_ENABLED:
+        return None
+    try:
+        client = await get_redis_client()
+        cached = await client.get(fingerprint)
+        return _decode_bytes(cached).decode('utf-8') if cached else None
+    except Exception as e:
+        print(f"⚠️ Error reading fingerprint cache: {e}")
+        return None
+
+
+async def save_fingerprint_result_async(fingerprint: str, response_text: str, index_keys: Optional[List[str]] = None) -> None:
+    """Async variant of save_fingerprint_result."""
+    if not FINGERPRINT_CACHE_ENABLED or not response_text:
+        return
+    try:
+        client = await get_redis_client()
+        payload = response_text.encode('utf-8')
+        encoded = _encode_bytes(payload)
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.setex(fingerprint, FINGERPRINT_TTL_SECONDS, encoded)
+            _count_bytes(pipe, fingerprint, len(payload), len(encoded))
+            now = time.time()
+            pipe.zremrangebyscore(FINGERPRINT_INDEX_KEY, "-inf", now)
+            pipe.zadd(FINGERPRINT_INDEX_KEY, {fingerprint: now + FINGERPRINT_TTL_SECONDS})
+            pipe.expire(FINGERPRINT_INDEX_KEY, FINGERPRINT_TTL_SECONDS)
+            for index_key in index_keys or []:
+                pipe.zadd(index_key, {fingerprint: now + FINGERPRINT_TTL_SECONDS})
+                pipe.expire(index_key, FINGERPRINT_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Error saving fingerprint cache: {e}")
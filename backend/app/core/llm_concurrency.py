@@ -0,0 +1,360 @@
+# app/core/llm_concurrency.py
+
+"""
+Bounded-concurrency engine for bulk ("all resources") LLM analysis.
+
+Three pieces live here:
+- A token-bucket rate limiter driven by the Azure OpenAI deployment quota
+  (requests-per-minute and tokens-per-minute). `llm_call` acquires from it
+  before every request instead of sleeping a fixed delay. The quota belongs to
+  the deployment, not to a process, so the buckets live in Redis and every API
+  worker and Celery worker draws from the same budget. While Redis is
+  unreachable each process falls back to a local bucket holding
+  1/LLM_RATE_LIMIT_PROCESSES of the quota.
+- `run_bulk_llm`, which fans a list of resources out over a bounded thread
+  pool, checks task cancellation between completions and returns results in
+  input order (skipping resources that produced no recommendation).
+- `run_in_llm_executor`, which lets async FastAPI endpoints hand blocking
+  analysis work (psycopg2, pandas, synchronous LLM calls) to a dedicated,
+  bounded thread pool so the event loop keeps serving other requests.
+"""
+
+import os
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Deployment quota (see Azure OpenAI "Quotas" blade for the deployment)
+AZURE_OPENAI_RPM = int(os.getenv("AZURE_OPENAI_RPM", "60"))
+AZURE_OPENAI_TPM = int(os.getenv("AZURE_OPENAI_TPM", "60000"))
+
+# Number of resources analyzed in parallel by a single bulk run
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# Number of blocking analysis requests a single API worker runs at once;
+# further cache misses queue here instead of stalling the event loop
+LLM_ENDPOINT_WORKERS = int(os.getenv("LLM_ENDPOINT_WORKERS", "4"))
+
+# Rough prompt size estimate used when reserving TPM budget
+CHARS_PER_TOKEN = 4
+
+# "redis": one budget shared by every process; "local": per-process buckets
+LLM_RATE_LIMIT_BACKEND = os.getenv("LLM_RATE_LIMIT_BACKEND", "redis").lower()
+# Processes sharing the deployment (API workers + Celery concurrency); the
+# local buckets get quota / LLM_RATE_LIMIT_PROCESSES so their sum stays within it
+LLM_RATE_LIMIT_PROCESSES = max(1, int(os.getenv("LLM_RATE_LIMIT_PROCESSES", "1")))
+# After a Redis error, use the local buckets for this long before retrying Redis
+LLM_RATE_LIMIT_REDIS_RETRY_SECONDS = 30.0
+
+# Refill-and-take on a Redis hash {tokens, ts}, using the server clock so all
+# processes agree. ARGV: capacity, refill rate (tokens/s), amount (-1 drains).
+# Returns the seconds to wait before retrying (0 when the tokens were taken).
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local wait = 0
+if amount < 0 then
+    tokens = 0
+elseif tokens >= amount then
+    tokens = tokens - amount
+else
+    wait = (amount - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Holds up to `capacity` tokens and refills at
+    `capacity / period_seconds` tokens per second.
+    """
+
+    def __init__(self, capacity: float, period_seconds: float = 60.0):
+        self.capacity = float(capacity)
+        self.refill_rate = self.capacity / period_seconds
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_rate)
+        self._last_refill = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Block until `amount` tokens are available, then take them.
+        Requests larger than the bucket are clamped to its capacity.
+
+        Returns:
+            Total seconds spent waiting
+        """
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                wait_time = (amount - self._tokens) / self.refill_rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def drain(self):
+        """Empty the bucket, e.g. after the service answered 429."""
+        with self._lock:
+            self._refill()
+            self._tokens = 0.0
+
+
+class RedisTokenBucket:
+    """
+    Token bucket kept in Redis, shared by every process using the same key.
+    Falls back to `local` (a per-process TokenBucket) while Redis is unreachable.
+    """
+
+    def __init__(self, key: str, capacity: float, local: TokenBucket, period_seconds: float = 60.0):
+        self.key = key
+        self.capacity = float(capacity)
+        self.refill_rate = self.capacity / period_seconds
+        self.local = local
+        self._redis_down_until = 0.0
+        self._script = None
+
+    def _run(self, amount: float) -> Optional[float]:
+        # Seconds to wait (0.0 = taken), or None when Redis is unavailable
+        if time.monotonic() < self._redis_down_until:
+            return None
+        try:
+            if self._script is None:
+                from app.core.llm_cache_utils import get_sync_redis_client
+                self._script = get_sync_redis_client().register_script(_TOKEN_BUCKET_SCRIPT)
+            return float(self._script(keys=[self.key], args=[self.capacity, self.refill_rate, amount]))
+        except Exception as e:
+            print(f"⚠️ Redis rate limiter unavailable, using the local {self.key} bucket: {e}")
+            self._redis_down_until = time.monotonic() + LLM_RATE_LIMIT_REDIS_RETRY_SECONDS
+            return None
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Block until `amount` tokens are available in the shared bucket, then take them.
+
+        Returns:
+            Total seconds spent waiting
+        """
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            wait_time = self._run(amount)
+            if wait_time is None:
+                return waited + self.local.acquire(amount)
+            if wait_time <= 0:
+                return waited
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def drain(self):
+        """Empty the bucket for every process, e.g. after the service answered 429."""
+        if self._run(-1) is None:
+            self.local.drain()
+
+
+class LLMRateLimiter:
+    """
+    RPM/TPM limiter for the Azure OpenAI deployment, shared by all processes
+    through Redis (see LLM_RATE_LIMIT_BACKEND).
+    One request token plus an estimated number of model tokens is reserved per call.
+    """
+
+    def __init__(
+        self,
+        rpm: int = AZURE_OPENAI_RPM,
+        tpm: int = AZURE_OPENAI_TPM,
+        backend: str = LLM_RATE_LIMIT_BACKEND,
+        processes: int = LLM_RATE_LIMIT_PROCESSES
+    ):
+        local_requests = TokenBucket(max(1.0, rpm / processes))
+        local_tokens = TokenBucket(max(1.0, tpm / processes))
+        if backend == "redis":
+            deployment = os.getenv("AZURE_DEPLOYMENT_NAME", "default")
+            self.requests = RedisTokenBucket(f"llm_rate:{deployment}:requests", rpm, local_requests)
+            self.tokens = RedisTokenBucket(f"llm_rate:{deployment}:tokens", tpm, local_tokens)
+        else:
+            self.requests = local_requests
+            self.tokens = local_tokens
+
+    @staticmethod
+    def estimate_tokens(prompt: str, max_tokens: int = 0) -> int:
+        """Estimate prompt + completion tokens for a request."""
+        return len(prompt or "") // CHARS_PER_TOKEN + max_tokens
+
+    def acquire(self, prompt: str, max_tokens: int = 0) -> float:
+        """Block until the deployment quota allows one more request of this size."""
+        waited = self.requests.acquire(1)
+        waited += self.tokens.acquire(self.estimate_tokens(prompt, max_tokens))
+        return waited
+
+    def throttle(self):
+        """Called on HTTP 429 so that every thread backs off together."""
+        self.requests.drain()
+
+
+# Global singleton shared by every thread in this process (and, through Redis, by every process)
+rate_limiter = LLMRateLimiter()
+
+
+def run_bulk_llm(
+    items: List[Dict[str, Any]],
+    worker: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+    task_id: Optional[str] = None,
+    label: str = "resource",
+    id_key: str = "resource_id",
+    max_workers: Optional[int] = None,
+    cache_scope: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run `worker` over every item with bounded concurrency.
+    With `cache_scope`, resources that already have a per-resource cache entry are
+    served from Redis (one MGET) and only the missing ones go to the LLM.
+
+    Args:
+        items: Resource rows (dicts) to analyze
+        worker: Function producing a recommendation dict (or None) for one row
+        task_id: Optional task ID; checked between completions for cancellation
+        label: Human readable resource label for logging (e.g. "VM")
+        id_key: Key in each row identifying the resource (logging and cache keys)
+        max_workers: Override for LLM_MAX_CONCURRENCY
+        cache_scope: Optional dict with cloud_platform, schema_name, resource_type,
+            start_date and end_date identifying per-resource cache entries
+
+    Returns:
+        List of non-empty recommendations, in the same order as `items`
+    """
+    total = len(items)
+    if total == 0:
+        return []
+
+    if task_id:
+        from app.core.task_manager import task_manager
+
+        def cancelled() -> bool:
+            return task_manager.is_cancelled(task_id)
+    else:
+        def cancelled() -> bool:
+            return False
+
+    cached: Dict[str, Dict[str, Any]] = {}
+    if cache_scope:
+        from app.core.llm_cache_utils import get_cached_resources, save_resource_to_cache
+        resource_ids = [str(item[id_key]) for item in items if item.get(id_key)]
+        cached = get_cached_resources(resource_ids=resource_ids, **cache_scope)
+
+    cancel_event = threading.Event()
+
+    def _run_one(idx: int, item: Dict[str, Any]):
+        resource_id = item.get(id_key, 'Unknown')
+        # Skip queued work once the task has been cancelled
+        if cancel_event.is_set():
+            return idx, None
+        print(f"  [{idx + 1}/{total}] Processing {label}: {resource_id}")
+        try:
+            recommendation = worker(item)
+        except Exception as e:
+            print(f"    ❌ Error processing {resource_id}: {e}")
+            return idx, None
+        if recommendation:
+            print(f"    ✅ LLM analysis complete for {resource_id}")
+            if cache_scope and item.get(id_key):
+                save_resource_to_cache(resource_id=str(item[id_key]), recommendation=recommendation, **cache_scope)
+        else:
+            print(f"    ⚠️ No recommendation generated for {resource_id}")
+        return idx, recommendation
+
+    results: List[Optional[Dict[str, Any]]] = [None] * total
+    pending = []
+    for idx, item in enumerate(items):
+        hit = cached.get(str(item.get(id_key)))
+        if hit:
+            results[idx] = hit
+        else:
+            pending.append((idx, item))
+
+    if not pending:
+        print(f"✅ All {total} {label} resources served from per-resource cache")
+        return [r for r in results if r]
+
+    workers = max(1, min(max_workers or LLM_MAX_CONCURRENCY, len(pending)))
+    completed = total - len(pending)
+
+    print(f"⚙️ Analyzing {len(pending)}/{total} {label} resource(s) with concurrency={workers}")
+
+    if cancelled():
+        print(f"🛑 Task {task_id} was cancelled before {label} analysis could start.")
+        return []
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-bulk")
+    try:
+        futures = [executor.submit(_run_one, idx, item) for idx, item in pending]
+        for future in as_completed(futures):
+            idx, recommendation = future.result()
+            results[idx] = recommendation
+            completed += 1
+
+            if cancelled():
+                cancel_event.set()
+                print(f"🛑 Task {task_id} was cancelled. Stopping {label} analysis. Processed {completed}/{total}")
+                break
+    finally:
+        # Do not wait for in-flight calls when cancelled; drop anything still queued
+        executor.shutdown(wait=not cancel_event.is_set(), cancel_futures=True)
+
+    recommendations = [r for r in results if r]
+    print(f"✅ Completed processing {len(recommendations)}/{total} {label} resources successfully")
+    return recommendations
+
+
+# Dedicated pool for blocking work started from the API (created lazily)
+_endpoint_executor = None
+_endpoint_executor_lock = threading.Lock()
+
+
+def get_llm_executor() -> ThreadPoolExecutor:
+    """Get the bounded executor used by the /llm endpoints."""
+    global _endpoint_executor
+
+    if _endpoint_executor is None:
+        with _endpoint_executor_lock:
+            if _endpoint_executor is None:
+                _endpoint_executor = ThreadPoolExecutor(
+                    max_workers=LLM_ENDPOINT_WORKERS,
+                    thread_name_prefix="llm-endpoint",
+                )
+    return _endpoint_executor
+
+
+async def run_in_llm_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking function on the dedicated LLM executor and await its result
+    without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_llm_executor(), functools.partial(func, *args, **kwargs))
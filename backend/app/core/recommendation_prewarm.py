@@ -15,7 +15,7 @@ from typing import List, Tuple, Dict, Any
 # Setup path for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from app.core.llm_cache_utils import generate_cache_hash_key, save_to_cache, get_cached_result
+from app.core.llm_cache_utils import generate_cache_hash_key, save_to_cache, get_cached_result, run_single_flight
 from app.ingestion.azure.llm_data_fetch import run_llm_analysis
 from app.ingestion.aws.llm_s3_integration import run_llm_analysis_s3
 from app.ingestion.aws.llm_ec2_integration import run_llm_analysis as run_llm_analysis_ec2
@@ -119,31 +119,40 @@ async def prewarm_azure_recommendations_async(schema_name: str, budget: float =
             print(f"  [{completed_tasks}/{total_tasks}] 🔄 {range_name:15} - Generating recommendations...")
 
             try:
-                # Call LLM analysis for ALL resources of this type (resource_id=None)
-                result = run_llm_analysis(
-                    resource_type=resource_type,
-                    schema_name=schema_name,
-                    start_date=start_date,
-                    end_date=end_date,
-                    resource_id=None,  # None = fetch all resources
-                    task_id=None
-                )
-
-                # Convert to list if needed
-                result_list = [result] if isinstance(result, dict) else result if result else []
-
-                if result_list:
-                    # Save to cache
-                    await save_to_cache(
-                        hash_key=hash_key,
-                        cloud_platform="azure",
-                        schema_name=schema_name,
+                async def _generate():
+                    # Call LLM analysis for ALL resources of this type (resource_id=None)
+                    # in a thread so the single-flight lock heartbeat keeps running
+                    result = await asyncio.to_thread(
+                        run_llm_analysis,
                         resource_type=resource_type,
-                        start_date=start_date.date(),
-                        end_date=end_date.date(),
-                        resource_id=None,
-                        output_json=result_list
+                        schema_name=schema_name,
+                        start_date=start_date,
+                        end_date=end_date,
+                        resource_id=None,  # None = fetch all resources
+                        task_id=None
                     )
+
+                    # Convert to list if needed
+                    result_list = [result] if isinstance(result, dict) else result if result else []
+
+                    if result_list:
+                        # Save to cache
+                        await save_to_cache(
+                            hash_key=hash_key,
+                            cloud_platform="azure",
+                            schema_name=schema_name,
+                            resource_type=resource_type,
+                            start_date=start_date.date(),
+                            end_date=end_date.date(),
+                            resource_id=None,
+                            output_json=result_list
+                        )
+                    return result_list
+
+                # Shares the run with any user request computing the same key
+                result_list = await run_single_flight(hash_key, None, _generate)
+
+                if result_list:
                     print(f"       ✅ Generated and cached {len(result_list)} recommendations")
                     generated_tasks += 1
                 else:
@@ -246,42 +255,53 @@ async def prewarm_aws_recommendations_async(schema_name: str, monthly_budget: fl
             # Generate recommendations
             print(f"  [{completed_tasks}/{total_tasks}] 🔄 {range_name:15} - Generating recommendations...")
 
-            try:
-                # Call appropriate LLM analysis function based on resource type
-                if resource_type == "ec2":
-                    result = run_llm_analysis_ec2(
-                        resource_type="ec2",
-                        schema_name=schema_name,
-                        start_date=start_date,
-                        end_date=end_date,
-                        resource_id=None  # None = fetch all instances
-                    )
-                elif resource_type == "s3":
-                    result = run_llm_analysis_s3(
-                        schema_name=schema_name,
-                        start_date=start_date,
-                        end_date=end_date,
-                        bucket_name=None  # None = fetch all buckets
-                    )
-                else:
-                    print(f"       ⚠️  Unsupported resource type: {resource_type}")
-                    continue
+            if resource_type not in ("ec2", "s3"):
+                print(f"       ⚠️  Unsupported resource type: {resource_type}")
+                continue
 
-                # Convert to list if needed
-                result_list = [result] if isinstance(result, dict) else result if result else []
+            try:
+                async def _generate():
+                    # Call appropriate LLM analysis function based on resource type,
+                    # in a thread so the single-flight lock heartbeat keeps running
+                    if resource_type == "ec2":
+                        result = await asyncio.to_thread(
+                            run_llm_analysis_ec2,
+                            resource_type="ec2",
+                            schema_name=schema_name,
+                            start_date=start_date,
+                            end_date=end_date,
+                            resource_id=None  # None = fetch all instances
+                        )
+                    else:
+                        result = await asyncio.to_thread(
+                            run_llm_analysis_s3,
+                            schema_name=schema_name,
+                            start_date=start_date,
+                            end_date=end_date,
+                            bucket_name=None  # None = fetch all buckets
+                        )
+
+                    # Convert to list if needed
+                    result_list = [result] if isinstance(result, dict) else result if result else []
+
+                    if result_list:
+                        # Save to cache
+                        await save_to_cache(
+                            hash_key=hash_key,
+                            cloud_platform="aws",
+                            schema_name=schema_name,
+                            resource_type=resource_type,
+                            start_date=start_date.date(),
+                            end_date=end_date.date(),
+                            resource_id=None,
+                            output_json=result_list
+                        )
+                    return result_list
+
+                # Shares the run with any user request computing the same key
+                result_list = await run_single_flight(hash_key, None, _generate)
 
                 if result_list:
-                    # Save to cache
-                    await save_to_cache(
-                        hash_key=hash_key,
-                        cloud_platform="aws",
-                        schema_name=schema_name,
-                        resource_type=resource_type,
-                        start_date=start_date.date(),
-                        end_date=end_date.date(),
-                        resource_id=None,
-                        output_json=result_list
-                    )
                     print(f"       ✅ Generated and cached {len(result_list)} recommendations")
                     generated_tasks += 1
                 else:
@@ -0,0 +1,197 @@
+# app/ingestion/arrow_rows.py
+
+"""
+Arrow-native preparation of billing export files for loading.
+
+The parquet path used to convert the whole file to pandas, run
+`df.applymap(lambda x: str(x) if isinstance(x, list) else x)` (one Python
+call per cell), `drop_duplicates` on every column, `fillna("")` and a row-wise
+MD5. Here the file stays a pyarrow Table:
+
+- nested columns (list / struct / map) are found from the schema and only
+  those are serialized to text (maps, the tag columns of the exports,
+  column-wise);
+- every column is rendered to the strings the legacy hash used (str(value)
+  after fillna("")) with columnar kernels, concatenated per row by Arrow and
+  digested once per row, so hash_keys stay identical to the pandas path;
+- duplicates are dropped on the hash_key, and empty strings become NULL like
+  in bulk_load, before the table is handed to the COPY loader.
+
+Types without a columnar rendering that matches str() (decimals, dates,
+sub-second or non-UTC timestamps) fall back to str() on that column only.
+"""
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app.ingestion.bulk_load import empty_strings_to_null
+from app.ingestion.row_hashing import md5_hex
+
+
+def _is_nested(data_type: pa.DataType) -> bool:
+    return (pa.types.is_list(data_type) or pa.types.is_large_list(data_type)
+            or pa.types.is_fixed_size_list(data_type) or pa.types.is_struct(data_type)
+            or pa.types.is_map(data_type))
+
+
+def nested_columns(schema: pa.Schema) -> List[str]:
+    """Names of the list / struct / map columns of a schema."""
+    return [field.name for field in schema if _is_nested(field.type)]
+
+
+def _render_distinct(array: pa.Array, render) -> pa.Array:
+    """
+    render(value) for every element, calling it once per distinct value
+    (dictionary-encode, render the dictionary, take). Nulls stay null.
+    """
+    encoded = pc.dictionary_encode(array)
+    rendered = pa.array(list(map(render, encoded.dictionary.to_pylist())), type=pa.string())
+    return rendered.take(encoded.indices)
+
+
+def _map_to_text(array: pa.MapArray) -> pa.Array:
+    """
+    str() of the list of (key, value) tuples pandas produced for a map
+    ("[('k', 'v'), ...]"), built column-wise from the flattened entries.
+    """
+    map_type = array.type
+    # list<struct<key, value>> view of the map, whose flatten() honours slicing
+    entry_type = pa.struct([map_type.key_field, map_type.item_field])
+    as_list = array.cast(pa.list_(pa.field("entries", entry_type, nullable=False)))
+    entries = as_list.flatten()
+    keys = _render_distinct(entries.field(0), repr)
+    values = pc.fill_null(_render_distinct(entries.field(1), repr), "None")
+    items = pc.binary_join_element_wise("(", keys, ", ", values, ")", "")
+
+    lengths = pc.fill_null(pc.list_value_length(as_list), 0).to_numpy(zero_copy_only=False)
+    offsets = pa.array(np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32))
+    joined = pc.binary_join(pa.ListArray.from_arrays(offsets, items), ", ")
+    text = pc.binary_join_element_wise("[", joined, "]", "")
+    return pc.if_else(array.is_null(), pa.scalar(None, pa.string()), text)
+
+
+def _nested_to_text(column: pa.ChunkedArray) -> pa.Array:
+    """
+    Text of a nested column, as the pandas path stored it: maps (list of
+    (key, value) tuples in pandas) column-wise, structs (dicts) via str(),
+    lists via str() of the numpy array pandas produced.
+    """
+    data_type = column.type
+    if pa.types.is_map(data_type):
+        return pa.concat_arrays([_map_to_text(chunk) for chunk in column.chunks]) \
+            if column.num_chunks else pa.array([], type=pa.string())
+
+    as_array = not pa.types.is_struct(data_type)
+    return pa.array(
+        [None if v is None else str(np.array(v) if as_array else v) for v in column.to_pylist()],
+        type=pa.string()
+    )
+
+
+def serialize_nested_columns(table: pa.Table) -> pa.Table:
+    """Replace the nested columns of a table by their text representation."""
+    for name in nested_columns(table.schema):
+        idx = table.schema.get_field_index(name)
+        table = table.set_column(idx, pa.field(name, pa.string()), _nested_to_text(table.column(name)))
+    return table
+
+
+def _fallback_strings(column: pa.ChunkedArray) -> pa.Array:
+    # str() of what pandas produced for the column, nulls as ""
+    series = column.to_pandas()
+    return pa.array([str(v) for v in series.fillna("").tolist()], type=pa.string())
+
+
+def _float_strings(column: pa.ChunkedArray) -> pa.Array:
+    # Python's str(float) (Arrow's cast differs: "1" vs "1.0"), once per distinct value;
+    # NaN was filled with "" like nulls
+    encoded = pc.dictionary_encode(pc.cast(column, pa.float64()).combine_chunks())
+    distinct = encoded.dictionary
+    rendered = pa.array(list(map(str, distinct.to_numpy().tolist())), type=pa.string())
+    rendered = pc.if_else(pc.is_nan(distinct), "", rendered)
+    return pc.fill_null(rendered.take(encoded.indices), "")
+
+
+def _timestamp_strings(column: pa.ChunkedArray) -> pa.Array:
+    data_type = column.type
+    if data_type.tz not in (None, "UTC", "+00:00"):
+        return _fallback_strings(column)
+
+    units_per_second = {"s": 1, "ms": 1_000, "us": 1_000_000, "ns": 1_000_000_000}[data_type.unit]
+    ticks = pc.fill_null(pc.cast(column, pa.int64()), 0).to_numpy()
+    if (ticks % units_per_second).any():
+        # str(Timestamp) prints the fraction; keep the exact legacy text
+        return _fallback_strings(column)
+
+    # Whole seconds: format each distinct value with numpy, like row_hashing does
+    distinct, inverse = np.unique(ticks // units_per_second, return_inverse=True)
+    strings = np.char.replace(np.datetime_as_string(distinct.astype("datetime64[s]"), unit="s"), "T", " ")
+    if data_type.tz is not None:
+        strings = np.char.add(strings, "+00:00")
+    rendered = pa.array(strings, type=pa.string()).take(pa.array(inverse.ravel()))
+    return pc.if_else(column.combine_chunks().is_null(), "", rendered)
+
+
+def legacy_strings(column: pa.ChunkedArray) -> pa.Array:
+    """
+    str(value) of every element after fillna(""), as the pandas hash path
+    rendered it (see row_hashing), computed column-wise.
+    """
+    data_type = column.type
+    if pa.types.is_dictionary(data_type):
+        column = pc.cast(column, data_type.value_type)
+        data_type = column.type
+
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return pc.fill_null(pc.cast(column, pa.string()), "").combine_chunks()
+    if pa.types.is_floating(data_type):
+        return _float_strings(column)
+    if pa.types.is_integer(data_type):
+        if column.null_count == 0:
+            return pc.cast(column, pa.string()).combine_chunks()
+        # pandas turned integer columns with nulls into float64 ("1.0")
+        return _float_strings(column)
+    if pa.types.is_boolean(data_type):
+        return pc.fill_null(pc.if_else(column, "True", "False"), "").combine_chunks()
+    if pa.types.is_timestamp(data_type):
+        return _timestamp_strings(column)
+    return _fallback_strings(column)
+
+
+def hash_table_rows(table: pa.Table) -> List[str]:
+    """
+    MD5 hash_key per row over all columns, identical to
+    row_hashing.hash_rows(df.fillna("")) on the pandas version of the table.
+    """
+    if table.num_rows == 0:
+        return []
+    parts = [legacy_strings(table.column(name)) for name in table.column_names]
+    joined = parts[0] if len(parts) == 1 else pc.binary_join_element_wise(*parts, "")
+    return md5_hex(joined.to_pylist())
+
+
+def prepare_table_for_load(table: pa.Table) -> pa.Table:
+    """
+    Serialize nested columns, add hash_key, drop duplicate rows (first kept)
+    and turn empty strings into NULLs.
+
+    Returns:
+        The table to pass to bulk_load.insert_new_rows
+    """
+    nested = nested_columns(table.schema)
+    if nested:
+        print(f"Serializing nested columns to text: {', '.join(nested)}")
+    table = serialize_nested_columns(table)
+
+    keys = hash_table_rows(table)
+    duplicated = pd.Index(keys).duplicated(keep="first")
+    table = table.append_column("hash_key", pa.array(keys, type=pa.string()))
+    if duplicated.any():
+        print(f"Dropping {int(duplicated.sum())} duplicate rows within the file")
+        table = table.filter(pa.array(~duplicated))
+
+    return empty_strings_to_null(table)
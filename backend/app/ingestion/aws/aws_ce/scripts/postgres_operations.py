@@ -1,10 +1,8 @@
 import psycopg2
 from psycopg2 import sql
-from sqlalchemy import create_engine
-from sqlalchemy.types import String, Integer, Float, DateTime, Boolean
-import pandas as pd
 from dotenv import load_dotenv
 import os
+from app.ingestion.bulk_load import replace_table
 
 # Load environment variables from .env file
 load_dotenv()
@@ -90,45 +88,17 @@ def display_schemas(connection):
             cursor.close()
 
 
-def get_sqlalchemy_type(dtype):
-    """
-    Convert a Pandas dtype to a SQLAlchemy type.
-    """
-    if pd.api.types.is_integer_dtype(dtype):
-        return Integer()
-    elif pd.api.types.is_float_dtype(dtype):
-        return Float()
-    elif pd.api.types.is_bool_dtype(dtype):
-        return Boolean()
-    elif pd.api.types.is_datetime64_any_dtype(dtype):
-        return DateTime()
-    else:
-        return String()
-
-
 @connection
 def dump_to_postgresql(connection, df, schema_name, table_name):
     """
     Dump the DataFrame into a PostgreSQL database table within a specific schema.
     """
     try:
-        # Create SQLAlchemy engine using the provided connection details
-        engine = create_engine(
-            f'postgresql+psycopg2://{DB_USER_NAME}:{DB_PASSWORD}@{DB_HOST_NAME}:{DB_PORT}/{DB_NAME}',
-            pool_pre_ping=True  # Optional: Enable SQLAlchemy's pool pre-ping feature
-        )
-        print("Engine created successfully..")
-
-        # Convert DataFrame column types to SQLAlchemy types
-        dtype_map = {col: get_sqlalchemy_type(df[col].dtype) for col in df.columns}
-
-        # Dump data to PostgreSQL table
-        df.to_sql(table_name, con=engine, schema=schema_name, if_exists='replace', index=False, dtype=dtype_map)
+        # Recreate the table from the DataFrame dtypes and COPY the rows in (one transaction)
+        replace_table(connection, df, schema_name, table_name)
+        connection.commit()
         print(f"Data dumped into {schema_name}.{table_name} table successfully.")
 
     except Exception as e:
+        connection.rollback()
         print(f"Error dumping data into {schema_name}.{table_name} table: {e}")
-
-    finally:
-        # Dispose of the engine after use (optional)
-        engine.dispose()
@@ -0,0 +1,159 @@
+# app/ingestion/aws/cloudwatch_batch.py
+
+"""
+Batched CloudWatch collection shared by the EC2 and S3 metric scrapers.
+
+Instead of one boto3 Session + client + GetMetricStatistics call per
+(resource, metric), queries are grouped per region and start time and sent
+MAX_QUERIES_PER_CALL at a time through GetMetricData (paginated with
+NextToken), using one CloudWatch client per region (inventory.AwsClients).
+
+Each query is a dict:
+    {"namespace", "metric_name", "dimensions", "start_time", "context"}
+where `context` is returned untouched with the datapoints so callers can map
+results back to their resource.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from app.ingestion.aws.inventory import AWS_DISCOVERY_MAX_WORKERS, AwsClients
+
+LOG = logging.getLogger("cloudwatch_batch")
+
+# GetMetricData accepts at most 500 MetricDataQueries per request
+MAX_QUERIES_PER_CALL = 500
+DEFAULT_PERIOD = 3600
+DEFAULT_STAT = "Average"
+
+
+def floor_to_period(value: datetime, period: int = DEFAULT_PERIOD) -> datetime:
+    """Round a timestamp down to the metric period (keeps batch start times shared)."""
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return epoch + timedelta(seconds=(int((value - epoch).total_seconds()) // period) * period)
+
+
+def start_time_for(
+    watermark: Optional[datetime],
+    lookback_days: int,
+    end_time: datetime,
+    period: int = DEFAULT_PERIOD
+) -> datetime:
+    """
+    Query start for a resource: its last stored timestamp (the last period is
+    re-read, it may have been partial) or `lookback_days` ago for new resources.
+    """
+    earliest = floor_to_period(end_time - timedelta(days=lookback_days), period)
+    if watermark is None:
+        return earliest
+    return max(earliest, floor_to_period(watermark, period))
+
+
+def _chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _get_metric_data(
+    cw,
+    queries: List[Dict[str, Any]],
+    start_time: datetime,
+    end_time: datetime,
+    period: int,
+    stat: str,
+    scan_by: str
+) -> Dict[int, Tuple[List[datetime], List[float]]]:
+    """Run one GetMetricData batch (<= 500 queries) across all NextToken pages."""
+    metric_queries = [
+        {
+            "Id": f"q{idx}",
+            "MetricStat": {
+                "Metric": {
+                    "Namespace": query["namespace"],
+                    "MetricName": query["metric_name"],
+                    "Dimensions": query["dimensions"],
+                },
+                "Period": period,
+                "Stat": stat,
+            },
+            "ReturnData": True,
+        }
+        for idx, query in enumerate(queries)
+    ]
+
+    results = {idx: ([], []) for idx in range(len(queries))}
+    kwargs = {
+        "MetricDataQueries": metric_queries,
+        "StartTime": start_time,
+        "EndTime": end_time,
+        "ScanBy": scan_by,
+    }
+    while True:
+        response = cw.get_metric_data(**kwargs)
+        for result in response.get("MetricDataResults", []):
+            idx = int(result["Id"][1:])
+            results[idx][0].extend(result.get("Timestamps", []))
+            results[idx][1].extend(result.get("Values", []))
+        next_token = response.get("NextToken")
+        if not next_token:
+            return results
+        kwargs["NextToken"] = next_token
+
+
+def fetch_metric_data(
+    clients: AwsClients,
+    queries_by_region: Dict[str, List[Dict[str, Any]]],
+    end_time: datetime,
+    period: int = DEFAULT_PERIOD,
+    stat: str = DEFAULT_STAT,
+    scan_by: str = "TimestampAscending"
+) -> List[Tuple[Dict[str, Any], datetime, float]]:
+    """
+    Fetch datapoints for many metric queries with as few GetMetricData calls as possible.
+    Regions are processed in parallel; within a region, queries with the same
+    start time share batches of up to MAX_QUERIES_PER_CALL.
+
+    Returns:
+        List of (query, naive UTC timestamp, value)
+    """
+    def _collect_region(item):
+        region, queries = item
+        cw = clients.client("cloudwatch", region)
+        by_start: Dict[datetime, List[Dict[str, Any]]] = {}
+        for query in queries:
+            by_start.setdefault(query["start_time"], []).append(query)
+
+        points = []
+        calls = 0
+        for start_time, group in by_start.items():
+            if start_time >= end_time:
+                continue
+            for batch in _chunks(group, MAX_QUERIES_PER_CALL):
+                try:
+                    results = _get_metric_data(cw, batch, start_time, end_time, period, stat, scan_by)
+                except ClientError as e:
+                    LOG.warning("GetMetricData failed in %s (%d queries): %s", region, len(batch), e)
+                    continue
+                calls += 1
+                for idx, (timestamps, values) in results.items():
+                    for ts, value in zip(timestamps, values):
+                        points.append((batch[idx], ts.astimezone(timezone.utc).replace(tzinfo=None), value))
+        LOG.info("CloudWatch %s: %d queries, %d GetMetricData batch(es), %d datapoints",
+                 region, len(queries), calls, len(points))
+        return points
+
+    regions = [(region, queries) for region, queries in queries_by_region.items() if queries]
+    if not regions:
+        return []
+
+    all_points = []
+    with ThreadPoolExecutor(max_workers=min(AWS_DISCOVERY_MAX_WORKERS, len(regions))) as pool:
+        for points in pool.map(_collect_region, regions):
+            all_points.extend(points)
+    return all_points
@@ -0,0 +1,273 @@
+# app/ingestion/aws/inventory.py
+
+"""
+Shared AWS resource discovery for the ingestion steps (S3 metrics, EC2
+metrics).
+
+- One boto3 Session per set of credentials, with clients created once per
+  (service, region) and a shared botocore Config: connection pool sized for
+  the discovery workers and adaptive retry mode (client-side rate limiting on
+  throttling errors).
+- Regions are scanned in parallel on a bounded thread pool
+  (AWS_DISCOVERY_MAX_WORKERS) instead of one region after the other; bucket
+  locations and storage class samples are fetched in parallel as well.
+- The resulting inventory snapshot is cached per account for
+  AWS_INVENTORY_TTL_SECONDS, so every step of one aws_run_ingestion reuses
+  the same discovery pass.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, NoCredentialsError
+
+AWS_DISCOVERY_MAX_WORKERS = int(os.getenv("AWS_DISCOVERY_MAX_WORKERS", "8"))
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32"))
+AWS_MAX_RETRY_ATTEMPTS = int(os.getenv("AWS_MAX_RETRY_ATTEMPTS", "10"))
+AWS_INVENTORY_TTL_SECONDS = int(os.getenv("AWS_INVENTORY_TTL_SECONDS", "3600"))
+
+DEFAULT_REGION = "us-east-1"
+MAX_OBJECT_SAMPLE = 100
+
+BOTO_CONFIG = Config(
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    retries={"mode": "adaptive", "max_attempts": AWS_MAX_RETRY_ATTEMPTS},
+)
+
+# (access_key, secret_key) -> AwsClients
+_clients: Dict[Tuple[str, str], "AwsClients"] = {}
+_clients_lock = threading.Lock()
+
+# account_id -> (expires_at epoch seconds, inventory)
+_inventories: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_inventory_locks: Dict[str, threading.Lock] = {}
+_inventory_locks_guard = threading.Lock()
+
+
+class AwsClients:
+    """
+    boto3 clients for one set of credentials, created once per (service, region)
+    from a single Session. Creating clients is not thread-safe in boto3, so it
+    happens under a lock; the clients themselves are shared by worker threads.
+    """
+
+    def __init__(self, aws_access_key, aws_secret_key):
+        self._session = boto3.Session(
+            aws_access_key_id=aws_access_key,
+            aws_secret_access_key=aws_secret_key,
+        )
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._account_id = None
+
+    def client(self, service: str, region: Optional[str] = None):
+        region = region or DEFAULT_REGION
+        with self._lock:
+            key = (service, region)
+            if key not in self._clients:
+                self._clients[key] = self._session.client(service, region_name=region, config=BOTO_CONFIG)
+            return self._clients[key]
+
+    def account_id(self) -> str:
+        """AWS Account ID via STS (looked up once)."""
+        if self._account_id is None:
+            try:
+                self._account_id = self.client("sts").get_caller_identity()["Account"]
+                print(f"Account ID retrieved: {self._account_id}")
+            except (ClientError, NoCredentialsError) as e:
+                print(f"⚠️ Could not retrieve Account ID via STS: {e}")
+                return "UNKNOWN"
+        return self._account_id
+
+
+def get_clients(aws_access_key, aws_secret_key) -> AwsClients:
+    """Shared AwsClients for a set of credentials."""
+    with _clients_lock:
+        key = (aws_access_key, aws_secret_key)
+        if key not in _clients:
+            _clients[key] = AwsClients(aws_access_key, aws_secret_key)
+        return _clients[key]
+
+
+def _map(func, items: List[Any]) -> List[Any]:
+    """Run func over items on the bounded discovery pool; results keep input order."""
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(AWS_DISCOVERY_MAX_WORKERS, len(items)),
+                            thread_name_prefix="aws-discovery") as executor:
+        return list(executor.map(func, items))
+
+
+def discover_regions(clients: AwsClients) -> List[str]:
+    """Regions enabled for the account."""
+    response = clients.client("ec2").describe_regions()
+    return [r["RegionName"] for r in response["Regions"]]
+
+
+def _instances_in_region(clients: AwsClients, region: str, account_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Instances of one region, None if the region could not be listed."""
+    instances = []
+    try:
+        paginator = clients.client("ec2", region).get_paginator("describe_instances")
+        for page in paginator.paginate():
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    # Get instance name from tags
+                    instance_name = ""
+                    for tag in instance.get("Tags", []):
+                        if tag["Key"] == "Name":
+                            instance_name = tag["Value"]
+                            break
+
+                    instances.append({
+                        "InstanceId": instance["InstanceId"],
+                        "InstanceName": instance_name,
+                        "InstanceType": instance.get("InstanceType", "unknown"),
+                        "Region": region,
+                        "AvailabilityZone": instance.get("Placement", {}).get("AvailabilityZone", "unknown"),
+                        "State": instance.get("State", {}).get("Name", "unknown"),
+                        "AccountId": account_id,
+                    })
+    except Exception as e:
+        print(f"⚠️ Failed to list instances in {region}: {e}")
+        return None
+
+    if instances:
+        print(f"Found {len(instances)} instance(s) in {region}")
+    return instances
+
+
+def discover_ec2_instances(clients: AwsClients, regions: List[str],
+                           account_id: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    EC2 instances of all regions, scanned in parallel.
+
+    Returns:
+        (instances of the regions that could be listed, regions that failed)
+    """
+    per_region = _map(lambda region: _instances_in_region(clients, region, account_id), regions)
+    instances = [instance for found in per_region if found for instance in found]
+    failed_regions = [region for region, found in zip(regions, per_region) if found is None]
+    return instances, failed_regions
+
+
+def sample_bucket_storage_classes(clients: AwsClients, bucket_name: str, region: str,
+                                  max_keys: int = MAX_OBJECT_SAMPLE) -> Dict[str, int]:
+    """Storage class counts of up to max_keys objects of a bucket."""
+    try:
+        paginator = clients.client("s3", region).get_paginator("list_objects_v2")
+        pages = paginator.paginate(Bucket=bucket_name, PaginationConfig={"MaxItems": max_keys, "PageSize": 100})
+        counts = {}
+        retrieved = 0
+        for page in pages:
+            for obj in page.get("Contents", []):
+                sc = obj.get("StorageClass", "STANDARD")
+                counts[sc] = counts.get(sc, 0) + 1
+                retrieved += 1
+                if retrieved >= max_keys:
+                    return counts
+        return counts
+    except ClientError:
+        return {}
+
+
+def _describe_bucket(clients: AwsClients, bucket: Dict[str, Any], account_id: str) -> Optional[Dict[str, Any]]:
+    name = bucket["Name"]
+    # Newer ListBuckets responses already carry the region
+    region = bucket.get("BucketRegion")
+    if not region:
+        try:
+            loc = clients.client("s3").get_bucket_location(Bucket=name).get("LocationConstraint")
+            region = loc if loc else DEFAULT_REGION
+        except ClientError as e:
+            print(f"⚠️ Could not get location for bucket {name}: {e} (skipping)")
+            return None
+
+    return {
+        "Name": name,
+        "Region": region,
+        "ARN": f"arn:aws:s3:::{name}",
+        "StorageClassesSample": sample_bucket_storage_classes(clients, name, region),
+        "AccountId": account_id,
+    }
+
+
+def discover_buckets(clients: AwsClients, account_id: str) -> List[Dict[str, Any]]:
+    """S3 buckets with their region and a storage class sample, described in parallel."""
+    buckets = clients.client("s3").list_buckets().get("Buckets", [])
+    described = _map(lambda bucket: _describe_bucket(clients, bucket, account_id), buckets)
+    return [bucket for bucket in described if bucket]
+
+
+def _inventory_lock(account_id: str) -> threading.Lock:
+    with _inventory_locks_guard:
+        return _inventory_locks.setdefault(account_id, threading.Lock())
+
+
+def get_inventory(aws_access_key, aws_secret_key, force_refresh: bool = False) -> Dict[str, Any]:
+    """
+    Inventory snapshot of the account, discovered at most once per
+    AWS_INVENTORY_TTL_SECONDS (concurrent callers wait for the same pass).
+
+    Returns:
+        {
+            "account_id": str,
+            "regions": [region, ...],
+            "ec2_instances": [{"InstanceId", "InstanceName", "InstanceType", "Region",
+                               "AvailabilityZone", "State", "AccountId"}, ...],
+            "failed_regions": [region whose instances could not be listed, ...],
+            "s3_buckets": [{"Name", "Region", "ARN", "StorageClassesSample", "AccountId"}, ...],
+            "discovered_at": epoch seconds,
+        }
+    """
+    clients = get_clients(aws_access_key, aws_secret_key)
+    account_id = clients.account_id()
+    # Without an account ID, do not share snapshots between credentials
+    cache_key = account_id if account_id != "UNKNOWN" else f"key:{aws_access_key}"
+
+    with _inventory_lock(cache_key):
+        cached = _inventories.get(cache_key)
+        if cached and not force_refresh and cached[0] > time.time():
+            print(f"♻️ Using cached AWS inventory for account {account_id}")
+            return cached[1]
+
+        print(f"🔍 Discovering AWS inventory for account {account_id}...")
+        started = time.time()
+        complete = True
+        try:
+            regions = discover_regions(clients)
+        except Exception as e:
+            print(f"❌ Failed to describe regions: {e}")
+            regions, complete = [], False
+
+        try:
+            buckets = discover_buckets(clients, account_id)
+        except Exception as e:
+            print(f"❌ Failed to discover buckets: {e}")
+            buckets, complete = [], False
+
+        ec2_instances, failed_regions = discover_ec2_instances(clients, regions, account_id)
+        if failed_regions:
+            print(f"⚠️ EC2 discovery failed in {len(failed_regions)} region(s): {', '.join(failed_regions)}")
+            complete = False
+
+        inventory = {
+            "account_id": account_id,
+            "regions": regions,
+            "ec2_instances": ec2_instances,
+            "failed_regions": failed_regions,
+            "s3_buckets": buckets,
+            "discovered_at": time.time(),
+        }
+        print(f"✅ Discovered {len(inventory['ec2_instances'])} EC2 instance(s) and {len(buckets)} bucket(s) "
+              f"in {len(regions)} region(s) ({time.time() - started:.1f}s)")
+
+        # A failed discovery is not cached, the next step tries again
+        if complete:
+            _inventories[cache_key] = (time.time() + AWS_INVENTORY_TTL_SECONDS, inventory)
+        return inventory
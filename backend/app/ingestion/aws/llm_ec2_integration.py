@@ -23,9 +23,9 @@ LOG = logging.getLogger("ec2_llm_integration")
 # Path adjustments for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 from app.core.genai import llm_call
+from app.core.llm_concurrency import run_bulk_llm
 from app.ingestion.aws.postgres_operations import connection
 from app.ingestion.azure.llm_json_extractor import extract_json
-from app.core.task_manager import task_manager  # For cancellation support
 # Import pricing helpers for dynamic pricing context
 from app.ingestion.aws.pricing_helpers import (
     get_ec2_current_pricing,
@@ -464,7 +464,7 @@ def get_ec2_recommendation_single(instance_data: Dict[str, Any]) -> Optional[Dic
 
         # Generate prompt with forecasts
         prompt = generate_ec2_prompt(instance_data, forecast['monthly'], forecast['annually'])
-        llm_response = llm_call(prompt)
+        llm_response = llm_call(prompt, cache_scope=("aws", instance_data.get('schema_name'), "ec2", instance_data.get('instance_id')))
 
         if not llm_response:
             LOG.warning(f"Empty LLM response for instance {instance_data.get('instance_id')}")
@@ -535,31 +535,27 @@ def run_llm_analysis_ec2(resource_type: str, schema_name: str,
 
     # Convert to list of dicts
     instances = df.to_dict(orient="records")
-    total_instances = len(instances)
 
     LOG.info("🤖 Calling LLM for EC2 recommendations...")
-    recommendations = []
-
-    for idx, instance_data in enumerate(instances):
-        # Check if task has been cancelled
-        if task_id:
-            is_cancelled = task_manager.is_cancelled(task_id)
-            if is_cancelled:
-                LOG.info(f"🛑 Task {task_id} was cancelled. Stopping EC2 analysis. Processed {len(recommendations)}/{total_instances}")
-                break
-            # Debug: Confirm task is still active
-            if idx == 0 or idx % 10 == 0:  # Log every 10th iteration
-                LOG.info(f"  🔍 Task {task_id[:8]}... still running, not cancelled (instance {idx + 1}/{total_instances})")
-
-        instance_id = instance_data.get('resource_id', 'Unknown')
-        LOG.info(f"  [{idx + 1}/{total_instances}] Processing instance: {instance_id}")
 
+    def _analyze(instance_data):
         # Add schema_name and region for pricing lookups
         instance_data['schema_name'] = schema_name
         instance_data['region'] = instance_data.get('region', 'us-east-1')
-        rec = get_ec2_recommendation_single(instance_data)
-        if rec:
-            recommendations.append(rec)
+        return get_ec2_recommendation_single(instance_data)
+
+    # Instances already analyzed for this date range (by a bulk or single run) come from cache
+    cache_scope = {
+        "cloud_platform": "aws",
+        "schema_name": schema_name,
+        "resource_type": "ec2",
+        "start_date": start_str,
+        "end_date": end_str,
+    }
+    recommendations = run_bulk_llm(
+        instances, _analyze, task_id=task_id, label="EC2 instance",
+        id_key="instance_id", cache_scope=cache_scope
+    )
 
     if recommendations:
         LOG.info(f"✅ EC2 analysis complete! Generated {len(recommendations)} recommendation(s).")
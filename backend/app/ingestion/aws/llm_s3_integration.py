@@ -16,12 +16,12 @@ LOG = logging.getLogger("s3_llm_integration")
 # Relative path hack kept to maintain original import functionality
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 from app.core.genai import llm_call
-from app.ingestion.aws.postgres_operations import connection, dump_to_postgresql, fetch_existing_hash_keys
+from app.core.llm_concurrency import run_bulk_llm
+from app.ingestion.aws.postgres_operations import connection, dump_to_postgresql
 from app.ingestion.aws.pricing_helpers import (
     get_s3_storage_class_pricing,
     format_s3_pricing_for_llm
 )
-from app.core.task_manager import task_manager  # For cancellation support
 from sqlalchemy import create_engine
 from urllib.parse import quote_plus
 from dotenv import load_dotenv
@@ -420,7 +420,7 @@ def get_s3_recommendation_single(bucket_data: dict) -> dict:
 
         # Generate prompt with forecasts
         prompt = generate_s3_prompt(bucket_data, forecast['monthly'], forecast['annually'])
-        llm_response = llm_call(prompt)
+        llm_response = llm_call(prompt, cache_scope=("aws", bucket_data.get('schema_name'), "s3", bucket_data.get('bucket_name')))
 
         if not llm_response:
             LOG.warning(f"Empty LLM response for bucket {bucket_data.get('bucket_name')}")
@@ -489,31 +489,27 @@ def run_llm_analysis_s3(schema_name, start_date=None, end_date=None, bucket_name
 
     # Convert to list-of-dicts for LLM helper
     buckets = df.to_dict(orient="records")
-    total_buckets = len(buckets)
 
     LOG.info("🤖 Calling LLM for S3 recommendations...")
-    recommendations = []
-
-    for idx, bucket_data in enumerate(buckets):
-        # Check if task has been cancelled
-        if task_id:
-            is_cancelled = task_manager.is_cancelled(task_id)
-            if is_cancelled:
-                LOG.info(f"🛑 Task {task_id} was cancelled. Stopping S3 analysis. Processed {len(recommendations)}/{total_buckets}")
-                break
-            # Debug: Confirm task is still active
-            if idx == 0 or idx % 10 == 0:  # Log every 10th iteration
-                LOG.info(f"  🔍 Task {task_id[:8]}... still running, not cancelled (bucket {idx + 1}/{total_buckets})")
-
-        bucket_name_current = bucket_data.get('bucket_name', 'Unknown')
-        LOG.info(f"  [{idx + 1}/{total_buckets}] Processing bucket: {bucket_name_current}")
 
+    def _analyze(bucket_data):
         # Add schema_name and region for pricing lookups
         bucket_data['schema_name'] = schema_name
         bucket_data['region'] = bucket_data.get('region', 'us-east-1')
-        rec = get_s3_recommendation_single(bucket_data)
-        if rec:
-            recommendations.append(rec)
+        return get_s3_recommendation_single(bucket_data)
+
+    # Buckets already analyzed for this date range (by a bulk or single run) come from cache
+    cache_scope = {
+        "cloud_platform": "aws",
+        "schema_name": schema_name,
+        "resource_type": "s3",
+        "start_date": start_str,
+        "end_date": end_str,
+    }
+    recommendations = run_bulk_llm(
+        buckets, _analyze, task_id=task_id, label="S3 bucket",
+        id_key="bucket_name", cache_scope=cache_scope
+    )
 
     if recommendations:
         LOG.info(f"✅ S3 analysis complete! Generated {len(recommendations)} recommendation(s).")
@@ -1,13 +1,14 @@
 
-import hashlib
 import pandas as pd
+from app.ingestion.row_hashing import hash_rows
 from .export_ops import create_export, update_export, create_boto3_client
 from .s3 import *
-from .postgres_operations import execute_sql_files, dump_to_postgresql, fetch_existing_hash_keys,connection
-import pandas as pd
+from .postgres_operations import execute_sql_files, run_silver_sql_file, refresh_gold_views, insert_new_rows_to_postgresql, get_ingestion_state, save_ingestion_state
+from app.ingestion.ingestion_state import filter_changed_objects
+from app.ingestion.arrow_rows import prepare_table_for_load
 from app.ingestion.aws.export_ops import create_export, update_export, create_boto3_client
 from app.ingestion.aws.s3 import *
-from app.ingestion.aws.postgres_operations import execute_sql_files, dump_to_postgresql
+from app.ingestion.aws.postgres_operations import execute_sql_files
 from .resource_metrics import fetch_and_store_cloudwatch_metrics
 from app.ingestion.aws.metrics_s3 import metrics_dump as metrics_dump_s3
 from app.ingestion.aws.metrics_ec2 import metrics_dump as metrics_dump_ec2
@@ -19,6 +20,8 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from app.core.recommendation_prewarm import prewarm_aws_recommendations
 
+# Materialized by sql/gz_gold_views.sql or sql/parquet_gold_views.sql, refreshed in this order
+GOLD_MATERIALIZED_VIEWS = ["gold_aws_billing_dim", "gold_aws_fact_focus_mv"]
 
 
 def generate_hash_key(df):
@@ -34,19 +37,16 @@ def generate_hash_key(df):
     # Fill NaN/NULL values with an empty string
     df = df.fillna("")
 
-    # Function to compute the hash key for a single row
-    def hash_row(row):
-        concatenated_values = "".join(map(str, row))
-        return hashlib.md5(concatenated_values.encode('utf-8')).hexdigest()
-
-    # Apply the hash function to each row
-    df['hash_key'] = df.apply(hash_row, axis=1)
+    # MD5 of the concatenated column values, computed column-wise for all rows at once
+    df['hash_key'] = hash_rows(df)
     return df
 
 
-def filter_new_data(df, schema_name, table_name):
+def insert_new_data(df, schema_name, table_name):
     """
-    Filter out rows that already exist in the database based on the hash_key.
+    Insert rows that do not exist in the database yet, based on the hash_key.
+    Deduplication runs in PostgreSQL (staging table + anti-join), so the
+    table's existing keys are never loaded into memory.
 
     Args:
         df (pd.DataFrame): The DataFrame containing the new data.
@@ -54,18 +54,11 @@ def filter_new_data(df, schema_name, table_name):
         table_name (str): The table name in the PostgreSQL database.
 
     Returns:
-        pd.DataFrame: A DataFrame containing only the new rows.
+        int: Number of new rows inserted, None if the load failed.
     """
-    # Fetch existing hash keys from the database
-    existing_hash_keys = fetch_existing_hash_keys(schema_name, table_name)
-
-    new_data = df[~df['hash_key'].isin(existing_hash_keys)]
-    existing_hash_keys.update(new_data['hash_key'])  # update cache to avoid duplicates
-
-    # # Filter the DataFrame to exclude rows with existing hash keys
-    # new_data = df[~df['hash_key'].isin(existing_hash_keys)]
-    print(f"New data rows: {len(new_data)}")
-    return new_data
+    inserted = insert_new_rows_to_postgresql(df, schema_name, table_name)
+    print(f"New data rows: {inserted}")
+    return inserted
 
 
 def remove_duplicates(df):
@@ -147,27 +140,31 @@ def aws_run_ingestion(project_name,
             execute_sql_files(sql_file_paths['create_table'], schema_name, monthly_budget)
             print(f'Table {table_name} created....')
 
-            # Create consolidated pricing tables
-            execute_sql_files(f'{base_path}/sql/pricing_tables_consolidated.sql', schema_name, monthly_budget)
-            print(f'Consolidated pricing tables created....')
-
-            # Fetch and store AWS pricing data (early in pipeline for LLM use)
+            # AWS prices come from the shared pricing catalog (daily beat task);
+            # fetch them here, with this connection's credentials, only if the
+            # catalog is empty or stale
             try:
                 fetch_and_store_all_aws_pricing(
-                    schema_name=schema_name,
                     aws_access_key=aws_access_key,
                     aws_secret_key=aws_secret_key,
-                    region=aws_region
+                    only_if_stale=True
                 )
             except Exception as e:
                 print(f'⚠️ Error fetching AWS pricing: {e}')
                 # Continue even if pricing fetch fails
 
+            # Pricing views onto the shared catalog
+            execute_sql_files(f'{base_path}/sql/pricing_tables_consolidated.sql', schema_name, monthly_budget)
+            print(f'Pricing views created....')
+
             # Create S3 client
             s3_client = get_s3_client(aws_access_key, aws_secret_key, aws_region)
 
             # List period folders in the S3 bucket
             period_folders = list_period_folders(s3_client, s3_bucket, parent_folder)
+            # Export files already ingested (key/ETag/LastModified), so unchanged periods are skipped
+            state_source = f's3:{s3_bucket}/{parent_folder}'
+            processed_files = get_ingestion_state(schema_name, state_source) or {}
             all_dfs = []
             file_type = None  # Track the type of file being processed
         
@@ -262,60 +259,61 @@ def aws_run_ingestion(project_name,
                 db_schema=schema_name,
                 db_table='metrics_details'
             )
+        changed_file_types = set()  # Export formats that brought new rows in this run
         for period_folder in period_folders.keys():
-            latest_file = get_latest_file(s3_client, s3_bucket, period_folder)
+            latest_object = get_latest_object(s3_client, s3_bucket, period_folder)
+            if latest_object and not filter_changed_objects([latest_object], processed_files):
+                print(f"Billing period {period_folder} unchanged since the last run, skipping: {latest_object['key']}")
+                continue
+            latest_file = latest_object["key"] if latest_object else None
             if latest_file:
                 print(f"Downloading and processing file: {latest_file}")
                 if latest_file.endswith('.csv.gz'):
                     df = download_and_extract_csv(s3_client, s3_bucket, latest_file)
                     file_type = 'csv'
+
+                    # Remove duplicates within the file
+                    df = df.drop_duplicates(subset=df.columns.difference(['hash_key']))
+
+                    # Generate hash key
+                    df = generate_hash_key(df)
                 elif latest_file.endswith('.parquet'):
-                    df = download_and_read_parquet(s3_client, s3_bucket, latest_file)
+                    # Stays in Arrow: nested columns serialized, hashed, deduplicated and COPY-ed column-wise
+                    df = prepare_table_for_load(download_parquet_table(s3_client, s3_bucket, latest_file))
                     file_type = 'parquet'
                 else:
                     print(f"Unsupported file format: {latest_file}")
                     continue
 
-                # Convert unhashable columns (like lists) to strings
-                # for col in df.columns:
-                #     if df[col].apply(lambda x: isinstance(x, list)).any():
-                #         print(f"Column '{col}' contains lists. Converting to strings.")
-                #         df[col] = df[col].apply(lambda x: str(x) if isinstance(x, list) else x)
-                df = df.applymap(lambda x: str(x) if isinstance(x, list) else x)
-
-
-                # Remove duplicates within the file
-                # df = df.drop_duplicates()
-                df = df.drop_duplicates(subset=df.columns.difference(['hash_key']))
-
-
-                # Generate hash key
-                df = generate_hash_key(df)
-
-                # Filter new data only
-                new_data = filter_new_data(df, schema_name, table_name)
-
-                if not new_data.empty:
-                    # Dump to PostgreSQL
-                    # dump_to_postgresql(new_data, schema_name, table_name)
-                    chunk_size = 100000
-                    for start in range(0, len(new_data), chunk_size):
-                        chunk = new_data.iloc[start:start + chunk_size]
-                        dump_to_postgresql(chunk, schema_name, table_name)
+                # Insert new data only (COPY is chunked inside the loader)
+                inserted = insert_new_data(df, schema_name, table_name)
 
+                # A failed insert (None) leaves the export unmarked, so the next run retries it
+                if inserted is None:
+                    print(f"Failed to load file '{latest_file}'; it will be retried on the next run.")
+                    continue
 
-                    print(f"Appended {len(new_data)} new rows from file '{latest_file}' to the table '{table_name}'.")
+                # Loaded - this export is only read again if it is rewritten
+                latest_object["row_count"] = df.num_rows if file_type == 'parquet' else len(df)
+                save_ingestion_state(schema_name, state_source, [latest_object])
 
-                    # Execute relevant SQLs based on file type
-                    if file_type == 'csv':
-                        execute_sql_files(sql_file_paths['gz_gold_views'], schema_name, monthly_budget)
-                    elif file_type == 'parquet':
-                        execute_sql_files(sql_file_paths['parquet_silver'], schema_name, monthly_budget)
-                        print(f"Parquet silver file executed....")
-                        execute_sql_files(sql_file_paths['parquet_gold_views'], schema_name, monthly_budget)
-                        print(f"Parquet gold views created....")
+                if inserted:
+                    print(f"Appended {inserted} new rows from file '{latest_file}' to the table '{table_name}'.")
+                    changed_file_types.add(file_type)
                 else:
                     print(f"No new data to append for file: {latest_file}")
+
+        # Silver and gold once per run, over everything loaded above
+        if 'csv' in changed_file_types:
+            execute_sql_files(sql_file_paths['gz_gold_views'], schema_name, monthly_budget)
+            refresh_gold_views(schema_name, GOLD_MATERIALIZED_VIEWS)
+        if 'parquet' in changed_file_types:
+            run_silver_sql_file(sql_file_paths['parquet_silver'], schema_name, monthly_budget,
+                                table_name, 'silver_focus_aws_2')
+            print(f"Parquet silver file executed....")
+            execute_sql_files(sql_file_paths['parquet_gold_views'], schema_name, monthly_budget)
+            refresh_gold_views(schema_name, GOLD_MATERIALIZED_VIEWS)
+            print(f"Parquet gold views created....")
         # Create bronze metrics tables
         print(f"\n📊 Creating bronze metrics tables...")
         execute_sql_files(f'{base_path}/sql/bronze_s3_metrics.sql', schema_name, monthly_budget)
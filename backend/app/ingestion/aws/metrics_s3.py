@@ -1,154 +1,95 @@
 # app/ingestion/aws/metrics_s3.py
 import json
 import pandas as pd
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import os
 import sys
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.exceptions import ClientError
 import logging
-import hashlib
+from app.ingestion.row_hashing import hash_rows
+from app.ingestion.aws.cloudwatch_batch import fetch_metric_data, start_time_for
+from app.ingestion.aws.inventory import get_clients, get_inventory
 
 # Configuration for the target table
 S3_BRONZE_TABLE_NAME = "bronze_s3_bucket_metrics" # Consistent name
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
-from app.ingestion.aws.postgres_operations import dump_to_postgresql, fetch_existing_hash_keys
+from app.ingestion.aws.postgres_operations import insert_new_rows_to_postgresql, get_metric_watermarks
 
 # Logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 LOG = logging.getLogger("s3_metrics_scraper")
 
 # Config
-MAX_OBJECT_SAMPLE = 100
-THREADS = 10
-
-def session_for_region(access_key, secret_key, region_name=None):
-    return boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=region_name or "us-east-1",
-    )
+LOOKBACK_DAYS = 30  # Window searched for series without stored datapoints
+METRIC_PERIOD = 3600
+
+# CloudWatch units of the S3 metrics (GetMetricData returns values only)
+S3_METRIC_UNITS = {
+    "BucketSizeBytes": "Bytes",
+    "NumberOfObjects": "Count",
+    "AllRequests": "Count",
+    "GetRequests": "Count",
+    "PutRequests": "Count",
+    "DeleteRequests": "Count",
+    "HeadRequests": "Count",
+    "PostRequests": "Count",
+    "SelectRequests": "Count",
+    "ListRequests": "Count",
+    "BytesDownloaded": "Bytes",
+    "BytesUploaded": "Bytes",
+    "SelectBytesScanned": "Bytes",
+    "SelectBytesReturned": "Bytes",
+    "4xxErrors": "Count",
+    "5xxErrors": "Count",
+    "FirstByteLatency": "Milliseconds",
+    "TotalRequestLatency": "Milliseconds",
+}
 
 def discover_all_buckets(aws_access_key, aws_secret_key, default_region="us-east-1"):
-    LOG.info("🔍 Discovering all S3 buckets...")
-    
-    account_id = None
-    try:
-        # Use STS to get the Account ID once
-        sess_sts = session_for_region(aws_access_key, aws_secret_key, "us-east-1")
-        sts = sess_sts.client("sts")
-        account_id = sts.get_caller_identity()["Account"]
-        LOG.info("Account ID retrieved: %s", account_id)
-    except (ClientError, NoCredentialsError) as e:
-        LOG.warning("Could not retrieve Account ID via STS: %s", e)
-        account_id = "UNKNOWN"
-    except Exception as e:
-        LOG.warning("An unexpected error occurred while retrieving Account ID: %s", e)
-        account_id = "UNKNOWN"
-
-    try:
-        sess = session_for_region(aws_access_key, aws_secret_key, default_region)
-        s3 = sess.client("s3")
-        resp = s3.list_buckets()
-        buckets = []
-        for b in resp.get("Buckets", []):
-            name = b["Name"]
-            try:
-                # Determine region
-                loc = s3.get_bucket_location(Bucket=name).get("LocationConstraint")
-                region = loc if loc else "us-east-1"
-            except ClientError as e:
-                LOG.warning("Could not get location for bucket %s: %s (skipping)", name, e)
-                continue
-
-            arn = f"arn:aws:s3:::{name}"
-            # Sample storage classes
-            storage_classes = sample_bucket_storage_classes(aws_access_key, aws_secret_key, name, region, max_keys=MAX_OBJECT_SAMPLE)
-            buckets.append({
-                "Name": name, 
-                "Region": region, 
-                "ARN": arn, 
-                "StorageClassesSample": storage_classes,
-                "AccountId": account_id # Include the account ID here
-            })
-        LOG.info("✅ Discovered %d bucket(s)", len(buckets))
-        return buckets
-    except Exception as e:
-        LOG.error("Failed to discover buckets: %s", e)
-        return []
-
-def sample_bucket_storage_classes(aws_access_key, aws_secret_key, bucket_name, region, max_keys=100):
-    try:
-        sess = session_for_region(aws_access_key, aws_secret_key, region)
-        s3 = sess.client("s3")
-        paginator = s3.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=bucket_name, PaginationConfig={"MaxItems": max_keys, "PageSize": 100})
-        counts = {}
-        retrieved = 0
-        for page in pages:
-            for obj in page.get("Contents", []):
-                sc = obj.get("StorageClass", "STANDARD")
-                counts[sc] = counts.get(sc, 0) + 1
-                retrieved += 1
-                if retrieved >= max_keys:
+    """
+    All S3 buckets with region, ARN, storage class sample and account ID, from
+    the shared per-account inventory (see inventory.get_inventory).
+    """
+    return get_inventory(aws_access_key, aws_secret_key)["s3_buckets"]
+
+def list_s3_metrics_by_bucket(cw):
+    """
+    All AWS/S3 CloudWatch metrics of a region with one paginated list_metrics
+    call, grouped by bucket name.
+    """
+    metrics_by_bucket = {}
+    paginator = cw.get_paginator("list_metrics")
+    for page in paginator.paginate(Namespace="AWS/S3"):
+        for m in page.get("Metrics", []):
+            for dim in m.get("Dimensions", []):
+                if dim.get("Name") == "BucketName":
+                    metrics_by_bucket.setdefault(dim.get("Value"), []).append(m)
                     break
-            if retrieved >= max_keys:
-                break
-        return counts
-    except ClientError as e:
-        LOG.debug("Sampling objects for bucket %s failed: %s", bucket_name, e)
-        return {}
-
-def list_bucket_metrics_for_bucket(aws_access_key, aws_secret_key, bucket_name, region):
-    try:
-        sess = session_for_region(aws_access_key, aws_secret_key, region)
-        cw = sess.client("cloudwatch", region_name=region)
-        paginator = cw.get_paginator("list_metrics")
-        metrics = []
-        page_iter = paginator.paginate(Namespace="AWS/S3", Dimensions=[{"Name": "BucketName", "Value": bucket_name}])
-        for page in page_iter:
-            for m in page.get("Metrics", []):
-                metrics.append(m)
-        return metrics
-    except ClientError as e:
-        LOG.warning("Failed to list metrics for bucket %s in %s: %s", bucket_name, region, e)
-        return []
-
-def fetch_latest_datapoint(aws_access_key, aws_secret_key, bucket_name, region, metric):
-    try:
-        sess = session_for_region(aws_access_key, aws_secret_key, region)
-        cw = sess.client("cloudwatch", region_name=region)
-        now = datetime.now(timezone.utc)
-        start = now - timedelta(days=30)
-        period = 3600
+    return metrics_by_bucket
+
 
+def _bucket_metric_queries(bucket, metrics, watermarks, end_time):
+    """GetMetricData queries for the listed metrics of one bucket."""
+    queries = []
+    for metric in metrics:
         dimensions = metric.get("Dimensions", [])
         if not any(d.get("Name") == "BucketName" for d in dimensions):
-            dimensions = [{"Name": "BucketName", "Value": bucket_name}] + dimensions
-
-        resp = cw.get_metric_statistics(
-            Namespace="AWS/S3",
-            MetricName=metric["MetricName"],
-            Dimensions=dimensions,
-            StartTime=start,
-            EndTime=now,
-            Period=period,
-            Statistics=["Average", "Sum", "Maximum", "Minimum"],
-        )
-    except ClientError as e:
-        LOG.debug("CloudWatch query failed for %s %s: %s", bucket_name, metric.get("MetricName"), e)
-        return None
-
-    datapoints = resp.get("Datapoints", [])
-    if not datapoints:
-        return None
-
-    latest = max(datapoints, key=lambda d: d["Timestamp"])
-    value = latest.get("Average")
-    if value is None:
-        value = latest.get("Sum") or latest.get("Maximum") or latest.get("Minimum")
+            dimensions = [{"Name": "BucketName", "Value": bucket["Name"]}] + dimensions
+        watermark = watermarks.get((bucket["Name"].lower(), metric["MetricName"].lower()))
+        queries.append({
+            "namespace": "AWS/S3",
+            "metric_name": metric["MetricName"],
+            "dimensions": dimensions,
+            "start_time": start_time_for(watermark, LOOKBACK_DAYS, end_time, METRIC_PERIOD),
+            "context": bucket,
+        })
+    return queries
+
+
+def _latest_datapoint_record(query, timestamp, value):
+    bucket = query["context"]
+    dimensions = query["dimensions"]
 
     # Determine StorageType. Default to None/empty string if not a dimension.
     storage_type = None
@@ -156,44 +97,34 @@ def fetch_latest_datapoint(aws_access_key, aws_secret_key, bucket_name, region,
         if dim.get("Name") == "StorageType":
             storage_type = dim.get("Value")
             break
-            
-    record = {
-        "bucket_name": bucket_name,
-        "region": region,
-        "metric_name": metric.get("MetricName"),
+
+    return {
+        "bucket_name": bucket["Name"],
+        "region": bucket["Region"],
+        "metric_name": query["metric_name"],
         "storage_type": storage_type,
         "dimensions_json": json.dumps(dimensions),
-        "timestamp": latest["Timestamp"].astimezone(timezone.utc).replace(tzinfo=None),  # naive UTC
+        "timestamp": timestamp,  # naive UTC
         "value": value,
-        "unit": latest.get("Unit"),
-        # account_id and storage_class will be added in scrape_bucket_metrics/metrics_dump
+        # GetMetricData does not return units
+        "unit": S3_METRIC_UNITS.get(query["metric_name"]),
+        # Add ARN, Account ID, and Storage Classes Sample from bucket discovery
+        "arn": bucket["ARN"],
+        "storage_classes_sample_json": json.dumps(bucket["StorageClassesSample"]),
+        "account_id": bucket["AccountId"],
     }
-    return record
-
-def scrape_bucket_metrics(aws_access_key, aws_secret_key, bucket):
-    name = bucket["Name"]
-    region = bucket["Region"]
-    account_id = bucket["AccountId"] # Retrieve account ID
-    metrics = list_bucket_metrics_for_bucket(aws_access_key, aws_secret_key, name, region)
-    if not metrics:
-        LOG.info("No CloudWatch metrics for bucket %s", name)
-        return []
-    records = []
-    with ThreadPoolExecutor(max_workers=6) as ex:
-        futures = {ex.submit(fetch_latest_datapoint, aws_access_key, aws_secret_key, name, region, m): m for m in metrics}
-        for fut in as_completed(futures):
-            res = fut.result()
-            if res:
-                # Add ARN, Account ID, and Storage Classes Sample from bucket discovery
-                res.update({
-                    "arn": bucket["ARN"], 
-                    "storage_classes_sample_json": json.dumps(bucket["StorageClassesSample"]),
-                    "account_id": account_id # Add account_id
-                })
-                records.append(res)
-    return records
-
-def collect_all_s3_metrics(aws_access_key, aws_secret_key, default_region="us-east-1"):
+
+
+def collect_all_s3_metrics(aws_access_key, aws_secret_key, default_region="us-east-1", watermarks=None):
+    """
+    Discover all buckets and collect the latest datapoint of each of their
+    CloudWatch metrics.
+
+    Metrics are listed once per region and fetched through batched
+    GetMetricData calls (see cloudwatch_batch), each series starting from its
+    latest stored datapoint (`watermarks`, {(bucket_name, metric_name): timestamp})
+    or LOOKBACK_DAYS ago.
+    """
     LOG.info("=" * 60)
     LOG.info("🚀 Starting S3 metrics collection...")
     LOG.info("=" * 60)
@@ -203,17 +134,41 @@ def collect_all_s3_metrics(aws_access_key, aws_secret_key, default_region="us-ea
         LOG.warning("No buckets found")
         return pd.DataFrame()
 
-    all_records = []
-    with ThreadPoolExecutor(max_workers=THREADS) as pool:
-        futures = {pool.submit(scrape_bucket_metrics, aws_access_key, aws_secret_key, b): b for b in buckets}
-        for fut in as_completed(futures):
-            b = futures[fut]
-            try:
-                recs = fut.result()
-                LOG.info("Collected %d metrics for bucket %s", len(recs), b["Name"])
-                all_records.extend(recs)
-            except Exception as e:
-                LOG.exception("Error scraping bucket %s: %s", b["Name"], e)
+    end_time = datetime.now(timezone.utc)
+    watermarks = watermarks or {}
+    clients = get_clients(aws_access_key, aws_secret_key)
+
+    buckets_by_region = {}
+    for b in buckets:
+        buckets_by_region.setdefault(b["Region"], []).append(b)
+
+    queries_by_region = {}
+    for region, region_buckets in buckets_by_region.items():
+        try:
+            metrics_by_bucket = list_s3_metrics_by_bucket(clients.client("cloudwatch", region))
+        except ClientError as e:
+            LOG.warning("Failed to list S3 metrics in %s: %s", region, e)
+            continue
+        for b in region_buckets:
+            metrics = metrics_by_bucket.get(b["Name"], [])
+            if not metrics:
+                LOG.info("No CloudWatch metrics for bucket %s", b["Name"])
+                continue
+            queries_by_region.setdefault(region, []).extend(
+                _bucket_metric_queries(b, metrics, watermarks, end_time)
+            )
+
+    points = fetch_metric_data(clients, queries_by_region, end_time, period=METRIC_PERIOD,
+                               scan_by="TimestampDescending")
+
+    # Keep only the latest datapoint of every series
+    latest = {}
+    for query, timestamp, value in points:
+        key = id(query)
+        if key not in latest or timestamp > latest[key][1]:
+            latest[key] = (query, timestamp, value)
+
+    all_records = [_latest_datapoint_record(*point) for point in latest.values()]
 
     if all_records:
         df = pd.DataFrame(all_records)
@@ -235,11 +190,11 @@ def _compute_s3_hash_key_for_df(df: pd.DataFrame) -> pd.DataFrame:
     df['timestamp_str'] = df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
     # value normalization
     df['value_norm'] = df['value'].astype(float).round(6).astype(str)
-    def row_hash(r):
-        s = f"{r['bucket_name']}|{r['timestamp_str']}|{r.get('metric_name','') or ''}|{r.get('value_norm','')}"
-        return hashlib.md5(s.encode('utf-8')).hexdigest()
-    df['hash_key'] = df.apply(row_hash, axis=1)
-    df = df.drop(columns=['timestamp_str','value_norm'], errors='ignore')
+    if 'metric_name' not in df.columns:
+        df['metric_name'] = ''
+    df['metric_name_norm'] = df['metric_name'].map(lambda v: v or '')
+    df['hash_key'] = hash_rows(df, columns=['bucket_name', 'timestamp_str', 'metric_name_norm', 'value_norm'], sep='|')
+    df = df.drop(columns=['timestamp_str','value_norm','metric_name_norm'], errors='ignore')
     return df
 
 def metrics_dump(aws_access_key, aws_secret_key, region, schema_name):
@@ -248,7 +203,13 @@ def metrics_dump(aws_access_key, aws_secret_key, region, schema_name):
     LOG.info("🔄 Starting S3 metrics dump...")
     LOG.info("Schema: %s, Table: %s", schema_name, table_name)
 
-    all_metrics_df = collect_all_s3_metrics(aws_access_key, aws_secret_key, region)
+    try:
+        watermarks = get_metric_watermarks(schema_name, table_name, ["bucket_name", "metric_name"])
+    except Exception as e:
+        LOG.warning("Could not read S3 metric watermarks, fetching the full window: %s", e)
+        watermarks = {}
+
+    all_metrics_df = collect_all_s3_metrics(aws_access_key, aws_secret_key, region, watermarks=watermarks)
 
     LOG.info("=" * 60)
     if all_metrics_df is None or all_metrics_df.empty:
@@ -276,33 +237,13 @@ def metrics_dump(aws_access_key, aws_secret_key, region, schema_name):
     # compute hash keys
     all_metrics_df = _compute_s3_hash_key_for_df(all_metrics_df)
 
-    # fetch existing hash keys from bronze to avoid duplicate insert
-    try:
-        # Pass the corrected table name
-        existing = fetch_existing_hash_keys(schema_name, table_name)
-    except Exception as e:
-        # The original code logged a warning; we'll keep that but log the specific error
-        LOG.warning("Could not fetch existing hash keys: %s", e)
-        existing = set()
-
-    # filter only new unique rows
-    new_df = all_metrics_df[~all_metrics_df['hash_key'].isin(existing)].copy()
-    LOG.info("Total collected: %d  New unique: %d", len(all_metrics_df), len(new_df))
-
-    if new_df.empty:
-        LOG.info("No new unique S3 metric rows to insert. Skipping DB dump.")
-        LOG.info("=" * 60)
-        return
-
-    # dump in chunks
+    # insert only new unique rows; duplicates are filtered in the database
     try:
-        chunk_size = 100000
-        num_chunks = (len(new_df) + chunk_size - 1) // chunk_size
-        LOG.info("Inserting %d rows in %d chunk(s)...", len(new_df), num_chunks)
-        for start in range(0, len(new_df), chunk_size):
-            chunk = new_df.iloc[start:start + chunk_size]
-            # Pass the corrected table name
-            dump_to_postgresql(chunk, schema_name, table_name)
-        LOG.info("✅ S3 metrics dumped successfully to %s.%s!", schema_name, table_name)
+        inserted = insert_new_rows_to_postgresql(all_metrics_df, schema_name, table_name)
+        if inserted is None:
+            LOG.error("Failed to dump S3 metrics to %s.%s", schema_name, table_name)
+        else:
+            LOG.info("Total collected: %d  New unique: %d", len(all_metrics_df), inserted)
+            LOG.info("✅ S3 metrics dumped successfully to %s.%s!", schema_name, table_name)
     except Exception as e:
         LOG.error("Failed to dump S3 metrics: %s", e)
\ No newline at end of file
@@ -4,6 +4,9 @@ import os
 import pandas as pd
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
+from app.ingestion import ingestion_operations
+from app.ingestion.bulk_load import copy_rows
+from app.ingestion.pricing_catalog import PRICING_CATALOG_SCHEMA
 
 # Load environment variables from .env file
 load_dotenv()
@@ -106,19 +109,11 @@ def create_schemas(connection, schema):
 #         connection.rollback()  # Rollback on error
 #         raise
 
-from psycopg2.extras import execute_values
-
 @connection
 def dump_to_postgresql(connection, new_data, schema_name, table_name):
     try:
-        new_data = new_data.replace("", None)
-        records = [tuple(row) for row in new_data.to_numpy()]
-        columns = ', '.join([f'"{col}"' for col in new_data.columns])
-        insert_query = f"INSERT INTO {schema_name}.{table_name} ({columns}) VALUES %s"
-        
-        cursor = connection.cursor()
-        # Use batching with page_size to boost speed
-        execute_values(cursor, insert_query, records, page_size=10000)
+        # Stream rows with COPY FROM STDIN in chunks, one transaction
+        copy_rows(connection, new_data, schema_name, table_name)
         connection.commit()
         print(f"Data dumped into {schema_name}.{table_name} table successfully.")
     except Exception as e:
@@ -198,7 +193,7 @@ def execute_sql_files(connection, sql_file_path, schema_name, budget):
         # Read the SQL file
         with open(sql_file_path, 'r') as file:
             sql_script = file.read()
-        sql_script = sql_script.replace('__schema__', schema_name).replace('__budget__', str(budget)).replace('__databasename__', DB_NAME).replace('__password__', DB_PASSWORD)
+        sql_script = sql_script.replace('__schema__', schema_name).replace('__budget__', str(budget)).replace('__databasename__', DB_NAME).replace('__password__', DB_PASSWORD).replace('__catalog__', PRICING_CATALOG_SCHEMA)
 
         # Create a cursor object
         cursor = connection.cursor()
@@ -218,17 +213,11 @@ def execute_sql_files(connection, sql_file_path, schema_name, budget):
     except Exception as error:
         print(f"Error executing {sql_file_path}: {error}")
 
-@connection
-def fetch_existing_hash_keys(connection, schema_name, table_name):
-    try:
-        cursor = connection.cursor()
-        query = f"SELECT hash_key FROM {schema_name}.{table_name};"
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        existing_keys = set(row[0] for row in rows)
-        print(f"Fetched {len(existing_keys)} existing hash keys.")
-        return existing_keys
-
-    except Exception as ex:
-        print(f"Error fetching hash keys: {ex}")
-        return set()
+
+# Shared ingestion operations (app/ingestion/ingestion_operations.py) on this module's connection
+run_silver_sql_file = connection(ingestion_operations.run_silver_sql_file)
+refresh_gold_views = connection(ingestion_operations.refresh_gold_views)
+insert_new_rows_to_postgresql = connection(ingestion_operations.insert_new_rows_to_postgresql)
+get_ingestion_state = connection(ingestion_operations.get_ingestion_state)
+save_ingestion_state = connection(ingestion_operations.save_ingestion_state)
+get_metric_watermarks = connection(ingestion_operations.get_metric_watermarks)
@@ -6,21 +6,38 @@ Fetches and stores AWS pricing information including:
 - S3 storage pricing (per GB/month, request costs)
 - EBS volume pricing
 
-Uses AWS Price List API for real-time pricing data.
+Uses AWS Price List API for real-time pricing data. Prices are stored once
+for all projects, in the shared pricing catalog (app.ingestion.pricing_catalog).
 """
 
-import boto3
 import pandas as pd
 import sys
 import os
+import socket
+import time
 import json
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from decimal import Decimal
 
 # Add path for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from app.ingestion.aws.postgres_operations import connection, dump_to_postgresql
+from app.ingestion.aws.postgres_operations import connection
+from app.ingestion.aws.inventory import get_clients
+from app.ingestion.pricing_catalog import (
+    PRICING_CATALOG_MAX_AGE_HOURS, PRICING_CATALOG_SCHEMA, ensure_catalog, snapshot_age_hours, write_snapshot
+)
+from app.core.ingestion_locks import acquire_pricing_lock, release_pricing_lock, wait_for_pricing_lock
+
+# Regions priced into the shared catalog (the regions the Price List location names are mapped for)
+PRICING_AWS_REGIONS = [r.strip() for r in os.getenv(
+    "PRICING_AWS_REGIONS",
+    "us-east-1,us-east-2,us-west-1,us-west-2,eu-west-1,eu-central-1,ap-southeast-1,ap-northeast-1"
+).split(",") if r.strip()]
+
+# Credentials of the catalog refresh; unset uses the boto3 default chain (instance role)
+PRICING_AWS_ACCESS_KEY = os.getenv("PRICING_AWS_ACCESS_KEY")
+PRICING_AWS_SECRET_KEY = os.getenv("PRICING_AWS_SECRET_KEY")
 
 
 def fetch_ec2_pricing(aws_access_key: str, aws_secret_key: str, region: str = "us-east-1") -> pd.DataFrame:
@@ -39,11 +56,8 @@ def fetch_ec2_pricing(aws_access_key: str, aws_secret_key: str, region: str = "u
 
     try:
         # Create pricing client (pricing API is only available in us-east-1 and ap-south-1)
-        pricing_client = boto3.client(
-            'pricing',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name='us-east-1'  # Pricing API only available here
+        pricing_client = get_clients(aws_access_key, aws_secret_key).client(
+            'pricing', 'us-east-1'  # Pricing API only available here
         )
 
         # Map region codes to region names
@@ -160,12 +174,7 @@ def fetch_s3_pricing(aws_access_key: str, aws_secret_key: str, region: str = "us
     print(f"📊 Fetching AWS S3 pricing for region: {region}")
 
     try:
-        pricing_client = boto3.client(
-            'pricing',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name='us-east-1'
-        )
+        pricing_client = get_clients(aws_access_key, aws_secret_key).client('pricing', 'us-east-1')
 
         region_name_map = {
             'us-east-1': 'US East (N. Virginia)',
@@ -267,12 +276,7 @@ def fetch_ebs_pricing(aws_access_key: str, aws_secret_key: str, region: str = "u
     print(f"📊 Fetching AWS EBS pricing for region: {region}")
 
     try:
-        pricing_client = boto3.client(
-            'pricing',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name='us-east-1'
-        )
+        pricing_client = get_clients(aws_access_key, aws_secret_key).client('pricing', 'us-east-1')
 
         region_name_map = {
             'us-east-1': 'US East (N. Virginia)',
@@ -354,80 +358,84 @@ def fetch_ebs_pricing(aws_access_key: str, aws_secret_key: str, region: str = "u
 
 
 @connection
-def store_aws_pricing(conn, schema_name: str, pricing_df: pd.DataFrame, pricing_type: str):
+def store_aws_pricing(conn, parts: Dict[Tuple[str, str], pd.DataFrame]):
     """
-    Store AWS pricing data in PostgreSQL consolidated table.
+    Store AWS prices as a new snapshot of the shared pricing catalog
+    (unchanged parts are not loaded again).
 
     Args:
         conn: Database connection
-        schema_name: Schema name
-        pricing_df: DataFrame with pricing data
-        pricing_type: Type of pricing (ec2, s3, ebs)
+        parts: {(pricing_type, region): DataFrame} (ec2, s3, ebs)
     """
-    if pricing_df.empty:
-        print(f"  ⚠️ No {pricing_type} pricing data to store")
-        return
-
-    # Add resource_type column
-    df_with_type = pricing_df.copy()
-    df_with_type['resource_type'] = pricing_type
-
-    # Use consolidated table name
-    table_name = "aws_pricing"
+    return write_snapshot(conn, "aws", parts)
 
-    # Delete existing records for this resource type before inserting new ones
-    delete_query = f"DELETE FROM {schema_name}.{table_name} WHERE resource_type = %s"
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute(delete_query, (pricing_type,))
-        conn.commit()
-        print(f"  🗑️ Cleared existing {pricing_type} pricing data from consolidated table")
-    except Exception as e:
-        print(f"  ⚠️ Could not clear existing {pricing_type} data: {e}")
-        conn.rollback()
-
-    # Insert new data into consolidated table
-    dump_to_postgresql(df_with_type, schema_name, table_name)
-    print(f"  💾 Stored {len(df_with_type)} {pricing_type} pricing records in {schema_name}.{table_name}")
+@connection
+def aws_pricing_age_hours(conn) -> Optional[float]:
+    """Age of the current AWS catalog snapshot (creates the catalog if needed)."""
+    ensure_catalog(conn)
+    return snapshot_age_hours(conn, "aws")
 
 
 def fetch_and_store_all_aws_pricing(
-    schema_name: str,
-    aws_access_key: str,
-    aws_secret_key: str,
-    region: str = "us-east-1"
+    aws_access_key: Optional[str] = PRICING_AWS_ACCESS_KEY,
+    aws_secret_key: Optional[str] = PRICING_AWS_SECRET_KEY,
+    regions: Optional[List[str]] = None,
+    only_if_stale: bool = False
 ):
     """
-    Main function to fetch and store all AWS pricing data.
+    Refresh the AWS prices of the shared pricing catalog.
 
     Args:
-        schema_name: PostgreSQL schema name
-        aws_access_key: AWS access key
+        aws_access_key: AWS access key (None: boto3 default credential chain)
         aws_secret_key: AWS secret key
-        region: AWS region
+        regions: AWS regions (default: PRICING_AWS_REGIONS)
+        only_if_stale: Skip when the catalog already has a snapshot younger
+            than PRICING_CATALOG_MAX_AGE_HOURS (ingestion bootstrap). With no
+            snapshot at all and another worker refreshing, wait for that refresh
     """
+    regions = regions or PRICING_AWS_REGIONS
+    if only_if_stale:
+        age = aws_pricing_age_hours()
+        if age is not None and age < PRICING_CATALOG_MAX_AGE_HOURS:
+            print(f"♻️ Using shared AWS pricing catalog ({age:.1f}h old)")
+            return
+
+    owner = f"{socket.gethostname()}:{os.getpid()}:{time.time()}"
+    try:
+        if not acquire_pricing_lock("aws", owner):
+            if only_if_stale and age is None:
+                # Nothing to price with yet: wait for the refresh in progress
+                print("⏳ AWS pricing catalog is being refreshed, waiting for it")
+                if not wait_for_pricing_lock("aws"):
+                    print("⚠️ Timed out waiting for the AWS pricing refresh")
+                elif aws_pricing_age_hours() is None:
+                    print("⚠️ The AWS pricing refresh finished without a snapshot")
+            else:
+                print("⚠️ AWS pricing catalog is already being refreshed, skipping")
+            return
+    except Exception as e:
+        print(f"⚠️ Could not take the AWS pricing lock, refreshing anyway: {e}")
+
     print(f"\n{'='*70}")
     print(f"💰 FETCHING AWS PRICING DATA")
-    print(f"   Schema: {schema_name}")
-    print(f"   Region: {region}")
+    print(f"   Catalog: {PRICING_CATALOG_SCHEMA}")
+    print(f"   Regions: {', '.join(regions)}")
     print(f"{'='*70}\n")
 
-    try:
-        # Fetch EC2 pricing
-        ec2_pricing = fetch_ec2_pricing(aws_access_key, aws_secret_key, region)
-        if not ec2_pricing.empty:
-            store_aws_pricing(schema_name, ec2_pricing, "ec2")
-
-        # Fetch S3 pricing
-        s3_pricing = fetch_s3_pricing(aws_access_key, aws_secret_key, region)
-        if not s3_pricing.empty:
-            store_aws_pricing(schema_name, s3_pricing, "s3")
+    fetchers = [
+        ("ec2", fetch_ec2_pricing),
+        ("s3", fetch_s3_pricing),
+        ("ebs", fetch_ebs_pricing),
+    ]
 
-        # Fetch EBS pricing
-        ebs_pricing = fetch_ebs_pricing(aws_access_key, aws_secret_key, region)
-        if not ebs_pricing.empty:
-            store_aws_pricing(schema_name, ebs_pricing, "ebs")
+    try:
+        parts = {
+            (pricing_type, r): fetch_pricing(aws_access_key, aws_secret_key, r)
+            for pricing_type, fetch_pricing in fetchers
+            for r in regions
+        }
+        store_aws_pricing(parts)
 
         print(f"\n{'='*70}")
         print(f"✅ AWS PRICING DATA FETCH COMPLETE")
@@ -438,13 +446,16 @@ def fetch_and_store_all_aws_pricing(
         import traceback
         traceback.print_exc()
 
+    finally:
+        release_pricing_lock("aws", owner)
+
 
 def get_ec2_instance_pricing(schema_name: str, instance_type: str, region: str = "us-east-1") -> Optional[Dict]:
     """
-    Get pricing for a specific EC2 instance type.
+    Get pricing for a specific EC2 instance type from the shared pricing catalog.
 
     Args:
-        schema_name: Schema name
+        schema_name: Schema name (kept for callers, prices are not per schema)
         instance_type: EC2 instance type (e.g., 't2.micro')
         region: AWS region
 
@@ -464,7 +475,7 @@ def get_ec2_instance_pricing(schema_name: str, instance_type: str, region: str =
                 currency,
                 network_performance,
                 physical_processor
-            FROM {schema}.aws_pricing_ec2
+            FROM {PRICING_CATALOG_SCHEMA}.aws_pricing_ec2
             WHERE LOWER(instance_type) = LOWER(%s)
               AND LOWER(region) = LOWER(%s)
             LIMIT 1
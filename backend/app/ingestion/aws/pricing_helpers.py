@@ -3,6 +3,10 @@ AWS Pricing Query Helpers
 
 Provides functions to query pricing data and generate alternative instance/storage recommendations
 based on resource utilization patterns.
+
+Prices are read from the shared pricing catalog (app.ingestion.pricing_catalog)
+once per region and served from the in-memory price index
+(app.ingestion.price_index); the schema_name arguments are kept for callers.
 """
 
 import pandas as pd
@@ -13,15 +17,61 @@ from typing import Dict, List, Optional
 # Add path for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from app.ingestion.aws.postgres_operations import connection
+from app.ingestion.price_index import PriceList, fetch_price_rows, get_price_list
+from app.ingestion.pricing_catalog import PRICING_CATALOG_SCHEMA
+
+
+EC2_ALTERNATIVE_COLUMNS = ('instance_type', 'vcpu', 'memory', 'network_performance', 'price_per_hour', 'currency',
+                           'instance_family')
+S3_OPTION_COLUMNS = ('storage_class', 'description', 'price_per_unit', 'unit', 'usage_type')
 
 
 @connection
-def get_ec2_current_pricing(conn, schema_name: str, instance_type: str, region: str = "us-east-1") -> Optional[Dict]:
+def _load_price_index(conn, region: str) -> Optional[Dict[str, PriceList]]:
+    """
+    Read the EC2, S3 and EBS prices of a region from the catalog, in one
+    query, and index them per family.
+
+    Returns:
+        {'ec2': instance types, 's3': per-GB storage classes, 'ebs': volume types},
+        or None on error
+    """
+    query = f"""
+        SELECT resource_type, instance_type, vcpu, memory, network_performance, price_per_hour,
+               currency, physical_processor, instance_family, storage_class, description,
+               price_per_unit, unit, usage_type, volume_type, storage_media, max_iops_volume,
+               max_throughput_volume, price_per_gb_month
+        FROM {PRICING_CATALOG_SCHEMA}.aws_pricing_current
+        WHERE resource_type IN ('ec2', 's3', 'ebs')
+          AND LOWER(region) = LOWER(%s)
+    """
+
+    try:
+        rows = fetch_price_rows(conn, query, (region,),
+                                price_columns=('price_per_hour', 'price_per_unit', 'price_per_gb_month'))
+    except Exception as e:
+        print(f"Error loading AWS prices for {region}: {e}")
+        return None
+
+    ec2_rows = [row for row in rows.get('ec2', []) if row['instance_type'] is not None]
+    s3_rows = [row for row in rows.get('s3', []) if row['storage_class'] is not None and 'GB' in (row['unit'] or '')]
+    ebs_rows = [row for row in rows.get('ebs', []) if row['volume_type'] is not None]
+    return {
+        'ec2': PriceList(ec2_rows, sku_key='instance_type', price_key='price_per_hour'),
+        's3': PriceList(s3_rows, sku_key='storage_class', price_key='price_per_unit'),
+        'ebs': PriceList(ebs_rows, sku_key='volume_type', price_key='price_per_gb_month'),
+    }
+
+
+def _prices(region: str, family: str) -> PriceList:
+    return get_price_list('aws', region, family, _load_price_index)
+
+
+def get_ec2_current_pricing(schema_name: str, instance_type: str, region: str = "us-east-1") -> Optional[Dict]:
     """
     Get pricing for the current EC2 instance type.
 
     Args:
-        conn: Database connection
         schema_name: Schema name
         instance_type: EC2 instance type (e.g., 't2.micro')
         region: AWS region
@@ -32,54 +82,28 @@ def get_ec2_current_pricing(conn, schema_name: str, instance_type: str, region:
     if not instance_type:
         return None
 
-    query = f"""
-        SELECT
-            instance_type,
-            vcpu,
-            memory,
-            network_performance,
-            price_per_hour,
-            currency,
-            physical_processor,
-            instance_family
-        FROM {schema_name}.aws_pricing_ec2
-        WHERE LOWER(instance_type) = LOWER(%s)
-          AND LOWER(region) = LOWER(%s)
-        LIMIT 1
-    """
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute(query, (instance_type, region))
-        result = cursor.fetchone()
-
-        if result:
-            return {
-                'instance_type': result[0],
-                'vcpu': result[1],
-                'memory': result[2],
-                'network_performance': result[3],
-                'price_per_hour': float(result[4]) if result[4] else 0.0,
-                'currency': result[5],
-                'physical_processor': result[6],
-                'instance_family': result[7],
-                'monthly_cost': float(result[4]) * 730 if result[4] else 0.0  # 730 hours/month
-            }
-        return None
-
-    except Exception as e:
-        print(f"Error fetching EC2 pricing: {e}")
+    row = _prices(region, 'ec2').lookup(instance_type)
+    if not row:
         return None
+    return {
+        'instance_type': row['instance_type'],
+        'vcpu': row['vcpu'],
+        'memory': row['memory'],
+        'network_performance': row['network_performance'],
+        'price_per_hour': row['price_per_hour'],
+        'currency': row['currency'],
+        'physical_processor': row['physical_processor'],
+        'instance_family': row['instance_family'],
+        'monthly_cost': row['price_per_hour'] * 730  # 730 hours/month
+    }
 
 
-@connection
-def get_ec2_alternative_pricing(conn, schema_name: str, current_instance: str, region: str = "us-east-1", max_results: int = 10) -> List[Dict]:
+def get_ec2_alternative_pricing(schema_name: str, current_instance: str, region: str = "us-east-1", max_results: int = 10) -> List[Dict]:
     """
     Get DIVERSE alternative EC2 instance types with pricing for comparison.
-    Fetches different instance families (t3, m5, c5, r5, etc.), not just upsize/downsize of same family.
+    Fetches the instance types priced closest below and above the current one, across all families.
 
     Args:
-        conn: Database connection
         schema_name: Schema name
         current_instance: Current instance type
         region: AWS region
@@ -88,82 +112,24 @@ def get_ec2_alternative_pricing(conn, schema_name: str, current_instance: str, r
     Returns:
         List of alternative instance pricing dicts from diverse families
     """
-    # First get current instance price to determine cheaper/similar/more expensive alternatives
-    current_price_query = f"""
-        SELECT price_per_hour
-        FROM {schema_name}.aws_pricing_ec2
-        WHERE LOWER(region) = LOWER(%s)
-          AND instance_type = %s
-        LIMIT 1
-    """
+    prices = _prices(region, 'ec2')
+    current = prices.lookup(current_instance)
+    current_price = current['price_per_hour'] if current else 0.0
+    per_side = max(2, max_results // 2)
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute(current_price_query, (region, current_instance))
-        current_price_result = cursor.fetchone()
-        current_price = float(current_price_result[0]) if current_price_result and current_price_result[0] else 0.0
-
-        # Get diverse alternatives: cheaper options, similar price, and more expensive
-        # Use UNION to get mix from different price ranges and different families
-        query = f"""
-            (
-                -- Cheaper alternatives (different families)
-                SELECT DISTINCT instance_type, vcpu, memory, network_performance, price_per_hour, currency, instance_family
-                FROM {schema_name}.aws_pricing_ec2
-                WHERE LOWER(region) = LOWER(%s)
-                  AND instance_type != %s
-                  AND instance_type IS NOT NULL
-                  AND price_per_hour < %s
-                  AND price_per_hour > 0
-                ORDER BY price_per_hour DESC
-                LIMIT {max(2, max_results // 2)}
-            )
-            UNION ALL
-            (
-                -- More expensive alternatives (different families for upsize)
-                SELECT DISTINCT instance_type, vcpu, memory, network_performance, price_per_hour, currency, instance_family
-                FROM {schema_name}.aws_pricing_ec2
-                WHERE LOWER(region) = LOWER(%s)
-                  AND instance_type != %s
-                  AND instance_type IS NOT NULL
-                  AND price_per_hour > %s
-                  AND price_per_hour > 0
-                ORDER BY price_per_hour ASC
-                LIMIT {max(2, max_results // 2)}
-            )
-        """
-
-        cursor.execute(query, (region, current_instance, current_price, region, current_instance, current_price))
-        results = cursor.fetchall()
-
-        alternatives = []
-        for row in results:
-            alternatives.append({
-                'instance_type': row[0],
-                'vcpu': row[1],
-                'memory': row[2],
-                'network_performance': row[3],
-                'price_per_hour': float(row[4]) if row[4] else 0.0,
-                'currency': row[5],
-                'instance_family': row[6]
-            })
-
-        print(f"  Found {len(alternatives)} diverse alternatives across different EC2 instance families")
-        return alternatives[:max_results]
+    alternatives = (prices.below(current_price, per_side, EC2_ALTERNATIVE_COLUMNS, exclude_sku=current_instance)
+                    + prices.above(current_price, per_side, EC2_ALTERNATIVE_COLUMNS, exclude_sku=current_instance))
 
-    except Exception as e:
-        print(f"Error fetching alternative EC2 pricing: {e}")
-        return []
+    print(f"  Found {len(alternatives)} diverse alternatives across different EC2 instance families")
+    return alternatives[:max_results]
 
 
-@connection
-def get_s3_storage_class_pricing(conn, schema_name: str, region: str = "us-east-1", max_results: int = 10) -> list:
+def get_s3_storage_class_pricing(schema_name: str, region: str = "us-east-1", max_results: int = 10) -> list:
     """
     Get DIVERSE S3 storage class pricing for comparison.
     Fetches different storage classes (Standard, IA, Intelligent-Tiering, Glacier, Deep Archive).
 
     Args:
-        conn: Database connection
         schema_name: Schema name
         region: AWS region
         max_results: Maximum number of diverse alternatives
@@ -171,96 +137,34 @@ def get_s3_storage_class_pricing(conn, schema_name: str, region: str = "us-east-
     Returns:
         List of diverse S3 storage class pricing dicts
     """
-    query = f"""
-        SELECT DISTINCT
-            storage_class,
-            description,
-            price_per_unit,
-            unit,
-            usage_type
-        FROM {schema_name}.aws_pricing_s3
-        WHERE LOWER(region) = LOWER(%s)
-          AND storage_class IS NOT NULL
-          AND unit LIKE '%%GB%%'
-          AND price_per_unit > 0
-        ORDER BY price_per_unit ASC
-        LIMIT %s
-    """
+    storage_options = _prices(region, 's3').cheapest(max_results, S3_OPTION_COLUMNS)
+    print(f"  Found {len(storage_options)} diverse S3 storage classes")
+    return storage_options
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute(query, (region, max_results))
-        results = cursor.fetchall()
-
-        storage_options = []
-        for row in results:
-            storage_options.append({
-                'storage_class': row[0],
-                'description': row[1],
-                'price_per_unit': float(row[2]) if row[2] else 0.0,
-                'unit': row[3],
-                'usage_type': row[4]
-            })
-
-        print(f"  Found {len(storage_options)} diverse S3 storage classes")
-        return storage_options
-
-    except Exception as e:
-        print(f"Error fetching S3 pricing: {e}")
-        return []
 
-
-@connection
-def get_ebs_volume_pricing(conn, schema_name: str, region: str = "us-east-1") -> List[Dict]:
+def get_ebs_volume_pricing(schema_name: str, region: str = "us-east-1") -> List[Dict]:
     """
     Get EBS volume pricing for different volume types.
 
     Args:
-        conn: Database connection
         schema_name: Schema name
         region: AWS region
 
     Returns:
         List of EBS volume pricing dicts
     """
-    query = f"""
-        SELECT
-            volume_type,
-            storage_media,
-            max_iops_volume,
-            max_throughput_volume,
-            price_per_gb_month,
-            currency,
-            unit
-        FROM {schema_name}.aws_pricing_ebs
-        WHERE LOWER(region) = LOWER(%s)
-          AND volume_type IS NOT NULL
-        ORDER BY price_per_gb_month ASC
-        LIMIT 10
-    """
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute(query, (region,))
-        results = cursor.fetchall()
-
-        volume_pricing = []
-        for row in results:
-            volume_pricing.append({
-                'volume_type': row[0],
-                'storage_media': row[1],
-                'max_iops': row[2],
-                'max_throughput': row[3],
-                'price_per_gb_month': float(row[4]) if row[4] else 0.0,
-                'currency': row[5],
-                'unit': row[6]
-            })
-
-        return volume_pricing
-
-    except Exception as e:
-        print(f"Error fetching EBS pricing: {e}")
-        return []
+    return [
+        {
+            'volume_type': row['volume_type'],
+            'storage_media': row['storage_media'],
+            'max_iops': row['max_iops_volume'],
+            'max_throughput': row['max_throughput_volume'],
+            'price_per_gb_month': row['price_per_gb_month'],
+            'currency': row['currency'],
+            'unit': row['unit']
+        }
+        for row in _prices(region, 'ebs').rows[:10]
+    ]
 
 
 def format_ec2_pricing_for_llm(alternatives: List[Dict]) -> str:
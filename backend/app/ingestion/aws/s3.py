@@ -4,6 +4,7 @@ import json
 import pandas as pd
 import io
 import gzip
+import pyarrow.parquet as pq
 from datetime import datetime
 from app.ingestion.aws.postgres_operations import *
 
@@ -155,21 +156,32 @@ def list_period_folders(s3_client, bucket_name, parent_folder):
     return periods
 
 
-def get_latest_file(s3_client, bucket_name, folder_name):
+def get_latest_object(s3_client, bucket_name, folder_name):
+    """
+    Return the most recent export object of a billing period folder as
+    {"key", "etag", "last_modified", "size"}, or None if the folder has none.
+    """
     paginator = s3_client.get_paginator('list_objects_v2')
-    latest_file = None
-    latest_time = None
+    latest = None
 
     for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_name):
         if 'Contents' in page:
             for obj in page['Contents']:
                 if obj['Key'].endswith(('.csv.gz', '.snappy.parquet')):
-                    last_modified = obj['LastModified']
-                    if latest_file is None or last_modified > latest_time:
-                        latest_file = obj['Key']
-                        latest_time = last_modified
+                    if latest is None or obj['LastModified'] > latest['last_modified']:
+                        latest = {
+                            "key": obj['Key'],
+                            "etag": obj.get('ETag'),
+                            "last_modified": obj['LastModified'],
+                            "size": obj.get('Size'),
+                        }
+
+    return latest
 
-    return latest_file
+
+def get_latest_file(s3_client, bucket_name, folder_name):
+    latest = get_latest_object(s3_client, bucket_name, folder_name)
+    return latest["key"] if latest else None
 
 
 # def download_and_extract_csv(s3_client, bucket_name, key):
@@ -193,3 +205,8 @@ def download_and_extract_csv(s3_client, bucket_name, key, chunksize=None):
 def download_and_read_parquet(s3_client, bucket_name, key):
     response = s3_client.get_object(Bucket=bucket_name, Key=key)
     return pd.read_parquet(io.BytesIO(response['Body'].read()), engine='pyarrow')
+
+def download_parquet_table(s3_client, bucket_name, key):
+    """Read a parquet export as a pyarrow Table (no pandas conversion)."""
+    response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    return pq.read_table(io.BytesIO(response['Body'].read()))
@@ -89,16 +89,46 @@
 
 
 --sloved datatype errro --
--- Create or replace view for gold_aws_billing_dim
-CREATE OR REPLACE VIEW __schema__.gold_aws_billing_dim AS
+-- The billing dim and the fact are materialized views with indexes, refreshed (CONCURRENTLY) at
+-- the end of ingestion by app/ingestion/gold_refresh.py. They are created empty here; the refresh
+-- populates them.
+DO $$
+BEGIN
+    -- Plain views created by earlier versions under the same names
+    IF EXISTS (SELECT 1 FROM pg_views WHERE schemaname = '__schema__' AND viewname = 'gold_aws_billing_dim') THEN
+        DROP VIEW __schema__.gold_aws_billing_dim;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_views WHERE schemaname = '__schema__' AND viewname = 'gold_aws_fact_focus')
+       AND NOT EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = '__schema__' AND matviewname = 'gold_aws_fact_focus_mv') THEN
+        DROP VIEW __schema__.gold_aws_fact_focus;
+    END IF;
+
+    -- gz_gold_views.sql builds the same objects from silver_focus_aws (CSV exports): rebuild on a format change
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = '__schema__' AND matviewname = 'gold_aws_billing_dim'
+               AND definition NOT LIKE '%silver_focus_aws_2%') THEN
+        DROP MATERIALIZED VIEW __schema__.gold_aws_billing_dim;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = '__schema__' AND matviewname = 'gold_aws_fact_focus_mv'
+               AND definition NOT LIKE '%silver_focus_aws_2%') THEN
+        DROP MATERIALIZED VIEW __schema__.gold_aws_fact_focus_mv CASCADE;
+    END IF;
+END $$;
+
+-- gold_aws_billing_dim
+CREATE MATERIALIZED VIEW IF NOT EXISTS __schema__.gold_aws_billing_dim AS
 SELECT DISTINCT
     "BillingAccountId" ::bigint AS billing_account_id,
     "BillingAccountName" AS billing_account_name,
     "SubAccountId" ::bigint AS sub_account_id,
     "SubAccountName" AS sub_account_name
-FROM __schema__.silver_focus_aws_2;
+FROM __schema__.silver_focus_aws_2
+WITH NO DATA;
 
-CREATE OR REPLACE VIEW __schema__.gold_aws_fact_focus AS
+CREATE UNIQUE INDEX IF NOT EXISTS gold_aws_billing_dim_key_idx ON __schema__.gold_aws_billing_dim
+    (billing_account_id, billing_account_name, sub_account_id, sub_account_name);
+
+-- fact (materialized without the budget, which can change between runs)
+CREATE MATERIALIZED VIEW IF NOT EXISTS __schema__.gold_aws_fact_focus_mv AS
 SELECT
     "BilledCost" AS billed_cost,
     "ConsumedUnit" AS consumed_unit,
@@ -131,19 +161,65 @@ SELECT
     "SkuPriceId" AS sku_price_id,
     "SkuId" AS sku_id,
     "BillingAccountId" ::bigint AS billing_account_id,
-    __budget__::integer AS monthly_budget,
 	"x_ServiceCode" AS x_service_code,
     md5("Tags"::text) as tags_key,
     "hash_key" as hash_key,
     "ResourceName" as resource_name
-FROM __schema__.silver_focus_aws_2;
+FROM __schema__.silver_focus_aws_2
+WITH NO DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS gold_aws_fact_focus_mv_hash_key_idx ON __schema__.gold_aws_fact_focus_mv (hash_key);
+CREATE INDEX IF NOT EXISTS gold_aws_fact_focus_mv_charge_period_start_idx ON __schema__.gold_aws_fact_focus_mv (charge_period_start);
+CREATE INDEX IF NOT EXISTS gold_aws_fact_focus_mv_resource_id_idx ON __schema__.gold_aws_fact_focus_mv (resource_id);
+CREATE INDEX IF NOT EXISTS gold_aws_fact_focus_mv_service_name_idx ON __schema__.gold_aws_fact_focus_mv (service_name);
+CREATE INDEX IF NOT EXISTS gold_aws_fact_focus_mv_tags_key_idx ON __schema__.gold_aws_fact_focus_mv (tags_key);
+
+CREATE OR REPLACE VIEW __schema__.gold_aws_fact_focus AS
+SELECT
+    billed_cost,
+    consumed_unit,
+    consumed_quantity,
+    charge_period_start,
+    charge_period_end,
+    contracted_cost,
+    effective_cost,
+    list_cost,
+    list_unit_price,
+    region_id,
+    region_name,
+    pricing_category,
+    pricing_quantity,
+    pricing_unit,
+    contracted_unit_price,
+    provider_name,
+    resource_id,
+    billing_period_start,
+    billing_period_end,
+    billing_account_name,
+    charge_category,
+    charge_class,
+    charge_description,
+    charge_frequency,
+    service_name,
+    service_category,
+    x_operation,
+    x_usage_type,
+    sku_price_id,
+    sku_id,
+    billing_account_id,
+    __budget__::integer AS monthly_budget,
+	x_service_code,
+    tags_key,
+    hash_key,
+    resource_name
+FROM __schema__.gold_aws_fact_focus_mv;
 
 
 CREATE OR REPLACE FUNCTION aws_tags_view_generation()
 RETURNS text AS $$
 DECLARE
     record_tagkey record;
-    q_statement text = format(E'CREATE OR REPLACE VIEW __schema__.gold_aws_tags AS\nSELECT DISTINCT\n    md5(cast("Tags" AS text)) AS tags_key,');
+    q_statement text = format(E'CREATE MATERIALIZED VIEW __schema__.gold_aws_tags AS\nSELECT DISTINCT\n    md5(cast("Tags" AS text)) AS tags_key,');
 BEGIN
     -- Loop through each distinct tag key from Tags, cast to jsonb
     FOR record_tagkey IN
@@ -163,16 +239,28 @@ $$ LANGUAGE plpgsql;
 -- Execute the function to generate and create the aws_tags view
 DO $$
 DECLARE
-    del_statement text := 'DROP VIEW IF EXISTS __schema__.gold_aws_tags';
     q_statement text;
 BEGIN
     -- Generate the view creation query
     q_statement := aws_tags_view_generation();
-    
-    -- Drop the existing view if it exists
-    EXECUTE del_statement;
-    
-    -- Execute the dynamically generated query
-    EXECUTE q_statement;
+
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = '__schema__' AND matviewname = 'gold_aws_tags')
+       AND obj_description(to_regclass('__schema__.gold_aws_tags'), 'pg_class') = md5(q_statement) THEN
+        -- Same tag keys as the last run: refresh the rows in place
+        REFRESH MATERIALIZED VIEW CONCURRENTLY __schema__.gold_aws_tags;
+    ELSE
+        -- First run, new tag keys (new columns) or other export format: drop the existing view and rebuild it
+        IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = '__schema__' AND matviewname = 'gold_aws_tags') THEN
+            DROP MATERIALIZED VIEW __schema__.gold_aws_tags;
+        ELSE
+            DROP VIEW IF EXISTS __schema__.gold_aws_tags;
+        END IF;
+
+        -- Execute the dynamically generated query
+        EXECUTE q_statement;
+        CREATE UNIQUE INDEX gold_aws_tags_tags_key_idx ON __schema__.gold_aws_tags (tags_key);
+        -- The definition hash tells the next run whether the columns changed
+        EXECUTE format('COMMENT ON MATERIALIZED VIEW __schema__.gold_aws_tags IS %L', md5(q_statement));
+    END IF;
 END;
 $$ LANGUAGE plpgsql;
@@ -1,5 +1,7 @@
 -- -- select "Tags" from __schema__.silver_focus_aws limit 100;
 DO $$
+DECLARE
+    rebuild BOOLEAN := __full_refresh__;
 BEGIN
     IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_schema = '__schema__' AND table_name = 'silver_focus_aws_2') THEN
         -- Create the table if it does not exist
@@ -72,35 +74,40 @@ BEGIN
             "hash_key"
         FROM
             __schema__.silver_focus_aws;
+        CREATE UNIQUE INDEX silver_focus_aws_2_hash_key_idx ON __schema__.silver_focus_aws_2 ("hash_key");
     ELSE
-        -- If the table exists, you can truncate or perform other operations as needed
-        -- TRUNCATE TABLE __schema__.silver_focus_aws_2;
-        -- Optionally, you could re-insert data from the original table
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE schemaname = '__schema__' AND indexname = 'silver_focus_aws_2_hash_key_idx') THEN
+            -- Tables from earlier versions were appended to on every run without a key:
+            -- drop the duplicates with one rebuild, then key the table on hash_key
+            TRUNCATE TABLE __schema__.silver_focus_aws_2;
+            CREATE UNIQUE INDEX silver_focus_aws_2_hash_key_idx ON __schema__.silver_focus_aws_2 ("hash_key");
+            rebuild := TRUE;
+        ELSIF rebuild THEN
+            -- Full rebuild (backfills): start from an empty silver table
+            TRUNCATE TABLE __schema__.silver_focus_aws_2;
+        END IF;
+
+        -- Upsert the bronze rows loaded since the last refresh (see app/ingestion/silver_load.py)
         INSERT INTO __schema__.silver_focus_aws_2
         SELECT
             "AvailabilityZone",
             "BilledCost",
-            "BillingAccountId"::bigint AS "BillingAccountId",
+            "BillingAccountId",
             "BillingAccountName",
             "BillingCurrency",
             "BillingPeriodEnd",
             "BillingPeriodStart",
             "ChargeCategory",
-            "ChargeClass"::double precision AS "ChargeClass",
+            "ChargeClass",
             "ChargeDescription",
             "ChargeFrequency",
             "ChargePeriodEnd",
             "ChargePeriodStart",
-            -- "CommitmentDiscountCategory"::double precision AS "CommitmentDiscountCategory",
-            -- "CommitmentDiscountId"::double precision AS "CommitmentDiscountId",
-            -- "CommitmentDiscountName"::double precision AS "CommitmentDiscountName",
-            -- "CommitmentDiscountStatus"::double precision AS "CommitmentDiscountStatus",
-            -- "CommitmentDiscountType"::double precision AS "CommitmentDiscountType",
-            "CommitmentDiscountCategory" AS "CommitmentDiscountCategory",
-            "CommitmentDiscountId" AS "CommitmentDiscountId",
-            "CommitmentDiscountName" AS "CommitmentDiscountName",
-            "CommitmentDiscountStatus" AS "CommitmentDiscountStatus",
-            "CommitmentDiscountType" AS "CommitmentDiscountType",
+            "CommitmentDiscountCategory",
+            "CommitmentDiscountId",
+            "CommitmentDiscountName",
+            "CommitmentDiscountStatus",
+            "CommitmentDiscountType",
             "ConsumedQuantity",
             "ConsumedUnit",
             "ContractedCost",
@@ -117,18 +124,21 @@ BEGIN
             "RegionId",
             "RegionName",
             "ResourceId",
-            "ResourceName"::double precision AS "ResourceName",
+            "ResourceName",
             "ResourceType",
             "ServiceCategory",
             "ServiceName",
             "SkuId",
             "SkuPriceId",
-            "SubAccountId"::bigint AS "SubAccountId",
+            "SubAccountId",
             "SubAccountName",
+            -- Transform Tags column into JSON and store it in the new table
             (
                 SELECT
                     json_object_agg(
+                        -- Extract key and remove unwanted characters
                         TRIM(BOTH '()' FROM REGEXP_REPLACE(split_part(tag, ',', 1), '^"|"$', '')),
+                        -- Extract value and remove unwanted characters
                         TRIM(BOTH '()' FROM REGEXP_REPLACE(split_part(tag, ',', 2), '^"|"$', ''))
                     )
                 FROM
@@ -146,6 +156,10 @@ BEGIN
             "x_UsageType",
             "hash_key"
         FROM
-            __schema__.silver_focus_aws;
+            __schema__.silver_focus_aws
+        WHERE rebuild
+           OR ("_ingested_at" > '__since__'::TIMESTAMPTZ AND "_ingested_at" <= '__until__'::TIMESTAMPTZ)
+        -- hash_key is a digest of the whole bronze row: an existing key is the same row
+        ON CONFLICT ("hash_key") DO NOTHING;
     END IF;
 END $$;
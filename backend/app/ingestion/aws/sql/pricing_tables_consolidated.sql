@@ -1,148 +1,47 @@
--- AWS Pricing Tables (Consolidated)
--- Single table to store pricing information for all AWS resource types
+-- AWS Pricing Views
+-- Prices are stored once for all projects in the shared pricing catalog
+-- (app/ingestion/sql/pricing_catalog.sql, refreshed daily by task_refresh_pricing_catalog).
+-- The project schema keeps the previous table/view names as views onto the
+-- catalog's current snapshot.
 
 -- =========================================================================
--- DROP OLD SEPARATE TABLES/VIEWS (One-time migration from old schema)
+-- DROP THE PER-PROJECT COPIES (tables, or views from a previous run)
 -- =========================================================================
--- These DROP statements clean up both old tables and views from previous schema.
--- Need both DROP TABLE and DROP VIEW since they might exist in either form.
--- The consolidated table (aws_pricing) is never dropped - it persists across runs.
--- Data refresh is handled by pricing.py which deletes by resource_type before inserting.
 
-DROP VIEW IF EXISTS __schema__.aws_pricing_ec2 CASCADE;
-DROP VIEW IF EXISTS __schema__.aws_pricing_s3 CASCADE;
-DROP VIEW IF EXISTS __schema__.aws_pricing_ebs CASCADE;
-
-DROP TABLE IF EXISTS __schema__.aws_pricing_ec2 CASCADE;
-DROP TABLE IF EXISTS __schema__.aws_pricing_s3 CASCADE;
-DROP TABLE IF EXISTS __schema__.aws_pricing_ebs CASCADE;
+DO $$
+DECLARE
+    rel RECORD;
+BEGIN
+    FOR rel IN
+        SELECT c.relname, c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = lower('__schema__')
+          AND c.relname IN ('aws_pricing', 'aws_pricing_ec2', 'aws_pricing_s3', 'aws_pricing_ebs')
+    LOOP
+        IF rel.relkind = 'r' THEN
+            EXECUTE format('DROP TABLE %I.%I CASCADE', lower('__schema__'), rel.relname);
+        ELSIF rel.relkind = 'v' THEN
+            EXECUTE format('DROP VIEW %I.%I CASCADE', lower('__schema__'), rel.relname);
+        END IF;
+    END LOOP;
+END $$;
 
 -- =========================================================================
--- CONSOLIDATED PRICING TABLE
+-- VIEWS ONTO THE SHARED CATALOG
 -- =========================================================================
 
-CREATE TABLE IF NOT EXISTS __schema__.aws_pricing (
-    id SERIAL PRIMARY KEY,
-
-    -- Resource type identifier
-    resource_type VARCHAR(50) NOT NULL,  -- 'ec2', 's3', 'ebs'
-
-    -- Common pricing fields
-    price DECIMAL(18, 6),
-    currency VARCHAR(10),
-    region VARCHAR(50),
-    region_name VARCHAR(100),
-    unit VARCHAR(50),
-    description TEXT,
-
-    -- EC2-specific fields (nullable)
-    instance_type VARCHAR(100),
-    vcpu VARCHAR(50),
-    memory VARCHAR(50),
-    storage VARCHAR(100),
-    network_performance VARCHAR(100),
-    instance_family VARCHAR(100),
-    physical_processor VARCHAR(255),
-    clock_speed VARCHAR(50),
-    price_per_hour DECIMAL(18, 6),
-    operating_system VARCHAR(50),
-    tenancy VARCHAR(50),
-
-    -- S3-specific fields (nullable)
-    storage_class VARCHAR(100),
-    volume_type VARCHAR(100),
-    usage_type VARCHAR(100),
-    price_per_unit DECIMAL(18, 6),
-
-    -- EBS-specific fields (nullable)
-    storage_media VARCHAR(50),
-    max_iops_volume VARCHAR(50),
-    max_throughput_volume VARCHAR(50),
-    price_per_gb_month DECIMAL(18, 6),
-
-    -- Timestamp
-    last_updated TIMESTAMP DEFAULT now()
-);
-
--- Create indexes for faster lookups
-CREATE INDEX IF NOT EXISTS idx_aws_pricing_resource_type
-    ON __schema__.aws_pricing(resource_type);
-
-CREATE INDEX IF NOT EXISTS idx_aws_pricing_ec2_instance
-    ON __schema__.aws_pricing(resource_type, instance_type, region)
-    WHERE resource_type = 'ec2';
-
-CREATE INDEX IF NOT EXISTS idx_aws_pricing_s3_storage
-    ON __schema__.aws_pricing(resource_type, storage_class, region)
-    WHERE resource_type = 's3';
-
-CREATE INDEX IF NOT EXISTS idx_aws_pricing_ebs_volume
-    ON __schema__.aws_pricing(resource_type, volume_type, region)
-    WHERE resource_type = 'ebs';
-
-CREATE INDEX IF NOT EXISTS idx_aws_pricing_region
-    ON __schema__.aws_pricing(region, resource_type);
-
--- =========================================================================
--- RESOURCE-SPECIFIC VIEWS (Optional, for backward compatibility)
--- =========================================================================
+CREATE VIEW __schema__.aws_pricing AS
+SELECT * FROM __catalog__.aws_pricing_current;
 
--- EC2 Pricing View
-CREATE OR REPLACE VIEW __schema__.aws_pricing_ec2 AS
-SELECT
-    id,
-    instance_type,
-    vcpu,
-    memory,
-    storage,
-    network_performance,
-    instance_family,
-    physical_processor,
-    clock_speed,
-    price_per_hour,
-    currency,
-    region,
-    region_name,
-    operating_system,
-    tenancy,
-    unit,
-    last_updated
-FROM __schema__.aws_pricing
-WHERE resource_type = 'ec2';
+CREATE VIEW __schema__.aws_pricing_ec2 AS
+SELECT * FROM __catalog__.aws_pricing_ec2;
 
--- S3 Pricing View
-CREATE OR REPLACE VIEW __schema__.aws_pricing_s3 AS
-SELECT
-    id,
-    storage_class,
-    volume_type,
-    usage_type,
-    price_per_unit,
-    currency,
-    region,
-    region_name,
-    unit,
-    description,
-    last_updated
-FROM __schema__.aws_pricing
-WHERE resource_type = 's3';
+CREATE VIEW __schema__.aws_pricing_s3 AS
+SELECT * FROM __catalog__.aws_pricing_s3;
 
--- EBS Pricing View
-CREATE OR REPLACE VIEW __schema__.aws_pricing_ebs AS
-SELECT
-    id,
-    volume_type,
-    storage_media,
-    max_iops_volume,
-    max_throughput_volume,
-    price_per_gb_month,
-    currency,
-    region,
-    region_name,
-    unit,
-    last_updated
-FROM __schema__.aws_pricing
-WHERE resource_type = 'ebs';
+CREATE VIEW __schema__.aws_pricing_ebs AS
+SELECT * FROM __catalog__.aws_pricing_ebs;
 
 -- Grant permissions
 GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA __schema__ TO PUBLIC;
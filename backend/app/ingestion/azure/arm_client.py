@@ -0,0 +1,167 @@
+# app/ingestion/azure/arm_client.py
+
+"""
+Shared Azure Resource Manager helpers for the metric collectors.
+
+- Access tokens are cached per service principal and reused by the VM,
+  storage account and public IP collectors (and their worker threads) until
+  shortly before they expire, instead of each collector logging in again.
+- Metric definitions depend only on the resource type (e.g.
+  microsoft.compute/virtualmachines), so they are cached per type: in-process,
+  and in Redis for METRIC_DEFINITIONS_TTL_SECONDS so the next nightly run and
+  the other Celery workers skip the metricDefinitions calls too.
+"""
+
+import os
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis
+import requests
+
+TOKEN_URL = "https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+ARM_SCOPE = "https://management.azure.com/.default"
+API_VERSION_METRIC_DEFS = "2023-10-01"
+
+# Refresh tokens this long before they expire
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+METRIC_DEFINITIONS_TTL_SECONDS = int(os.getenv("AZURE_METRIC_DEFINITIONS_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+METRIC_DEFINITIONS_KEY_PREFIX = "azure_metric_defs:"
+
+# (tenant_id, client_id) -> (access_token, expires_at epoch seconds)
+_tokens: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_token_lock = threading.Lock()
+
+# resource type -> metric definitions
+_definitions: Dict[str, List[dict]] = {}
+_definitions_lock = threading.Lock()
+
+_redis_client = None
+
+
+def get_access_token(tenant_id, client_id, client_secret) -> str:
+    """
+    Return an ARM access token for the service principal, requesting a new one
+    only when there is none cached or it expires within TOKEN_REFRESH_MARGIN_SECONDS.
+    """
+    cache_key = (tenant_id, client_id)
+    with _token_lock:
+        cached = _tokens.get(cache_key)
+        if cached and cached[1] - TOKEN_REFRESH_MARGIN_SECONDS > time.time():
+            return cached[0]
+
+        data = {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "scope": ARM_SCOPE,
+            "grant_type": "client_credentials",
+        }
+        r = requests.post(TOKEN_URL.format(tenant_id=tenant_id), data=data, timeout=30)
+        r.raise_for_status()
+        payload = r.json()
+        token = payload.get("access_token")
+        if not token:
+            raise RuntimeError("No access token received from Azure")
+
+        _tokens[cache_key] = (token, time.time() + int(payload.get("expires_in", 3600)))
+        return token
+
+
+class ArmAuth:
+    """Request headers for one service principal, refreshed through the token cache."""
+
+    def __init__(self, tenant_id, client_id, client_secret):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+
+    def __call__(self) -> Dict[str, str]:
+        token = get_access_token(self.tenant_id, self.client_id, self.client_secret)
+        return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+
+def get_redis_client() -> redis.Redis:
+    """Get the (lazily created) Redis client used for the metric definition cache."""
+    global _redis_client
+
+    if _redis_client is None:
+        redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+        _redis_client = redis.from_url(redis_url, decode_responses=True)
+    return _redis_client
+
+
+def resource_type_of(resource_id: str) -> str:
+    """
+    Lower-cased resource type of an ARM resource ID, including child types:
+    .../providers/Microsoft.Storage/storageAccounts/acc/blobServices/default
+    -> microsoft.storage/storageaccounts/blobservices
+    """
+    parts = resource_id.strip("/").split("/")
+    lowered = [p.lower() for p in parts]
+    if "providers" not in lowered:
+        return resource_id.lower()
+    idx = len(lowered) - 1 - lowered[::-1].index("providers")
+    namespace, rest = parts[idx + 1], parts[idx + 2:]
+    # rest alternates type/name: keep the type segments
+    return "/".join([namespace] + rest[0::2]).lower()
+
+
+def _load_definitions(resource_type: str) -> Optional[List[dict]]:
+    with _definitions_lock:
+        if resource_type in _definitions:
+            return _definitions[resource_type]
+    try:
+        cached = get_redis_client().get(f"{METRIC_DEFINITIONS_KEY_PREFIX}{resource_type}")
+    except Exception as e:
+        print(f"⚠️ Metric definition cache unavailable: {e}")
+        return None
+    if cached is None:
+        return None
+    definitions = json.loads(cached)
+    with _definitions_lock:
+        _definitions[resource_type] = definitions
+    return definitions
+
+
+def _store_definitions(resource_type: str, definitions: List[dict]) -> None:
+    with _definitions_lock:
+        _definitions[resource_type] = definitions
+    try:
+        get_redis_client().setex(
+            f"{METRIC_DEFINITIONS_KEY_PREFIX}{resource_type}",
+            METRIC_DEFINITIONS_TTL_SECONDS,
+            json.dumps(definitions)
+        )
+    except Exception as e:
+        print(f"⚠️ Could not cache metric definitions for {resource_type}: {e}")
+
+
+def get_metric_definitions(session, resource_id: str) -> List[dict]:
+    """
+    Metric definitions ("value" of the metricDefinitions response) for a resource,
+    served from the per-resource-type cache when possible.
+
+    Args:
+        session: monitor_metrics.MonitorSession used on a cache miss
+        resource_id: Any resource of the type
+
+    Returns:
+        List of metric definition dicts ([] if they could not be fetched; failures are not cached)
+    """
+    resource_type = resource_type_of(resource_id)
+    definitions = _load_definitions(resource_type)
+    if definitions is not None:
+        return definitions
+
+    r = session.get(f"{resource_id}/providers/microsoft.insights/metricDefinitions",
+                    {"api-version": API_VERSION_METRIC_DEFS})
+    if r is None or r.status_code != 200:
+        print(f"⚠️ metricDefinitions failed for {resource_id}: {getattr(r, 'status_code', 'no response')}")
+        return []
+
+    definitions = r.json().get("value", [])
+    _store_definitions(resource_type, definitions)
+    return definitions
@@ -1,66 +1,290 @@
 from azure.identity import ClientSecretCredential
 from azure.storage.blob import BlobServiceClient
 from dotenv import load_dotenv
+import csv
+import os
+import tempfile
+from itertools import chain, islice
 import pandas as pd
-from io import StringIO
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.ingestion.arrow_rows import hash_table_rows
+from app.ingestion.ingestion_state import filter_changed_objects
+from app.ingestion.row_hashing import hash_rows
 
 load_dotenv()
 
+# Bytes of CSV parsed per batch handed to hashing / COPY (bounds worker memory)
+BLOB_BLOCK_BYTES = int(os.getenv("AZURE_BLOB_BLOCK_BYTES", str(32 * 1024 * 1024)))
+# Rows per pandas chunk when recomputing legacy keys (see iter_legacy_key_pairs)
+BLOB_CHUNK_ROWS = int(os.getenv("AZURE_BLOB_CHUNK_ROWS", "100000"))
+# Blobs downloaded in parallel, and parallel range requests within one blob
+BLOB_DOWNLOAD_WORKERS = int(os.getenv("AZURE_BLOB_DOWNLOAD_WORKERS", "4"))
+BLOB_DOWNLOAD_CONCURRENCY = int(os.getenv("AZURE_BLOB_DOWNLOAD_CONCURRENCY", "2"))
 
-def get_df_from_blob(tenant_id, client_id, client_secret, storage_account_name, container_name):
-    """
-    Combines all CSV files in the specified Azure Blob Storage container into a single DataFrame.
-
-    Args:
-        tenant_id (str): The Azure Active Directory tenant ID.
-        client_id (str): The Azure Active Directory client ID.
-        client_secret (str): The Azure Active Directory client secret.
-        storage_account_name (str): The name of the Azure Storage account.
-        container_name (str): The name of the container within the storage account.
 
-    Returns:
-        pd.DataFrame: A DataFrame containing the combined data from all CSV files in the container.
-    """
+def get_container_client(tenant_id, client_id, client_secret, storage_account_name, container_name):
+    """Authenticate with the service principal and return a ContainerClient."""
     # Authenticate using the ClientSecretCredential
     credential = ClientSecretCredential(tenant_id, client_id, client_secret)
 
     # Create a BlobServiceClient and get a reference to the container object
     blob_service_client = BlobServiceClient(account_url=f"https://{storage_account_name}.blob.core.windows.net",
                                             credential=credential)
-    blob_container_client = blob_service_client.get_container_client(container_name)
+    return blob_service_client.get_container_client(container_name)
 
-    # List all blobs in the container
-    blob_list = blob_container_client.list_blobs()
 
-    # Filter out only CSV files
-    csv_blobs = [blob for blob in blob_list if blob.name.endswith('.csv')]
+def list_csv_blobs(blob_container_client) -> List[Dict]:
+    """
+    List the CSV exports in a container with the metadata used for incremental ingestion.
 
-    # Initialize an empty list to hold the DataFrames
-    dataframes = []
+    Returns:
+        List of {"key", "etag", "last_modified", "size"} dicts
+    """
+    return [
+        {"key": blob.name, "etag": blob.etag, "last_modified": blob.last_modified, "size": blob.size}
+        for blob in blob_container_client.list_blobs()
+        if blob.name.endswith('.csv')
+    ]
 
-    # Download each CSV file and read it into a DataFrame
-    for blob in csv_blobs:
-        blob_client = blob_container_client.get_blob_client(blob)
-        csv_content = blob_client.download_blob().readall().decode('utf-8')
-        df = pd.read_csv(StringIO(csv_content))
-        dataframes.append(df)
 
-    # Combine all DataFrames into a single DataFrame
-    combined_dataframe = pd.concat(dataframes, ignore_index=True)
+def _clean_tags(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize the 'Tags' column to JSON text, as the legacy pandas reader did."""
     # If the 'Tags' column is empty, its data type changes to double precision,
     # so we need to convert it to string to ensure consistent processing.
-    if 'Tags' in combined_dataframe.columns:
-        if combined_dataframe['Tags'].dtype != 'object':  # Not text
-            combined_dataframe['Tags'] = combined_dataframe['Tags'].astype(str)  # Convert to string
+    if 'Tags' in df.columns:
+        if df['Tags'].dtype != 'object':  # Not text
+            df['Tags'] = df['Tags'].astype(str)  # Convert to string
 
         # Replace NaN with empty JSON object and ensure proper formatting
-        combined_dataframe['Tags'] = combined_dataframe['Tags'].fillna('{}').astype(str)
-        combined_dataframe['Tags'] = combined_dataframe['Tags'].replace('nan', '{}')
+        df['Tags'] = df['Tags'].fillna('{}').astype(str)
+        df['Tags'] = df['Tags'].replace('nan', '{}')
 
         # Validate and correct improper JSON formats (e.g., replacing single quotes with double quotes)
-        combined_dataframe['Tags'] = combined_dataframe['Tags'].apply(lambda x: x if x == '{}' else x.replace("'", '"'))
-    
-    print("Data type of 'Tags' column:", combined_dataframe['Tags'].dtypes)
+        df['Tags'] = df['Tags'].apply(lambda x: x if x == '{}' else x.replace("'", '"'))
+    return df
+
+
+def _clean_tags_text(table: pa.Table) -> pa.Table:
+    """Normalize the 'Tags' column of a text batch to JSON text (blank -> '{}', ' -> \")."""
+    if 'Tags' not in table.column_names:
+        return table
+    idx = table.schema.get_field_index('Tags')
+    tags = pc.replace_substring(table.column(idx), "'", '"')
+    return table.set_column(idx, 'Tags', pc.if_else(pc.equal(tags, ""), "{}", tags))
+
+
+def _read_text_batches(path: str, block_bytes: int = BLOB_BLOCK_BYTES) -> Iterator[pa.Table]:
+    """
+    Stream a CSV file with pyarrow's reader, every column as its exported text
+    (blanks as "", never inferred types), one block of `block_bytes` at a time.
+    A value renders the same whatever file or batch it is in, so its hash_key
+    does not depend on how the export was split.
+    """
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        columns = next(csv.reader(file), None)
+    if not columns:
+        return
+
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(column_names=columns, skip_rows=1, block_size=block_bytes),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in columns},
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    for batch in reader:
+        if batch.num_rows:
+            yield _clean_tags_text(pa.Table.from_batches([batch]))
+
+
+def _download_to_file(blob_container_client, blob: Dict) -> str:
+    """Stream one blob to a temporary file (never holding it in memory) and return its path."""
+    blob_client = blob_container_client.get_blob_client(blob["key"])
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as temp_file:
+        try:
+            blob_client.download_blob(max_concurrency=BLOB_DOWNLOAD_CONCURRENCY).readinto(temp_file)
+        except Exception:
+            temp_file.close()
+            os.remove(temp_file.name)
+            raise
+        return temp_file.name
+
+
+def iter_blob_batches(blob_container_client, blobs: List[Dict],
+                      block_bytes: int = BLOB_BLOCK_BYTES,
+                      max_workers: int = BLOB_DOWNLOAD_WORKERS) -> Iterator[Tuple[Dict, pa.Table]]:
+    """
+    Yield (blob, Arrow text batch) for every CSV blob (see _read_text_batches).
+
+    Blobs are downloaded in parallel to temporary files (at most 2 * max_workers
+    waiting on disk) and streamed through pyarrow's CSV reader, so memory use
+    is bounded by one batch instead of the whole export. All batches of a blob
+    are yielded consecutively; blob["row_count"] is final once the next blob
+    starts (or the generator is exhausted).
+
+    A blob that fails to download or parse is logged and skipped with
+    blob["failed"] = True (possibly after some of its batches), so the caller
+    does not record it as ingested and the next run retries it.
+    """
+    if not blobs:
+        return
+
+    pending = list(blobs)
+    in_flight = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(blobs))),
+                                  thread_name_prefix="blob-download")
+
+    def _submit_more():
+        while pending and len(in_flight) < 2 * max_workers:
+            blob = pending.pop(0)
+            in_flight[executor.submit(_download_to_file, blob_container_client, blob)] = blob
+
+    try:
+        _submit_more()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                blob = in_flight.pop(future)
+                _submit_more()
+                try:
+                    path = future.result()
+                except Exception as e:
+                    print(f"⚠️ Failed to download export {blob['key']}, skipping it until the next run: {e}")
+                    blob["failed"] = True
+                    continue
+                try:
+                    blob["row_count"] = 0
+                    for table in _read_text_batches(path, block_bytes):
+                        blob["row_count"] += table.num_rows
+                        yield blob, table
+                except (pa.ArrowException, OSError, UnicodeDecodeError, csv.Error) as e:
+                    print(f"⚠️ Failed to parse export {blob['key']}, skipping it until the next run: {e}")
+                    blob["failed"] = True
+                finally:
+                    os.remove(path)
+    finally:
+        # Stop queued downloads if the consumer stopped early or failed
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in in_flight:
+            if not future.cancelled() and future.exception() is None:
+                os.remove(future.result())
 
 
-    return combined_dataframe
+def _merge_dtypes(left, right):
+    """dtype pd.concat gives a column read as `left` in one frame and `right` in another."""
+    if left == right:
+        return left
+    if left.kind in "iuf" and right.kind in "iuf":
+        # Integers plus blanks (or an all-blank file) -> float64, as pandas does
+        return "float64"
+    return "object"
+
+
+def iter_legacy_key_pairs(blob_container_client, blobs: List[Dict],
+                          chunk_rows: int = BLOB_CHUNK_ROWS,
+                          max_workers: int = BLOB_DOWNLOAD_WORKERS) -> Iterator[Tuple[List[str], List[str]]]:
+    """
+    Yield (legacy hash_keys, text hash_keys) of the rows of `blobs`, a batch at a time.
+
+    Runs before iter_blob_batches concatenated every export with pd.read_csv's
+    inferred dtypes and hashed that frame, so a stored row's key depends on all
+    files. Each file's dtypes are rebuilt from a chunked pass, and so is the
+    upcast pd.concat applies (a column that is int in one file and float in
+    another becomes float64; other mixes become object, keeping every file's own
+    values). Each file is then read twice in lockstep: with those dtypes (legacy
+    key) and as text, like iter_blob_batches (current key). Used once, to rekey
+    rows loaded by those runs. Every blob is kept on disk until the generator finishes.
+    """
+    if not blobs:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(blobs))),
+                            thread_name_prefix="blob-download") as executor:
+        futures = [executor.submit(_download_to_file, blob_container_client, blob) for blob in blobs]
+    paths = []
+    for blob, future in zip(blobs, futures):
+        if future.exception() is not None:
+            print(f"⚠️ Failed to download export {blob['key']}, its rows are not rekeyed: {future.exception()}")
+        else:
+            paths.append(future.result())
+
+    try:
+        file_dtypes: List[Dict[str, object]] = []
+        for path in paths:
+            dtypes: Dict[str, object] = {}
+            for chunk in pd.read_csv(path, chunksize=chunk_rows):
+                for column, dtype in chunk.dtypes.items():
+                    dtypes[column] = _merge_dtypes(dtypes[column], dtype) if column in dtypes else dtype
+            file_dtypes.append(dtypes)
+
+        concat_dtypes: Dict[str, object] = {}
+        for dtypes in file_dtypes:
+            for column, dtype in dtypes.items():
+                concat_dtypes[column] = _merge_dtypes(concat_dtypes[column], dtype) if column in concat_dtypes else dtype
+
+        for path, dtypes in zip(paths, file_dtypes):
+            read_dtypes = {
+                column: "float64" if concat_dtypes[column] == "float64" else dtype
+                for column, dtype in dtypes.items()
+            }
+            legacy_keys = chain.from_iterable(
+                hash_rows(_clean_tags(chunk)).tolist()
+                for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=read_dtypes)
+            )
+            for table in _read_text_batches(path):
+                text_keys = hash_table_rows(table)
+                yield list(islice(legacy_keys, len(text_keys))), text_keys
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+def get_df_from_blob(tenant_id, client_id, client_secret, storage_account_name, container_name):
+    """
+    Combines all CSV files in the specified Azure Blob Storage container into a single DataFrame
+    of text columns. Loads the whole export into memory; ingestion uses iter_blob_batches instead.
+
+    Args:
+        tenant_id (str): The Azure Active Directory tenant ID.
+        client_id (str): The Azure Active Directory client ID.
+        client_secret (str): The Azure Active Directory client secret.
+        storage_account_name (str): The name of the Azure Storage account.
+        container_name (str): The name of the container within the storage account.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing the combined data from all CSV files in the container.
+    """
+    blob_container_client = get_container_client(tenant_id, client_id, client_secret,
+                                                  storage_account_name, container_name)
+    batches = [batch for _, batch in iter_blob_batches(blob_container_client, list_csv_blobs(blob_container_client))]
+    if not batches:
+        return pd.DataFrame()
+    return pa.concat_tables(batches, promote_options="default").to_pandas()
+
+
+def get_changed_blobs(tenant_id, client_id, client_secret, storage_account_name, container_name,
+                      processed_blobs: Optional[Dict[str, Dict]] = None):
+    """
+    List the CSV exports that are new or whose ETag / LastModified changed since
+    they were last ingested.
+
+    Args:
+        processed_blobs: {blob_name: {"etag", "last_modified"}} from the ingestion state table
+            (None or empty: every blob is returned)
+
+    Returns:
+        (ContainerClient, list of new/changed blobs) - pass both to iter_blob_batches
+    """
+    blob_container_client = get_container_client(tenant_id, client_id, client_secret,
+                                                  storage_account_name, container_name)
+    blobs = list_csv_blobs(blob_container_client)
+    changed_blobs = filter_changed_objects(blobs, processed_blobs or {})
+    print(f"{len(changed_blobs)}/{len(blobs)} CSV export(s) new or changed since the last run")
+    return blob_container_client, changed_blobs
@@ -563,7 +563,7 @@ def get_storage_recommendation_single(resource_data: Dict[str, Any]) -> Optional
     forecast = _extrapolate_costs(billed_cost, duration_days)
     prompt = _generate_storage_prompt(resource_data, start_date, end_date, forecast['monthly'], forecast['annually'])
     
-    raw = llm_call(prompt)
+    raw = llm_call(prompt, cache_scope=("azure", resource_data.get("schema_name"), "storage", resource_id))
     if not raw:
         logging.error(f"Empty LLM response for storage resource {resource_id}")
         return None
@@ -606,7 +606,7 @@ def get_compute_recommendation_single(resource_data: Dict[str, Any]) -> Optional
     forecast = _extrapolate_costs(billed_cost, duration_days)
     prompt = _generate_compute_prompt(resource_data, start_date, end_date, forecast['monthly'], forecast['annually'])
     
-    raw = llm_call(prompt)
+    raw = llm_call(prompt, cache_scope=("azure", resource_data.get("schema_name"), "vm", resource_id))
     if not raw:
         logging.error(f"Empty LLM response for compute resource {resource_id}")
         return None
@@ -883,7 +883,7 @@ def get_public_ip_recommendation_single(resource_data: Dict[str, Any]) -> Option
     forecast = _extrapolate_costs(billed_cost, duration_days)
     prompt = _generate_public_ip_prompt(resource_data, start_date, end_date, forecast['monthly'], forecast['annually'])
     
-    raw = llm_call(prompt)
+    raw = llm_call(prompt, cache_scope=("azure", resource_data.get("schema_name"), "publicip", resource_id))
     if not raw:
         logging.error(f"Empty LLM response for Public IP resource {resource_id}")
         return None
@@ -14,6 +14,7 @@ from urllib.parse import quote_plus
 # Import necessary functions from the same directory or core modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 from app.ingestion.azure.postgres_operation import connection
+from app.core.llm_concurrency import run_bulk_llm
 # Import LLM recommendation functions from the new analysis file
 from app.ingestion.azure.llm_analysis import (
     _extrapolate_costs,
@@ -667,7 +668,6 @@ def run_llm_vm_all_resources(conn, schema_name, start_date=None, end_date=None,
     Returns:
         List of recommendation dictionaries, one per VM resource
     """
-    from app.core.task_manager import task_manager
     if end_date is None:
         end_dt = datetime.utcnow().date()
     else:
@@ -695,43 +695,25 @@ def run_llm_vm_all_resources(conn, schema_name, start_date=None, end_date=None,
     df["end_date"] = end_str
     df["duration_days"] = (pd.to_datetime(end_str) - pd.to_datetime(start_str)).days or 1
 
-    recommendations = []
     total_resources = len(df)
     print(f"📊 Found {total_resources} distinct VM resources to analyze")
 
-    # Process each row (resource) individually through LLM
-    for idx, row in df.iterrows():
-        # Check if task has been cancelled
-        if task_id:
-            is_cancelled = task_manager.is_cancelled(task_id)
-            if is_cancelled:
-                print(f"🛑 Task {task_id} was cancelled. Stopping VM analysis. Processed {len(recommendations)}/{total_resources}")
-                break
-            # Debug: Confirm task is still active
-            if idx == 0 or idx % 10 == 0:  # Log every 10th iteration
-                print(f"  🔍 Task {task_id[:8]}... still running, not cancelled (iteration {idx + 1})")
-
-        resource_id = row.get('resource_id', 'Unknown')
-        print(f"  [{idx + 1}/{total_resources}] Processing VM: {resource_id}")
-
-        try:
-            resource_dict = row.to_dict()
-            # Add schema_name and region for pricing lookups
-            resource_dict['schema_name'] = schema_name
-            resource_dict['region'] = resource_dict.get('location', 'eastus')
-            recommendation = get_compute_recommendation_single(resource_dict)
-
-            if recommendation:
-                recommendations.append(recommendation)
-                print(f"    ✅ LLM analysis complete for {resource_id}")
-            else:
-                print(f"    ⚠️ No recommendation generated for {resource_id}")
-        except Exception as e:
-            print(f"    ❌ Error processing {resource_id}: {e}")
-            continue
-
-    print(f"✅ Completed processing {len(recommendations)}/{total_resources} VMs successfully")
-    return recommendations
+    def _analyze(resource_dict):
+        # Add schema_name and region for pricing lookups
+        resource_dict['schema_name'] = schema_name
+        resource_dict['region'] = resource_dict.get('location', 'eastus')
+        return get_compute_recommendation_single(resource_dict)
+
+    # Process each resource through the LLM with bounded concurrency
+    # Resources already analyzed for this date range (by a bulk or single run) come from cache
+    cache_scope = {
+        "cloud_platform": "azure",
+        "schema_name": schema_name,
+        "resource_type": "vm",
+        "start_date": start_dt,
+        "end_date": end_dt,
+    }
+    return run_bulk_llm(df.to_dict(orient="records"), _analyze, task_id=task_id, label="VM", cache_scope=cache_scope)
 
 
 @connection
@@ -745,7 +727,6 @@ def run_llm_storage_all_resources(conn, schema_name, start_date=None, end_date=N
     Returns:
         List of recommendation dictionaries, one per Storage Account
     """
-    from app.core.task_manager import task_manager
     if end_date is None:
         end_dt = datetime.utcnow().date()
     else:
@@ -773,43 +754,25 @@ def run_llm_storage_all_resources(conn, schema_name, start_date=None, end_date=N
     df["end_date"] = end_str
     df["duration_days"] = (pd.to_datetime(end_str) - pd.to_datetime(start_str)).days or 1
 
-    recommendations = []
     total_resources = len(df)
     print(f"📊 Found {total_resources} distinct Storage Account resources to analyze")
 
-    # Process each row (resource) individually through LLM
-    for idx, row in df.iterrows():
-        # Check if task has been cancelled
-        if task_id:
-            is_cancelled = task_manager.is_cancelled(task_id)
-            if is_cancelled:
-                print(f"🛑 Task {task_id} was cancelled. Stopping Storage analysis. Processed {len(recommendations)}/{total_resources}")
-                break
-            # Debug: Confirm task is still active
-            if idx == 0 or idx % 10 == 0:  # Log every 10th iteration
-                print(f"  🔍 Task {task_id[:8]}... still running, not cancelled (iteration {idx + 1})")
-
-        resource_id = row.get('resource_id', 'Unknown')
-        print(f"  [{idx + 1}/{total_resources}] Processing Storage Account: {resource_id}")
-
-        try:
-            resource_dict = row.to_dict()
-            # Add schema_name and region for pricing lookups
-            resource_dict['schema_name'] = schema_name
-            resource_dict['region'] = resource_dict.get('location', 'eastus')
-            recommendation = get_storage_recommendation_single(resource_dict)
-
-            if recommendation:
-                recommendations.append(recommendation)
-                print(f"    ✅ LLM analysis complete for {resource_id}")
-            else:
-                print(f"    ⚠️ No recommendation generated for {resource_id}")
-        except Exception as e:
-            print(f"    ❌ Error processing {resource_id}: {e}")
-            continue
-
-    print(f"✅ Completed processing {len(recommendations)}/{total_resources} Storage Accounts successfully")
-    return recommendations
+    def _analyze(resource_dict):
+        # Add schema_name and region for pricing lookups
+        resource_dict['schema_name'] = schema_name
+        resource_dict['region'] = resource_dict.get('location', 'eastus')
+        return get_storage_recommendation_single(resource_dict)
+
+    # Process each resource through the LLM with bounded concurrency
+    # Resources already analyzed for this date range (by a bulk or single run) come from cache
+    cache_scope = {
+        "cloud_platform": "azure",
+        "schema_name": schema_name,
+        "resource_type": "storage",
+        "start_date": start_dt,
+        "end_date": end_dt,
+    }
+    return run_bulk_llm(df.to_dict(orient="records"), _analyze, task_id=task_id, label="Storage Account", cache_scope=cache_scope)
 
 
 
@@ -1085,7 +1048,6 @@ def run_llm_public_ip_all_resources(conn, schema_name, start_date=None, end_date
     Returns:
         List of recommendation dictionaries, one per Public IP
     """
-    from app.core.task_manager import task_manager
     if end_date is None:
         end_dt = datetime.utcnow().date()
     else:
@@ -1113,43 +1075,25 @@ def run_llm_public_ip_all_resources(conn, schema_name, start_date=None, end_date
     df["end_date"] = end_str
     df["duration_days"] = (pd.to_datetime(end_str) - pd.to_datetime(start_str)).days or 1
 
-    recommendations = []
     total_resources = len(df)
     print(f"📊 Found {total_resources} distinct Public IP resources to analyze")
 
-    # Process each row (resource) individually through LLM
-    for idx, row in df.iterrows():
-        # Check if task has been cancelled
-        if task_id:
-            is_cancelled = task_manager.is_cancelled(task_id)
-            if is_cancelled:
-                print(f"🛑 Task {task_id} was cancelled. Stopping Public IP analysis. Processed {len(recommendations)}/{total_resources}")
-                break
-            # Debug: Confirm task is still active
-            if idx == 0 or idx % 10 == 0:  # Log every 10th iteration
-                print(f"  🔍 Task {task_id[:8]}... still running, not cancelled (iteration {idx + 1})")
-
-        resource_id = row.get('resource_id', 'Unknown')
-        print(f"  [{idx + 1}/{total_resources}] Processing Public IP: {resource_id}")
-
-        try:
-            resource_dict = row.to_dict()
-            # Add schema_name and region for pricing lookups
-            resource_dict['schema_name'] = schema_name
-            resource_dict['region'] = resource_dict.get('location', 'eastus')
-            recommendation = get_public_ip_recommendation_single(resource_dict)
-
-            if recommendation:
-                recommendations.append(recommendation)
-                print(f"    ✅ LLM analysis complete for {resource_id}")
-            else:
-                print(f"    ⚠️ No recommendation generated for {resource_id}")
-        except Exception as e:
-            print(f"    ❌ Error processing {resource_id}: {e}")
-            continue
-
-    print(f"✅ Completed processing {len(recommendations)}/{total_resources} Public IPs successfully")
-    return recommendations
+    def _analyze(resource_dict):
+        # Add schema_name and region for pricing lookups
+        resource_dict['schema_name'] = schema_name
+        resource_dict['region'] = resource_dict.get('location', 'eastus')
+        return get_public_ip_recommendation_single(resource_dict)
+
+    # Process each resource through the LLM with bounded concurrency
+    # Resources already analyzed for this date range (by a bulk or single run) come from cache
+    cache_scope = {
+        "cloud_platform": "azure",
+        "schema_name": schema_name,
+        "resource_type": "publicip",
+        "start_date": start_dt,
+        "end_date": end_dt,
+    }
+    return run_bulk_llm(df.to_dict(orient="records"), _analyze, task_id=task_id, label="Public IP", cache_scope=cache_scope)
 def run_llm_analysis(resource_type, schema_name, start_date=None, end_date=None, resource_id=None, task_id=None):
     """
     Unified entry point for running LLM cost optimization analyses.
@@ -1,13 +1,10 @@
-import hashlib
-import pandas as pd
-from .postgres_operation import dump_to_postgresql, run_sql_file,fetch_existing_hash_keys,create_hash_key
-from .blob import get_df_from_blob
-import psycopg2
+from .postgres_operation import run_sql_file, run_silver_sql_file, refresh_gold_views, insert_new_rows_to_postgresql, get_ingestion_state, save_ingestion_state, table_has_rows, rekey_hash_keys
+from .blob import get_changed_blobs, iter_blob_batches, iter_legacy_key_pairs
+from app.ingestion.arrow_rows import prepare_table_for_load
 from .metrics_vm import metrics_dump
 from .metrics_storage_account import metrics_dump as storage_metrics_dump
 from .metrics_public_ip import metrics_dump as public_ip_metrics_dump
 from .pricing import fetch_and_store_all_azure_pricing
-import json
 import sys
 import os
 
@@ -15,6 +12,13 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from app.core.recommendation_prewarm import prewarm_azure_recommendations
 
+# Materialized by sql/gold.sql, refreshed in this order after each billing load
+GOLD_MATERIALIZED_VIEWS = [
+    "gold_azure_resource_dim",
+    "gold_azure_charge_summary_dim",
+    "gold_azure_account_dim",
+    "gold_azure_fact_cost_mv",
+]
 
 def azure_main(project_name,
                budget,
@@ -28,13 +32,6 @@ def azure_main(project_name,
     table_name = "bronze_azure_focus"
     schema_name = project_name.lower()
     print(f'Azure subscription id: {subscription_id}')
-    # Get the dataframe from the blob storage
-    df = get_df_from_blob(tenant_id, client_id, client_secret, storage_account_name, container_name)
-    print(f'df created')
-
-    # Create a hash key using all columns in the dataset
-    df = create_hash_key(df)
-    print(f'hash_key column added to dataframe')
 
     run_sql_file(f'{base_path}/sql/new_schema.sql', schema_name, budget)
     print(f'schema {schema_name} created')
@@ -47,34 +44,68 @@ def azure_main(project_name,
     run_sql_file(f'{base_path}/sql/genai_response.sql', schema_name, budget)
     print(f'Bronze metrics tables created')
 
-    # Create consolidated pricing table
-    run_sql_file(f'{base_path}/sql/pricing_tables_consolidated.sql', schema_name, budget)
-    print(f'Consolidated pricing table created')
-
-    # Fetch and store Azure pricing data (early in pipeline for LLM use)
+    # Azure prices come from the shared pricing catalog (daily beat task);
+    # fetch them here only if the catalog is empty or stale
     try:
-        # Detect region from data or use default eastus
-        fetch_and_store_all_azure_pricing(schema_name, region="eastus", currency="USD")
+        fetch_and_store_all_azure_pricing(only_if_stale=True)
     except Exception as e:
         print(f'⚠️ Error fetching Azure pricing: {e}')
         # Continue even if pricing fetch fails
 
-
-    # Check for existing hash keys in the PostgreSQL table
-    existing_hash_keys = fetch_existing_hash_keys(schema_name, table_name)
-    # print(f'Existing hash keys fetched: {len(existing_hash_keys)}')
-
-     # Filter out rows with hash keys that already exist in PostgreSQL
-    new_data = df[~df['hash_key'].isin(existing_hash_keys)]
-    print(f'Number of new records to insert: {len(new_data)}')
-
-    # If there is new data, dump it into PostgreSQL
-    if not new_data.empty:
-        dump_to_postgresql(new_data, schema_name, table_name)
-        print(f'New records appended to PostgreSQL')
-
-    # Run SQL files for billing silver and gold stages
-    run_sql_file(f'{base_path}/sql/silver.sql', schema_name, budget)
+    # Pricing views onto the shared catalog
+    run_sql_file(f'{base_path}/sql/pricing_tables_consolidated.sql', schema_name, budget)
+    print(f'Pricing views created')
+
+
+    # Only exports that are new or changed since the last run
+    state_source = f'azure_blob:{storage_account_name}/{container_name}'
+    processed_blobs = get_ingestion_state(schema_name, state_source) or {}
+    container_client, changed_blobs = get_changed_blobs(tenant_id, client_id, client_secret,
+                                                        storage_account_name, container_name, processed_blobs)
+
+    if not processed_blobs and changed_blobs and table_has_rows(schema_name, table_name):
+        # Rows loaded before exports were read as text carry keys of the legacy
+        # all-files pandas read; move them to the text keys once, so this full
+        # pass over the exports does not insert them a second time
+        print('Rekeying billing rows loaded before text hashing...')
+        rekeyed = 0
+        for legacy_keys, text_keys in iter_legacy_key_pairs(container_client, changed_blobs):
+            counts = rekey_hash_keys(schema_name, [table_name, 'silver_azure_focus'], legacy_keys, text_keys) or {}
+            rekeyed += counts.get(table_name, 0)
+        print(f'Rekeyed {rekeyed} previously loaded rows in {schema_name}.{table_name}')
+
+    # Stream the exports batch by batch: hash, deduplicate and COPY each batch
+    # before the next one is parsed, so memory is bounded by one batch
+    inserted = 0
+    current_blob, current_blob_ok = None, True
+
+    def _finish_blob(blob, ok):
+        # Loaded - do not download this export again unless it changes
+        if blob is not None and ok and not blob.get("failed"):
+            save_ingestion_state(schema_name, state_source, [blob])
+
+    for blob, batch in iter_blob_batches(container_client, changed_blobs):
+        if blob is not current_blob:
+            _finish_blob(current_blob, current_blob_ok)
+            current_blob, current_blob_ok = blob, True
+            print(f'Processing export {blob["key"]}')
+
+        # Hash every row from its exported text, drop in-batch duplicates, blanks to NULL
+        batch = prepare_table_for_load(batch)
+
+        # Insert only rows whose hash key is not in PostgreSQL yet (deduplicated in the database)
+        batch_inserted = insert_new_rows_to_postgresql(batch, schema_name, table_name)
+        if batch_inserted is None:
+            current_blob_ok = False
+        inserted += batch_inserted or 0
+    _finish_blob(current_blob, current_blob_ok)
+    print(f'Number of new records inserted: {inserted}')
+
+    # Run SQL files for billing silver and gold stages (only when billing data changed)
+    if inserted:
+        run_silver_sql_file(f'{base_path}/sql/silver.sql', schema_name, budget, table_name, 'silver_azure_focus')
+    else:
+        print(f'No new billing rows, skipping silver billing refresh')
 
     # Fetch metrics from Azure Monitor for all resource types
     print(f"\n📊 Fetching metrics from Azure Monitor...")
@@ -105,6 +136,7 @@ def azure_main(project_name,
 
     # Billing gold views
     run_sql_file(f'{base_path}/sql/gold.sql', schema_name, budget)
+    refresh_gold_views(schema_name, GOLD_MATERIALIZED_VIEWS, data_changed=bool(inserted))
     print(f"✅ Gold billing views created")
 
     # Consolidated metrics gold views
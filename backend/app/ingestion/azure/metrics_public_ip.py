@@ -1,15 +1,14 @@
 import os
-import time
 import requests
 import pandas as pd
-from datetime import datetime, timedelta
-from urllib.parse import quote_plus
-from app.ingestion.azure.postgres_operation import dump_to_postgresql, fetch_existing_hash_keys
+from app.ingestion.azure.postgres_operation import insert_new_rows_to_postgresql, get_metric_watermarks
+from app.ingestion.azure.arm_client import ArmAuth, get_access_token, get_metric_definitions
+from app.ingestion.azure.monitor_metrics import MonitorSession, fetch_metrics, iter_points, resource_timespans
+from app.ingestion.row_hashing import hash_rows_int
 
 # ---------------- Config ----------------
 API_VERSION_PUBLIC_IP = "2023-05-01"
 API_VERSION_METRICS = "2023-10-01"
-API_VERSION_METRIC_DEFS = "2023-10-01"
 
 # Default preferred aggregations for known metrics
 # This is used as a fallback if metric definitions don't specify aggregations
@@ -27,24 +26,8 @@ DEFAULT_PREFERRED_AGG = {
 
 INTERVAL = os.getenv("INTERVAL", "PT1H")
 DAYS_BACK = int(os.getenv("DAYS_BACK", "30")) # Default matching your test script
-SLEEP_BETWEEN_CALLS = float(os.getenv("SLEEP_BETWEEN_CALLS", "0.25"))
 
 # ---------------- Helpers ----------------
-def get_access_token(tenant_id, client_id, client_secret):
-    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
-    data = {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "scope": "https://management.azure.com/.default",
-        "grant_type": "client_credentials",
-    }
-    r = requests.post(token_url, data=data, timeout=30)
-    r.raise_for_status()
-    token = r.json().get("access_token")
-    if not token:
-        raise RuntimeError("No access token received from Azure")
-    return token
-
 def list_public_ips(subscription_id, headers):
     url = (
         f"https://management.azure.com/subscriptions/{subscription_id}/providers/Microsoft.Network/publicIPAddresses"
@@ -69,22 +52,14 @@ def get_public_ip_details(data):
         "provisioning_state": props.get("provisioningState", "unknown"),
     }
 
-def get_available_metrics(resource_id, headers):
+def get_available_metrics(resource_id, session):
     """
     Discover all available metrics for a given Public IP resource.
     Returns a list of tuples: (metric_name, supported_aggregations)
     """
-    url = (
-        f"https://management.azure.com{resource_id}/providers/microsoft.insights/metricDefinitions"
-        f"?api-version={API_VERSION_METRIC_DEFS}"
-    )
     try:
-        r = requests.get(url, headers=headers, timeout=30)
-        if r.status_code != 200:
-            print(f"⚠️  Failed to fetch metric definitions: {r.status_code}")
-            return []
-
-        definitions = r.json().get("value", [])
+        # Definitions are the same for every Public IP; served from the per-resource-type cache
+        definitions = get_metric_definitions(session, resource_id)
         metrics_info = []
 
         for metric_def in definitions:
@@ -116,97 +91,88 @@ def get_available_metrics(resource_id, headers):
         print(f"❌ Error fetching metric definitions: {e}")
         return []
 
-def fetch_metric_response(resource_id, metric_name, headers, timespan, interval, agg_to_use):
-    metric_q = quote_plus(metric_name)
-    metrics_url = (
-        f"https://management.azure.com{resource_id}/providers/microsoft.insights/metrics"
-        f"?api-version={API_VERSION_METRICS}"
-        f"&metricnames={metric_q}"
-        f"&timespan={timespan}"
-        f"&interval={interval}"
-        f"&aggregation={agg_to_use}"
-    )
-    try:
-        r = requests.get(metrics_url, headers=headers, timeout=30)
-    except Exception as e:
-        print(f"❌ REQUEST ERROR for {resource_id} metric {metric_name}: {e}")
-        return None
-    
-    if r.status_code == 400:
-        print(f"⊘ Metric not available -> {metric_name}. 400")
-        return None
-    if r.status_code != 200:
-        print(f"⚠️ Unexpected status -> {metric_name}: {r.status_code}")
-        return r
-    return r
-
 # ---------- Collection ----------
-def collect_all_public_ip_metrics(public_ips, headers, timespan, interval, subscription_id):
+def collect_public_ip_metrics(pip, session, timespan, interval, subscription_id):
+    """
+    Fetch all available metrics of one Public IP, several metrics per request
+    (grouped by aggregation).
+
+    Returns:
+        List of row dicts
+    """
     rows = []
-    for pip in public_ips:
-        name = pip.get("name")
-        resource_id = pip.get("id")
-        print(f"\n📦 Processing Public IP: {name}")
-
-        details = get_public_ip_details(pip)
-
-        # Discover available metrics for this Public IP
-        available_metrics = get_available_metrics(resource_id, headers)
-        if not available_metrics:
-            print(f"⚠️  No metrics available for {name}, skipping...")
-            continue
-
-        print(f"✅ Found {len(available_metrics)} available metric(s)")
-
-        for metric_name, agg_to_use in available_metrics:
-            
-            resp = fetch_metric_response(resource_id, metric_name, headers, timespan, interval, agg_to_use)
-            time.sleep(SLEEP_BETWEEN_CALLS)
-            
-            if resp is None or resp.status_code != 200:
-                continue
+    name = pip.get("name")
+    resource_id = pip.get("id")
+    print(f"\n📦 Processing Public IP: {name}")
 
-            payload = resp.json()
+    details = get_public_ip_details(pip)
+
+    # Discover available metrics for this Public IP
+    available_metrics = get_available_metrics(resource_id, session)
+    if not available_metrics:
+        print(f"⚠️  No metrics available for {name}, skipping...")
+        return rows
+
+    print(f"✅ Found {len(available_metrics)} available metric(s)")
+
+    metrics_by_aggregation = {}
+    for metric_name, agg_to_use in available_metrics:
+        metrics_by_aggregation.setdefault(agg_to_use, []).append(metric_name)
+
+    for agg_to_use, names in metrics_by_aggregation.items():
+        for payload in fetch_metrics(session, resource_id, names, agg_to_use, timespan, interval):
             namespace = payload.get("namespace", "")
             resourceregion = payload.get("resourceregion", "")
 
-            for metric in payload.get("value", []):
-                metric_unit = metric.get("unit", "")
-                metric_name_actual = (metric.get("name") or {}).get("value", metric_name)
-                display_desc = metric.get("displayDescription", "")
-
-                for series in metric.get("timeseries", []):
-                    for point in series.get("data", []):
-                        # Extract value based on aggregation used
-                        if "total" in point: value = point.get("total")
-                        elif "average" in point: value = point.get("average")
-                        elif "count" in point: value = point.get("count")
-                        elif "maximum" in point: value = point.get("maximum")
-                        else: value = 0.0
-
-                        if value is None: value = 0.0
-
-                        row = {
-                            "public_ip_name": name,
-                            "resource_group": resource_id.split("/")[4] if resource_id and "/" in resource_id else "unknown",
-                            "subscription_id": subscription_id,
-                            "timestamp": point.get("timeStamp"),
-                            "value": value,
-                            "metric_name": metric_name_actual,
-                            "unit": metric_unit,
-                            "displaydescription": display_desc,
-                            "namespace": namespace,
-                            "resourceregion": resourceregion,
-                            "resource_id": resource_id,
-                            "sku": details.get("sku"),
-                            "tier": details.get("tier"),
-                            "ip_address": details.get("ip_address"),
-                            "ip_version": details.get("ip_version"),
-                            "ip_allocation_method": details.get("ip_allocation_method"),
-                            "location": details.get("location"),
-                            "provisioning_state": details.get("provisioning_state"),
-                        }
-                        rows.append(row)
+            for metric, point in iter_points(payload):
+                # Extract value based on aggregation used
+                if "total" in point: value = point.get("total")
+                elif "average" in point: value = point.get("average")
+                elif "count" in point: value = point.get("count")
+                elif "maximum" in point: value = point.get("maximum")
+                else: value = 0.0
+
+                if value is None: value = 0.0
+
+                rows.append({
+                    "public_ip_name": name,
+                    "resource_group": resource_id.split("/")[4] if resource_id and "/" in resource_id else "unknown",
+                    "subscription_id": subscription_id,
+                    "timestamp": point.get("timeStamp"),
+                    "value": value,
+                    "metric_name": (metric.get("name") or {}).get("value"),
+                    "unit": metric.get("unit", ""),
+                    "displaydescription": metric.get("displayDescription", ""),
+                    "namespace": namespace,
+                    "resourceregion": resourceregion,
+                    "resource_id": resource_id,
+                    "sku": details.get("sku"),
+                    "tier": details.get("tier"),
+                    "ip_address": details.get("ip_address"),
+                    "ip_version": details.get("ip_version"),
+                    "ip_allocation_method": details.get("ip_allocation_method"),
+                    "location": details.get("location"),
+                    "provisioning_state": details.get("provisioning_state"),
+                })
+    return rows
+
+def collect_all_public_ip_metrics(public_ips, session, timespans, interval, subscription_id):
+    """
+    Collect metrics for all Public IPs in parallel (bounded by the session's worker count).
+
+    Args:
+        timespans: {resource_id: timespan} (see monitor_metrics.resource_timespans)
+    """
+    def _collect(pip):
+        try:
+            return collect_public_ip_metrics(pip, session, timespans[pip.get("id")], interval, subscription_id)
+        except Exception as e:
+            print(f"❌ Error collecting metrics for Public IP {pip.get('name')}: {e}")
+            return []
+
+    rows = []
+    for pip_rows in session.map(_collect, public_ips):
+        rows.extend(pip_rows)
     return pd.DataFrame(rows)
 
 # ---------- Main ----------
@@ -219,10 +185,7 @@ def metrics_dump(tenant_id, client_id, client_secret, subscription_id, schema_na
         return
     
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    end_time = datetime.utcnow()
-    start_time = end_time - timedelta(days=DAYS_BACK)
-    timespan = f"{start_time.isoformat()}Z/{end_time.isoformat()}Z"
-    
+
     try:
         public_ips = list_public_ips(subscription_id, headers)
         print(f"📦 Found {len(public_ips)} Public IP(s)")
@@ -234,7 +197,12 @@ def metrics_dump(tenant_id, client_id, client_secret, subscription_id, schema_na
         print("No Public IPs found. Exiting.")
         return
 
-    df = collect_all_public_ip_metrics(public_ips, headers, timespan, INTERVAL, subscription_id)
+    # Only the points after what is already stored (full DAYS_BACK window for new Public IPs)
+    watermarks = get_metric_watermarks(schema_name, table_name) or {}
+    timespans = resource_timespans([pip.get("id") for pip in public_ips], watermarks, DAYS_BACK, INTERVAL)
+
+    with MonitorSession(ArmAuth(tenant_id, client_id, client_secret)) as session:
+        df = collect_all_public_ip_metrics(public_ips, session, timespans, INTERVAL, subscription_id)
     if df.empty:
         print("No metrics collected. Exiting.")
         return
@@ -245,16 +213,10 @@ def metrics_dump(tenant_id, client_id, client_secret, subscription_id, schema_na
     # create hash_key
     df = df.copy()
     # Hash based on resource + timestamp + metric
-    df['hash_key'] = df[['public_ip_name', 'timestamp', 'metric_name', 'resource_id', 'subscription_id']].astype(str).sum(axis=1).apply(lambda x: hash(x) % (10**12))
-
-    existing = fetch_existing_hash_keys(schema_name, table_name)
-    new_df = df[~df['hash_key'].isin(existing)].copy()
-    print(f"🔎 New unique records to insert: {len(new_df)}")
-
-    if new_df.empty:
-        print("No new unique records to insert.")
-        return
+    # Stable across processes (builtin hash() is salted per interpreter run)
+    df['hash_key'] = hash_rows_int(df, columns=['public_ip_name', 'timestamp', 'metric_name', 'resource_id', 'subscription_id'], modulus=10**12)
 
+    new_df = df
     # Ensure column order matches Bronze table
     column_order = [
         "public_ip_name", "resource_group", "subscription_id", "timestamp", "value",
@@ -269,7 +231,9 @@ def metrics_dump(tenant_id, client_id, client_secret, subscription_id, schema_na
     new_df = new_df[column_order]
 
     try:
-        dump_to_postgresql(new_df, schema_name, table_name)
+        # Duplicates (by hash_key) are filtered in the database
+        inserted = insert_new_rows_to_postgresql(new_df, schema_name, table_name) or 0
+        print(f"🔎 New unique records inserted: {inserted}")
         print(f"✅ Public IP metrics dumped successfully to {schema_name}.{table_name}!")
     except Exception as e:
         print(f"❌ Failed to dump to PostgreSQL: {e}")
@@ -0,0 +1,261 @@
+# app/ingestion/azure/monitor_metrics.py
+
+"""
+Shared Azure Monitor collection engine for the VM, storage account and public
+IP metric collectors.
+
+- One pooled `requests.Session` per collection run, used by a bounded thread
+  pool (AZURE_METRICS_MAX_WORKERS) instead of one sequential request per
+  resource per metric with a fixed sleep in between.
+- Up to MAX_METRICS_PER_CALL metric names per request (comma-separated
+  `metricnames`), grouped by aggregation so every point keeps the value the
+  collectors read before.
+- 429 handling: the Retry-After interval is honoured and every worker backs
+  off together, like the LLM rate limiter does after a 429.
+- Incremental windows: each resource is queried only from the bucket after
+  its latest stored one instead of a fixed DAYS_BACK window; resources without
+  stored points still get the full window. Points are insert-only and their
+  hash_key leaves out the value, so a stored bucket is never updated and
+  re-reading it would only fetch rows that the insert drops.
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ARM_BASE_URL = "https://management.azure.com"
+API_VERSION_METRICS = "2023-10-01"
+
+# Azure Monitor accepts at most 20 metric names per metrics request
+MAX_METRICS_PER_CALL = 20
+
+METRICS_MAX_WORKERS = int(os.getenv("AZURE_METRICS_MAX_WORKERS", "8"))
+METRICS_MAX_RETRIES = int(os.getenv("AZURE_METRICS_MAX_RETRIES", "5"))
+METRICS_TIMEOUT_SECONDS = float(os.getenv("AZURE_METRICS_TIMEOUT_SECONDS", "30"))
+
+INITIAL_BACKOFF = 2
+MAX_BACKOFF = 60
+
+_METRICS_PROVIDER_PATH = "/providers/Microsoft.Insights/metrics"
+
+
+class MonitorSession:
+    """
+    Pooled, throttling-aware HTTP session for ARM / Azure Monitor GET requests,
+    shared by the worker threads of one collection run.
+
+    `headers` is either a dict or a callable returning one per request
+    (arm_client.ArmAuth, which refreshes the token before it expires).
+    """
+
+    def __init__(self, headers, max_workers: int = METRICS_MAX_WORKERS):
+        self.headers = headers
+        self.max_workers = max(1, max_workers)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self._session.mount("https://", adapter)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_if_throttled(self):
+        with self._lock:
+            delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _throttle(self, seconds: float):
+        """Called on HTTP 429 so that every worker backs off together."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @staticmethod
+    def _retry_after_seconds(response, attempt: int) -> float:
+        try:
+            if response.headers.get("Retry-After"):
+                return min(float(response.headers["Retry-After"]), MAX_BACKOFF)
+        except (TypeError, ValueError):
+            pass
+        return min(INITIAL_BACKOFF * (2 ** attempt), MAX_BACKOFF)
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[requests.Response]:
+        """
+        GET an ARM URL (absolute, or a path below management.azure.com).
+        429 and 5xx responses are retried; other responses are returned as-is.
+
+        Returns:
+            The response, or None if the request kept failing
+        """
+        if url.startswith("/"):
+            url = f"{ARM_BASE_URL}{url}"
+
+        for attempt in range(METRICS_MAX_RETRIES):
+            self._wait_if_throttled()
+            try:
+                headers = self.headers() if callable(self.headers) else self.headers
+                response = self._session.get(url, params=params, headers=headers,
+                                             timeout=METRICS_TIMEOUT_SECONDS)
+            except requests.exceptions.RequestException as e:
+                print(f"❌ REQUEST ERROR for {url}: {e}")
+                time.sleep(min(INITIAL_BACKOFF * (2 ** attempt), MAX_BACKOFF))
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                backoff_time = self._retry_after_seconds(response, attempt)
+                if response.status_code == 429:
+                    self._throttle(backoff_time)
+                print(f"⚠️ Azure Monitor returned {response.status_code}. Retrying in {backoff_time:.1f}s "
+                      f"(Attempt {attempt + 1}/{METRICS_MAX_RETRIES})")
+                if response.status_code != 429:
+                    time.sleep(backoff_time)
+                continue
+            return response
+
+        print(f"❌ Giving up on {url} after {METRICS_MAX_RETRIES} attempts")
+        return None
+
+    def map(self, func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+        """Run func over items on a bounded thread pool; results keep input order."""
+        if not items:
+            return []
+        workers = min(self.max_workers, len(items))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="az-metrics") as executor:
+            return list(executor.map(func, items))
+
+    def close(self):
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def strip_metrics_suffix(metric_id: str) -> str:
+    """Resource ID part of a metric's id (".../providers/Microsoft.Insights/metrics/<name>")."""
+    return metric_id.split(_METRICS_PROVIDER_PATH)[0] if _METRICS_PROVIDER_PATH in metric_id else metric_id
+
+
+def format_timespan(start_time: datetime, end_time: datetime) -> str:
+    return f"{start_time.isoformat()}Z/{end_time.isoformat()}Z"
+
+
+def interval_to_timedelta(interval: str) -> timedelta:
+    """Parse the ISO-8601 durations used as metric grains (PT1M ... PT12H, P1D)."""
+    match = re.fullmatch(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?)?", interval.upper())
+    if not match or not any(match.groups()):
+        raise ValueError(f"Unsupported metric interval: {interval}")
+    days, hours, minutes = (int(group or 0) for group in match.groups())
+    return timedelta(days=days, hours=hours, minutes=minutes)
+
+
+def _floor_to_interval(value: datetime, grain: timedelta) -> datetime:
+    # Keep bucket timestamps aligned (and hash keys stable) whatever the run time
+    seconds = int(grain.total_seconds())
+    epoch = datetime(1970, 1, 1)
+    return epoch + timedelta(seconds=(int((value - epoch).total_seconds()) // seconds) * seconds)
+
+
+def resource_timespans(
+    resource_ids: List[str],
+    watermarks: Optional[Dict[Tuple[str], datetime]],
+    days_back: int,
+    interval: str,
+    end_time: Optional[datetime] = None
+) -> Dict[str, str]:
+    """
+    Timespan to query per resource: from the bucket after the resource's latest
+    stored one or, for new resources, `days_back` days ago.
+
+    Args:
+        resource_ids: Resources about to be queried
+        watermarks: {(lower-cased resource_id,): latest stored timestamp (naive UTC)},
+            as returned by get_metric_watermarks
+        days_back: Full window for resources without stored points
+        interval: Metric grain (ISO-8601 duration); window starts are aligned to it
+    """
+    grain = interval_to_timedelta(interval)
+    end_time = end_time or datetime.utcnow()
+    earliest = _floor_to_interval(end_time - timedelta(days=days_back), grain)
+    watermarks = watermarks or {}
+
+    timespans = {}
+    for resource_id in resource_ids:
+        start_time = earliest
+        latest = watermarks.get((resource_id.lower(),))
+        if latest is not None:
+            latest = latest.replace(tzinfo=None)
+            # Never past the current bucket, Azure Monitor rejects an empty timespan
+            start_time = min(max(earliest, _floor_to_interval(latest, grain) + grain),
+                             _floor_to_interval(end_time, grain))
+        timespans[resource_id] = format_timespan(start_time, end_time)
+    return timespans
+
+
+def _chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fetch_metrics(
+    session: MonitorSession,
+    resource_id: str,
+    metric_names: List[str],
+    aggregation: str,
+    timespan: str,
+    interval: str,
+    metric_filter: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Query several metrics of one resource with a single aggregation.
+
+    Metric names are sent MAX_METRICS_PER_CALL at a time. If Azure rejects a
+    combined request (400 - one name not valid for the resource), the chunk is
+    retried one metric per request so the valid metrics are still collected.
+
+    Returns:
+        The JSON payloads of the successful responses
+    """
+    payloads = []
+    for names in _chunks(list(metric_names), MAX_METRICS_PER_CALL):
+        params = {
+            "api-version": API_VERSION_METRICS,
+            "metricnames": ",".join(names),
+            "timespan": timespan,
+            "interval": interval,
+            "aggregation": aggregation,
+        }
+        if metric_filter:
+            params["$filter"] = metric_filter
+
+        response = session.get(f"{resource_id}/providers/microsoft.insights/metrics", params)
+        if response is None:
+            continue
+        if response.status_code == 400 and len(names) > 1:
+            for name in names:
+                payloads.extend(fetch_metrics(session, resource_id, [name], aggregation,
+                                              timespan, interval, metric_filter))
+            continue
+        if response.status_code == 400:
+            print(f"⊘ Metric not available for '{resource_id.split('/')[-1]}' -> {names[0]} (agg={aggregation}). 400")
+            continue
+        if response.status_code != 200:
+            print(f"⚠️ Unexpected status for '{resource_id.split('/')[-1]}' -> {','.join(names)}: {response.status_code}")
+            continue
+        payloads.append(response.json())
+    return payloads
+
+
+def iter_points(payload: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Yield (metric, data point) for every point of a metrics response."""
+    for metric in payload.get("value", []):
+        for series in metric.get("timeseries", []):
+            for point in series.get("data", []):
+                yield metric, point
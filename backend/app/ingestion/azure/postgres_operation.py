@@ -4,7 +4,10 @@ import os
 import pandas as pd
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
-import hashlib
+from app.ingestion.row_hashing import add_hash_key
+from app.ingestion import ingestion_operations
+from app.ingestion.bulk_load import copy_rows
+from app.ingestion.pricing_catalog import PRICING_CATALOG_SCHEMA
 load_dotenv()
 
 DB_HOST_NAME = os.getenv("DB_HOST_NAME")
@@ -63,26 +66,9 @@ def create_schemas(connection, schema):
 
 @connection
 def dump_to_postgresql(connection, new_data, schema_name, table_name):
-    from psycopg2.extras import execute_values  # Import this utility for bulk inserts
     try:
-        # Replace empty strings with None for all columns
-        new_data = new_data.replace("", None)
-
-        # Prepare the data as a list of tuples
-        records = [tuple(row) for row in new_data.to_numpy()]
-
-        # Debugging: Print some sample records to inspect data
-        print(f"First 5 records to insert: {records[:5]}")
-
-        # Get the column names and ensure they are properly quoted
-        columns = ', '.join([f'"{col}"' for col in new_data.columns])
-
-        # Generate the SQL query for bulk insert
-        insert_query = f"INSERT INTO {schema_name}.{table_name} ({columns}) VALUES %s"
-
-        cursor = connection.cursor()
-        # Use execute_values for efficient bulk insert
-        execute_values(cursor, insert_query, records)
+        # Stream rows with COPY FROM STDIN (empty strings are loaded as NULL)
+        copy_rows(connection, new_data, schema_name, table_name)
         connection.commit()  # Commit transaction
         print(f"Data dumped into {schema_name}.{table_name} table successfully.")
 
@@ -143,7 +129,7 @@ def run_sql_file(connection, sql_file_path, schema_name, budget):
         # Read the SQL file
         with open(sql_file_path, 'r') as file:
             sql_script = file.read()
-        sql_script = sql_script.replace('__schema__', schema_name).replace('__budget__', str(budget)).replace('__databasename__', DB_NAME).replace('__password__', DB_PASSWORD)
+        sql_script = sql_script.replace('__schema__', schema_name).replace('__budget__', str(budget)).replace('__databasename__', DB_NAME).replace('__password__', DB_PASSWORD).replace('__catalog__', PRICING_CATALOG_SCHEMA)
 
         # Create a cursor object
         cursor = connection.cursor()
@@ -163,23 +149,19 @@ def run_sql_file(connection, sql_file_path, schema_name, budget):
     except Exception as error:
         print(f"Error executing {sql_file_path}: {error}")
 
-@connection
-def fetch_existing_hash_keys(connection, schema_name, table_name):
-    try:
-        cursor = connection.cursor()
-        query = f"SELECT hash_key FROM {schema_name}.{table_name};"
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        existing_keys = set(row[0] for row in rows)
-        print(f"Fetched {len(existing_keys)} existing hash keys.")
-        return existing_keys
-
-    except Exception as ex:
-        print(f"Error fetching hash keys: {ex}")
-        return set()
 
 def create_hash_key(df):
     """Generate an MD5 hash key using all available columns in the dataframe."""
-    # Concatenate all columns to form a single string per row
-    df['hash_key'] = df.apply(lambda row: hashlib.md5(''.join(map(str, row)).encode('utf-8')).hexdigest(), axis=1)
-    return df
\ No newline at end of file
+    # Concatenate all columns to form a single string per row (vectorized, same keys as before)
+    return add_hash_key(df)
+
+
+# Shared ingestion operations (app/ingestion/ingestion_operations.py) on this module's connection
+run_silver_sql_file = connection(ingestion_operations.run_silver_sql_file)
+refresh_gold_views = connection(ingestion_operations.refresh_gold_views)
+insert_new_rows_to_postgresql = connection(ingestion_operations.insert_new_rows_to_postgresql)
+get_ingestion_state = connection(ingestion_operations.get_ingestion_state)
+save_ingestion_state = connection(ingestion_operations.save_ingestion_state)
+get_metric_watermarks = connection(ingestion_operations.get_metric_watermarks)
+table_has_rows = connection(ingestion_operations.table_has_rows)
+rekey_hash_keys = connection(ingestion_operations.rekey_hash_keys)
@@ -7,25 +7,66 @@ Fetches and stores Azure SKU pricing information including:
 - Public IP pricing
 - Managed Disk pricing
 
-Uses Azure Retail Prices API for real-time pricing data.
+Uses Azure Retail Prices API for real-time pricing data. Prices are stored once
+for all projects, in the shared pricing catalog (app.ingestion.pricing_catalog).
+
+Every (service, region) price list is downloaded completely (all NextPageLink
+pages) for each region an Azure project has resources in, concurrently over a
+pooled session with retry/backoff.
 """
 
 import requests
 import pandas as pd
 import sys
 import os
-from typing import Dict, List, Optional
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-import json
+from psycopg2 import sql
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Add path for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from app.ingestion.azure.postgres_operation import connection, dump_to_postgresql
+from app.ingestion.azure.postgres_operation import connection
+from app.ingestion.pricing_catalog import (
+    PRICING_CATALOG_MAX_AGE_HOURS, PRICING_CATALOG_SCHEMA, ensure_catalog, snapshot_age_hours, write_snapshot
+)
+from app.core.ingestion_locks import acquire_pricing_lock, release_pricing_lock, wait_for_pricing_lock
 
 
 # Azure Retail Prices API endpoint
 AZURE_PRICING_API = "https://prices.azure.com/api/retail/prices"
 
+# Regions always priced into the shared catalog, next to the regions projects use
+PRICING_AZURE_REGIONS = [r.strip() for r in os.getenv("PRICING_AZURE_REGIONS", "eastus").split(",") if r.strip()]
+
+# Concurrent (service, region) downloads, and the HTTP retry policy
+AZURE_PRICING_MAX_WORKERS = int(os.getenv("AZURE_PRICING_MAX_WORKERS", "8"))
+AZURE_PRICING_MAX_RETRIES = int(os.getenv("AZURE_PRICING_MAX_RETRIES", "5"))
+AZURE_PRICING_BACKOFF_SECONDS = float(os.getenv("AZURE_PRICING_BACKOFF_SECONDS", "1"))
+AZURE_PRICING_TIMEOUT_SECONDS = 60
+
+_COMMON_COLUMNS = [
+    'skuName', 'productName', 'armRegionName',
+    'retailPrice', 'unitPrice', 'currencyCode', 'unitOfMeasure',
+    'meterName', 'effectiveStartDate'
+]
+
+# pricing_type -> (Retail Prices API serviceName, productName filter, API columns kept)
+PRICING_TYPES = {
+    "vm": ("Virtual Machines", None, _COMMON_COLUMNS + ['armSkuName', 'type', 'isPrimaryMeterRegion']),
+    "storage": ("Storage", None, _COMMON_COLUMNS + ['type']),
+    "disk": ("Storage", "Disk", _COMMON_COLUMNS),
+    "publicip": ("Virtual Network", "IP", _COMMON_COLUMNS),
+}
+
+_session = None
+_session_lock = threading.Lock()
+
 
 def convert_to_snake_case(name: str) -> str:
     """Convert camelCase to snake_case."""
@@ -34,361 +75,230 @@ def convert_to_snake_case(name: str) -> str:
     return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
 
 
-def fetch_azure_vm_pricing(region: str = "eastus", currency: str = "USD") -> pd.DataFrame:
+def get_pricing_session() -> requests.Session:
     """
-    Fetch Azure VM pricing from Retail Prices API.
-
-    Args:
-        region: Azure region (e.g., 'eastus', 'westus2')
-        currency: Currency code (default: USD)
-
-    Returns:
-        DataFrame with VM pricing information
+    Shared HTTP session of the Retail Prices API downloads: keep-alive
+    connections pooled for the download workers, and retries with exponential
+    backoff on throttling (429, honouring Retry-After) and server errors.
     """
-    print(f"📊 Fetching Azure VM pricing for region: {region}")
-
-    # Filter for Virtual Machines, Linux OS, pay-as-you-go
-    filter_query = (
-        f"serviceName eq 'Virtual Machines' "
-        f"and armRegionName eq '{region}' "
-        f"and priceType eq 'Consumption' "
-        f"and currencyCode eq '{currency}'"
-    )
-
-    all_items = []
-    url = f"{AZURE_PRICING_API}?$filter={filter_query}"
-
-    while url:
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-
-            items = data.get('Items', [])
-            all_items.extend(items)
-
-            # Get next page URL
-            url = data.get('NextPageLink')
-
-            print(f"  Fetched {len(items)} VM pricing records (total: {len(all_items)})")
-
-            # Limit to prevent excessive API calls
-            if len(all_items) >= 5000:
-                print(f"  ⚠️ Reached limit of 5000 records, stopping pagination")
-                break
-
-        except requests.exceptions.RequestException as e:
-            print(f"  ❌ Error fetching VM pricing: {e}")
-            break
-
-    if not all_items:
-        print(f"  ⚠️ No VM pricing data found for region {region}")
-        return pd.DataFrame()
-
-    # Convert to DataFrame
-    df = pd.DataFrame(all_items)
-
-    # Extract relevant columns
-    columns_to_keep = [
-        'skuName', 'productName', 'armSkuName', 'armRegionName',
-        'retailPrice', 'unitPrice', 'currencyCode', 'unitOfMeasure',
-        'meterName', 'type', 'isPrimaryMeterRegion', 'effectiveStartDate'
-    ]
-
-    df = df[[col for col in columns_to_keep if col in df.columns]]
-
-    # Add metadata
-    df['last_updated'] = datetime.utcnow()
-    df['pricing_tier'] = 'consumption'
-
-    # Convert column names from camelCase to snake_case for PostgreSQL
-    df.columns = [convert_to_snake_case(col) for col in df.columns]
-
-    print(f"✅ Successfully fetched {len(df)} VM pricing records")
-    return df
-
-
-def fetch_azure_storage_pricing(region: str = "eastus", currency: str = "USD") -> pd.DataFrame:
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=AZURE_PRICING_MAX_RETRIES,
+                backoff_factor=AZURE_PRICING_BACKOFF_SECONDS,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(["GET"]),
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=AZURE_PRICING_MAX_WORKERS, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def fetch_service_prices(service: str, region: str, currency: str = "USD") -> List[Dict]:
     """
-    Fetch Azure Storage pricing from Retail Prices API.
+    Fetch every consumption price item of a service in a region, following
+    NextPageLink until the last page.
 
     Args:
-        region: Azure region
+        service: Retail Prices API serviceName (e.g., 'Virtual Machines')
+        region: Azure region (e.g., 'eastus')
         currency: Currency code
 
     Returns:
-        DataFrame with storage pricing information
-    """
-    print(f"📊 Fetching Azure Storage pricing for region: {region}")
+        List of price items as returned by the API
 
-    # Filter for Storage accounts
+    Raises:
+        requests.exceptions.RequestException once the retries are exhausted
+    """
     filter_query = (
-        f"serviceName eq 'Storage' "
+        f"serviceName eq '{service}' "
         f"and armRegionName eq '{region}' "
         f"and priceType eq 'Consumption' "
         f"and currencyCode eq '{currency}'"
     )
 
-    all_items = []
-    url = f"{AZURE_PRICING_API}?$filter={filter_query}"
+    session = get_pricing_session()
+    url, params = AZURE_PRICING_API, {"$filter": filter_query}
+    items = []
+    pages = 0
 
     while url:
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+        response = session.get(url, params=params, timeout=AZURE_PRICING_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        data = response.json()
 
-            items = data.get('Items', [])
-            all_items.extend(items)
+        items.extend(data.get('Items', []))
+        pages += 1
+        # NextPageLink already carries the filter
+        url, params = data.get('NextPageLink'), None
 
-            url = data.get('NextPageLink')
+    print(f"  Fetched {len(items)} {service} price records for {region} ({pages} page(s))")
+    return items
 
-            print(f"  Fetched {len(items)} storage pricing records (total: {len(all_items)})")
 
-            if len(all_items) >= 3000:
-                print(f"  ⚠️ Reached limit of 3000 records, stopping pagination")
-                break
-
-        except requests.exceptions.RequestException as e:
-            print(f"  ❌ Error fetching storage pricing: {e}")
-            break
-
-    if not all_items:
-        print(f"  ⚠️ No storage pricing data found for region {region}")
+def _prices_frame(items: List[Dict], product_filter: Optional[str], columns: List[str]) -> pd.DataFrame:
+    """DataFrame of the kept columns (snake_case) of price items, optionally filtered on productName."""
+    if not items:
         return pd.DataFrame()
 
-    df = pd.DataFrame(all_items)
-
-    # Extract relevant columns
-    columns_to_keep = [
-        'skuName', 'productName', 'armRegionName',
-        'retailPrice', 'unitPrice', 'currencyCode', 'unitOfMeasure',
-        'meterName', 'type', 'effectiveStartDate'
-    ]
+    df = pd.DataFrame(items)
+    if product_filter and 'productName' in df.columns:
+        df = df[df['productName'].str.contains(product_filter, case=False, na=False)]
 
-    df = df[[col for col in columns_to_keep if col in df.columns]]
-    df['last_updated'] = datetime.utcnow()
+    df = df[[col for col in columns if col in df.columns]].copy()
 
     # Convert column names from camelCase to snake_case for PostgreSQL
     df.columns = [convert_to_snake_case(col) for col in df.columns]
-
-    print(f"✅ Successfully fetched {len(df)} storage pricing records")
+    df['last_updated'] = datetime.utcnow()
     return df
 
 
-def fetch_azure_disk_pricing(region: str = "eastus", currency: str = "USD") -> pd.DataFrame:
+def fetch_azure_pricing(regions: List[str], currency: str = "USD") -> Dict[Tuple[str, str], Optional[pd.DataFrame]]:
     """
-    Fetch Azure Managed Disk pricing from Retail Prices API.
+    Fetch VM, storage, disk and public IP prices of all regions. Each
+    (service, region) is downloaded once, concurrently on
+    AZURE_PRICING_MAX_WORKERS threads; disks are taken from the Storage items.
 
     Args:
-        region: Azure region
+        regions: Azure regions
         currency: Currency code
 
     Returns:
-        DataFrame with disk pricing information
+        {(pricing_type, region): DataFrame}, None for parts whose download failed
     """
-    print(f"📊 Fetching Azure Managed Disk pricing for region: {region}")
-
-    # Filter for Managed Disks
-    # Note: Using 'Disk' instead of 'Managed Disks' for broader match
-    filter_query = (
-        f"serviceName eq 'Storage' "
-        f"and armRegionName eq '{region}' "
-        f"and priceType eq 'Consumption' "
-        f"and currencyCode eq '{currency}'"
-    )
+    jobs = sorted({(service, region) for service, _, _ in PRICING_TYPES.values() for region in regions})
 
-    all_items = []
-    url = f"{AZURE_PRICING_API}?$filter={filter_query}"
-
-    while url:
+    def _fetch(job):
+        service, region = job
         try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-
-            items = data.get('Items', [])
-            all_items.extend(items)
-
-            url = data.get('NextPageLink')
-
-            print(f"  Fetched {len(items)} disk pricing records (total: {len(all_items)})")
-
-            if len(all_items) >= 2000:
-                break
-
+            return job, fetch_service_prices(service, region, currency)
         except requests.exceptions.RequestException as e:
-            print(f"  ❌ Error fetching disk pricing: {e}")
-            break
-
-    if not all_items:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(all_items)
-
-    # Filter for Managed Disk products only
-    if 'productName' in df.columns:
-        df = df[df['productName'].str.contains('Disk', case=False, na=False)]
-
-    columns_to_keep = [
-        'skuName', 'productName', 'armRegionName',
-        'retailPrice', 'unitPrice', 'currencyCode', 'unitOfMeasure',
-        'meterName', 'effectiveStartDate'
-    ]
-
-    df = df[[col for col in columns_to_keep if col in df.columns]]
-    df['last_updated'] = datetime.utcnow()
+            print(f"  ❌ Error fetching {service} pricing for {region}: {e}")
+            return job, None
+
+    with ThreadPoolExecutor(max_workers=min(AZURE_PRICING_MAX_WORKERS, len(jobs)),
+                            thread_name_prefix="azure-pricing") as executor:
+        items = dict(executor.map(_fetch, jobs))
+
+    parts = {}
+    for pricing_type, (service, product_filter, columns) in PRICING_TYPES.items():
+        for region in regions:
+            service_items = items[(service, region)]
+            if service_items is None:
+                parts[(pricing_type, region)] = None
+                continue
+            df = _prices_frame(service_items, product_filter, columns)
+            if pricing_type == "vm" and not df.empty:
+                df['pricing_tier'] = 'consumption'
+            parts[(pricing_type, region)] = df
+    return parts
 
-    # Convert column names from camelCase to snake_case for PostgreSQL
-    df.columns = [convert_to_snake_case(col) for col in df.columns]
-
-    print(f"✅ Successfully fetched {len(df)} disk pricing records")
-    return df
 
-
-def fetch_azure_ip_pricing(region: str = "eastus", currency: str = "USD") -> pd.DataFrame:
+@connection
+def azure_regions_in_use(conn) -> List[str]:
     """
-    Fetch Azure Public IP pricing from Retail Prices API.
-
-    Args:
-        region: Azure region
-        currency: Currency code
-
-    Returns:
-        DataFrame with public IP pricing information
+    Regions holding resources of any Azure project, read from the projects'
+    populated gold_azure_resource_dim views.
     """
-    print(f"📊 Fetching Azure Public IP pricing for region: {region}")
-
-    # Filter for Public IP addresses
-    # Using broader filter and will filter productName after fetching
-    filter_query = (
-        f"serviceName eq 'Virtual Network' "
-        f"and armRegionName eq '{region}' "
-        f"and priceType eq 'Consumption' "
-        f"and currencyCode eq '{currency}'"
-    )
-
-    all_items = []
-    url = f"{AZURE_PRICING_API}?$filter={filter_query}"
-
-    while url:
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-
-            items = data.get('Items', [])
-            all_items.extend(items)
-
-            url = data.get('NextPageLink')
-
-            if len(all_items) >= 500:
-                break
-
-        except requests.exceptions.RequestException as e:
-            print(f"  ❌ Error fetching IP pricing: {e}")
-            break
-
-    if not all_items:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(all_items)
-
-    # Filter for Public IP products only
-    if 'productName' in df.columns:
-        df = df[df['productName'].str.contains('IP', case=False, na=False)]
-
-    columns_to_keep = [
-        'skuName', 'productName', 'armRegionName',
-        'retailPrice', 'unitPrice', 'currencyCode', 'unitOfMeasure',
-        'meterName', 'effectiveStartDate'
-    ]
-
-    df = df[[col for col in columns_to_keep if col in df.columns]]
-    df['last_updated'] = datetime.utcnow()
-
-    # Convert column names from camelCase to snake_case for PostgreSQL
-    df.columns = [convert_to_snake_case(col) for col in df.columns]
-
-    print(f"✅ Successfully fetched {len(df)} IP pricing records")
-    return df
+    regions = set()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT m.schemaname
+                FROM pg_matviews m
+                JOIN project p ON LOWER(p.name) = m.schemaname
+                WHERE p.cloud_platform = 'azure'
+                  AND m.matviewname = 'gold_azure_resource_dim'
+                  AND m.ispopulated
+            """)
+            for (schema,) in cursor.fetchall():
+                cursor.execute(sql.SQL(
+                    "SELECT DISTINCT LOWER(region_id) FROM {}.gold_azure_resource_dim WHERE region_id <> ''"
+                ).format(sql.Identifier(schema)))
+                regions.update(row[0] for row in cursor.fetchall())
+    except Exception as e:
+        print(f"⚠️ Could not read the Azure regions in use: {e}")
+    return sorted(regions)
 
 
 @connection
-def store_azure_pricing(conn, schema_name: str, pricing_df: pd.DataFrame, pricing_type: str):
+def store_azure_pricing(conn, parts: Dict[Tuple[str, str], Optional[pd.DataFrame]]):
     """
-    Store Azure pricing data in PostgreSQL consolidated table.
+    Store Azure prices as a new snapshot of the shared pricing catalog
+    (unchanged parts are not loaded again).
 
     Args:
         conn: Database connection
-        schema_name: Schema name
-        pricing_df: DataFrame with pricing data
-        pricing_type: Type of pricing (vm, storage, disk, publicip)
+        parts: {(pricing_type, region): DataFrame} (vm, storage, disk, publicip)
     """
-    if pricing_df.empty:
-        print(f"  ⚠️ No {pricing_type} pricing data to store")
-        return
-
-    # Add resource_type column
-    df_with_type = pricing_df.copy()
-    df_with_type['resource_type'] = pricing_type
-
-    # Use consolidated table name
-    table_name = "azure_pricing"
-
-    # Delete existing records for this resource type before inserting new ones
-    delete_query = f"DELETE FROM {schema_name}.{table_name} WHERE resource_type = %s"
+    return write_snapshot(conn, "azure", parts)
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute(delete_query, (pricing_type,))
-        conn.commit()
-        print(f"  🗑️ Cleared existing {pricing_type} pricing data from consolidated table")
-    except Exception as e:
-        print(f"  ⚠️ Could not clear existing {pricing_type} data: {e}")
-        conn.rollback()
 
-    # Insert new data into consolidated table
-    dump_to_postgresql(df_with_type, schema_name, table_name)
-    print(f"  💾 Stored {len(df_with_type)} {pricing_type} pricing records in {schema_name}.{table_name}")
+@connection
+def azure_pricing_age_hours(conn) -> Optional[float]:
+    """Age of the current Azure catalog snapshot (creates the catalog if needed)."""
+    ensure_catalog(conn)
+    return snapshot_age_hours(conn, "azure")
 
 
-def fetch_and_store_all_azure_pricing(schema_name: str, region: str = "eastus", currency: str = "USD"):
+def fetch_and_store_all_azure_pricing(
+    regions: Optional[List[str]] = None,
+    currency: str = "USD",
+    only_if_stale: bool = False
+):
     """
-    Main function to fetch and store all Azure pricing data.
+    Refresh the Azure prices of the shared pricing catalog.
 
     Args:
-        schema_name: PostgreSQL schema name
-        region: Azure region
+        regions: Azure regions (default: PRICING_AZURE_REGIONS plus every
+            region an Azure project has resources in)
         currency: Currency code
+        only_if_stale: Skip when the catalog already has a snapshot younger
+            than PRICING_CATALOG_MAX_AGE_HOURS (ingestion bootstrap). With no
+            snapshot at all and another worker refreshing, wait for that refresh
     """
+    if only_if_stale:
+        age = azure_pricing_age_hours()
+        if age is not None and age < PRICING_CATALOG_MAX_AGE_HOURS:
+            print(f"♻️ Using shared Azure pricing catalog ({age:.1f}h old)")
+            return
+
+    owner = f"{socket.gethostname()}:{os.getpid()}:{time.time()}"
+    try:
+        if not acquire_pricing_lock("azure", owner):
+            if only_if_stale and age is None:
+                # Nothing to price with yet: wait for the refresh in progress
+                print("⏳ Azure pricing catalog is being refreshed, waiting for it")
+                if not wait_for_pricing_lock("azure"):
+                    print("⚠️ Timed out waiting for the Azure pricing refresh")
+                elif azure_pricing_age_hours() is None:
+                    print("⚠️ The Azure pricing refresh finished without a snapshot")
+            else:
+                print("⚠️ Azure pricing catalog is already being refreshed, skipping")
+            return
+    except Exception as e:
+        print(f"⚠️ Could not take the Azure pricing lock, refreshing anyway: {e}")
+
+    regions = regions or sorted(set(PRICING_AZURE_REGIONS) | set(azure_regions_in_use() or []))
+
     print(f"\n{'='*70}")
     print(f"💰 FETCHING AZURE PRICING DATA")
-    print(f"   Schema: {schema_name}")
-    print(f"   Region: {region}")
+    print(f"   Catalog: {PRICING_CATALOG_SCHEMA}")
+    print(f"   Regions: {', '.join(regions)}")
     print(f"   Currency: {currency}")
     print(f"{'='*70}\n")
 
     try:
-        # Fetch VM pricing
-        vm_pricing = fetch_azure_vm_pricing(region, currency)
-        if not vm_pricing.empty:
-            store_azure_pricing(schema_name, vm_pricing, "vm")
-
-        # Fetch Storage pricing
-        storage_pricing = fetch_azure_storage_pricing(region, currency)
-        if not storage_pricing.empty:
-            store_azure_pricing(schema_name, storage_pricing, "storage")
-
-        # Fetch Disk pricing
-        disk_pricing = fetch_azure_disk_pricing(region, currency)
-        if not disk_pricing.empty:
-            store_azure_pricing(schema_name, disk_pricing, "disk")
-
-        # Fetch IP pricing
-        ip_pricing = fetch_azure_ip_pricing(region, currency)
-        if not ip_pricing.empty:
-            store_azure_pricing(schema_name, ip_pricing, "ip")
+        started = time.time()
+        parts = fetch_azure_pricing(regions, currency)
+        print(f"📊 Downloaded Azure prices for {len(regions)} region(s) in {time.time() - started:.1f}s")
+
+        store_azure_pricing(parts)
 
         print(f"\n{'='*70}")
         print(f"✅ AZURE PRICING DATA FETCH COMPLETE")
@@ -399,13 +309,16 @@ def fetch_and_store_all_azure_pricing(schema_name: str, region: str = "eastus",
         import traceback
         traceback.print_exc()
 
+    finally:
+        release_pricing_lock("azure", owner)
+
 
 def get_vm_sku_pricing(schema_name: str, sku_name: str, region: str = "eastus") -> Optional[Dict]:
     """
-    Get pricing for a specific VM SKU.
+    Get pricing for a specific VM SKU from the shared pricing catalog.
 
     Args:
-        schema_name: Schema name
+        schema_name: Schema name (kept for callers, prices are not per schema)
         sku_name: VM SKU name (e.g., 'Standard_D4s_v3')
         region: Azure region
 
@@ -425,9 +338,8 @@ def get_vm_sku_pricing(schema_name: str, sku_name: str, region: str = "eastus")
                 currency_code,
                 unit_of_measure,
                 meter_name
-            FROM {schema}.azure_pricing
-            WHERE resource_type = 'vm'
-              AND LOWER(sku_name) = LOWER(%s)
+            FROM {PRICING_CATALOG_SCHEMA}.azure_pricing_vm
+            WHERE LOWER(sku_name) = LOWER(%s)
               AND LOWER(arm_region_name) = LOWER(%s)
             LIMIT 1
         """
@@ -3,6 +3,10 @@ Azure Pricing Query Helpers
 
 Provides functions to query pricing data and generate alternative SKU recommendations
 based on resource utilization patterns.
+
+Prices are read from the shared pricing catalog (app.ingestion.pricing_catalog)
+once per region and served from the in-memory price index
+(app.ingestion.price_index); the schema_name arguments are kept for callers.
 """
 
 import pandas as pd
@@ -13,15 +17,79 @@ from typing import Dict, List, Optional
 # Add path for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from app.ingestion.azure.postgres_operation import connection
+from app.ingestion.price_index import PriceList, fetch_price_rows, get_price_list
+from app.ingestion.pricing_catalog import PRICING_CATALOG_SCHEMA
+
+
+VM_ALTERNATIVE_COLUMNS = ('sku_name', 'product_name', 'retail_price', 'currency_code', 'unit_of_measure', 'meter_name')
+OPTION_COLUMNS = ('sku_name', 'product_name', 'meter_name', 'retail_price', 'unit_of_measure')
+
+# First match wins, as in the former DISTINCT ON (tier, redundancy) query
+STORAGE_TIERS = ('Archive', 'Cool', 'Hot', 'Premium')
+STORAGE_REDUNDANCIES = ('LRS', 'GRS', 'ZRS', 'RAGRS', 'GZRS')
+STORAGE_METER_EXCLUDES = ('Provisioned', 'Confidential', 'Metadata')
+
+
+def _first_match(meter_name: str, names) -> str:
+    return next((name for name in names if name in meter_name), 'Other')
+
+
+def _storage_options(rows: List[Dict]) -> List[Dict]:
+    """Cheapest 'Data Stored' per-GB meter per (tier, redundancy)."""
+    options = {}
+    for row in sorted(rows, key=lambda r: r['retail_price']):
+        meter_name = row['meter_name'] or ''
+        if ('Data Stored' not in meter_name
+                or any(word in meter_name for word in STORAGE_METER_EXCLUDES)
+                or row['retail_price'] <= 0
+                or 'GB' not in (row['unit_of_measure'] or '')):
+            continue
+        key = (_first_match(meter_name, STORAGE_TIERS), _first_match(meter_name, STORAGE_REDUNDANCIES))
+        options.setdefault(key, row)
+    return list(options.values())
 
 
 @connection
-def get_vm_current_pricing(conn, schema_name: str, sku_name: str, region: str = "eastus") -> Optional[Dict]:
+def _load_price_index(conn, region: str) -> Optional[Dict[str, PriceList]]:
     """
-    Get pricing for the current VM SKU.
+    Read the VM, storage and public IP prices of a region from the catalog,
+    in one query, and index them per family.
+
+    Returns:
+        {'vm': compute meters, 'storage': one option per tier/redundancy,
+         'publicip': all meters}, or None on error
+    """
+    query = f"""
+        SELECT resource_type, sku_name, product_name, retail_price, unit_price,
+               currency_code, unit_of_measure, meter_name
+        FROM {PRICING_CATALOG_SCHEMA}.azure_pricing_current
+        WHERE resource_type IN ('vm', 'storage', 'publicip')
+          AND LOWER(arm_region_name) = LOWER(%s)
+    """
+
+    try:
+        rows = fetch_price_rows(conn, query, (region,), price_columns=('retail_price', 'unit_price'))
+    except Exception as e:
+        print(f"Error loading Azure prices for {region}: {e}")
+        return None
+
+    compute_rows = [row for row in rows.get('vm', []) if 'Compute' in (row['meter_name'] or '')]
+    return {
+        'vm': PriceList(compute_rows, sku_key='sku_name', price_key='retail_price'),
+        'storage': PriceList(_storage_options(rows.get('storage', [])), sku_key='sku_name', price_key='retail_price'),
+        'publicip': PriceList(rows.get('publicip', []), sku_key='sku_name', price_key='retail_price'),
+    }
+
+
+def _prices(region: str, family: str) -> PriceList:
+    return get_price_list('azure', region, family, _load_price_index)
+
+
+def get_vm_current_pricing(schema_name: str, sku_name: str, region: str = "eastus") -> Optional[Dict]:
+    """
+    Get pricing for the current VM SKU (cheapest compute meter).
 
     Args:
-        conn: Database connection
         schema_name: Schema name
         sku_name: VM SKU (e.g., 'Standard_D4s_v3')
         region: Azure region
@@ -32,54 +100,27 @@ def get_vm_current_pricing(conn, schema_name: str, sku_name: str, region: str =
     if not sku_name:
         return None
 
-    query = f"""
-        SELECT
-            sku_name,
-            product_name,
-            retail_price,
-            unit_price,
-            currency_code,
-            unit_of_measure,
-            meter_name
-        FROM {schema_name}.azure_pricing_vm
-        WHERE LOWER(sku_name) = LOWER(%s)
-          AND LOWER(arm_region_name) = LOWER(%s)
-          AND meter_name LIKE '%%Compute%%'
-        ORDER BY retail_price ASC
-        LIMIT 1
-    """
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute(query, (sku_name, region))
-        result = cursor.fetchone()
-
-        if result:
-            return {
-                'sku_name': result[0],
-                'product_name': result[1],
-                'retail_price': float(result[2]) if result[2] else 0.0,
-                'unit_price': float(result[3]) if result[3] else 0.0,
-                'currency_code': result[4],
-                'unit_of_measure': result[5],
-                'meter_name': result[6],
-                'monthly_cost': float(result[2]) * 730 if result[2] else 0.0  # 730 hours/month
-            }
-        return None
-
-    except Exception as e:
-        print(f"Error fetching VM pricing: {e}")
+    row = _prices(region, 'vm').lookup(sku_name)
+    if not row:
         return None
+    return {
+        'sku_name': row['sku_name'],
+        'product_name': row['product_name'],
+        'retail_price': row['retail_price'],
+        'unit_price': row['unit_price'],
+        'currency_code': row['currency_code'],
+        'unit_of_measure': row['unit_of_measure'],
+        'meter_name': row['meter_name'],
+        'monthly_cost': row['retail_price'] * 730  # 730 hours/month
+    }
 
 
-@connection
-def get_vm_alternative_pricing(conn, schema_name: str, current_sku: str, region: str = "eastus", max_results: int = 10) -> List[Dict]:
+def get_vm_alternative_pricing(schema_name: str, current_sku: str, region: str = "eastus", max_results: int = 10) -> List[Dict]:
     """
     Get DIVERSE alternative VM SKUs with pricing for comparison.
-    Fetches different series/families, not just upsize/downsize of same type.
+    Fetches the SKUs priced closest below and above the current one, across all series.
 
     Args:
-        conn: Database connection
         schema_name: Schema name
         current_sku: Current VM SKU
         region: Azure region
@@ -88,84 +129,24 @@ def get_vm_alternative_pricing(conn, schema_name: str, current_sku: str, region:
     Returns:
         List of alternative SKU pricing dicts from diverse series (B, D, E, F, etc.)
     """
-    # First get current SKU price to determine cheaper/similar/more expensive alternatives
-    current_price_query = f"""
-        SELECT retail_price
-        FROM {schema_name}.azure_pricing_vm
-        WHERE LOWER(arm_region_name) = LOWER(%s)
-          AND sku_name = %s
-          AND meter_name LIKE '%%Compute%%'
-        LIMIT 1
-    """
+    prices = _prices(region, 'vm')
+    current = prices.lookup(current_sku)
+    current_price = current['retail_price'] if current else 0.0
+    per_side = max(2, max_results // 2)
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute(current_price_query, (region, current_sku))
-        current_price_result = cursor.fetchone()
-        current_price = float(current_price_result[0]) if current_price_result and current_price_result[0] else 0.0
-
-        # Get diverse alternatives: cheaper options, similar price, and more expensive
-        # Use UNION to get mix from different price ranges and different series
-        query = f"""
-            (
-                -- Cheaper alternatives (different series)
-                SELECT DISTINCT sku_name, product_name, retail_price, currency_code, unit_of_measure, meter_name
-                FROM {schema_name}.azure_pricing_vm
-                WHERE LOWER(arm_region_name) = LOWER(%s)
-                  AND meter_name LIKE '%%Compute%%'
-                  AND sku_name != %s
-                  AND sku_name IS NOT NULL
-                  AND retail_price < %s
-                  AND retail_price > 0
-                ORDER BY retail_price DESC
-                LIMIT {max(2, max_results // 2)}
-            )
-            UNION ALL
-            (
-                -- More expensive alternatives (different series for upsize)
-                SELECT DISTINCT sku_name, product_name, retail_price, currency_code, unit_of_measure, meter_name
-                FROM {schema_name}.azure_pricing_vm
-                WHERE LOWER(arm_region_name) = LOWER(%s)
-                  AND meter_name LIKE '%%Compute%%'
-                  AND sku_name != %s
-                  AND sku_name IS NOT NULL
-                  AND retail_price > %s
-                  AND retail_price > 0
-                ORDER BY retail_price ASC
-                LIMIT {max(2, max_results // 2)}
-            )
-        """
-
-        cursor.execute(query, (region, current_sku, current_price, region, current_sku, current_price))
-        results = cursor.fetchall()
-
-        alternatives = []
-        for row in results:
-            alternatives.append({
-                'sku_name': row[0],
-                'product_name': row[1],
-                'retail_price': float(row[2]) if row[2] else 0.0,
-                'currency_code': row[3],
-                'unit_of_measure': row[4],
-                'meter_name': row[5]
-            })
-
-        print(f"  Found {len(alternatives)} diverse alternatives across different VM series")
-        return alternatives[:max_results]
+    alternatives = (prices.below(current_price, per_side, VM_ALTERNATIVE_COLUMNS, exclude_sku=current_sku)
+                    + prices.above(current_price, per_side, VM_ALTERNATIVE_COLUMNS, exclude_sku=current_sku))
 
-    except Exception as e:
-        print(f"Error fetching alternative VM pricing: {e}")
-        return []
+    print(f"  Found {len(alternatives)} diverse alternatives across different VM series")
+    return alternatives[:max_results]
 
 
-@connection
-def get_storage_pricing_context(conn, schema_name: str, region: str = "eastus", max_results: int = 10) -> list:
+def get_storage_pricing_context(schema_name: str, region: str = "eastus", max_results: int = 10) -> list:
     """
     Get DIVERSE storage pricing options for comparison.
-    Fetches different tiers (Hot/Cool/Archive), redundancy (LRS/GRS/ZRS), and account types.
+    One option per tier (Hot/Cool/Archive/Premium) and redundancy (LRS/GRS/ZRS/...), cheapest first.
 
     Args:
-        conn: Database connection
         schema_name: Schema name
         region: Azure region
         max_results: Maximum number of diverse alternatives
@@ -173,95 +154,17 @@ def get_storage_pricing_context(conn, schema_name: str, region: str = "eastus",
     Returns:
         List of diverse storage option pricing dicts
     """
-    # Get diverse storage options across tiers and redundancy
-    # Focus on actual data storage tiers, not provisioned capacity
-    # Use DISTINCT ON to ensure we get one option per tier type
-    query = f"""
-        WITH diverse_tiers AS (
-            SELECT DISTINCT ON (
-                CASE
-                    WHEN meter_name LIKE '%%Archive%%' THEN 'Archive'
-                    WHEN meter_name LIKE '%%Cool%%' THEN 'Cool'
-                    WHEN meter_name LIKE '%%Hot%%' THEN 'Hot'
-                    WHEN meter_name LIKE '%%Premium%%' THEN 'Premium'
-                    ELSE 'Other'
-                END,
-                CASE
-                    WHEN meter_name LIKE '%%LRS%%' THEN 'LRS'
-                    WHEN meter_name LIKE '%%GRS%%' THEN 'GRS'
-                    WHEN meter_name LIKE '%%ZRS%%' THEN 'ZRS'
-                    WHEN meter_name LIKE '%%RAGRS%%' THEN 'RAGRS'
-                    WHEN meter_name LIKE '%%GZRS%%' THEN 'GZRS'
-                    ELSE 'Other'
-                END
-            )
-            sku_name,
-            product_name,
-            meter_name,
-            retail_price,
-            unit_of_measure
-        FROM {schema_name}.azure_pricing_storage
-        WHERE LOWER(arm_region_name) = LOWER(%s)
-          AND meter_name LIKE '%%Data Stored%%'
-          AND meter_name NOT LIKE '%%Provisioned%%'
-          AND meter_name NOT LIKE '%%Confidential%%'
-          AND meter_name NOT LIKE '%%Metadata%%'
-          AND retail_price > 0
-          AND unit_of_measure LIKE '%%GB%%'
-        ORDER BY
-            CASE
-                WHEN meter_name LIKE '%%Archive%%' THEN 'Archive'
-                WHEN meter_name LIKE '%%Cool%%' THEN 'Cool'
-                WHEN meter_name LIKE '%%Hot%%' THEN 'Hot'
-                WHEN meter_name LIKE '%%Premium%%' THEN 'Premium'
-                ELSE 'Other'
-            END,
-            CASE
-                WHEN meter_name LIKE '%%LRS%%' THEN 'LRS'
-                WHEN meter_name LIKE '%%GRS%%' THEN 'GRS'
-                WHEN meter_name LIKE '%%ZRS%%' THEN 'ZRS'
-                WHEN meter_name LIKE '%%RAGRS%%' THEN 'RAGRS'
-                WHEN meter_name LIKE '%%GZRS%%' THEN 'GZRS'
-                ELSE 'Other'
-            END,
-            retail_price ASC
-        )
-        SELECT * FROM diverse_tiers
-        ORDER BY retail_price ASC
-        LIMIT %s
-    """
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute(query, (region, max_results))
-        results = cursor.fetchall()
-
-        alternatives = []
-        for row in results:
-            alternatives.append({
-                'sku_name': row[0],
-                'product_name': row[1],
-                'meter_name': row[2],
-                'retail_price': float(row[3]) if row[3] else 0.0,
-                'unit_of_measure': row[4]
-            })
-
-        print(f"  Found {len(alternatives)} diverse storage options across different tiers/redundancy")
-        return alternatives
-
-    except Exception as e:
-        print(f"Error fetching storage pricing: {e}")
-        return []
+    alternatives = _prices(region, 'storage').cheapest(max_results, OPTION_COLUMNS)
+    print(f"  Found {len(alternatives)} diverse storage options across different tiers/redundancy")
+    return alternatives
 
 
-@connection
-def get_public_ip_pricing_context(conn, schema_name: str, region: str = "eastus", max_results: int = 5) -> list:
+def get_public_ip_pricing_context(schema_name: str, region: str = "eastus", max_results: int = 5) -> list:
     """
     Get DIVERSE public IP pricing options for comparison.
     Fetches different SKUs (Basic/Standard) and allocation methods (Static/Dynamic).
 
     Args:
-        conn: Database connection
         schema_name: Schema name
         region: Azure region
         max_results: Maximum number of diverse alternatives
@@ -269,41 +172,9 @@ def get_public_ip_pricing_context(conn, schema_name: str, region: str = "eastus"
     Returns:
         List of diverse public IP option pricing dicts
     """
-    query = f"""
-        SELECT DISTINCT
-            sku_name,
-            product_name,
-            meter_name,
-            retail_price,
-            unit_of_measure
-        FROM {schema_name}.azure_pricing_ip
-        WHERE LOWER(arm_region_name) = LOWER(%s)
-          AND retail_price > 0
-        ORDER BY retail_price ASC
-        LIMIT %s
-    """
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute(query, (region, max_results))
-        results = cursor.fetchall()
-
-        pricing_options = []
-        for row in results:
-            pricing_options.append({
-                'sku_name': row[0],
-                'product_name': row[1],
-                'meter_name': row[2],
-                'retail_price': float(row[3]) if row[3] else 0.0,
-                'unit_of_measure': row[4]
-            })
-
-        print(f"  Found {len(pricing_options)} diverse public IP options")
-        return pricing_options
-
-    except Exception as e:
-        print(f"Error fetching IP pricing: {e}")
-        return []
+    pricing_options = _prices(region, 'publicip').cheapest(max_results, OPTION_COLUMNS)
+    print(f"  Found {len(pricing_options)} diverse public IP options")
+    return pricing_options
 
 
 def format_vm_pricing_for_llm(current_pricing: Optional[Dict], alternatives: List[Dict]) -> str:
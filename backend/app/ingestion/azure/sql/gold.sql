@@ -1,6 +1,21 @@
 
+-- Gold dims and the fact are materialized views with indexes, refreshed (CONCURRENTLY) at the
+-- end of ingestion by app/ingestion/gold_refresh.py. They are created empty here; the refresh
+-- populates them. Drop the plain views earlier versions created under the same names.
+DO $$
+DECLARE
+    view_name text;
+BEGIN
+    FOREACH view_name IN ARRAY ARRAY['gold_azure_resource_dim', 'gold_azure_charge_summary_dim', 'gold_azure_account_dim']
+    LOOP
+        IF EXISTS (SELECT 1 FROM pg_views WHERE schemaname = '__schema__' AND viewname = view_name) THEN
+            EXECUTE format('DROP VIEW __schema__.%I', view_name);
+        END IF;
+    END LOOP;
+END $$;
+
 --resource dim
-CREATE OR REPLACE VIEW __schema__.gold_azure_resource_dim AS
+CREATE MATERIALIZED VIEW IF NOT EXISTS __schema__.gold_azure_resource_dim AS
 SELECT DISTINCT 
     "ResourceId" AS resource_id, 
     "ResourceName" AS resource_name,  
@@ -8,11 +23,16 @@ SELECT DISTINCT
     "RegionName" AS region_name, 
     "ServiceCategory" AS service_category, 
     "ServiceName" AS service_name
-FROM __schema__.silver_azure_focus;
+FROM __schema__.silver_azure_focus
+WITH NO DATA;
 
+CREATE UNIQUE INDEX IF NOT EXISTS gold_azure_resource_dim_key_idx ON __schema__.gold_azure_resource_dim
+    (resource_id, resource_name, region_id, region_name, service_category, service_name);
+CREATE INDEX IF NOT EXISTS gold_azure_resource_dim_resource_id_idx ON __schema__.gold_azure_resource_dim (resource_id);
+CREATE INDEX IF NOT EXISTS gold_azure_resource_dim_service_name_idx ON __schema__.gold_azure_resource_dim (service_name);
 
 --charge_summary_dim
-CREATE OR REPLACE VIEW __schema__.gold_azure_charge_summary_dim AS
+CREATE MATERIALIZED VIEW IF NOT EXISTS __schema__.gold_azure_charge_summary_dim AS
 SELECT DISTINCT 
     "SkuId" AS sku_id,
     "ChargeCategory" AS charge_category,
@@ -20,10 +40,14 @@ SELECT DISTINCT
     "ChargeDescription" AS charge_description,
     "ChargeFrequency" AS charge_frequency,
     "x_SkuDescription" AS x_sku_description
-FROM __schema__.silver_azure_focus;
+FROM __schema__.silver_azure_focus
+WITH NO DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS gold_azure_charge_summary_dim_key_idx ON __schema__.gold_azure_charge_summary_dim
+    (sku_id, charge_category, charge_class, charge_description, charge_frequency, x_sku_description);
 
 --azure_account_dim
-CREATE OR REPLACE VIEW __schema__.gold_azure_account_dim AS
+CREATE MATERIALIZED VIEW IF NOT EXISTS __schema__.gold_azure_account_dim AS
 SELECT DISTINCT 
     "SubAccountId" AS sub_account_id,
     "SubAccountName" AS sub_account_name,
@@ -36,10 +60,15 @@ SELECT DISTINCT
     "BillingAccountId" AS billing_account_id,
     "BillingAccountName" AS billing_account_name,
     "BillingAccountType" AS billing_account_type
-FROM __schema__.silver_azure_focus;
+FROM __schema__.silver_azure_focus
+WITH NO DATA;
 
--- fact
-CREATE OR REPLACE VIEW __schema__.gold_azure_fact_cost AS
+CREATE UNIQUE INDEX IF NOT EXISTS gold_azure_account_dim_key_idx ON __schema__.gold_azure_account_dim
+    (sub_account_id, sub_account_name, sub_account_type, x_account_id, x_account_name, x_account_owner_id,
+     x_billing_profile_id, x_billing_profile_name, billing_account_id, billing_account_name, billing_account_type);
+
+-- fact (materialized without the budget, which can change between runs)
+CREATE MATERIALIZED VIEW IF NOT EXISTS __schema__.gold_azure_fact_cost_mv AS
 SELECT 
     md5(cast("Tags" AS text)) AS tags_key,
     "SubAccountId" AS sub_account_id,
@@ -66,9 +95,45 @@ SELECT
     "x_SkuMeterName" AS sku_meter_name,
     "x_SkuMeterSubcategory" AS sku_meter_subcategory,
     "x_SkuServiceFamily" AS sku_service_family,
-    __budget__::integer as monthly_budget,
     "hash_key" as hash_key
-FROM __schema__.silver_azure_focus;  
+FROM __schema__.silver_azure_focus
+WITH NO DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS gold_azure_fact_cost_mv_hash_key_idx ON __schema__.gold_azure_fact_cost_mv (hash_key);
+CREATE INDEX IF NOT EXISTS gold_azure_fact_cost_mv_charge_period_start_idx ON __schema__.gold_azure_fact_cost_mv (charge_period_start);
+CREATE INDEX IF NOT EXISTS gold_azure_fact_cost_mv_resource_id_idx ON __schema__.gold_azure_fact_cost_mv (resource_id);
+CREATE INDEX IF NOT EXISTS gold_azure_fact_cost_mv_tags_key_idx ON __schema__.gold_azure_fact_cost_mv (tags_key);
+
+CREATE OR REPLACE VIEW __schema__.gold_azure_fact_cost AS
+SELECT 
+    tags_key,
+    sub_account_id,
+    resource_id,
+    sku_id,
+    resource_group_name,
+    charge_period_start,
+    pricing_category,
+    pricing_unit,
+    list_unit_price,
+    contracted_unit_price,
+    pricing_quantity,
+    billed_cost,
+    consumed_quantity,
+    consumed_unit,
+    effective_cost,
+    contracted_cost,
+    list_cost,
+    effective_unit_price,
+    billed_cost_in_usd,
+    effective_cost_in_usd,
+    list_cost_in_usd,
+    sku_price_id,
+    sku_meter_name,
+    sku_meter_subcategory,
+    sku_service_family,
+    __budget__::integer as monthly_budget,
+    hash_key
+FROM __schema__.gold_azure_fact_cost_mv;  
 
 CREATE OR REPLACE FUNCTION azure_tags_view_generation()
 RETURNS text AS $$
@@ -1,146 +1,51 @@
--- Azure Pricing Tables (Consolidated)
--- Single table to store pricing information for all Azure resource types
+-- Azure Pricing Views
+-- Prices are stored once for all projects in the shared pricing catalog
+-- (app/ingestion/sql/pricing_catalog.sql, refreshed daily by task_refresh_pricing_catalog).
+-- The project schema keeps the previous table/view names as views onto the
+-- catalog's current snapshot.
 
 -- =========================================================================
--- DROP OLD SEPARATE TABLES/VIEWS (One-time migration from old schema)
+-- DROP THE PER-PROJECT COPIES (tables, or views from a previous run)
 -- =========================================================================
--- These DROP statements clean up both old tables and views from previous schema.
--- Need both DROP TABLE and DROP VIEW since they might exist in either form.
--- The consolidated table (azure_pricing) is never dropped - it persists across runs.
--- Data refresh is handled by pricing.py which deletes by resource_type before inserting.
 
-DROP VIEW IF EXISTS __schema__.azure_pricing_vm CASCADE;
-DROP VIEW IF EXISTS __schema__.azure_pricing_storage CASCADE;
-DROP VIEW IF EXISTS __schema__.azure_pricing_disk CASCADE;
-DROP VIEW IF EXISTS __schema__.azure_pricing_ip CASCADE;
-
-DROP TABLE IF EXISTS __schema__.azure_pricing_vm CASCADE;
-DROP TABLE IF EXISTS __schema__.azure_pricing_storage CASCADE;
-DROP TABLE IF EXISTS __schema__.azure_pricing_disk CASCADE;
-DROP TABLE IF EXISTS __schema__.azure_pricing_ip CASCADE;
+DO $$
+DECLARE
+    rel RECORD;
+BEGIN
+    FOR rel IN
+        SELECT c.relname, c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = lower('__schema__')
+          AND c.relname IN ('azure_pricing', 'azure_pricing_vm', 'azure_pricing_storage',
+                            'azure_pricing_disk', 'azure_pricing_ip')
+    LOOP
+        IF rel.relkind = 'r' THEN
+            EXECUTE format('DROP TABLE %I.%I CASCADE', lower('__schema__'), rel.relname);
+        ELSIF rel.relkind = 'v' THEN
+            EXECUTE format('DROP VIEW %I.%I CASCADE', lower('__schema__'), rel.relname);
+        END IF;
+    END LOOP;
+END $$;
 
 -- =========================================================================
--- CONSOLIDATED PRICING TABLE
+-- VIEWS ONTO THE SHARED CATALOG
 -- =========================================================================
 
-CREATE TABLE IF NOT EXISTS __schema__.azure_pricing (
-    id SERIAL PRIMARY KEY,
-
-    -- Resource type identifier
-    resource_type VARCHAR(50) NOT NULL,  -- 'vm', 'storage', 'disk', 'publicip'
-
-    -- Common pricing fields
-    sku_name VARCHAR(255),
-    product_name VARCHAR(255),
-    retail_price DECIMAL(18, 6),
-    unit_price DECIMAL(18, 6),
-    currency_code VARCHAR(10),
-    unit_of_measure VARCHAR(50),
-
-    -- Location
-    arm_region_name VARCHAR(100),
-
-    -- Metadata
-    meter_name VARCHAR(255),
-    type VARCHAR(100),
-    description TEXT,
-
-    -- VM-specific fields (nullable)
-    arm_sku_name VARCHAR(255),
-    pricing_tier VARCHAR(50),
-    is_primary_meter_region BOOLEAN,
-
-    -- Timestamp
-    effective_start_date TIMESTAMP,
-    last_updated TIMESTAMP DEFAULT now()
-);
-
--- Create indexes for faster lookups
-CREATE INDEX IF NOT EXISTS idx_azure_pricing_resource_type
-    ON __schema__.azure_pricing(resource_type);
-
-CREATE INDEX IF NOT EXISTS idx_azure_pricing_sku
-    ON __schema__.azure_pricing(resource_type, sku_name, arm_region_name);
-
-CREATE INDEX IF NOT EXISTS idx_azure_pricing_region
-    ON __schema__.azure_pricing(arm_region_name, resource_type);
-
--- =========================================================================
--- RESOURCE-SPECIFIC VIEWS (Optional, for backward compatibility)
--- =========================================================================
+CREATE VIEW __schema__.azure_pricing AS
+SELECT * FROM __catalog__.azure_pricing_current;
 
--- VM Pricing View
-CREATE OR REPLACE VIEW __schema__.azure_pricing_vm AS
-SELECT
-    id,
-    sku_name,
-    product_name,
-    arm_sku_name,
-    arm_region_name,
-    retail_price,
-    unit_price,
-    currency_code,
-    unit_of_measure,
-    meter_name,
-    type,
-    is_primary_meter_region,
-    effective_start_date,
-    last_updated,
-    pricing_tier
-FROM __schema__.azure_pricing
-WHERE resource_type = 'vm';
+CREATE VIEW __schema__.azure_pricing_vm AS
+SELECT * FROM __catalog__.azure_pricing_vm;
 
--- Storage Pricing View
-CREATE OR REPLACE VIEW __schema__.azure_pricing_storage AS
-SELECT
-    id,
-    sku_name,
-    product_name,
-    arm_region_name,
-    retail_price,
-    unit_price,
-    currency_code,
-    unit_of_measure,
-    meter_name,
-    type,
-    effective_start_date,
-    last_updated
-FROM __schema__.azure_pricing
-WHERE resource_type = 'storage';
+CREATE VIEW __schema__.azure_pricing_storage AS
+SELECT * FROM __catalog__.azure_pricing_storage;
 
--- Disk Pricing View
-CREATE OR REPLACE VIEW __schema__.azure_pricing_disk AS
-SELECT
-    id,
-    sku_name,
-    product_name,
-    arm_region_name,
-    retail_price,
-    unit_price,
-    currency_code,
-    unit_of_measure,
-    meter_name,
-    effective_start_date,
-    last_updated
-FROM __schema__.azure_pricing
-WHERE resource_type = 'disk';
+CREATE VIEW __schema__.azure_pricing_disk AS
+SELECT * FROM __catalog__.azure_pricing_disk;
 
--- Public IP Pricing View
-CREATE OR REPLACE VIEW __schema__.azure_pricing_ip AS
-SELECT
-    id,
-    sku_name,
-    product_name,
-    arm_region_name,
-    retail_price,
-    unit_price,
-    currency_code,
-    unit_of_measure,
-    meter_name,
-    effective_start_date,
-    last_updated
-FROM __schema__.azure_pricing
-WHERE resource_type = 'publicip';
+CREATE VIEW __schema__.azure_pricing_ip AS
+SELECT * FROM __catalog__.azure_pricing_ip;
 
 -- Grant permissions
 GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA __schema__ TO PUBLIC;
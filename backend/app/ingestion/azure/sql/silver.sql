@@ -147,12 +147,13 @@ BEGIN
             "x_SkuServiceFamily" TEXT,
             "hash_key" TEXT PRIMARY KEY 
         );
-    ELSE
-        -- Truncate the silver table if it already exists
+    ELSIF __full_refresh__ THEN
+        -- Full rebuild (backfills): start from an empty silver table
         TRUNCATE TABLE __schema__.silver_azure_focus;
     END IF;
 
-    -- Insert data with robust JSON sanitization and validation
+    -- Upsert the bronze rows loaded since the last refresh (see app/ingestion/silver_load.py),
+    -- with robust JSON sanitization and validation
     INSERT INTO __schema__.silver_azure_focus (
         "BilledCost", "BillingAccountId", "BillingAccountName", "BillingAccountType", 
         "ChargePeriodStart", "ChargeCategory", "ChargeClass", "ChargeDescription", 
@@ -186,6 +187,10 @@ BEGIN
         "x_EffectiveUnitPrice", "x_ListCostInUsd", "x_ResourceGroupName", 
         "x_SkuDescription", "x_SkuMeterName", "x_SkuMeterSubcategory", 
         "x_SkuServiceFamily", "hash_key"
-    FROM __schema__.bronze_azure_focus;
+    FROM __schema__.bronze_azure_focus
+    WHERE "_ingested_at" > '__since__'::TIMESTAMPTZ
+      AND "_ingested_at" <= '__until__'::TIMESTAMPTZ
+    -- hash_key is a digest of the whole bronze row: an existing key is the same row
+    ON CONFLICT ("hash_key") DO NOTHING;
 
 END $$;
@@ -0,0 +1,369 @@
+# app/ingestion/bulk_load.py
+
+"""
+Bulk loading helpers shared by the AWS, Azure and GCP ingestion paths.
+
+All functions take an open psycopg2 connection (as provided by each cloud's
+`@connection` decorator) and leave committing to the caller's transaction
+handling, except where stated.
+
+- `copy_rows` streams rows into a table with COPY FROM STDIN (CSV), in
+  chunks: a DataFrame through `copy_dataframe` (pandas values mapped onto the
+  target column types), a pyarrow Table or RecordBatch through
+  `copy_arrow_table` (pyarrow's CSV writer, batch by batch, no pandas
+  conversion). Empty strings are loaded as NULL either way.
+- `replace_table` recreates a table from a DataFrame's dtypes or an Arrow
+  schema and COPYs the rows into it (what `df.to_sql(if_exists='replace')`
+  did, without row-wise INSERTs).
+- `insert_new_rows` deduplicates inside the database: rows are COPY-ed into a
+  temporary staging table and only those whose hash_key is not in the target
+  yet are inserted (anti-join), so the worker never loads the table's existing
+  keys into memory.
+- `rekey_rows` rewrites stored keys (old -> new pairs, COPY-ed the same way)
+  when the way a source's rows are hashed changes.
+
+Every loader accepts a DataFrame, a pyarrow Table or a RecordBatch; Arrow
+input must have flat columns (see arrow_rows.serialize_nested_columns).
+"""
+
+import io
+import json
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from psycopg2 import sql
+
+# Rows serialized per COPY round-trip (bounds the size of the CSV buffer)
+COPY_CHUNK_ROWS = 50_000
+
+_INTEGER_TYPES = {"smallint", "integer", "bigint"}
+_JSON_TYPES = {"json", "jsonb"}
+
+# Rows accepted by the loaders
+Rows = Union[pd.DataFrame, pa.Table, pa.RecordBatch]
+
+
+def _table_identifier(schema_name: str, table_name: str) -> sql.SQL:
+    # Unquoted, like the rest of the ingestion SQL, so names fold to lower case the same way
+    return sql.SQL(f"{schema_name}.{table_name}")
+
+
+def get_column_types(connection, schema_name: str, table_name: str) -> Dict[str, str]:
+    """Return {column_name: data_type} of a table from information_schema."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = %s AND table_name = %s",
+            [schema_name.lower(), table_name.lower()]
+        )
+        return {name: data_type for name, data_type in cursor.fetchall()}
+
+
+def _to_json(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def _prepare_frame(df: pd.DataFrame, column_types: Dict[str, str]) -> pd.DataFrame:
+    """
+    Map pandas values onto the target column types for CSV COPY.
+    Empty strings become NULL (as the previous execute_values loaders did).
+    """
+    df = df.replace("", None)
+    for col in df.columns:
+        data_type = column_types.get(col)
+        series = df[col]
+        if data_type in _INTEGER_TYPES and series.dtype.kind == "f":
+            # NaN turned an integer column into floats; "1.0" is not a valid integer literal
+            df[col] = series.round().astype("Int64")
+        elif data_type in _JSON_TYPES and series.dtype == object:
+            df[col] = series.map(_to_json)
+        elif series.dtype == object:
+            df[col] = series.map(lambda v: str(v) if isinstance(v, (list, dict, np.ndarray)) else v)
+    return df
+
+
+def copy_dataframe(
+    connection,
+    df: pd.DataFrame,
+    schema_name: str,
+    table_name: str,
+    column_types: Optional[Dict[str, str]] = None,
+    chunk_rows: int = COPY_CHUNK_ROWS
+) -> int:
+    """
+    Stream a DataFrame into schema.table with COPY FROM STDIN.
+    Does not commit.
+
+    Returns:
+        Number of rows copied
+    """
+    if df.empty:
+        return 0
+    if column_types is None:
+        column_types = get_column_types(connection, schema_name, table_name)
+
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '')").format(
+        _table_identifier(schema_name, table_name),
+        sql.SQL(", ").join(sql.Identifier(col) for col in df.columns)
+    )
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(df), chunk_rows):
+            chunk = _prepare_frame(df.iloc[start:start + chunk_rows], column_types)
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, header=False, index=False, na_rep="")
+            buffer.seek(0)
+            cursor.copy_expert(copy_query, buffer)
+    return len(df)
+
+
+def empty_strings_to_null(table: pa.Table) -> pa.Table:
+    """Replace empty strings by nulls in the string columns of an Arrow table."""
+    for idx, field in enumerate(table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            column = table.column(idx)
+            table = table.set_column(
+                idx, field, pc.if_else(pc.equal(column, ""), pa.scalar(None, field.type), column)
+            )
+    return table
+
+
+def copy_arrow_table(
+    connection,
+    table: Union[pa.Table, pa.RecordBatch],
+    schema_name: str,
+    table_name: str,
+    chunk_rows: int = COPY_CHUNK_ROWS
+) -> int:
+    """
+    Stream a pyarrow Table (or RecordBatch) into schema.table with COPY FROM
+    STDIN, one record batch at a time, without converting it to pandas. Nulls
+    and empty strings are written as empty unquoted fields (NULL). Does not commit.
+
+    Returns:
+        Number of rows copied
+    """
+    if isinstance(table, pa.RecordBatch):
+        table = pa.Table.from_batches([table])
+    if table.num_rows == 0:
+        return 0
+    table = empty_strings_to_null(table)
+
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '')").format(
+        _table_identifier(schema_name, table_name),
+        sql.SQL(", ").join(sql.Identifier(col) for col in table.column_names)
+    )
+    write_options = pa_csv.WriteOptions(include_header=False)
+
+    with connection.cursor() as cursor:
+        for batch in table.to_batches(max_chunksize=chunk_rows):
+            buffer = io.BytesIO()
+            pa_csv.write_csv(batch, buffer, write_options)
+            buffer.seek(0)
+            cursor.copy_expert(copy_query, buffer)
+    return table.num_rows
+
+
+def copy_rows(
+    connection,
+    rows: Rows,
+    schema_name: str,
+    table_name: str,
+    column_types: Optional[Dict[str, str]] = None,
+    chunk_rows: int = COPY_CHUNK_ROWS
+) -> int:
+    """
+    Stream a DataFrame, pyarrow Table or RecordBatch into schema.table with
+    COPY FROM STDIN. Does not commit.
+
+    Args:
+        column_types: Target column types for the pandas value mapping (looked
+            up when omitted; not needed for Arrow input)
+
+    Returns:
+        Number of rows copied
+    """
+    if isinstance(rows, (pa.Table, pa.RecordBatch)):
+        return copy_arrow_table(connection, rows, schema_name, table_name, chunk_rows)
+    return copy_dataframe(connection, rows, schema_name, table_name, column_types, chunk_rows)
+
+
+def _pg_type_for_arrow(data_type: pa.DataType) -> str:
+    if pa.types.is_boolean(data_type):
+        return "boolean"
+    if pa.types.is_integer(data_type):
+        return "bigint"
+    if pa.types.is_floating(data_type):
+        return "double precision"
+    if pa.types.is_timestamp(data_type):
+        return "timestamp with time zone" if data_type.tz else "timestamp without time zone"
+    if pa.types.is_date(data_type):
+        return "date"
+    return "text"
+
+
+def pg_type_for(dtype) -> str:
+    """Postgres column type for a pandas dtype (as used by replace_table)."""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "bigint"
+    if pd.api.types.is_float_dtype(dtype):
+        return "double precision"
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return "timestamp with time zone"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "timestamp without time zone"
+    return "text"
+
+
+def replace_table(
+    connection,
+    df: Rows,
+    schema_name: str,
+    table_name: str,
+    chunk_rows: int = COPY_CHUNK_ROWS
+) -> int:
+    """
+    Drop and recreate schema.table from the DataFrame's dtypes (or the Arrow
+    schema), then COPY the rows in.
+    Runs in the caller's transaction and does not commit, so readers keep seeing
+    the old table until the caller commits.
+
+    Returns:
+        Number of rows copied
+    """
+    if isinstance(df, (pa.Table, pa.RecordBatch)):
+        column_types = {field.name: _pg_type_for_arrow(field.type) for field in df.schema}
+    else:
+        column_types = {col: pg_type_for(df[col].dtype) for col in df.columns}
+    target = _table_identifier(schema_name, table_name)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(target))
+        cursor.execute(sql.SQL("CREATE TABLE {} ({})").format(
+            target,
+            sql.SQL(", ").join(
+                sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(data_type))
+                for col, data_type in column_types.items()
+            )
+        ))
+
+    return copy_rows(connection, df, schema_name, table_name, column_types, chunk_rows)
+
+
+def ensure_key_index(connection, schema_name: str, table_name: str, key_column: str = "hash_key") -> None:
+    """Create the (non-unique) index the anti-join probes, if it does not exist yet."""
+    index_name = f"{table_name}_{key_column}_idx".lower()[:63]
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})").format(
+            sql.Identifier(index_name),
+            _table_identifier(schema_name, table_name),
+            sql.Identifier(key_column)
+        ))
+
+
+def insert_new_rows(
+    connection,
+    df,
+    schema_name: str,
+    table_name: str,
+    key_column: str = "hash_key"
+) -> int:
+    """
+    Insert only rows whose key is not in schema.table yet, deduplicating in Postgres.
+    `df` is a DataFrame, a pyarrow Table or a RecordBatch.
+
+    The rows are COPY-ed into a temporary (unlogged, dropped on commit) staging
+    table shaped like the target, then moved with
+    INSERT ... SELECT DISTINCT ON (key) ... WHERE NOT EXISTS (...).
+    Commits on success.
+
+    Returns:
+        Number of rows actually inserted
+    """
+    is_arrow = isinstance(df, (pa.Table, pa.RecordBatch))
+    total_rows = df.num_rows if is_arrow else len(df)
+    if total_rows == 0:
+        return 0
+
+    target = _table_identifier(schema_name, table_name)
+    stage_name = f"stage_{table_name}".lower()[:63]
+    stage = sql.Identifier(stage_name)
+    columns: List[str] = list(df.column_names if is_arrow else df.columns)
+    column_list = sql.SQL(", ").join(sql.Identifier(col) for col in columns)
+    key = sql.Identifier(key_column)
+
+    column_types = get_column_types(connection, schema_name, table_name)
+    ensure_key_index(connection, schema_name, table_name, key_column)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL(
+            "CREATE TEMP TABLE IF NOT EXISTS {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+        ).format(stage, target))
+
+    copy_rows(connection, df, "pg_temp", stage_name, column_types)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL(
+            "INSERT INTO {target} ({columns}) "
+            "SELECT DISTINCT ON (s.{key}) {stage_columns} FROM {stage} s "
+            "WHERE NOT EXISTS (SELECT 1 FROM {target} t WHERE t.{key} = s.{key})"
+        ).format(
+            target=target,
+            columns=column_list,
+            key=key,
+            stage_columns=sql.SQL(", ").join(sql.SQL("s.{}").format(sql.Identifier(col)) for col in columns),
+            stage=stage,
+        ))
+        inserted = cursor.rowcount
+
+    connection.commit()
+    print(f"Inserted {inserted} new rows into {schema_name}.{table_name} ({total_rows - inserted} duplicates skipped in database)")
+    return inserted
+
+
+def rekey_rows(
+    connection,
+    schema_name: str,
+    table_name: str,
+    old_keys: List[str],
+    new_keys: List[str],
+    key_column: str = "hash_key"
+) -> int:
+    """
+    Replace stored keys: every row keyed old_keys[i] gets new_keys[i]. Used once
+    when a source's hashing changes, so rows already loaded keep deduplicating
+    against the new keys. Pairs whose new key is already stored are skipped.
+    Does not commit.
+
+    Returns:
+        Number of rows rekeyed
+    """
+    pairs = pd.DataFrame({"old_key": old_keys, "new_key": new_keys})
+    pairs = pairs[pairs["old_key"] != pairs["new_key"]].drop_duplicates("old_key")
+    if pairs.empty:
+        return 0
+
+    target = _table_identifier(schema_name, table_name)
+    key = sql.Identifier(key_column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS rekey_pairs (old_key TEXT, new_key TEXT) ON COMMIT DROP"
+        )
+        cursor.execute("TRUNCATE rekey_pairs")
+    copy_dataframe(connection, pairs, "pg_temp", "rekey_pairs", {"old_key": "text", "new_key": "text"})
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL(
+            "UPDATE {target} t SET {key} = p.new_key FROM rekey_pairs p "
+            "WHERE t.{key} = p.old_key "
+            "AND NOT EXISTS (SELECT 1 FROM {target} d WHERE d.{key} = p.new_key)"
+        ).format(target=target, key=key))
+        return cursor.rowcount
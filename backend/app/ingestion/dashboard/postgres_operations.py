@@ -2,8 +2,9 @@ import psycopg2
 from psycopg2 import sql
 import os
 import pandas as pd
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from app.ingestion.bulk_load import replace_table
 
 # Load environment variables from .env file
 load_dotenv()
@@ -67,11 +68,12 @@ def create_schemas(connection, schema):
 @connection
 def dump_to_postgresql(connection, df, schema_name, table_name):
     try:
-        engine = create_engine('postgresql+psycopg2://', creator=lambda: connection)
-        print("Engine created..")
-        df.to_sql(table_name, engine, schema=schema_name, if_exists='replace', index=False)
+        # Recreate the table from the DataFrame dtypes and COPY the rows in (one transaction)
+        replace_table(connection, df, schema_name, table_name)
+        connection.commit()
         print(f"Data dumped into {schema_name}.{table_name} table successfully.")
     except Exception as e:
+        connection.rollback()
         print(f"Error dumping data into {schema_name}.{table_name} table: {e}")
 
 
@@ -55,14 +55,14 @@
 
 
 
-import hashlib
 import os
 import tempfile
 from google.oauth2 import service_account
 from google.cloud import bigquery
 import pandas as pd
 from sqlalchemy import create_engine, inspect
-from .postgres_operations import run_sql_file, dump_to_postgresql, connection
+from .postgres_operations import run_sql_file, run_silver_sql_file, refresh_gold_views, insert_new_rows_to_postgresql, get_ingestion_watermark, save_ingestion_watermark, rekey_hash_keys
+from app.ingestion.row_hashing import hash_rows
 from sqlalchemy.exc import SQLAlchemyError
 
 # project_id = "cloud-meter-dev"
@@ -72,28 +72,18 @@ from sqlalchemy.exc import SQLAlchemyError
 # schema = "test"
 # table_name = "gcp_temp"
 
-def generate_hash_key(row):
+# FOCUS view column used as the incremental-load watermark
+WATERMARK_COLUMN = "x_ExportTime"
+
+# Materialized by sql/gold.sql, refreshed in this order after each load
+GOLD_MATERIALIZED_VIEWS = ["gold_gcp_billing_dim", "gold_gcp_fact_dim_mv"]
+
+
+def generate_hash_key(df):
     """
-    Generate an MD5 hash key for a given row by concatenating all column values.
+    Generate an MD5 hash key for every row by concatenating all column values.
     """
-    # print("This is rowww-------",row)
-    concatenated_values = ''.join(str(value) for value in row)
-    return hashlib.md5(concatenated_values.encode('utf-8')).hexdigest()
-
-@connection
-def fetch_existing_hash_keys(connection, schema, table_name):
-    try:
-        cursor = connection.cursor()
-        query = f"SELECT hash_key FROM {schema}.{table_name};"
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        existing_keys = set(row[0] for row in rows)
-        print(f"Fetched {len(existing_keys)} existing hash keys.")
-        return existing_keys
-
-    except Exception as ex:
-        print(f"Error fetching hash keys: {ex}")
-        return set()
+    return hash_rows(df)
 
 
 def fetch_data_from_bigquery_to_postgres(project_id, dataset_id, view_id, credentials, schema, table_name, monthly_budget):
@@ -118,26 +108,44 @@ def fetch_data_from_bigquery_to_postgres(project_id, dataset_id, view_id, creden
 
     print("BigQuery client initialized successfully.")
 
+    # Create new schema
+    run_sql_file(sql_file_path=f'{base_path}/sql/new_schema.sql',
+                 schema_name=schema,
+                 budget=monthly_budget
+                 )
+    print(f"Schema {schema} created...")
+
+    # Last export_time loaded by a previous run (None on the first run -> full load)
+    state_source = f'bigquery:{project_id}.{dataset_id}.{view_id}'
+    watermark = get_ingestion_watermark(schema, state_source)
+
     # Construct the query
     query = f"""
     SELECT *
     FROM `{project_id}.{dataset_id}.{view_id}`
     """
+    job_config = None
+    if watermark:
+        # Only rows exported since the last run; >= re-reads the last export batch,
+        # which the hash_key deduplication discards
+        query += f"WHERE {WATERMARK_COLUMN} >= @watermark"
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter("watermark", "TIMESTAMP", watermark)]
+        )
+        print(f"Incremental load: {WATERMARK_COLUMN} >= {watermark}")
 
     # Execute the query and convert the results to a pandas DataFrame
-    dataframe = client.query(query).to_dataframe()
+    dataframe = client.query(query, job_config=job_config).to_dataframe()
 
-    # Replace problematic None/NaN values
-    dataframe = dataframe.fillna(value="")
+    new_watermark = None
+    if WATERMARK_COLUMN in dataframe.columns and dataframe[WATERMARK_COLUMN].notna().any():
+        new_watermark = pd.Timestamp(dataframe[WATERMARK_COLUMN].max()).isoformat()
 
     # Log the data fetched from BigQuery
     print(f"Fetched {len(dataframe)} rows from BigQuery.")
-    # Create new schema
-    run_sql_file(sql_file_path=f'{base_path}/sql/new_schema.sql',
-                 schema_name=schema,
-                 budget=monthly_budget
-                 )
-    print(f"Schema {schema} created...")
+
+    # Replace problematic None/NaN values
+    dataframe = dataframe.fillna(value="")
 
     # Execute the SQL script to ensure the table exists in PostgreSQL
     run_sql_file(sql_file_path=f'{base_path}/sql/create_table.sql',
@@ -148,6 +156,10 @@ def fetch_data_from_bigquery_to_postgres(project_id, dataset_id, view_id, creden
 
     print(f"Table {schema}.{table_name} ensured to exist.")
 
+    if dataframe.empty:
+        print("No rows exported since the last run. Nothing to load.")
+        return
+
     # Create a temporary CSV file
     with tempfile.NamedTemporaryFile(delete=False, mode='w', newline='', suffix='.csv') as temp_csv_file:
         temp_csv_path = temp_csv_file.name
@@ -155,38 +167,52 @@ def fetch_data_from_bigquery_to_postgres(project_id, dataset_id, view_id, creden
         dataframe.to_csv(temp_csv_file, index=False)
         print(f"DataFrame saved to temporary CSV file: {temp_csv_path}")
 
-    # Read the CSV file back into a DataFrame
-    temp_dataframe = pd.read_csv(temp_csv_path)
+    # Read the CSV file back as text: inferring dtypes on each run's delta would
+    # render the same value differently from one run to the next ("123" / "123.0")
+    temp_dataframe = pd.read_csv(temp_csv_path, dtype=str, keep_default_na=False)
     print(f"CSV file loaded into DataFrame with {len(temp_dataframe)} rows.")
 
-    # Create hash keys for each row after re-loading the data from CSV
-    temp_dataframe['hash_key'] = temp_dataframe.apply(generate_hash_key, axis=1)
-
-    # Use the function
-    existing_keys = fetch_existing_hash_keys(schema, table_name)
-    print(f"Existing keys: {len(existing_keys)}")
-
-
-    # # Filter out rows that already exist in the PostgreSQL table
-    new_data = temp_dataframe[~temp_dataframe['hash_key'].isin(existing_keys)]
-    
-    # Log the number of new rows before appending
-    print(f"New rows to append: {len(new_data)}")
-
-    # Only dump new data into PostgreSQL
-    if not new_data.empty:
-        dump_to_postgresql(new_data, schema, table_name)
-        print(f"Appended {len(new_data)} new rows to {schema}.{table_name}.")
+    # Create hash keys for each row from its exported text, stable across runs
+    temp_dataframe['hash_key'] = generate_hash_key(temp_dataframe)
+
+    if watermark is None:
+        # Full export, as every run made before the watermark existed: rows loaded
+        # by those runs are keyed from the inferred-dtype rendering of this same
+        # CSV. Move them to the text keys so they are not inserted a second time.
+        legacy_keys = generate_hash_key(pd.read_csv(temp_csv_path))
+        rekeyed = rekey_hash_keys(schema, [table_name, 'silver_focus_gcp_data'],
+                                  legacy_keys.tolist(), temp_dataframe['hash_key'].tolist())
+        for rekeyed_table, count in rekeyed.items():
+            if count:
+                print(f"Rekeyed {count} previously loaded rows in {schema}.{rekeyed_table}.")
+
+    # Only insert rows that are not in PostgreSQL yet (deduplicated in the database)
+    inserted = insert_new_rows_to_postgresql(temp_dataframe, schema, table_name)
+
+    # Loaded - the next run starts from the newest export_time seen here. A failed
+    # insert (None) keeps the old watermark so these rows are exported again
+    if inserted is None:
+        print(f"Insert into {schema}.{table_name} failed; the watermark is not advanced.")
+        os.remove(temp_csv_path)
+        return
+    if new_watermark:
+        save_ingestion_watermark(schema, state_source, new_watermark, len(temp_dataframe))
+
+    if inserted:
+        print(f"Appended {inserted} new rows to {schema}.{table_name}.")
     # Run the bronze-to-silver SQL script
-        run_sql_file(sql_file_path=f'{base_path}/sql/silver.sql',
+        run_silver_sql_file(sql_file_path=f'{base_path}/sql/silver.sql',
                     schema_name=schema,
-                    budget=monthly_budget
+                    budget=monthly_budget,
+                    bronze_table=table_name,
+                    silver_table='silver_focus_gcp_data'
                     )
         # Run the silver-to-gold SQL script
         run_sql_file(sql_file_path=f'{base_path}/sql/gold.sql',
                     schema_name=schema,
                     budget=monthly_budget
                     )
+        refresh_gold_views(schema, GOLD_MATERIALIZED_VIEWS)
     else:
         print("No new rows to append. All data already exists in the PostgreSQL table.")
 
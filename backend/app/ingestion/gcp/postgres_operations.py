@@ -4,6 +4,8 @@ import os
 import pandas as pd
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
+from app.ingestion import ingestion_operations
+from app.ingestion.bulk_load import copy_rows
 
 # Load environment variables from .env file
 load_dotenv()
@@ -79,26 +81,9 @@ def create_schemas(connection, schema):
 
 @connection
 def dump_to_postgresql(connection, new_data, schema, table_name):
-    from psycopg2.extras import execute_values  # Import this utility for bulk inserts
     try:
-        # Replace empty strings with None for all columns
-        new_data = new_data.replace("", None)
-
-        # Prepare the data as a list of tuples
-        records = [tuple(row) for row in new_data.to_numpy()]
-
-        # Debugging: Print some sample records to inspect data
-        print(f"First 5 records to insert: {records[:5]}")
-
-        # Get the column names and ensure they are properly quoted
-        columns = ', '.join([f'"{col}"' for col in new_data.columns])
-
-        # Generate the SQL query for bulk insert
-        insert_query = f"INSERT INTO {schema}.{table_name} ({columns}) VALUES %s"
-
-        cursor = connection.cursor()
-        # Use execute_values for efficient bulk insert
-        execute_values(cursor, insert_query, records)
+        # Stream rows with COPY FROM STDIN (empty strings are loaded as NULL)
+        copy_rows(connection, new_data, schema, table_name)
         connection.commit()  # Commit transaction
         print(f"Data dumped into {schema}.{table_name} table successfully.")
 
@@ -196,3 +181,12 @@ def run_sql_file(connection, sql_file_path, schema_name, budget):
 
     except Exception as error:
         print(f"Error executing {sql_file_path}: {error}")
+
+
+# Shared ingestion operations (app/ingestion/ingestion_operations.py) on this module's connection
+run_silver_sql_file = connection(ingestion_operations.run_silver_sql_file)
+refresh_gold_views = connection(ingestion_operations.refresh_gold_views)
+insert_new_rows_to_postgresql = connection(ingestion_operations.insert_new_rows_to_postgresql)
+get_ingestion_watermark = connection(ingestion_operations.get_ingestion_watermark)
+save_ingestion_watermark = connection(ingestion_operations.save_ingestion_watermark)
+rekey_hash_keys = connection(ingestion_operations.rekey_hash_keys)
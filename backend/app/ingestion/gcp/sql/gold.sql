@@ -23,30 +23,80 @@
 -- --FROM
 -- --    __schema__.silver_focus_gcp_data;
 
--- CREATE OR REPLACE VIEW __schema__.gold_gcp_fact_dim AS
--- SELECT
---     billed_cost,
---     resource_name,
---     resource_type,
---     billing_period_start,
---     x_project_id,
---     region_id,
---     x_service_id,
---     charge_period_start,
---     contracted_cost,
---     charge_description,
---     charge_category,
---     substr(cast(digest(tags::text, 'sha256') as text), 3, 64) as tags_key,
---     __budget__::integer AS monthly_budget,
---     consumed_quantity,
---     pricing_quantity,
---     provider_name,
---     list_cost,
--- 	effective_cost
--- FROM
---    __schema__.silver_focus_gcp_data;
+-- -- fact (materialized without the budget, which can change between runs)
+CREATE MATERIALIZED VIEW IF NOT EXISTS __schema__.gold_gcp_fact_dim_mv AS
+SELECT
+    billed_cost,
+	billing_account_id,
+    resource_name,
+    resource_type,
+    billing_period_start,
+	billing_period_end,
+    x_project_id,
+    region_id,
+    x_service_id,
+    charge_period_start,
+	charge_period_end,
+    contracted_cost,
+    charge_description,
+    charge_category,
+    md5(tags::text) as tags_key,
+    consumed_quantity,
+    pricing_quantity,
+    provider_name,
+    list_cost,
+	effective_cost,
+	region_name,
+    x_location,
+	sku_id,
+	service_name,
+	service_category,
+    hash_key,
+    resource_id
+FROM
+   __schema__.silver_focus_gcp_data
+WITH NO DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS gold_gcp_fact_dim_mv_hash_key_idx ON __schema__.gold_gcp_fact_dim_mv (hash_key);
+CREATE INDEX IF NOT EXISTS gold_gcp_fact_dim_mv_charge_period_start_idx ON __schema__.gold_gcp_fact_dim_mv (charge_period_start);
+CREATE INDEX IF NOT EXISTS gold_gcp_fact_dim_mv_resource_id_idx ON __schema__.gold_gcp_fact_dim_mv (resource_id);
+CREATE INDEX IF NOT EXISTS gold_gcp_fact_dim_mv_service_name_idx ON __schema__.gold_gcp_fact_dim_mv (service_name);
+CREATE INDEX IF NOT EXISTS gold_gcp_fact_dim_mv_tags_key_idx ON __schema__.gold_gcp_fact_dim_mv (tags_key);
 
--- CREATE OR REPLACE FUNCTION gcp_tags_view_generation()
+CREATE OR REPLACE VIEW __schema__.gold_gcp_fact_dim AS
+SELECT
+    billed_cost,
+	billing_account_id,
+    resource_name,
+    resource_type,
+    billing_period_start,
+	billing_period_end,
+    x_project_id,
+    region_id,
+    x_service_id,
+    charge_period_start,
+	charge_period_end,
+    contracted_cost,
+    charge_description,
+    charge_category,
+    tags_key,
+    __budget__::integer AS monthly_budget,
+    consumed_quantity,
+    pricing_quantity,
+    provider_name,
+    list_cost,
+	effective_cost,
+	region_name,
+    x_location,
+	sku_id,
+	service_name,
+	service_category,
+    hash_key,
+    resource_id
+FROM
+   __schema__.gold_gcp_fact_dim_mv;
+
+CREATE OR REPLACE FUNCTION gcp_tags_view_generation()
 -- RETURNS text AS $$
 -- DECLARE
 --     record_tagkey record;
@@ -84,12 +134,26 @@
 -- $$ LANGUAGE plpgsql;
 
 
-CREATE OR REPLACE VIEW __schema__.gold_gcp_billing_dim AS
+-- The billing dim and the fact are materialized views with indexes, refreshed (CONCURRENTLY) at
+-- the end of ingestion by app/ingestion/gold_refresh.py. They are created empty here; the refresh
+-- populates them. Drop the plain view earlier versions created under the same name.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_views WHERE schemaname = '__schema__' AND viewname = 'gold_gcp_billing_dim') THEN
+        DROP VIEW __schema__.gold_gcp_billing_dim;
+    END IF;
+END $$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS __schema__.gold_gcp_billing_dim AS
 SELECT
    DISTINCT billing_account_id,
    sub_account_id
 FROM
-   __schema__.silver_focus_gcp_data;
+   __schema__.silver_focus_gcp_data
+WITH NO DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS gold_gcp_billing_dim_key_idx ON __schema__.gold_gcp_billing_dim
+    (billing_account_id, sub_account_id);
 
 
 
@@ -140,7 +204,7 @@ CREATE OR REPLACE FUNCTION gcp_tags_view_generation()
 RETURNS text AS $$
 DECLARE
     record_tagkey record;
-    q_statement text = format(E'CREATE OR REPLACE VIEW __schema__.gold_gcp_tags_dim AS\nSELECT DISTINCT\n    md5(cast(tags AS text)) AS tags_key,');
+    q_statement text = format(E'CREATE MATERIALIZED VIEW __schema__.gold_gcp_tags_dim AS\nSELECT DISTINCT\n    md5(cast(tags AS text)) AS tags_key,');
 BEGIN
     -- Loop through each distinct tag key
     FOR record_tagkey IN
@@ -159,18 +223,28 @@ $$ LANGUAGE plpgsql;
 
 DO $$
 DECLARE
-    del_statement text := 'DROP VIEW IF EXISTS __schema__.gold_gcp_tags_dim CASCADE';
     q_statement text;
 BEGIN
     -- Generate the view creation query
     q_statement := gcp_tags_view_generation();
 
-    -- Drop the existing view if it exists
-    EXECUTE del_statement;
-
-    -- Execute the dynamically generated query
-    EXECUTE q_statement;
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = '__schema__' AND matviewname = 'gold_gcp_tags_dim')
+       AND obj_description(to_regclass('__schema__.gold_gcp_tags_dim'), 'pg_class') = md5(q_statement) THEN
+        -- Same tag keys as the last run: refresh the rows in place
+        REFRESH MATERIALIZED VIEW CONCURRENTLY __schema__.gold_gcp_tags_dim;
+    ELSE
+        -- First run or new tag keys (new columns): drop the existing view and rebuild it
+        IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = '__schema__' AND matviewname = 'gold_gcp_tags_dim') THEN
+            DROP MATERIALIZED VIEW __schema__.gold_gcp_tags_dim CASCADE;
+        ELSE
+            DROP VIEW IF EXISTS __schema__.gold_gcp_tags_dim CASCADE;
+        END IF;
+
+        -- Execute the dynamically generated query
+        EXECUTE q_statement;
+        CREATE UNIQUE INDEX gold_gcp_tags_dim_tags_key_idx ON __schema__.gold_gcp_tags_dim (tags_key);
+        -- The definition hash tells the next run whether the columns changed
+        EXECUTE format('COMMENT ON MATERIALIZED VIEW __schema__.gold_gcp_tags_dim IS %L', md5(q_statement));
+    END IF;
 END;
 $$ LANGUAGE plpgsql;
-
-
@@ -0,0 +1,70 @@
+# app/ingestion/gold_refresh.py
+
+"""
+Refresh of the materialized gold layer, run once at the end of an ingestion.
+
+The gold dims and facts read by Cube.js, the LLM fetchers and
+/resources/sync-resources used to be plain views, recomputing DISTINCTs and
+md5(Tags) over the whole silver table on every query. The gold SQL files now
+create them as indexed materialized views (WITH NO DATA, each with a unique
+index); the facts get a thin view on top that adds the monthly budget.
+
+`refresh_materialized_views` populates a view the first time and afterwards
+uses REFRESH MATERIALIZED VIEW CONCURRENTLY, so dashboards keep reading the
+previous rows while the new ones are computed.
+
+Like bulk_load, the functions take an open psycopg2 connection from the
+calling cloud's `@connection` decorator and commit their own writes.
+"""
+
+import time
+from typing import Iterable, Optional
+
+from psycopg2 import sql
+
+
+def _is_populated(connection, schema_name: str, view_name: str) -> Optional[bool]:
+    """pg_matviews.ispopulated of a view, None if it is not a materialized view."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT ispopulated FROM pg_matviews WHERE schemaname = %s AND matviewname = %s",
+            [schema_name.lower(), view_name.lower()]
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
+def refresh_materialized_views(
+    connection,
+    schema_name: str,
+    view_names: Iterable[str],
+    data_changed: bool = True
+) -> None:
+    """
+    Refresh materialized views in order, each in its own transaction.
+
+    A view created WITH NO DATA is populated with a plain REFRESH (CONCURRENTLY
+    requires a populated view); populated views are refreshed CONCURRENTLY,
+    which needs the unique index the gold SQL files create.
+
+    Args:
+        data_changed: False when no silver rows changed this run: only views
+            that were never populated are loaded
+    """
+    for view_name in view_names:
+        populated = _is_populated(connection, schema_name, view_name)
+        if populated is None:
+            print(f"⚠️ {schema_name}.{view_name} is not a materialized view, skipping refresh")
+            continue
+        if populated and not data_changed:
+            continue
+
+        started = time.time()
+        with connection.cursor() as cursor:
+            cursor.execute(sql.SQL("REFRESH MATERIALIZED VIEW {concurrently} {view}").format(
+                concurrently=sql.SQL("CONCURRENTLY" if populated else ""),
+                view=sql.SQL(f"{schema_name}.{view_name}")
+            ))
+        connection.commit()
+        mode = "concurrently" if populated else "initial load"
+        print(f"Refreshed {schema_name}.{view_name} ({mode}) in {time.time() - started:.1f}s")
@@ -0,0 +1,147 @@
+# app/ingestion/ingestion_operations.py
+
+"""
+Database operations of the billing and metrics ingestion, shared by the AWS,
+Azure and GCP paths.
+
+Every function takes an open psycopg2 connection as its first argument, like
+bulk_load, ingestion_state and silver_load, whose building blocks they
+combine. The cloud modules expose them through their own `@connection`
+decorator, so connection settings and error handling stay per cloud:
+
+    insert_new_rows_to_postgresql = connection(ingestion_operations.insert_new_rows_to_postgresql)
+
+Table names are unquoted (see bulk_load), so schema and table names fold to
+lower case the same way as in the SQL scripts.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from psycopg2 import sql
+
+from app.ingestion.bulk_load import insert_new_rows, rekey_rows
+from app.ingestion.gold_refresh import refresh_materialized_views
+from app.ingestion.ingestion_state import get_processed_objects, get_watermark, mark_objects_processed, set_watermark
+from app.ingestion.silver_load import run_silver_refresh
+
+
+def insert_new_rows_to_postgresql(connection, new_data, schema_name: str, table_name: str) -> int:
+    """
+    Insert rows whose hash_key is not in the table yet. Deduplication happens in
+    Postgres (COPY into a temp staging table + anti-join), so existing keys are
+    never loaded into memory.
+
+    Returns:
+        Number of rows inserted
+    """
+    return insert_new_rows(connection, new_data, schema_name, table_name)
+
+
+def get_ingestion_state(connection, schema_name: str, source: str) -> Dict[str, Dict]:
+    """
+    Return {object_key: {"etag", "last_modified"}} of the export objects already
+    ingested for `source` (see app.ingestion.ingestion_state).
+    """
+    return get_processed_objects(connection, schema_name, source)
+
+
+def save_ingestion_state(connection, schema_name: str, source: str, objects: Iterable[Dict]) -> None:
+    """Record export objects (dicts with key/etag/last_modified) as ingested."""
+    mark_objects_processed(connection, schema_name, source, objects)
+
+
+def get_ingestion_watermark(connection, schema_name: str, source: str) -> Optional[str]:
+    """Return the last loaded watermark of `source`, or None on the first run."""
+    return get_watermark(connection, schema_name, source)
+
+
+def save_ingestion_watermark(connection, schema_name: str, source: str, watermark: str,
+                             row_count: Optional[int] = None) -> None:
+    """Store the last loaded watermark of `source`."""
+    set_watermark(connection, schema_name, source, watermark, row_count)
+
+
+def run_silver_sql_file(connection, sql_file_path: str, schema_name: str, budget, bronze_table: str,
+                        silver_table: str, full_refresh: bool = False) -> None:
+    """
+    Run a bronze-to-silver SQL file over the bronze rows loaded since the last
+    refresh (upsert on hash_key); full_refresh rebuilds silver for backfills.
+    See app.ingestion.silver_load.
+    """
+    try:
+        with open(sql_file_path, 'r') as file:
+            sql_script = file.read()
+        sql_script = sql_script.replace('__schema__', schema_name).replace('__budget__', str(budget))
+
+        if run_silver_refresh(connection, sql_script, schema_name, bronze_table, silver_table, full_refresh):
+            print(f"Executed {sql_file_path} successfully")
+
+    except Exception as error:
+        print(f"Error executing {sql_file_path}: {error}")
+
+
+def refresh_gold_views(connection, schema_name: str, view_names: List[str], data_changed: bool = True) -> None:
+    """Refresh the materialized gold views of a schema (see app.ingestion.gold_refresh)."""
+    try:
+        refresh_materialized_views(connection, schema_name, view_names, data_changed)
+    except Exception as error:
+        print(f"Error refreshing gold views in {schema_name}: {error}")
+
+
+def get_metric_watermarks(connection, schema_name: str, table_name: str,
+                          key_columns: Sequence[str] = ("resource_id",)) -> Dict[Tuple, object]:
+    """
+    Latest stored timestamp per series of a bronze metrics table, used to fetch
+    only new datapoints.
+
+    Args:
+        key_columns: Columns identifying a series, e.g. ["instance_id"]
+
+    Returns:
+        {tuple of lower-cased key values: timestamp}
+    """
+    keys = sql.SQL(", ").join(sql.SQL("lower({}::text)").format(sql.Identifier(col)) for col in key_columns)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("SELECT {keys}, max(timestamp) FROM {table} GROUP BY {groups}").format(
+                keys=keys,
+                table=sql.SQL(f"{schema_name}.{table_name}"),
+                groups=sql.SQL(", ").join(sql.SQL(str(i + 1)) for i in range(len(key_columns)))
+            )
+        )
+        return {
+            tuple(row[:-1]): row[-1]
+            for row in cursor.fetchall()
+            if row[-1] is not None and all(row[:-1])
+        }
+
+
+def table_has_rows(connection, schema_name: str, table_name: str) -> bool:
+    """True if schema.table exists and holds at least one row."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [f"{schema_name}.{table_name}"])
+        if cursor.fetchone()[0] is None:
+            return False
+        cursor.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {})").format(sql.SQL(f"{schema_name}.{table_name}")))
+        return bool(cursor.fetchone()[0])
+
+
+def rekey_hash_keys(connection, schema_name: str, table_names: Iterable[str],
+                    old_keys: List[str], new_keys: List[str]) -> Dict[str, int]:
+    """
+    Rewrite stored hash_keys (old_keys[i] -> new_keys[i]) in the given tables
+    of a schema, in one transaction. Tables that do not exist yet are skipped.
+    Commits on success.
+
+    Returns:
+        {table_name: rows rekeyed}
+    """
+    rekeyed = {}
+    with connection.cursor() as cursor:
+        for table_name in table_names:
+            cursor.execute("SELECT to_regclass(%s)", [f"{schema_name}.{table_name}"])
+            if cursor.fetchone()[0] is None:
+                continue
+            rekeyed[table_name] = rekey_rows(connection, schema_name, table_name, old_keys, new_keys)
+    connection.commit()
+    return rekeyed
@@ -0,0 +1,156 @@
+# app/ingestion/ingestion_state.py
+
+"""
+Per-project ingestion state, so the daily billing ingestion only fetches what
+changed since the previous run.
+
+One table per project schema, `<schema>.ingestion_state`, keyed by
+(source, object_key):
+- Object sources (Azure blob exports, AWS S3 exports) store one row per
+  processed object with its ETag and LastModified. An object is fetched again
+  only if it is new or its ETag/LastModified changed (exports rewritten in
+  place for the current billing period).
+- Watermark sources (the GCP BigQuery FOCUS view) store a single row with
+  object_key = WATERMARK_KEY and the last loaded value (x_ExportTime).
+
+Like bulk_load, the functions take an open psycopg2 connection from the
+calling cloud's `@connection` decorator and commit their own writes.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+STATE_TABLE = "ingestion_state"
+WATERMARK_KEY = "__watermark__"
+
+
+def _state_table(schema_name: str) -> sql.SQL:
+    # Unquoted, like the rest of the ingestion SQL (schema names fold to lower case)
+    return sql.SQL(f"{schema_name}.{STATE_TABLE}")
+
+
+def ensure_state_table(connection, schema_name: str) -> None:
+    """Create <schema>.ingestion_state if it does not exist yet."""
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {} (
+                source TEXT NOT NULL,
+                object_key TEXT NOT NULL,
+                etag TEXT,
+                last_modified TIMESTAMP WITH TIME ZONE,
+                watermark TEXT,
+                row_count BIGINT,
+                processed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                PRIMARY KEY (source, object_key)
+            )
+        """).format(_state_table(schema_name)))
+    connection.commit()
+
+
+def get_processed_objects(connection, schema_name: str, source: str) -> Dict[str, Dict]:
+    """
+    Return the objects already ingested for a source.
+
+    Returns:
+        {object_key: {"etag": ..., "last_modified": ...}}
+    """
+    ensure_state_table(connection, schema_name)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("SELECT object_key, etag, last_modified FROM {} WHERE source = %s AND object_key <> %s").format(
+                _state_table(schema_name)
+            ),
+            [source, WATERMARK_KEY]
+        )
+        return {
+            key: {"etag": etag, "last_modified": last_modified}
+            for key, etag, last_modified in cursor.fetchall()
+        }
+
+
+def _normalize_etag(etag: Optional[str]) -> Optional[str]:
+    # S3 returns quoted ETags, Azure sometimes does; compare them bare
+    return etag.strip('"') if etag else etag
+
+
+def filter_changed_objects(objects: Iterable[Dict], processed: Dict[str, Dict]) -> List[Dict]:
+    """
+    Keep only objects that are new, or whose ETag / LastModified differ from the
+    recorded state.
+
+    Args:
+        objects: Dicts with "key", "etag" and "last_modified"
+        processed: Output of get_processed_objects
+
+    Returns:
+        The new or changed objects, in input order
+    """
+    changed = []
+    for obj in objects:
+        seen = processed.get(obj["key"])
+        if seen is None:
+            changed.append(obj)
+            continue
+        etag, seen_etag = _normalize_etag(obj.get("etag")), _normalize_etag(seen.get("etag"))
+        if etag and seen_etag:
+            if etag != seen_etag:
+                changed.append(obj)
+        elif obj.get("last_modified") != seen.get("last_modified"):
+            changed.append(obj)
+    return changed
+
+
+def mark_objects_processed(connection, schema_name: str, source: str, objects: Iterable[Dict]) -> None:
+    """Record objects (dicts with "key", "etag", "last_modified", optional "row_count") as ingested."""
+    rows = [
+        (source, obj["key"], _normalize_etag(obj.get("etag")), obj.get("last_modified"), obj.get("row_count"))
+        for obj in objects
+    ]
+    if not rows:
+        return
+    ensure_state_table(connection, schema_name)
+    with connection.cursor() as cursor:
+        execute_values(cursor, sql.SQL("""
+            INSERT INTO {} (source, object_key, etag, last_modified, row_count)
+            VALUES %s
+            ON CONFLICT (source, object_key) DO UPDATE SET
+                etag = EXCLUDED.etag,
+                last_modified = EXCLUDED.last_modified,
+                row_count = EXCLUDED.row_count,
+                processed_at = now()
+        """).format(_state_table(schema_name)).as_string(connection), rows)
+    connection.commit()
+
+
+def get_watermark(connection, schema_name: str, source: str) -> Optional[str]:
+    """Return the last loaded watermark of a source, or None on the first run."""
+    ensure_state_table(connection, schema_name)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("SELECT watermark FROM {} WHERE source = %s AND object_key = %s").format(
+                _state_table(schema_name)
+            ),
+            [source, WATERMARK_KEY]
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
+def set_watermark(connection, schema_name: str, source: str, watermark: str, row_count: Optional[int] = None) -> None:
+    """Store the last loaded watermark of a source."""
+    ensure_state_table(connection, schema_name)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("""
+                INSERT INTO {} (source, object_key, watermark, row_count)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (source, object_key) DO UPDATE SET
+                    watermark = EXCLUDED.watermark,
+                    row_count = EXCLUDED.row_count,
+                    processed_at = now()
+            """).format(_state_table(schema_name)),
+            [source, WATERMARK_KEY, str(watermark), row_count]
+        )
+    connection.commit()
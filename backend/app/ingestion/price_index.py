@@ -0,0 +1,169 @@
+# app/ingestion/price_index.py
+
+"""
+In-memory price index used while building the LLM prompts.
+
+The pricing helpers used to open a `@connection` connection and run one or two
+catalog queries per lookup (current SKU price, alternatives below and above
+it, storage / public IP options), for every resource of a bulk run. Now the
+catalog rows of a (provider, region) are read once, with one query, and kept
+here for PRICE_INDEX_TTL_SECONDS:
+
+- every resource family (Azure 'vm' compute meters, 'storage', 'publicip';
+  AWS 'ec2', 's3', 'ebs') is a PriceList sorted by price, with a dict from
+  lower-cased SKU to its cheapest row;
+- the current SKU is a dict lookup, and the alternatives just below and above
+  its price are found by bisection and a walk outwards;
+- concurrent callers (run_bulk_llm threads) wait for the same load.
+
+The catalog is refreshed daily, so an index is at most one TTL behind it.
+Loaders are the cloud pricing helpers: `@connection` functions that read the
+rows with `fetch_price_rows` and group them into PriceLists.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+PRICE_INDEX_TTL_SECONDS = int(os.getenv("PRICE_INDEX_TTL_SECONDS", "3600"))
+
+# (provider, region) -> (expires_at epoch seconds, {family: PriceList})
+_indexes: Dict[Tuple[str, str], Tuple[float, Dict[str, "PriceList"]]] = {}
+_index_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_index_locks_guard = threading.Lock()
+
+
+class PriceList:
+    """
+    Price rows of one resource family in one region, sorted by price.
+    Prices are floats (NULL as 0.0); rows without a SKU are only returned by
+    `cheapest`.
+    """
+
+    def __init__(self, rows: Iterable[Dict], sku_key: str, price_key: str):
+        self.sku_key = sku_key
+        self.price_key = price_key
+        self.rows = sorted(rows, key=lambda row: row[price_key])
+        self._prices = [row[price_key] for row in self.rows]
+        self._by_sku: Dict[str, Dict] = {}
+        for row in self.rows:
+            # Ascending order: the first row kept per SKU is its cheapest
+            if row[sku_key] is not None:
+                self._by_sku.setdefault(row[sku_key].lower(), row)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def lookup(self, sku: Optional[str]) -> Optional[Dict]:
+        """Cheapest row of a SKU (case-insensitive), None if it has no price."""
+        return self._by_sku.get(sku.lower()) if sku else None
+
+    def _distinct(
+        self,
+        positions: Iterable[int],
+        columns: Sequence[str],
+        limit: int,
+        exclude_sku: Optional[str] = None,
+        require_sku: bool = True
+    ) -> List[Dict]:
+        # Rows at the given positions reduced to `columns`, duplicates skipped (SELECT DISTINCT)
+        exclude = exclude_sku.lower() if exclude_sku else None
+        selected, seen = [], set()
+        for position in positions:
+            if len(selected) >= limit:
+                break
+            row = self.rows[position]
+            sku = row[self.sku_key]
+            if sku is None and require_sku:
+                continue
+            if exclude is not None and sku is not None and sku.lower() == exclude:
+                continue
+            values = tuple(row[column] for column in columns)
+            if values not in seen:
+                seen.add(values)
+                selected.append(dict(zip(columns, values)))
+        return selected
+
+    def below(self, price: float, limit: int, columns: Sequence[str], exclude_sku: Optional[str] = None) -> List[Dict]:
+        """Up to `limit` distinct rows priced in (0, price), closest to `price` first."""
+        start = bisect_left(self._prices, price)
+        stop = bisect_right(self._prices, 0)
+        return self._distinct(range(start - 1, stop - 1, -1), columns, limit, exclude_sku)
+
+    def above(self, price: float, limit: int, columns: Sequence[str], exclude_sku: Optional[str] = None) -> List[Dict]:
+        """Up to `limit` distinct rows priced above max(price, 0), closest to `price` first."""
+        start = bisect_right(self._prices, max(price, 0))
+        return self._distinct(range(start, len(self.rows)), columns, limit, exclude_sku)
+
+    def cheapest(self, limit: int, columns: Sequence[str]) -> List[Dict]:
+        """Up to `limit` distinct rows with a positive price, cheapest first."""
+        start = bisect_right(self._prices, 0)
+        return self._distinct(range(start, len(self.rows)), columns, limit, require_sku=False)
+
+
+def fetch_price_rows(
+    connection,
+    query: str,
+    params: Sequence,
+    price_columns: Sequence[str],
+    type_column: str = "resource_type"
+) -> Dict[str, List[Dict]]:
+    """
+    Run a catalog query and group its rows, as dicts, by resource type.
+    Price columns are converted to float (NULL as 0.0).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        rows = cursor.fetchall()
+
+    grouped: Dict[str, List[Dict]] = {}
+    for values in rows:
+        row = dict(zip(columns, values))
+        for column in price_columns:
+            value = row[column]
+            row[column] = float(value) if isinstance(value, (Decimal, int, float)) else 0.0
+        grouped.setdefault(row[type_column], []).append(row)
+    return grouped
+
+
+def _index_lock(key: Tuple[str, str]) -> threading.Lock:
+    with _index_locks_guard:
+        return _index_locks.setdefault(key, threading.Lock())
+
+
+def get_price_list(
+    provider: str,
+    region: str,
+    family: str,
+    load: Callable[[str], Optional[Dict[str, PriceList]]]
+) -> PriceList:
+    """
+    Price list of a resource family in a region. The region is loaded with
+    `load(region)` at most once per PRICE_INDEX_TTL_SECONDS; a failed load
+    (None) is not cached and yields an empty list.
+
+    Args:
+        provider: 'azure' or 'aws'
+        family: Resource family, e.g. 'vm', 'storage', 'ec2'
+        load: Loader returning {family: PriceList} for a region, None on error
+    """
+    key = (provider, (region or "").lower())
+    with _index_lock(key):
+        cached = _indexes.get(key)
+        if cached and cached[0] > time.time():
+            index = cached[1]
+        else:
+            started = time.time()
+            index = load(region)
+            if index is not None:
+                _indexes[key] = (time.time() + PRICE_INDEX_TTL_SECONDS, index)
+                counts = ", ".join(f"{name}: {len(prices)}" for name, prices in index.items())
+                print(f"📇 Indexed {provider} prices for {region} ({counts}) in {time.time() - started:.1f}s")
+
+    prices = (index or {}).get(family)
+    return prices if prices is not None else PriceList([], "sku", "price")
+
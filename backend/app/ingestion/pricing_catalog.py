@@ -0,0 +1,210 @@
+# app/ingestion/pricing_catalog.py
+
+"""
+Shared pricing catalog: one copy of the public Azure / AWS retail price lists
+for all projects.
+
+Every project ingestion used to download the same price lists and
+DELETE + insert them into its own `<schema>.azure_pricing` /
+`<schema>.aws_pricing`. Now:
+
+- the prices live once, in the PRICING_CATALOG_SCHEMA schema
+  (sql/pricing_catalog.sql), refreshed by the daily
+  `task_refresh_pricing_catalog` beat task;
+- each refresh is a versioned snapshot (`snapshots` row + its price rows,
+  written in one transaction); the `*_current` views and the per-type views
+  (`azure_pricing_vm`, `aws_pricing_ec2`, ...) read the latest snapshot only,
+  and the PRICING_SNAPSHOTS_TO_KEEP most recent snapshots are kept;
+- prices are hashed per (resource type, region): a refresh where nothing
+  changed writes no snapshot, and unchanged parts of a new snapshot are
+  copied inside Postgres instead of being loaded again;
+- project schemas keep their `azure_pricing_vm`-style names as views onto
+  the catalog, and the pricing helpers query the catalog directly;
+- an ingestion only fetches prices itself when the catalog has no snapshot
+  younger than PRICING_CATALOG_MAX_AGE_HOURS (first deployment, failed beat).
+
+Like bulk_load, the functions take an open psycopg2 connection from the
+calling cloud's `@connection` decorator and commit their own writes.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+
+from app.ingestion.bulk_load import copy_dataframe, get_column_types
+
+PRICING_CATALOG_SCHEMA = os.getenv("PRICING_CATALOG_SCHEMA", "pricing_catalog")
+PRICING_SNAPSHOTS_TO_KEEP = int(os.getenv("PRICING_SNAPSHOTS_TO_KEEP", "3"))
+PRICING_CATALOG_MAX_AGE_HOURS = float(os.getenv("PRICING_CATALOG_MAX_AGE_HOURS", "36"))
+
+# Column holding the region of a price row, per provider
+REGION_COLUMNS = {"azure": "arm_region_name", "aws": "region"}
+
+CATALOG_SQL_PATH = os.path.join(os.path.dirname(__file__), "sql", "pricing_catalog.sql")
+
+
+def catalog_table(provider: str) -> str:
+    """Catalog table holding the price rows of a provider ('azure', 'aws')."""
+    return f"{provider}_pricing"
+
+
+def ensure_catalog(connection) -> None:
+    """Create the catalog schema, tables, indexes and views if needed."""
+    with open(CATALOG_SQL_PATH, "r") as file:
+        sql_script = file.read().replace("__catalog__", PRICING_CATALOG_SCHEMA)
+    with connection.cursor() as cursor:
+        cursor.execute(sql_script)
+    connection.commit()
+
+
+def snapshot_age_hours(connection, provider: str) -> Optional[float]:
+    """
+    Hours since the catalog last checked a provider's prices (new snapshot, or
+    a refresh that found nothing changed), None if there is no snapshot.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("SELECT MAX(checked_at) FROM {}.snapshots WHERE provider = %s").format(
+            sql.SQL(PRICING_CATALOG_SCHEMA)
+        ), [provider])
+        checked_at = cursor.fetchone()[0]
+    if checked_at is None:
+        return None
+    return (datetime.now(timezone.utc) - checked_at).total_seconds() / 3600
+
+
+def part_key(resource_type: str, region: str) -> str:
+    """Key of a (resource type, region) part in snapshots.content_hashes."""
+    return f"{resource_type}:{region}"
+
+
+def frame_content_hash(df: pd.DataFrame) -> str:
+    """
+    Content hash of a price frame, independent of row order and of the
+    last_updated fetch timestamp.
+    """
+    df = df.drop(columns=["last_updated"], errors="ignore")
+    df = df[sorted(df.columns)]
+    row_hashes = np.sort(pd.util.hash_pandas_object(df, index=False).to_numpy())
+    digest = hashlib.md5(",".join(df.columns).encode())
+    digest.update(row_hashes.tobytes())
+    return digest.hexdigest()
+
+
+def _latest_snapshot(connection, provider: str) -> Tuple[Optional[int], Dict[str, str]]:
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("""
+            SELECT snapshot_id, content_hashes FROM {}.snapshots
+            WHERE provider = %s
+            ORDER BY snapshot_id DESC
+            LIMIT 1
+        """).format(sql.SQL(PRICING_CATALOG_SCHEMA)), [provider])
+        row = cursor.fetchone()
+    if not row:
+        return None, {}
+    return row[0], row[1] or {}
+
+
+def write_snapshot(
+    connection,
+    provider: str,
+    parts: Dict[Tuple[str, str], Optional[pd.DataFrame]]
+) -> Optional[int]:
+    """
+    Store fetched prices as a new snapshot, in one transaction, and prune the
+    old snapshots.
+
+    Each (resource_type, region) part is content-hashed: parts identical to the
+    current snapshot, and parts that could not be fetched (None / empty), are
+    copied from the current snapshot inside Postgres; only changed parts are
+    written through the COPY loader. When nothing changed, no snapshot is
+    written and the current one is marked as checked.
+
+    Args:
+        provider: 'azure' or 'aws'
+        parts: {(resource_type, region): DataFrame of prices or None};
+            columns the catalog table does not have are dropped
+
+    Returns:
+        The current snapshot_id, or None if there are no prices at all
+    """
+    table_name = catalog_table(provider)
+    region_column = REGION_COLUMNS[provider]
+    catalog = sql.SQL(PRICING_CATALOG_SCHEMA)
+    previous_id, previous_hashes = _latest_snapshot(connection, provider)
+
+    fetched = {key: df for key, df in parts.items() if df is not None and not df.empty}
+    hashes = {part_key(*key): frame_content_hash(df) for key, df in fetched.items()}
+    changed = {key: df for key, df in fetched.items() if previous_hashes.get(part_key(*key)) != hashes[part_key(*key)]}
+    changed_keys = {part_key(*key) for key in changed}
+
+    if not changed:
+        if previous_id is None:
+            print(f"⚠️ No {provider} prices fetched and no catalog snapshot yet")
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql.SQL("UPDATE {}.snapshots SET checked_at = now() WHERE snapshot_id = %s").format(catalog),
+                           [previous_id])
+        connection.commit()
+        print(f"♻️ {provider} prices unchanged ({len(fetched)} part(s)), keeping snapshot {previous_id}")
+        return previous_id
+
+    # Parts carried over from the current snapshot: unchanged, or not fetched this time
+    carried = {key: value for key, value in previous_hashes.items() if key not in changed_keys}
+    content_hashes = {**carried, **{key: hashes[key] for key in changed_keys}}
+    regions = sorted({key.split(":", 1)[1] for key in content_hashes})
+
+    column_types = get_column_types(connection, PRICING_CATALOG_SCHEMA, table_name)
+    copy_columns = [col for col in column_types if col not in ("id", "snapshot_id")]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("""
+            INSERT INTO {}.snapshots (provider, regions, content_hashes)
+            VALUES (%s, %s, %s) RETURNING snapshot_id
+        """).format(catalog), [provider, ", ".join(regions), json.dumps(content_hashes)])
+        snapshot_id = cursor.fetchone()[0]
+
+        row_count = 0
+        for key in carried:
+            resource_type, region = key.split(":", 1)
+            cursor.execute(sql.SQL("""
+                INSERT INTO {table} (snapshot_id, {columns})
+                SELECT %s, {columns} FROM {table}
+                WHERE snapshot_id = %s AND resource_type = %s AND {region_column} = %s
+            """).format(
+                table=sql.SQL(f"{PRICING_CATALOG_SCHEMA}.{table_name}"),
+                columns=sql.SQL(", ").join(sql.Identifier(col) for col in copy_columns),
+                region_column=sql.Identifier(region_column)
+            ), [snapshot_id, previous_id, resource_type, region])
+            row_count += cursor.rowcount
+
+        for (resource_type, region), df in changed.items():
+            df = df.assign(resource_type=resource_type, snapshot_id=snapshot_id)
+            df = df[[col for col in df.columns if col in column_types]]
+            row_count += copy_dataframe(connection, df, PRICING_CATALOG_SCHEMA, table_name, column_types)
+
+        cursor.execute(sql.SQL("UPDATE {}.snapshots SET row_count = %s WHERE snapshot_id = %s").format(catalog),
+                       [row_count, snapshot_id])
+        # Price rows of pruned snapshots go with them (ON DELETE CASCADE)
+        cursor.execute(sql.SQL("""
+            DELETE FROM {catalog}.snapshots
+            WHERE provider = %s
+              AND snapshot_id NOT IN (
+                  SELECT snapshot_id FROM {catalog}.snapshots
+                  WHERE provider = %s
+                  ORDER BY snapshot_id DESC
+                  LIMIT %s
+              )
+        """).format(catalog=catalog), [provider, provider, PRICING_SNAPSHOTS_TO_KEEP])
+        pruned = cursor.rowcount
+    connection.commit()
+
+    print(f"💾 Stored {provider} pricing snapshot {snapshot_id} ({row_count} rows: {len(changed)} changed part(s) "
+          f"written, {len(carried)} carried over; {pruned} old snapshot(s) pruned) "
+          f"in {PRICING_CATALOG_SCHEMA}.{table_name}")
+    return snapshot_id
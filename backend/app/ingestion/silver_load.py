@@ -0,0 +1,132 @@
+# app/ingestion/silver_load.py
+
+"""
+Incremental bronze-to-silver refreshes shared by the AWS, Azure and GCP
+ingestion paths.
+
+The silver scripts used to TRUNCATE the silver table (or re-append the whole
+bronze table) and transform the full bronze history on every run. Now:
+
+- every bronze table gets an `_ingested_at` column (DEFAULT now(), indexed),
+  filled by the COPY loaders for each new row without any loader change;
+- the last `_ingested_at` processed into silver is stored in ingestion_state
+  (source "silver:<silver table>");
+- the silver script only reads bronze rows with
+  `_ingested_at > __since__ AND _ingested_at <= __until__` and upserts them on
+  hash_key (ON CONFLICT), so a refresh costs time proportional to the delta;
+- full_refresh (or SILVER_FULL_REFRESH=true) keeps the old behaviour for
+  backfills: the script truncates silver and the window covers all of bronze.
+
+Placeholders substituted in the silver scripts, next to __schema__ and
+__budget__: __since__ / __until__ (timestamptz literals) and __full_refresh__
+(true / false).
+
+Like bulk_load and ingestion_state, the functions take an open psycopg2
+connection from the calling cloud's `@connection` decorator and commit their
+own writes.
+"""
+
+import os
+from datetime import datetime
+from typing import Optional
+
+from psycopg2 import sql
+
+from app.ingestion.ingestion_state import get_watermark, set_watermark
+
+INGESTED_AT_COLUMN = "_ingested_at"
+SILVER_FULL_REFRESH = os.getenv("SILVER_FULL_REFRESH", "false").lower() in ("1", "true", "yes")
+
+
+def silver_state_source(silver_table: str) -> str:
+    """ingestion_state source holding the silver watermark of a table."""
+    return f"silver:{silver_table}"
+
+
+def _has_column(connection, schema_name: str, table_name: str, column_name: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = %s AND table_name = %s AND column_name = %s",
+            [schema_name.lower(), table_name.lower(), column_name]
+        )
+        return cursor.fetchone() is not None
+
+
+def ensure_ingested_at(connection, schema_name: str, bronze_table: str) -> None:
+    """
+    Add the indexed `_ingested_at` load timestamp to a bronze table. Rows that
+    existed before get the time of the ALTER (constant default, no table rewrite),
+    so the first incremental refresh still covers them.
+
+    The ALTER takes an ACCESS EXCLUSIVE lock even when the column exists, so it
+    only runs when the column is missing.
+    """
+    if _has_column(connection, schema_name, bronze_table, INGESTED_AT_COLUMN):
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL(
+            "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()"
+        ).format(table=sql.SQL(f"{schema_name}.{bronze_table}"), column=sql.Identifier(INGESTED_AT_COLUMN)))
+        cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} ({column})").format(
+            index=sql.Identifier(f"{bronze_table}{INGESTED_AT_COLUMN}_idx"),
+            table=sql.SQL(f"{schema_name}.{bronze_table}"),
+            column=sql.Identifier(INGESTED_AT_COLUMN)
+        ))
+    connection.commit()
+
+
+def _latest_ingested_at(connection, schema_name: str, bronze_table: str) -> Optional[datetime]:
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("SELECT max({column}) FROM {table}").format(
+            column=sql.Identifier(INGESTED_AT_COLUMN),
+            table=sql.SQL(f"{schema_name}.{bronze_table}")
+        ))
+        return cursor.fetchone()[0]
+
+
+def run_silver_refresh(
+    connection,
+    sql_script: str,
+    schema_name: str,
+    bronze_table: str,
+    silver_table: str,
+    full_refresh: bool = False
+) -> bool:
+    """
+    Run a silver script over the bronze rows loaded since its last refresh.
+
+    Args:
+        sql_script: Script with __schema__ / __budget__ already substituted
+        bronze_table: Table the script reads (gets the `_ingested_at` column)
+        silver_table: Table the script upserts into (names the watermark)
+        full_refresh: Rebuild silver from the whole bronze table (backfills)
+
+    Returns:
+        True if the script ran, False if there was nothing new to process
+    """
+    full_refresh = full_refresh or SILVER_FULL_REFRESH
+    source = silver_state_source(silver_table)
+    ensure_ingested_at(connection, schema_name, bronze_table)
+
+    since = None if full_refresh else get_watermark(connection, schema_name, source)
+    until = _latest_ingested_at(connection, schema_name, bronze_table)
+    if until is None:
+        print(f"{schema_name}.{bronze_table} is empty, skipping {silver_table} refresh")
+        return False
+    if since is not None and datetime.fromisoformat(since) >= until:
+        print(f"No bronze rows newer than {since}, skipping {silver_table} refresh")
+        return False
+
+    sql_script = (sql_script.replace('__since__', since or '-infinity')
+                  .replace('__until__', until.isoformat())
+                  .replace('__full_refresh__', 'true' if full_refresh else 'false'))
+    with connection.cursor() as cursor:
+        cursor.execute(sql_script)
+    connection.commit()
+
+    mode = "full rebuild" if full_refresh else f"rows loaded after {since or 'the start'}"
+    print(f"Refreshed {schema_name}.{silver_table} ({mode}, up to {until.isoformat()})")
+    set_watermark(connection, schema_name, source, until.isoformat())
+    return True
@@ -0,0 +1,289 @@
+-- Shared Pricing Catalog
+-- Public retail price lists (Azure Retail Prices API, AWS Price List API), downloaded
+-- once per day for all projects instead of once per project ingestion.
+-- Every refresh writes a new snapshot; readers only see the latest snapshot of a
+-- provider, which becomes visible when its load transaction commits.
+-- Project schemas expose these prices through views (pricing_tables_consolidated.sql).
+
+-- Serialize concurrent ingestions running this script (IF NOT EXISTS races on first creation)
+SELECT pg_advisory_xact_lock(hashtext('__catalog__'));
+
+CREATE SCHEMA IF NOT EXISTS __catalog__;
+
+-- =========================================================================
+-- SNAPSHOTS
+-- =========================================================================
+
+CREATE TABLE IF NOT EXISTS __catalog__.snapshots (
+    snapshot_id BIGSERIAL PRIMARY KEY,
+    provider VARCHAR(20) NOT NULL,  -- 'azure', 'aws'
+    regions TEXT,
+    row_count INTEGER,
+    loaded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+-- Content hash per "<resource_type>:<region>" part, and last refresh that found the prices unchanged
+ALTER TABLE __catalog__.snapshots ADD COLUMN IF NOT EXISTS content_hashes JSONB;
+ALTER TABLE __catalog__.snapshots ADD COLUMN IF NOT EXISTS checked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS idx_pricing_snapshots_provider
+    ON __catalog__.snapshots(provider, snapshot_id DESC);
+
+-- =========================================================================
+-- AZURE PRICES
+-- =========================================================================
+
+CREATE TABLE IF NOT EXISTS __catalog__.azure_pricing (
+    snapshot_id BIGINT NOT NULL REFERENCES __catalog__.snapshots(snapshot_id) ON DELETE CASCADE,
+    id BIGSERIAL,
+
+    -- Resource type identifier
+    resource_type VARCHAR(50) NOT NULL,  -- 'vm', 'storage', 'disk', 'publicip'
+
+    -- Common pricing fields
+    sku_name VARCHAR(255),
+    product_name VARCHAR(255),
+    retail_price DECIMAL(18, 6),
+    unit_price DECIMAL(18, 6),
+    currency_code VARCHAR(10),
+    unit_of_measure VARCHAR(50),
+
+    -- Location
+    arm_region_name VARCHAR(100),
+
+    -- Metadata
+    meter_name VARCHAR(255),
+    type VARCHAR(100),
+    description TEXT,
+
+    -- VM-specific fields (nullable)
+    arm_sku_name VARCHAR(255),
+    pricing_tier VARCHAR(50),
+    is_primary_meter_region BOOLEAN,
+
+    -- Timestamp
+    effective_start_date TIMESTAMP,
+    last_updated TIMESTAMP DEFAULT now()
+);
+
+-- Covering indexes: SKU lookups and per-region alternative scans are answered
+-- from the index (meter_name filters included), without visiting the heap
+CREATE INDEX IF NOT EXISTS idx_azure_pricing_sku_region_meter
+    ON __catalog__.azure_pricing(snapshot_id, resource_type, LOWER(sku_name), LOWER(arm_region_name), meter_name)
+    INCLUDE (sku_name, product_name, retail_price, unit_price, currency_code, unit_of_measure);
+
+CREATE INDEX IF NOT EXISTS idx_azure_pricing_region_meter
+    ON __catalog__.azure_pricing(snapshot_id, resource_type, LOWER(arm_region_name), meter_name)
+    INCLUDE (sku_name, product_name, retail_price, unit_price, currency_code, unit_of_measure);
+
+-- =========================================================================
+-- AWS PRICES
+-- =========================================================================
+
+CREATE TABLE IF NOT EXISTS __catalog__.aws_pricing (
+    snapshot_id BIGINT NOT NULL REFERENCES __catalog__.snapshots(snapshot_id) ON DELETE CASCADE,
+    id BIGSERIAL,
+
+    -- Resource type identifier
+    resource_type VARCHAR(50) NOT NULL,  -- 'ec2', 's3', 'ebs'
+
+    -- Common pricing fields
+    price DECIMAL(18, 6),
+    currency VARCHAR(10),
+    region VARCHAR(50),
+    region_name VARCHAR(100),
+    unit VARCHAR(50),
+    description TEXT,
+
+    -- EC2-specific fields (nullable)
+    instance_type VARCHAR(100),
+    vcpu VARCHAR(50),
+    memory VARCHAR(50),
+    storage VARCHAR(100),
+    network_performance VARCHAR(100),
+    instance_family VARCHAR(100),
+    physical_processor VARCHAR(255),
+    clock_speed VARCHAR(50),
+    price_per_hour DECIMAL(18, 6),
+    operating_system VARCHAR(50),
+    tenancy VARCHAR(50),
+
+    -- S3-specific fields (nullable)
+    storage_class VARCHAR(100),
+    volume_type VARCHAR(100),
+    usage_type VARCHAR(100),
+    price_per_unit DECIMAL(18, 6),
+
+    -- EBS-specific fields (nullable)
+    storage_media VARCHAR(50),
+    max_iops_volume VARCHAR(50),
+    max_throughput_volume VARCHAR(50),
+    price_per_gb_month DECIMAL(18, 6),
+
+    -- Timestamp
+    last_updated TIMESTAMP DEFAULT now()
+);
+
+-- EC2: instance type (SKU) / region lookups
+CREATE INDEX IF NOT EXISTS idx_aws_pricing_ec2_instance_region
+    ON __catalog__.aws_pricing(snapshot_id, resource_type, LOWER(instance_type), LOWER(region))
+    INCLUDE (instance_type, vcpu, memory, price_per_hour, currency, instance_family)
+    WHERE resource_type = 'ec2';
+
+-- S3 / EBS: storage class or volume type (SKU), region, usage type (meter)
+CREATE INDEX IF NOT EXISTS idx_aws_pricing_storage_region_usage
+    ON __catalog__.aws_pricing(snapshot_id, resource_type, LOWER(region), storage_class, volume_type, usage_type)
+    INCLUDE (price_per_unit, price_per_gb_month, unit)
+    WHERE resource_type IN ('s3', 'ebs');
+
+-- =========================================================================
+-- CURRENT SNAPSHOT VIEWS
+-- =========================================================================
+
+CREATE OR REPLACE VIEW __catalog__.azure_pricing_current AS
+SELECT *
+FROM __catalog__.azure_pricing
+WHERE snapshot_id = (
+    SELECT MAX(snapshot_id) FROM __catalog__.snapshots WHERE provider = 'azure'
+);
+
+CREATE OR REPLACE VIEW __catalog__.aws_pricing_current AS
+SELECT *
+FROM __catalog__.aws_pricing
+WHERE snapshot_id = (
+    SELECT MAX(snapshot_id) FROM __catalog__.snapshots WHERE provider = 'aws'
+);
+
+-- VM Pricing View
+CREATE OR REPLACE VIEW __catalog__.azure_pricing_vm AS
+SELECT
+    id,
+    sku_name,
+    product_name,
+    arm_sku_name,
+    arm_region_name,
+    retail_price,
+    unit_price,
+    currency_code,
+    unit_of_measure,
+    meter_name,
+    type,
+    is_primary_meter_region,
+    effective_start_date,
+    last_updated,
+    pricing_tier
+FROM __catalog__.azure_pricing_current
+WHERE resource_type = 'vm';
+
+-- Storage Pricing View
+CREATE OR REPLACE VIEW __catalog__.azure_pricing_storage AS
+SELECT
+    id,
+    sku_name,
+    product_name,
+    arm_region_name,
+    retail_price,
+    unit_price,
+    currency_code,
+    unit_of_measure,
+    meter_name,
+    type,
+    effective_start_date,
+    last_updated
+FROM __catalog__.azure_pricing_current
+WHERE resource_type = 'storage';
+
+-- Disk Pricing View
+CREATE OR REPLACE VIEW __catalog__.azure_pricing_disk AS
+SELECT
+    id,
+    sku_name,
+    product_name,
+    arm_region_name,
+    retail_price,
+    unit_price,
+    currency_code,
+    unit_of_measure,
+    meter_name,
+    effective_start_date,
+    last_updated
+FROM __catalog__.azure_pricing_current
+WHERE resource_type = 'disk';
+
+-- Public IP Pricing View
+CREATE OR REPLACE VIEW __catalog__.azure_pricing_ip AS
+SELECT
+    id,
+    sku_name,
+    product_name,
+    arm_region_name,
+    retail_price,
+    unit_price,
+    currency_code,
+    unit_of_measure,
+    meter_name,
+    effective_start_date,
+    last_updated
+FROM __catalog__.azure_pricing_current
+WHERE resource_type = 'publicip';
+
+-- EC2 Pricing View
+CREATE OR REPLACE VIEW __catalog__.aws_pricing_ec2 AS
+SELECT
+    id,
+    instance_type,
+    vcpu,
+    memory,
+    storage,
+    network_performance,
+    instance_family,
+    physical_processor,
+    clock_speed,
+    price_per_hour,
+    currency,
+    region,
+    region_name,
+    operating_system,
+    tenancy,
+    unit,
+    last_updated
+FROM __catalog__.aws_pricing_current
+WHERE resource_type = 'ec2';
+
+-- S3 Pricing View
+CREATE OR REPLACE VIEW __catalog__.aws_pricing_s3 AS
+SELECT
+    id,
+    storage_class,
+    volume_type,
+    usage_type,
+    price_per_unit,
+    currency,
+    region,
+    region_name,
+    unit,
+    description,
+    last_updated
+FROM __catalog__.aws_pricing_current
+WHERE resource_type = 's3';
+
+-- EBS Pricing View
+CREATE OR REPLACE VIEW __catalog__.aws_pricing_ebs AS
+SELECT
+    id,
+    volume_type,
+    storage_media,
+    max_iops_volume,
+    max_throughput_volume,
+    price_per_gb_month,
+    currency,
+    region,
+    region_name,
+    unit,
+    last_updated
+FROM __catalog__.aws_pricing_current
+WHERE resource_type = 'ebs';
+
+-- Readable from every project
+GRANT USAGE ON SCHEMA __catalog__ TO PUBLIC;
+GRANT SELECT ON ALL TABLES IN SCHEMA __catalog__ TO PUBLIC;
@@ -176,6 +176,27 @@ async def load_config() -> None:
     # await create_services()  # create services in service table for dashboards and requests
 
 
+@app.on_event('startup')
+async def start_llm_l1_cache() -> None:
+    """
+    Enable the in-process LLM recommendation cache and its invalidation listener.
+    """
+    from app.core.llm_cache_utils import start_l1_cache
+    await start_l1_cache()
+
+
+@app.on_event('shutdown')
+async def close_pooled_clients() -> None:
+    """
+    Close pooled Azure OpenAI connections and stop the LLM L1 cache on shutdown.
+    """
+    from app.core.genai import close_llm_clients, close_async_llm_clients
+    from app.core.llm_cache_utils import stop_l1_cache
+    close_llm_clients()
+    await close_async_llm_clients()
+    await stop_l1_cache()
+
+
 
 #app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -17,14 +17,15 @@ celery_app.conf.update(
     enable_utc=True,
     timezone="UTC",
     beat_schedule={
+        'refresh-pricing-catalog-every-day': {
+            'task': 'task_refresh_pricing_catalog',
+            'schedule': crontab(hour=6, minute=0),  # Run every day at 06:00 UTC, before the ingestion
+        },
         'run-ingestion-every-day': {
             'task': 'task_run_daily_ingestion',
             'schedule': crontab(hour=7, minute=00),  # Run every day at 07:00 UTC
         },
-        'run-dashboard-ingestion-every-day': {
-            'task': 'task_run_daily_dashboard_ingestion',
-            'schedule': crontab(hour=7, minute=30),  # Run every day at 07:30 UTC
-        },
+        # Dashboards are refreshed by the ingestion chord callback once their projects finish
         'run-daily-alerts': {
             'task': 'run_daily_alerts', 
             'schedule': crontab(minute=0, hour=8),  # Run every day at 08:00 UTC
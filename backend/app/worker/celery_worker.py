@@ -3,6 +3,7 @@ import json
 import datetime
 import asyncpg
 import asyncio
+from celery import chord
 from .celery_app import celery_app
 from app.ingestion.aws.main import aws_create_focus_export, aws_run_ingestion
 from app.ingestion.aws.aws_ce.main import aws_ce_main
@@ -14,6 +15,8 @@ from app.ingestion.gcp.main import fetch_data_from_bigquery_to_postgres
 from app.ingestion.gcp.bigquery_view import create_view
 from app.ingestion.azure.main import azure_main
 from app.ingestion.azure.azure_ops import AzFunctions
+from app.ingestion.azure.pricing import fetch_and_store_all_azure_pricing
+from app.ingestion.aws.pricing import fetch_and_store_all_aws_pricing
 from app.ingestion.dashboard.main import create_dashboard_view
 from app.core.misc import execute_query
 from app.core.encryption import decrypt_data
@@ -21,6 +24,7 @@ from app.models.project import Project
 from app.models.alert_integration import Integration
 from app.models.alert import Alert
 from app.core.misc import build_query, init_tortoise_connection, close_tortoise_connection, send_message
+from app.core.ingestion_locks import acquire_project_lock, release_project_lock, acquire_cloud_slot, release_cloud_slot
 
 DB_HOST_NAME = os.getenv("DB_HOST_NAME")
 DB_NAME = os.getenv("DB_NAME")
@@ -462,172 +466,244 @@ def task_delete_azure_project(payload):
     return True
 
 
-@celery_app.task(name='task_run_daily_ingestion')
-def task_run_daily_ingestion(input={}):
-    print('task_run_daily_ingestion')
-
+def _build_connection_payloads(project_id, project_name, cloud_platform, encryption_key):
+    """
+    Build the ingestion payload of every connection of a project.
+    Credentials are decrypted here, inside the worker, so they never travel
+    through the broker.
+    """
+    payloads = []
+
+    if cloud_platform == "aws":
+        query = f"""select id, aws_access_key, aws_secret_key, monthly_budget, date, export_location
+        from awsconnection 
+        where project_id = {project_id};"""
+        connection = execute_query(query=query)
+        for c in connection:
+            print("aws conn: ", c)
+
+            s3_bucket_split = c[5].split("/")
+            print(c[4], type(c[4]))
+            billing_period = datetime.datetime.utcnow().strftime("%Y-%m")
+            payloads.append({
+                "project_id": project_id,
+                "project_name": project_name,
+                "aws_connection_id": c[0],
+                "aws_access_key": decrypt_data(encrypted_data=c[1], key=encryption_key),
+                "aws_secret_key": decrypt_data(encrypted_data=c[2], key=encryption_key),
+                "aws_region": 'us-east-1',
+                "monthly_budget": c[3],
+                "s3_bucket": s3_bucket_split[2],
+                "s3_prefix": s3_bucket_split[3],
+                "export_name": s3_bucket_split[4],
+                "billing_period": billing_period
+            })
+
+    elif cloud_platform == "azure":
+        query = f"""select id, azure_tenant_id, azure_client_id, azure_client_secret, monthly_budget, storage_account_name, container_name,subscription_info
+         from azureconnection 
+         where project_id = {project_id};"""
+        connection = execute_query(query=query)
+        for c in connection:
+            print("azure conn: ", c)
+            subscription_info = c[7]
+            if isinstance(subscription_info, str):
+                subscription_info = json.loads(subscription_info)
+                print("Parsed subscription_info: ", subscription_info)
+
+            payloads.append({
+                "project_id": project_id,
+                "project_name": project_name,
+                "azure_connection_id": c[0],
+                "azure_tenant_id": decrypt_data(encrypted_data=c[1], key=encryption_key),
+                "azure_client_id": decrypt_data(encrypted_data=c[2], key=encryption_key),
+                "azure_client_secret": decrypt_data(encrypted_data=c[3], key=encryption_key),
+                "monthly_budget": c[4],
+                "storage_account_name": c[5],
+                "container_name": c[6],
+                "subscription_info": subscription_info
+            })
+
+    elif cloud_platform == "gcp":
+        query = f"""select id, credentials, project_info, date, monthly_budget, dataset_id, billing_account_id
+        from gcpconnection 
+        where project_id = {project_id};"""
+        connection = execute_query(query=query)
+        for c in connection:
+            print("gcp conn: ", c)
+
+            credentials = json.loads(
+                decrypt_data(encrypted_data=c[1]["encrypted_credentials"], key=encryption_key))
+
+            payloads.append({
+                "project_id": project_id,
+                "project_name": project_name,
+                "gcp_connection_id": c[0],
+                "credentials": credentials,
+                "gcp_project_id": c[2]["project_id"],
+                "date": c[3],
+                "monthly_budget": c[4],
+                "dataset_id": c[5],
+                "billing_account_id": c[6],
+            })
+
+    return payloads
+
+
+def _get_encryption_key():
     # Ensure encryption key is fetched correctly
     encryption_key = os.getenv("ENCRYPTION_KEY")
     if not encryption_key:
         raise ValueError("Encryption key not found in environment variables")
 
     # Convert encryption key from string to bytes
-    encryption_key = bytes.fromhex(encryption_key)
+    return bytes.fromhex(encryption_key)
+
+
+@celery_app.task(name="task_refresh_pricing_catalog")
+def task_refresh_pricing_catalog():
+    """
+    Refresh the shared pricing catalog (app.ingestion.pricing_catalog): the
+    Azure and AWS retail price lists are downloaded once for all projects,
+    before the daily ingestion, and stored as a new snapshot.
+    """
+    print('task_refresh_pricing_catalog')
+    fetch_and_store_all_azure_pricing()
+    fetch_and_store_all_aws_pricing()
+    return True
+
 
-    query = f"""select * from project order by id desc;"""
+# Per-connection ingestion, run inline inside task_ingest_project
+INGESTION_RUNNERS = {
+    "aws": task_run_ingestion_aws,
+    "azure": task_run_ingestion_azure,
+    "gcp": task_run_ingestion_gcp,
+}
+
+# How long a project task waits before retrying when its cloud has no free slot
+INGESTION_SLOT_RETRY_SECONDS = int(os.getenv("INGESTION_SLOT_RETRY_SECONDS", "60"))
+INGESTION_SLOT_MAX_RETRIES = int(os.getenv("INGESTION_SLOT_MAX_RETRIES", "180"))
+
+
+@celery_app.task(name='task_run_daily_ingestion')
+def task_run_daily_ingestion(input={}):
+    """
+    Fan the daily ingestion out as one task per project (a chord), so projects
+    run in parallel across workers and one slow or failing tenant does not hold
+    up the others. When every project task has finished, dashboards whose member
+    projects were ingested successfully are refreshed.
+    """
+    print('task_run_daily_ingestion')
+    print("input", input)
+
+    # check if project_id is provided in input.
+    # If yes, run ingestion only for that project, else run for all
+    query = f"""select id, name, cloud_platform from project order by id desc;"""
+    if input:
+        query = f"""select id, name, cloud_platform from project where id = {int(input["project_id"])};"""
     projects = execute_query(query=query)
-    for p in projects:
-        print("project: ", p)
 
-        # check if project_id is provided in input.
-        # If yes, run ingestion only for that project, else run for all
-        print("input", input)
-        if input:
-            if int(input["project_id"]) != int(p[0]):
-                continue
+    header = [task_ingest_project.s(p[0], p[1], p[2]) for p in projects if p[2] in INGESTION_RUNNERS]
+    if not header:
+        print("No projects to ingest")
+        return True
+
+    chord(header)(task_refresh_ingested_dashboards.s())
+    print(f"Dispatched ingestion for {len(header)} project(s)")
+    return True
+
+
+@celery_app.task(name="task_ingest_project", bind=True, max_retries=INGESTION_SLOT_MAX_RETRIES)
+def task_ingest_project(self, project_id, project_name, cloud_platform):
+    """
+    Ingest every connection of one project.
+    Waits (by retrying) for a free slot of its cloud and skips the project if
+    another task is already ingesting it. Never raises, so the chord callback
+    always runs; the outcome is reported in the returned status.
+    """
+    owner = self.request.id or f"{project_id}:{os.getpid()}"
+    result = {"project_id": project_id, "cloud_platform": cloud_platform, "status": "failed"}
+
+    if not acquire_cloud_slot(cloud_platform, owner):
+        if self.request.retries < self.max_retries:
+            print(f"⏳ No free {cloud_platform} ingestion slot, project {project_name} retries in {INGESTION_SLOT_RETRY_SECONDS}s")
+            raise self.retry(countdown=INGESTION_SLOT_RETRY_SECONDS)
+        print(f"❌ Gave up waiting for a {cloud_platform} ingestion slot for project {project_name}")
+        return result
+
+    try:
+        if not acquire_project_lock(project_id, owner):
+            print(f"⚠️ Project {project_name} is already being ingested, skipping")
+            result["status"] = "skipped"
+            return result
 
         try:
-            if p[4] == "aws":
-                query = f"""select id, aws_access_key, aws_secret_key, monthly_budget, date, export_location
-                from awsconnection 
-                where project_id = {p[0]};"""
-                connection = execute_query(query=query)
-                for c in connection:
-                    print("aws conn: ", c)
-
-                    s3_bucket_split = c[5].split("/")
-                    print(c[4], type(c[4]))
-                    billing_period = datetime.datetime.utcnow().strftime("%Y-%m")
-                    payload = {
-                        "project_id": p[0],
-                        "project_name": p[1],
-                        "aws_connection_id": c[0],
-                        "aws_access_key": decrypt_data(encrypted_data=c[1], key=encryption_key),
-                        "aws_secret_key": decrypt_data(encrypted_data=c[2], key=encryption_key),
-                        "aws_region": 'us-east-1',
-                        "monthly_budget": c[3],
-                        "s3_bucket": s3_bucket_split[2],
-                        "s3_prefix": s3_bucket_split[3],
-                        "export_name": s3_bucket_split[4],
-                        "billing_period": billing_period
-                    }
-                    # task_run_ingestion_aws(payload)
-                    aws_run_ingestion(
-                        project_name=payload["project_name"],
-                        monthly_budget=str(payload["monthly_budget"]),
-                        aws_access_key=payload["aws_access_key"],
-                        aws_secret_key=payload["aws_secret_key"],
-                        aws_region=payload["aws_region"],
-                        s3_bucket=payload["s3_bucket"],
-                        s3_prefix=payload["s3_prefix"],
-                        export_name=payload["export_name"],
-                        billing_period=payload["billing_period"]
-                    )
-                    query = f"""
-                    update project set status = true where id = {payload["project_id"]};
-                    """
-                    execute_query(query=query, fetch=False)
-
-                    query = f"""
-                    update awsconnection set status = true where id = {payload["aws_connection_id"]};
-                    """
-                    execute_query(query=query, fetch=False)
-
-            elif p[4] == "azure":
-                query = f"""select id, azure_tenant_id, azure_client_id, azure_client_secret, monthly_budget, storage_account_name, container_name,subscription_info
-                 from azureconnection 
-                 where project_id = {p[0]};"""
-                connection = execute_query(query=query)
-                for c in connection:
-                    print("azure conn: ", c)
-                    subscription_info = c[7]
-                    if isinstance(subscription_info, str):
-                        subscription_info = json.loads(subscription_info)
-                        print("Parsed subscription_info: ", subscription_info)
-
-                    payload = {
-                        "project_id": p[0],
-                        "project_name": p[1],
-                        "azure_connection_id": c[0],
-                        "azure_tenant_id": decrypt_data(encrypted_data=c[1], key=encryption_key),
-                        "azure_client_id": decrypt_data(encrypted_data=c[2], key=encryption_key),
-                        "azure_client_secret": decrypt_data(encrypted_data=c[3], key=encryption_key),
-                        "monthly_budget": c[4],
-                        "storage_account_name": c[5],
-                        "container_name": c[6],
-                        "subscription_info": subscription_info
-                    }
-                    # task_run_ingestion_azure(payload)
-                    azure_main(project_name=payload["project_name"],
-                               budget=str(payload["monthly_budget"]),
-                               tenant_id=payload["azure_tenant_id"],
-                               client_id=payload["azure_client_id"],
-                               client_secret=payload["azure_client_secret"],
-                               storage_account_name=payload["storage_account_name"],
-                               container_name=payload["container_name"],
-                               subscription_id = payload["subscription_info"]["subscription_id"]
-                               )
-
-                    query = f"""
-                    update project set status = true where id = {payload["project_id"]};
-                    """
-                    execute_query(query=query, fetch=False)
-
-                    query = f"""
-                    update azureconnection set status = true where id = {payload["azure_connection_id"]};
-                    """
-                    execute_query(query=query, fetch=False)
-
-            elif p[4] == "gcp":
-                query = f"""select id, credentials, project_info, date, monthly_budget, dataset_id, billing_account_id
-                from gcpconnection 
-                where project_id = {p[0]};"""
-                connection = execute_query(query=query)
-                for c in connection:
-                    print("gcp conn: ", c)
-
-                    credentials = json.loads(
-                        decrypt_data(encrypted_data=c[1]["encrypted_credentials"], key=encryption_key))
-
-                    payload = {
-                        "project_id": p[0],
-                        "project_name": p[1],
-                        "gcp_connection_id": c[0],
-                        "credentials": credentials,
-                        "gcp_project_id": c[2]["project_id"],
-                        "date": c[3],
-                        "monthly_budget": c[4],
-                        "dataset_id": c[5],
-                        "billing_account_id": c[6],
-                    }
-                    # task_run_ingestion_gcp(payload)
-                    create_view(credentials=payload["credentials"],
-                                project_id=payload["gcp_project_id"],
-                                dataset_id=payload["dataset_id"],
-                                billing_account_id=payload["billing_account_id"],
-                                date=payload["date"],
-                                view_id="focus_format_temp")
-                    fetch_data_from_bigquery_to_postgres(project_id=payload["gcp_project_id"],
-                                                         dataset_id=payload["dataset_id"],
-                                                         view_id="focus_format_temp",
-                                                         credentials=payload["credentials"],
-                                                         schema=payload["project_name"],
-                                                         table_name="bronze_focus_gcp_data",
-                                                         monthly_budget=str(payload["monthly_budget"]))
-
-                    query = f"""
-                    update project set status = true where id = {payload["project_id"]};
-                    """
-                    execute_query(query=query, fetch=False)
-
-                    query = f"""
-                    update gcpconnection set status = true where id = {payload["gcp_connection_id"]};
-                    """
-                    execute_query(query=query, fetch=False)
+            print("project: ", project_id, project_name, cloud_platform)
+            encryption_key = _get_encryption_key()
+            for payload in _build_connection_payloads(project_id, project_name, cloud_platform, encryption_key):
+                INGESTION_RUNNERS[cloud_platform](payload)
+            result["status"] = "success"
+        except Exception as ex:
+            print(ex)
+        finally:
+            release_project_lock(project_id, owner)
+    finally:
+        release_cloud_slot(cloud_platform, owner)
+
+    return result
 
+
+def _dashboard_payload(d):
+    """Build the task_create_dashboard_view payload for a dashboard row."""
+    project_ids = d[5]
+    project_names = []
+
+    # Validate if the project exists
+    for project_id in d[5]:
+        try:
+            query = f"""select name from project where id = {project_id};"""
+            result = execute_query(query=query)
+            if result:
+                # take first object from list, as execute query returns List
+                result = result[0]
+                print("project", result)
+                project_names.append(result[0])
         except Exception as ex:
             print(ex)
 
+    return {
+        "cloud_platforms": d[6],
+        "project_ids": project_ids,
+        "project_names": project_names,
+        "dashboard_id": d[0],
+        "dashboard_name": d[1],
+    }
+
+
+@celery_app.task(name="task_refresh_ingested_dashboards")
+def task_refresh_ingested_dashboards(results):
+    """
+    Chord callback of task_run_daily_ingestion.
+    Refreshes only dashboards with at least one freshly ingested member project
+    and no member project that failed or was skipped in this run.
+    """
+    succeeded = {int(r["project_id"]) for r in results if r and r.get("status") == "success"}
+    unfinished = {int(r["project_id"]) for r in results if r and r.get("status") != "success"}
+    print(f"Ingestion finished: {len(succeeded)} succeeded, {len(unfinished)} failed/skipped")
+
+    if not succeeded:
+        return True
+
+    query = f"""select * from dashboard order by id desc;"""
+    dashboards = execute_query(query=query)
+    for d in dashboards:
+        members = {int(project_id) for project_id in (d[5] or [])}
+        if not members & succeeded or members & unfinished:
+            continue
+
+        print("dashboard: ", d)
+        # run task to refresh views (in parallel across workers)
+        task_create_dashboard_view.delay(payload=_dashboard_payload(d))
     return True
 
 
@@ -638,31 +714,8 @@ def task_run_daily_dashboard_ingestion(payload={}):
     for d in dashboards:
         print("dashboard: ", d)
 
-        project_ids = d[5]
-        project_names = []
-
-        # Validate if the project exists
-        for project_id in d[5]:
-            try:
-                query = f"""select name from project where id = {project_id};"""
-                result = execute_query(query=query)
-                if result:
-                    # take first object from list, as execute query returns List
-                    result = result[0]
-                    print("project", result)
-                    project_names.append(result[0])
-            except Exception as ex:
-                print(ex)
-
         # run task to refresh views
-        payload = {
-            "cloud_platforms": d[6],
-            "project_ids": project_ids,
-            "project_names": project_names,
-            "dashboard_id": d[0],
-            "dashboard_name": d[1],
-        }
-        task_create_dashboard_view(payload=payload)
+        task_create_dashboard_view(payload=_dashboard_payload(d))
     return True
 
 
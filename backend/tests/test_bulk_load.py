@@ -0,0 +1,59 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app.ingestion.bulk_load import insert_new_rows, rekey_rows
+
+
+@pytest.fixture
+def billing_table(pg_connection, pg_schema):
+    with pg_connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {pg_schema}.bronze (hash_key TEXT, service TEXT, cost DOUBLE PRECISION)")
+        cursor.execute(f"INSERT INTO {pg_schema}.bronze VALUES ('k1', 'Storage', 1.5)")
+    pg_connection.commit()
+    return pg_schema, "bronze"
+
+
+def _rows(connection, schema_name):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT hash_key, service, cost FROM {schema_name}.bronze ORDER BY hash_key")
+        return cursor.fetchall()
+
+
+def test_insert_new_rows_skips_stored_and_repeated_keys(pg_connection, billing_table):
+    schema_name, table_name = billing_table
+    df = pd.DataFrame({
+        "hash_key": ["k1", "k2", "k2", "k3"],
+        "service": ["Storage", "VM", "VM", "IP"],
+        "cost": [1.5, 2.0, 2.0, 0.25],
+    })
+
+    assert insert_new_rows(pg_connection, df, schema_name, table_name) == 2
+    # Loading the same batch again inserts nothing
+    assert insert_new_rows(pg_connection, df, schema_name, table_name) == 0
+
+    assert _rows(pg_connection, schema_name) == [
+        ("k1", "Storage", 1.5), ("k2", "VM", 2.0), ("k3", "IP", 0.25),
+    ]
+
+
+def test_insert_new_rows_accepts_arrow_tables(pg_connection, billing_table):
+    schema_name, table_name = billing_table
+    table = pa.table({"hash_key": ["k1", "k4"], "service": ["Storage", None], "cost": [1.5, None]})
+
+    assert insert_new_rows(pg_connection, table, schema_name, table_name) == 1
+    assert insert_new_rows(pg_connection, table.slice(0, 0), schema_name, table_name) == 0
+
+    assert _rows(pg_connection, schema_name)[-1] == ("k4", None, None)
+
+
+def test_rekey_rows_skips_keys_already_taken(pg_connection, billing_table):
+    schema_name, table_name = billing_table
+    df = pd.DataFrame({"hash_key": ["k2", "n2"], "service": ["VM", "VM"], "cost": [2.0, 2.0]})
+    insert_new_rows(pg_connection, df, schema_name, table_name)
+
+    # k1 -> n1 moves; n2 is already stored, so k2 keeps its key
+    assert rekey_rows(pg_connection, schema_name, table_name, ["k1", "k2"], ["n1", "n2"]) == 1
+    pg_connection.commit()
+
+    assert [row[0] for row in _rows(pg_connection, schema_name)] == ["k2", "n1", "n2"]
@@ -0,0 +1,137 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.ingestion import silver_load
+from app.ingestion.ingestion_state import (
+    filter_changed_objects,
+    get_processed_objects,
+    get_watermark,
+    mark_objects_processed,
+    set_watermark,
+)
+
+JAN_1 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+JAN_2 = datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+
+def test_filter_changed_objects_keeps_new_and_changed_objects():
+    processed = {
+        "same.csv": {"etag": "abc", "last_modified": JAN_1},
+        "rewritten.csv": {"etag": "abc", "last_modified": JAN_1},
+        "no_etag.csv": {"etag": None, "last_modified": JAN_1},
+    }
+    objects = [
+        {"key": "same.csv", "etag": '"abc"', "last_modified": JAN_2},
+        {"key": "rewritten.csv", "etag": "def", "last_modified": JAN_1},
+        {"key": "no_etag.csv", "etag": None, "last_modified": JAN_2},
+        {"key": "new.csv", "etag": "xyz", "last_modified": JAN_1},
+    ]
+
+    changed = filter_changed_objects(objects, processed)
+
+    # Quoted and bare ETags compare equal; LastModified only decides without ETags
+    assert [obj["key"] for obj in changed] == ["rewritten.csv", "no_etag.csv", "new.csv"]
+
+
+def test_object_state_and_watermark_round_trip(pg_connection, pg_schema):
+    assert get_processed_objects(pg_connection, pg_schema, "azure_export") == {}
+    assert get_watermark(pg_connection, pg_schema, "gcp_focus") is None
+
+    mark_objects_processed(pg_connection, pg_schema, "azure_export", [
+        {"key": "a.csv", "etag": '"1"', "last_modified": JAN_1, "row_count": 10},
+    ])
+    mark_objects_processed(pg_connection, pg_schema, "azure_export", [
+        {"key": "a.csv", "etag": '"2"', "last_modified": JAN_2},
+    ])
+    set_watermark(pg_connection, pg_schema, "gcp_focus", "2024-01-02T00:00:00")
+
+    assert get_processed_objects(pg_connection, pg_schema, "azure_export") == {
+        "a.csv": {"etag": "2", "last_modified": JAN_2},
+    }
+    assert get_processed_objects(pg_connection, pg_schema, "other") == {}
+    assert get_watermark(pg_connection, pg_schema, "gcp_focus") == "2024-01-02T00:00:00"
+
+
+class RecordingConnection:
+    """Connection double recording the scripts executed through its cursors."""
+
+    def __init__(self):
+        self.scripts = []
+        self.commits = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, script, params=None):
+        self.scripts.append(script)
+
+    def commit(self):
+        self.commits += 1
+
+
+SILVER_SCRIPT = (
+    "INSERT INTO __schema__.silver SELECT * FROM __schema__.bronze "
+    "WHERE _ingested_at > '__since__' AND _ingested_at <= '__until__' -- full: __full_refresh__"
+)
+
+
+@pytest.fixture
+def silver_state(monkeypatch):
+    state = {"watermark": None, "latest": None, "saved": []}
+    monkeypatch.setattr(silver_load, "SILVER_FULL_REFRESH", False)
+    monkeypatch.setattr(silver_load, "ensure_ingested_at", lambda *args: None)
+    monkeypatch.setattr(silver_load, "_latest_ingested_at", lambda *args: state["latest"])
+    monkeypatch.setattr(silver_load, "get_watermark", lambda *args: state["watermark"])
+    monkeypatch.setattr(silver_load, "set_watermark", lambda conn, schema, source, value: state["saved"].append((source, value)))
+    return state
+
+
+def _refresh(connection, full_refresh=False):
+    script = SILVER_SCRIPT.replace("__schema__", "proj")
+    return silver_load.run_silver_refresh(connection, script, "proj", "bronze", "silver", full_refresh)
+
+
+def test_silver_refresh_reads_the_window_since_the_last_watermark(silver_state):
+    silver_state["watermark"] = JAN_1.isoformat()
+    silver_state["latest"] = JAN_2
+    connection = RecordingConnection()
+
+    assert _refresh(connection)
+
+    assert connection.scripts == [
+        "INSERT INTO proj.silver SELECT * FROM proj.bronze "
+        f"WHERE _ingested_at > '{JAN_1.isoformat()}' AND _ingested_at <= '{JAN_2.isoformat()}' -- full: false"
+    ]
+    assert silver_state["saved"] == [("silver:silver", JAN_2.isoformat())]
+
+
+def test_silver_full_refresh_covers_all_of_bronze(silver_state):
+    silver_state["watermark"] = JAN_1.isoformat()
+    silver_state["latest"] = JAN_2
+    connection = RecordingConnection()
+
+    assert _refresh(connection, full_refresh=True)
+
+    assert "> '-infinity'" in connection.scripts[0]
+    assert "-- full: true" in connection.scripts[0]
+
+
+def test_silver_refresh_skips_when_nothing_new(silver_state):
+    connection = RecordingConnection()
+
+    # Empty bronze
+    assert not _refresh(connection)
+    # Watermark already at the latest bronze row
+    silver_state["watermark"] = JAN_2.isoformat()
+    silver_state["latest"] = JAN_2
+    assert not _refresh(connection)
+
+    assert connection.scripts == []
+    assert silver_state["saved"] == []
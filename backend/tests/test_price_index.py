@@ -0,0 +1,84 @@
+import random
+
+from app.ingestion.price_index import PriceList
+
+COLUMNS = ["sku", "price"]
+
+
+def _rows():
+    return [
+        {"sku": "B2s", "price": 0.05},
+        {"sku": "D2s_v3", "price": 0.10},
+        {"sku": "d2s_v3", "price": 0.12},
+        {"sku": "D4s_v3", "price": 0.20},
+        {"sku": "E4s_v3", "price": 0.20},
+        {"sku": "D8s_v3", "price": 0.40},
+        {"sku": None, "price": 0.30},
+        {"sku": "Free", "price": 0.0},
+    ]
+
+
+def _brute_below(rows, price, limit, exclude=None):
+    candidates = sorted((r for r in rows if 0 < r["price"] < price and r["sku"] is not None),
+                        key=lambda r: r["price"])[::-1]
+    return _distinct(candidates, limit, exclude)
+
+
+def _brute_above(rows, price, limit, exclude=None):
+    candidates = sorted((r for r in rows if r["price"] > max(price, 0) and r["sku"] is not None),
+                        key=lambda r: r["price"])
+    return _distinct(candidates, limit, exclude)
+
+
+def _distinct(candidates, limit, exclude):
+    selected, seen = [], set()
+    for row in candidates:
+        if exclude and row["sku"].lower() == exclude.lower():
+            continue
+        values = (row["sku"], row["price"])
+        if values not in seen:
+            seen.add(values)
+            selected.append(dict(zip(COLUMNS, values)))
+    return selected[:limit]
+
+
+def test_lookup_returns_cheapest_row_case_insensitively():
+    prices = PriceList(_rows(), "sku", "price")
+
+    assert prices.lookup("D2S_V3")["price"] == 0.10
+    assert prices.lookup("missing") is None
+    assert prices.lookup(None) is None
+
+
+def test_below_and_above_walk_outwards_from_the_price():
+    prices = PriceList(_rows(), "sku", "price")
+
+    below = prices.below(0.20, 3, COLUMNS)
+    assert [row["price"] for row in below] == [0.12, 0.10, 0.05]
+
+    above = prices.above(0.10, 3, COLUMNS, exclude_sku="d4s_v3")
+    assert [row["sku"] for row in above] == ["d2s_v3", "E4s_v3", "D8s_v3"]
+
+
+def test_below_skips_free_and_skuless_rows_cheapest_keeps_skuless():
+    prices = PriceList(_rows(), "sku", "price")
+
+    assert all(row["price"] > 0 and row["sku"] for row in prices.below(1.0, 10, COLUMNS))
+    assert {"sku": None, "price": 0.30} in prices.cheapest(10, COLUMNS)
+    assert prices.cheapest(1, COLUMNS) == [{"sku": "B2s", "price": 0.05}]
+
+
+def test_bisection_matches_linear_scan():
+    rng = random.Random(7)
+    rows = [
+        {"sku": f"sku{rng.randrange(40)}", "price": round(rng.choice([0.0, rng.uniform(0, 5)]), 2)}
+        for _ in range(300)
+    ]
+    prices = PriceList(rows, "sku", "price")
+
+    for _ in range(200):
+        price = round(rng.uniform(-0.5, 5.5), 2)
+        limit = rng.randrange(1, 8)
+        exclude = rng.choice([None, f"SKU{rng.randrange(40)}"])
+        assert prices.below(price, limit, COLUMNS, exclude) == _brute_below(rows, price, limit, exclude)
+        assert prices.above(price, limit, COLUMNS, exclude) == _brute_above(rows, price, limit, exclude)
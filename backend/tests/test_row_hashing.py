@@ -0,0 +1,81 @@
+import hashlib
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app.ingestion.arrow_rows import hash_table_rows, prepare_table_for_load
+from app.ingestion.row_hashing import hash_rows, hash_rows_int, md5_hex
+
+
+def legacy_keys(df):
+    """The keys stored by the original df.apply(md5(''.join(map(str, row))), axis=1)."""
+    return df.apply(lambda row: hashlib.md5(''.join(map(str, row)).encode('utf-8')).hexdigest(), axis=1).tolist()
+
+
+FRAMES = {
+    "strings": pd.DataFrame({"a": ["x", "y", None], "b": ["1", "", "z"]}),
+    "ints": pd.DataFrame({"a": [1, 2, 3], "b": [10, 20, 30]}),
+    "int_and_float": pd.DataFrame({"a": [1, 2, 3], "b": [0.5, 2.0, np.nan]}),
+    "bool_and_int": pd.DataFrame({"a": [True, False, True], "b": [1, 2, 3]}),
+    "bool_and_float": pd.DataFrame({"a": [True, False, True], "b": [1.5, 2.0, 3.25]}),
+    "mixed_object": pd.DataFrame({"a": ["x", "y", "z"], "b": [1, 2, 3], "c": [1.0, 2.5, 3.0]}),
+    "timestamps": pd.DataFrame({
+        "t": pd.to_datetime(["2024-01-01 00:00:00", "2024-01-02 12:30:00", "2024-01-03 23:59:59"]),
+        "v": [1.0, 2.0, 3.0],
+    }),
+    "sub_second": pd.DataFrame({"t": pd.to_datetime(["2024-01-01 00:00:00.500", "2024-01-01 00:00:01.000"])}),
+}
+
+
+@pytest.mark.parametrize("name", sorted(FRAMES))
+def test_hash_rows_matches_legacy_keys(name):
+    df = FRAMES[name]
+    assert hash_rows(df, algorithm="md5").tolist() == legacy_keys(df)
+
+
+def test_hash_rows_on_a_column_subset():
+    df = FRAMES["mixed_object"]
+    assert hash_rows(df, columns=["c", "b"], algorithm="md5").tolist() == legacy_keys(df[["c", "b"]])
+
+
+def test_hash_rows_int_is_the_md5_modulo():
+    df = FRAMES["int_and_float"]
+    expected = [int(key, 16) % 10**18 for key in legacy_keys(df)]
+    assert hash_rows_int(df, modulus=10**18).tolist() == expected
+
+
+def test_md5_hex_encodes_utf8():
+    assert md5_hex(["é"]) == [hashlib.md5("é".encode("utf-8")).hexdigest()]
+
+
+TABLES = {
+    "strings": pa.table({"a": ["x", None, ""], "b": ["1", "2", None]}),
+    "ints": pa.table({"a": pa.array([1, 2, 3], pa.int64())}),
+    "ints_with_nulls": pa.table({"a": pa.array([1, None, 3], pa.int64()), "b": ["x", "y", "z"]}),
+    "floats": pa.table({"a": [0.1, 2.0, None], "b": [1e20, float("nan"), 3.5]}),
+    "bools": pa.table({"a": [True, None, False], "b": ["x", "y", "z"]}),
+    "timestamps": pa.table({
+        "t": pa.array([datetime(2024, 1, 1), datetime(2024, 1, 1), datetime(2024, 1, 2, 3, 4, 5)], pa.timestamp("us")),
+        "u": pa.array([datetime(2024, 1, 1, tzinfo=timezone.utc)] * 3, pa.timestamp("ns", tz="UTC")),
+    }),
+    "dictionary": pa.table({"a": pa.array(["x", "y", "x"]).dictionary_encode()}),
+}
+
+
+@pytest.mark.parametrize("name", sorted(TABLES))
+def test_hash_table_rows_matches_the_pandas_path(name):
+    table = TABLES[name]
+    assert hash_table_rows(table) == legacy_keys(table.to_pandas().fillna(""))
+
+
+def test_prepare_table_for_load_drops_duplicates_and_blanks():
+    table = pa.table({"a": ["x", "x", "y"], "b": ["", "", "z"]})
+
+    prepared = prepare_table_for_load(table)
+
+    assert prepared.column("a").to_pylist() == ["x", "y"]
+    assert prepared.column("b").to_pylist() == [None, "z"]
+    assert prepared.column("hash_key").to_pylist() == hash_table_rows(table.slice(1))
@@ -0,0 +1,161 @@
+import asyncio
+import sys
+import types
+
+import pytest
+
+from app.core import llm_cache_utils
+from app.core.llm_cache_utils import (
+    encode_cache_value,
+    run_single_flight,
+    wait_for_singleflight_result,
+)
+
+HASH_KEY = "llm_cache:abc123"
+LOCK_KEY = "llm_lock:abc123"
+RESULT = [{"resource_id": "vm-1", "recommendation": "resize"}]
+
+
+class FakeRedis:
+    """In-memory stand-in for the async Redis client (bytes values, no TTLs)."""
+
+    def __init__(self):
+        self.data = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("redis is down")
+
+    async def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        self._check()
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, nx=False, ex=None):
+        self._check()
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    async def eval(self, script, numkeys, key, owner, *args):
+        # Release / extend scripts: act only while `owner` holds the lock
+        self._check()
+        if self.data.get(key) != owner.encode():
+            return 0
+        if "del" in script:
+            del self.data[key]
+        return 1
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = FakeRedis()
+
+    async def get_redis_client():
+        return client
+
+    monkeypatch.setattr(llm_cache_utils, "get_redis_client", get_redis_client)
+    monkeypatch.setattr(llm_cache_utils, "SINGLEFLIGHT_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(llm_cache_utils, "SINGLEFLIGHT_MAX_POLL_SECONDS", 0.02)
+    return client
+
+
+@pytest.fixture
+def cancelled(monkeypatch):
+    """Task ids reported as cancelled by the task manager."""
+    cancelled_ids = set()
+    task_manager = types.SimpleNamespace(is_cancelled=lambda task_id: task_id in cancelled_ids)
+    monkeypatch.setitem(sys.modules, "app.core.task_manager", types.SimpleNamespace(task_manager=task_manager))
+    return cancelled_ids
+
+
+def test_waiter_polls_until_the_holder_caches_its_result(redis_client, cancelled):
+    redis_client.data[LOCK_KEY] = b"holder"
+
+    async def scenario():
+        async def holder_finishes():
+            await asyncio.sleep(0.05)
+            redis_client.data[HASH_KEY] = encode_cache_value(RESULT)
+            del redis_client.data[LOCK_KEY]
+
+        finishing = asyncio.create_task(holder_finishes())
+        result = await wait_for_singleflight_result(HASH_KEY, "waiter", timeout=5)
+        await finishing
+        return result
+
+    assert asyncio.run(scenario()) == RESULT
+
+
+def test_waiter_returns_none_when_the_lock_is_released_without_a_result(redis_client, cancelled):
+    assert asyncio.run(wait_for_singleflight_result(HASH_KEY, "waiter", timeout=5)) is None
+
+
+def test_waiter_releases_the_lock_of_a_cancelled_holder(redis_client, cancelled):
+    redis_client.data[LOCK_KEY] = b"holder"
+    cancelled.add("holder")
+
+    assert asyncio.run(wait_for_singleflight_result(HASH_KEY, "waiter", timeout=5)) is None
+    assert LOCK_KEY not in redis_client.data
+
+
+def test_waiter_gives_up_when_its_own_task_is_cancelled(redis_client, cancelled):
+    redis_client.data[LOCK_KEY] = b"holder"
+    cancelled.add("waiter")
+
+    assert asyncio.run(wait_for_singleflight_result(HASH_KEY, "waiter", timeout=5)) is None
+    assert redis_client.data[LOCK_KEY] == b"holder"
+
+
+def test_concurrent_misses_compute_once(redis_client, cancelled):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        redis_client.data[HASH_KEY] = encode_cache_value(RESULT)
+        return RESULT
+
+    async def scenario():
+        return await asyncio.gather(*(run_single_flight(HASH_KEY, f"task-{i}", compute) for i in range(5)))
+
+    assert asyncio.run(scenario()) == [RESULT] * 5
+    assert len(calls) == 1
+    assert LOCK_KEY not in redis_client.data
+
+
+def test_waiter_takes_over_when_the_holder_fails(redis_client, cancelled):
+    calls = []
+
+    async def failing_compute():
+        calls.append("holder")
+        await asyncio.sleep(0.05)
+        raise RuntimeError("LLM call failed")
+
+    async def compute():
+        calls.append("waiter")
+        return RESULT
+
+    async def scenario():
+        holder = asyncio.create_task(run_single_flight(HASH_KEY, "holder", failing_compute))
+        await asyncio.sleep(0.01)
+        result = await run_single_flight(HASH_KEY, "waiter", compute)
+        with pytest.raises(RuntimeError):
+            await holder
+        return result
+
+    assert asyncio.run(scenario()) == RESULT
+    assert calls == ["holder", "waiter"]
+
+
+def test_computes_without_the_lock_when_redis_is_down(redis_client, cancelled):
+    redis_client.down = True
+
+    async def compute():
+        return RESULT
+
+    assert asyncio.run(run_single_flight(HASH_KEY, "task", compute)) == RESULT